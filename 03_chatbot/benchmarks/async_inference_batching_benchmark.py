@@ -0,0 +1,149 @@
+""" Benchmark for micro-batching the prompts of concurrent sessions to an async SageMaker endpoint.
+
+16 sessions send a prompt at random times within one second. The stand-in endpoint has
+one instance that processes one request at a time: 300 ms per request plus 60 ms per
+prompt of the request, so a batch shares the fixed cost of a request. Stand-ins of the
+S3 and SageMaker runtime clients count the uploads and invocations. The benchmark
+compares one request per prompt with batches of up to 8 prompts within 50 ms.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/async_inference_batching_benchmark.py
+"""
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# The benchmark prints its own summary instead of an EMF record per request
+os.environ.setdefault("LATENCY_METRICS_EMF", "false")
+
+from botocore.exceptions import ClientError  # noqa: E402
+from chatbot.catalog.model_catalog_item_sagemaker import SageMakerModelItem  # noqa: E402
+from chatbot.helpers import sagemaker_async_endpoint  # noqa: E402
+from chatbot.helpers.aws_client_pool import AWS_CLIENT_POOL  # noqa: E402
+from chatbot.helpers.micro_batcher import MicroBatcher  # noqa: E402
+from chatbot.helpers.sagemaker_async_endpoint import SagemakerAsyncEndpoint  # noqa: E402
+
+SESSIONS = 16
+REGION = "eu-west-1"
+BUCKET = "genie-async-inference"
+REQUEST_SECONDS = 0.3
+PROMPT_SECONDS = 0.06
+
+
+class FakeS3:
+    """Local stand-in of the S3 client."""
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+        self._lock = threading.Lock()
+
+    def put_object(self, Body, Bucket, Key):
+        with self._lock:
+            self.puts += 1
+            self.objects[Key] = Body
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {}
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+
+class FakeSageMaker:
+    """Local stand-in of the SageMaker client with a running endpoint."""
+
+    def describe_endpoint(self, EndpointName):
+        return {"ProductionVariants": [{"CurrentInstanceCount": 1}]}
+
+
+class FakeSageMakerRuntime:
+    """Local stand-in of an async endpoint with one instance that processes one request at a time."""
+
+    def __init__(self, s3):
+        self.s3 = s3
+        self.invocations = 0
+        self._instance = threading.Lock()
+
+    def invoke_endpoint_async(self, EndpointName, InputLocation, InferenceId, **kwargs):
+        self.invocations += 1
+        key = InputLocation.split("/", 3)[3]
+        output_key = f"output/{InferenceId}.out"
+        threading.Thread(target=self._process, args=(key, output_key), daemon=True).start()
+        return {
+            "InferenceId": InferenceId,
+            "OutputLocation": f"s3://{BUCKET}/{output_key}",
+            "FailureLocation": f"s3://{BUCKET}/output/{InferenceId}.failure",
+        }
+
+    def _process(self, key, output_key):
+        inputs = json.loads(self.s3.objects[key])["inputs"]
+        prompts = inputs if isinstance(inputs, list) else [inputs]
+        with self._instance:
+            time.sleep(REQUEST_SECONDS + PROMPT_SECONDS * len(prompts))
+        outputs = [[{"generated_text": f"Answer to {prompt}"}] for prompt in prompts]
+        self.s3.objects[output_key] = json.dumps(outputs if isinstance(inputs, list) else outputs[0]).encode("utf-8")
+
+
+def _run(name, batcher):
+    s3 = FakeS3()
+    runtime = FakeSageMakerRuntime(s3)
+    AWS_CLIENT_POOL._clients[("s3", REGION, None, ("default",))] = s3
+    AWS_CLIENT_POOL._clients[("sagemaker", REGION, None, ("default",))] = FakeSageMaker()
+    sagemaker_async_endpoint.ASYNC_INFERENCE_BATCHER = batcher
+    sagemaker_async_endpoint.ENDPOINT_STATES.invalidate()
+    llm = SagemakerAsyncEndpoint(
+        client=runtime,
+        endpoint_name="falcon-7b-async",
+        region_name=REGION,
+        content_handler=SageMakerModelItem.content_handler,
+        input_bucket=BUCKET,
+        input_prefix="input",
+    )
+    rng = random.Random(3)
+    delays = [rng.uniform(0, 1.0) for _ in range(SESSIONS)]
+
+    def session(index):
+        time.sleep(delays[index])
+        start_time = time.perf_counter()
+        answer = llm(f"question {index}")
+        assert answer == f"Answer to question {index}", answer
+        return (time.perf_counter() - start_time) * 1000
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+        milliseconds = sorted(executor.map(session, range(SESSIONS)))
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"{name:18} answer after mean {statistics.mean(milliseconds):6.0f} ms  "
+        f"p95 {milliseconds[int(len(milliseconds) * 0.95)]:6.0f} ms   all answered after {elapsed:4.1f} s   "
+        f"uploads {s3.puts:3d}  invocations {runtime.invocations:3d}"
+    )
+
+
+def main():
+    print(f"{SESSIONS} sessions within 1 s, {REQUEST_SECONDS * 1000:.0f} ms per request and {PROMPT_SECONDS * 1000:.0f} ms per prompt")
+    _run("one per prompt", None)
+    _run(
+        "micro-batches",
+        MicroBatcher(
+            sagemaker_async_endpoint._invoke_batch,
+            max_batch_size=8,
+            max_wait=0.05,
+            name="async_inference_batch",
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
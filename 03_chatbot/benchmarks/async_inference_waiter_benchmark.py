@@ -0,0 +1,166 @@
+""" Benchmark for the time until the result of an asynchronous SageMaker inference is read.
+
+20 concurrent requests take between 0.3 and 3 seconds on the stand-in endpoint. The
+stand-in S3 client counts requests and answers HEAD and GET for the objects that the
+endpoint has written so far. The benchmark compares the former fixed polling, a GET of
+the output and of the failure location every 2 seconds, with the waiter, polling with
+backoff and with notifications from a stand-in SQS queue.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/async_inference_waiter_benchmark.py
+"""
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# The benchmark prints its own summary instead of an EMF record per request
+os.environ.setdefault("LATENCY_METRICS_EMF", "false")
+
+from botocore.exceptions import ClientError  # noqa: E402
+from chatbot.helpers.async_inference_waiter import AsyncInferenceWaiter  # noqa: E402
+
+REQUESTS = 20
+BUCKET = "sagemaker-eu-west-1-123456789012"
+
+
+class FakeS3:
+    """Local stand-in of the S3 client that holds the outputs of the endpoint."""
+
+    def __init__(self):
+        self.objects = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _find(self, operation, key):
+        with self._lock:
+            self.requests += 1
+            if key not in self.objects:
+                raise ClientError({"Error": {"Code": "NoSuchKey"}}, operation)
+            return self.objects[key]
+
+    def head_object(self, Bucket, Key):
+        self._find("HeadObject", Key)
+        return {}
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self._find("GetObject", Key))}
+
+
+class FakeSQS:
+    """Local stand-in of the SQS queue subscribed to the notifications of the endpoint."""
+
+    def __init__(self):
+        self.messages = []
+        self._condition = threading.Condition()
+
+    def send(self, body):
+        with self._condition:
+            self.messages.append({"ReceiptHandle": str(len(self.messages)), "Body": json.dumps(body)})
+            self._condition.notify_all()
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds):
+        with self._condition:
+            self._condition.wait_for(lambda: self.messages, timeout=WaitTimeSeconds)
+            messages, self.messages = self.messages[:MaxNumberOfMessages], self.messages[MaxNumberOfMessages:]
+        return {"Messages": messages}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        pass
+
+
+def _endpoint(s3, sqs, inference_id, seconds):
+    """Writes the output like an asynchronous endpoint after seconds."""
+
+    def finish():
+        time.sleep(seconds)
+        s3.objects[f"output/{inference_id}.out"] = b'[{"generated_text": "Bern"}]'
+        if sqs:
+            sqs.send(
+                {
+                    "inferenceId": inference_id,
+                    "invocationStatus": "Completed",
+                    "responseParameters": {"outputLocation": f"s3://{BUCKET}/output/{inference_id}.out"},
+                }
+            )
+
+    threading.Thread(target=finish, daemon=True).start()
+
+
+def _fixed_polling(s3, inference_id):
+    while True:
+        for key in (f"output/{inference_id}.out", f"output/{inference_id}.failure"):
+            try:
+                body = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+                return body
+            except ClientError:
+                pass
+        time.sleep(2)
+
+
+def _run(name, durations, wait, s3, sqs=None):
+    def request(index):
+        start_time = time.perf_counter()
+        inference_id = f"{name}-{index}"
+        _endpoint(s3, sqs, inference_id, durations[index])
+        wait(inference_id)
+        return (time.perf_counter() - start_time - durations[index]) * 1000
+
+    with ThreadPoolExecutor(max_workers=REQUESTS) as executor:
+        overheads = sorted(executor.map(request, range(REQUESTS)))
+    print(
+        f"{name:22} waiting after the result mean {statistics.mean(overheads):6.0f} ms  "
+        f"p95 {overheads[int(len(overheads) * 0.95)]:6.0f} ms   S3 requests {s3.requests:4d}"
+    )
+
+
+def main():
+    rng = random.Random(5)
+    durations = [rng.uniform(0.3, 3.0) for _ in range(REQUESTS)]
+    print(f"{REQUESTS} concurrent requests of 0.3 to 3 seconds")
+
+    s3 = FakeS3()
+    _run("fixed polling", durations, lambda inference_id: _fixed_polling(s3, inference_id), s3)
+
+    s3 = FakeS3()
+    waiter = AsyncInferenceWaiter(lambda region: s3)
+    _run(
+        "polling with backoff",
+        durations,
+        lambda inference_id: waiter.wait(
+            inference_id,
+            f"s3://{BUCKET}/output/{inference_id}.out",
+            f"s3://{BUCKET}/output/{inference_id}.failure",
+            "eu-west-1",
+            timeout=30,
+        ),
+        s3,
+    )
+
+    s3 = FakeS3()
+    sqs = FakeSQS()
+    waiter = AsyncInferenceWaiter(lambda region: s3, sqs, "https://sqs.eu-west-1.amazonaws.com/123456789012/genie")
+    _run(
+        "notifications",
+        durations,
+        lambda inference_id: waiter.wait(
+            inference_id,
+            f"s3://{BUCKET}/output/{inference_id}.out",
+            f"s3://{BUCKET}/output/{inference_id}.failure",
+            "eu-west-1",
+            timeout=30,
+        ),
+        s3,
+        sqs,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+""" Benchmark for the time to get an Amazon Bedrock runtime client per turn.
+
+Before the client pool, the Bedrock model item created a session and a client on
+every turn. The benchmark compares that with the pooled client. Both use static
+credentials from the environment, so neither resolves credentials over the network,
+an assumed IAM role would add an STS call per turn without the pool.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/aws_client_pool_benchmark.py
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# The benchmark prints its own summary instead of an EMF record per client
+os.environ.setdefault("LATENCY_METRICS_EMF", "false")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+from chatbot.helpers import get_boto_session  # noqa: E402
+from chatbot.helpers.aws_client_pool import AWSClientPool  # noqa: E402
+
+TURNS = 100
+REGION = "eu-west-1"
+
+
+def _report(name, milliseconds, creations):
+    milliseconds.sort()
+    print(
+        f"{name:20} mean {statistics.mean(milliseconds):7.3f} ms  "
+        f"p95 {milliseconds[int(len(milliseconds) * 0.95)]:7.3f} ms  clients created {creations}"
+    )
+
+
+def main():
+    print(f"{TURNS} turns")
+
+    milliseconds = []
+    for _ in range(TURNS):
+        start_time = time.perf_counter()
+        get_boto_session(None, REGION).client("bedrock-runtime", REGION)
+        milliseconds.append((time.perf_counter() - start_time) * 1000)
+    _report("client per turn", milliseconds, TURNS)
+
+    pool = AWSClientPool()
+    milliseconds = []
+    for _ in range(TURNS):
+        start_time = time.perf_counter()
+        pool.get_client("bedrock-runtime", REGION)
+        milliseconds.append((time.perf_counter() - start_time) * 1000)
+    _report("pooled client", milliseconds, pool.stats()["client_creations"])
+
+
+if __name__ == "__main__":
+    main()
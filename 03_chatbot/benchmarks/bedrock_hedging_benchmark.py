@@ -0,0 +1,159 @@
+""" Benchmark for hedging Amazon Bedrock requests across two regions.
+
+Local stand-ins of the bedrock-runtime clients of two regions stream ten tokens 20 ms
+apart. The first token takes 100 ms in us-east-1 and 130 ms in us-west-2, but one
+request in ten stalls for 1.5 s before its first token and one in twenty is throttled.
+Pinned to us-east-1, a throttled request is retried after a backoff of 500 ms like the
+pooled client does. Hedged, the request goes to the next region after the 95th
+percentile of the recent times to first token, and at once when it is throttled.
+Only when both regions throttled it, it is retried like the pinned request.
+The latencies are scaled down, so the default hedge delay is 500 ms here instead of
+BEDROCK_HEDGE_DELAY.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/bedrock_hedging_benchmark.py
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# The benchmark prints its own summary instead of an EMF record per request
+os.environ.setdefault("LATENCY_METRICS_EMF", "false")
+
+from botocore.exceptions import ClientError  # noqa: E402
+from chatbot.helpers import Bedrock  # noqa: E402
+from chatbot.helpers.bedrock_hedging import HedgedBedrockClient, RegionLatencies  # noqa: E402
+from langchain.callbacks.base import BaseCallbackHandler  # noqa: E402
+
+REQUESTS = 200
+SESSIONS = 8
+MODEL_ID = "amazon.titan-text-express-v1"
+TOKENS = 10
+TOKEN_SECONDS = 0.02
+STALL_SECONDS = 1.5
+RETRY_SECONDS = 0.5
+
+
+class FakeStream:
+    """Stand-in of the event stream of a Bedrock response that can be closed."""
+
+    def __init__(self, first_token_seconds: float):
+        self.first_token_seconds = first_token_seconds
+        self.closed = False
+
+    def __iter__(self):
+        time.sleep(self.first_token_seconds)
+        for index in range(TOKENS):
+            if self.closed:
+                return
+            if index:
+                time.sleep(TOKEN_SECONDS)
+            yield {"chunk": {"bytes": json.dumps({"outputText": f" token{index}"}).encode("utf-8")}}
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBedrockRuntime:
+    """Local stand-in of the bedrock-runtime client of a region."""
+
+    def __init__(self, region: str, first_token_seconds: float, seed: int):
+        self.region = region
+        self.first_token_seconds = first_token_seconds
+        self.rng = random.Random(seed)
+        self.invocations = 0
+        self._lock = threading.Lock()
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        with self._lock:
+            self.invocations += 1
+            draw = self.rng.random()
+        if draw < 0.05:
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}},
+                "InvokeModelWithResponseStream",
+            )
+        stall = STALL_SECONDS if draw < 0.15 else 0
+        return {"body": FakeStream(self.first_token_seconds + stall), "contentType": "application/json"}
+
+
+class RetryingClient:
+    """A single-region client that retries throttled requests after a backoff."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        while True:
+            try:
+                return self.client.invoke_model_with_response_stream(**kwargs)
+            except ClientError:
+                time.sleep(RETRY_SECONDS)
+
+
+class FirstTokenHandler(BaseCallbackHandler):
+    def __init__(self):
+        self.first_token_at = None
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+
+def _regions():
+    return {
+        "us-east-1": FakeBedrockRuntime("us-east-1", 0.1, seed=1),
+        "us-west-2": FakeBedrockRuntime("us-west-2", 0.13, seed=2),
+    }
+
+
+def _run(name, regions, client):
+    llm = Bedrock(client=client, model_id=MODEL_ID, streaming=True)
+
+    def turn(_):
+        handler = FirstTokenHandler()
+        start_time = time.perf_counter()
+        answer = llm("question", callbacks=[handler])
+        assert answer.count("token") == TOKENS, answer
+        return (handler.first_token_at - start_time) * 1000
+
+    with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+        milliseconds = sorted(executor.map(turn, range(REQUESTS)))
+    invocations = sum(region.invocations for region in regions.values())
+    print(
+        f"{name:22} first token p50 {milliseconds[len(milliseconds) // 2]:6.0f} ms  "
+        f"p95 {milliseconds[int(len(milliseconds) * 0.95)]:6.0f} ms  "
+        f"p99 {milliseconds[int(len(milliseconds) * 0.99)]:6.0f} ms   "
+        f"invocations {invocations:4d} for {REQUESTS} answers"
+    )
+
+
+def main():
+    print(
+        f"{REQUESTS} answers of {SESSIONS} concurrent sessions, 10% of the requests stall "
+        f"{STALL_SECONDS * 1000:.0f} ms, 5% are throttled"
+    )
+    regions = _regions()
+    _run("pinned to us-east-1", regions, RetryingClient(regions["us-east-1"]))
+    regions = _regions()
+    _run(
+        "hedged across regions",
+        regions,
+        HedgedBedrockClient(
+            regions,
+            percentile=95,
+            default_delay=0.5,
+            latencies=RegionLatencies(),
+            retry_clients={region: RetryingClient(client) for region, client in regions.items()},
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+""" Microbenchmark for the per-turn overhead of compiling LangChain chains.
+
+Compares turns that compile their chain on every prompt with turns that reuse a chain
+from the process-wide chain cache. The LLM and retriever are local stubs, so the
+measured time is the overhead of the app itself and not of model inference.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/chain_cache_benchmark.py
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from langchain.llms.fake import FakeListLLM  # noqa: E402
+from langchain.memory import ChatMessageHistory  # noqa: E402
+from langchain.prompts import PromptTemplate  # noqa: E402
+from langchain.schema import BaseRetriever, Document  # noqa: E402
+
+from chatbot.llm_app import CHAIN_CACHE, RAGApp, SQLMRKLApp  # noqa: E402
+
+TURNS = 200
+SQL_TURNS = 20
+
+
+class StubRetriever(BaseRetriever):
+    """Retriever that returns the same documents for every query."""
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return [
+            Document(page_content=f"Document {i} about {query}", metadata={"title": f"Doc {i}", "source": f"https://example.com/{i}"})
+            for i in range(3)
+        ]
+
+
+def _rag_app(cache_key=None) -> RAGApp:
+    return RAGApp(
+        prompt=PromptTemplate.from_template("Context: {context}\nQuestion: {question}\nAnswer:"),
+        llm=FakeListLLM(responses=["Stub answer."]),
+        condense_question_prompt_template=PromptTemplate.from_template(
+            "{chat_history}\nFollow up: {question}\nStandalone question:"
+        ),
+        retriever=StubRetriever(),
+        cache_key=cache_key,
+    )
+
+
+def _sql_app(uri: str, cache_key=None) -> SQLMRKLApp:
+    return SQLMRKLApp(
+        prompt=PromptTemplate.from_template("{input}"),
+        llm=FakeListLLM(responses=["Final Answer: 42"]),
+        sql_connection_uri=uri,
+        sql_llm=FakeListLLM(responses=["SELECT 1"]),
+        cache_key=cache_key,
+    )
+
+
+def _time_turns(make_app, turns: int) -> List[float]:
+    history = ChatMessageHistory()
+    durations = []
+    for i in range(turns):
+        app = make_app()
+        # The agent apps switch on langchain.debug, keep its output out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            response = app.run_llm(f"Question number {i}?", history)
+            durations.append((time.perf_counter() - start) * 1000)
+        assert "Sorry" not in str(response), response
+    return durations
+
+
+def _report(name: str, durations: List[float]):
+    durations = sorted(durations)
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(
+        f"{name:<32} mean {statistics.mean(durations):8.3f} ms   "
+        f"p50 {statistics.median(durations):8.3f} ms   p95 {p95:8.3f} ms"
+    )
+
+
+def _create_sqlite_db(path: str, tables: int = 40):
+    connection = sqlite3.connect(path)
+    for i in range(tables):
+        connection.execute(
+            f"CREATE TABLE table_{i} (id INTEGER PRIMARY KEY, name TEXT, value REAL, created TEXT)"
+        )
+        connection.execute(f"INSERT INTO table_{i} VALUES (1, 'a', 1.0, '2024-01-01')")
+    connection.commit()
+    connection.close()
+
+
+def main():
+    print(f"RAGApp, {TURNS} turns")
+    _report("compile chain every turn", _time_turns(_rag_app, TURNS))
+    _report("chain cache", _time_turns(lambda: _rag_app(cache_key=("benchmark", "rag")), TURNS))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "benchmark.sqlite")
+        _create_sqlite_db(db_path)
+        uri = f"sqlite:///{db_path}"
+        print(f"\nSQLMRKLApp, {SQL_TURNS} turns")
+        _report("compile agent every turn", _time_turns(lambda: _sql_app(uri), SQL_TURNS))
+        _report(
+            "chain cache",
+            _time_turns(lambda: _sql_app(uri, cache_key=("benchmark", "sql")), SQL_TURNS),
+        )
+
+    print(f"\nChain cache: {CHAIN_CACHE.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+""" Benchmark for the DynamoDB write and read units of the chat history per turn.
+
+A conversation of 60 turns with answers of about 1,500 characters is stored once in
+one item per session, like LangChain's DynamoDBChatMessageHistory, which rewrites the
+item with every message and reads it on every turn, and once with one item per
+message. A local stand-in of the DynamoDB client counts the units: one write unit per
+started KB written and one read unit per started 4 KB read, like on-demand tables.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/chat_history_benchmark.py
+"""
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chatbot.helpers import dynamodb_message_history  # noqa: E402
+from chatbot.helpers.dynamodb_message_history import (  # noqa: E402
+    DynamoDBBatchWriter,
+    DynamoDBMessageHistory,
+)
+from langchain.schema.messages import AIMessage, HumanMessage, messages_to_dict  # noqa: E402
+
+TURNS = 60
+ANSWER_CHARACTERS = 1500
+ITEM_LIMIT_BYTES = 400 * 1024
+
+
+def _size(item) -> int:
+    return len(json.dumps(item).encode("utf-8"))
+
+
+class CountingClient:
+    """Local stand-in of the DynamoDB client that counts capacity units."""
+
+    def __init__(self):
+        self.items = []
+        self.write_units = 0
+        self.read_units = 0
+        self.calls = 0
+
+    def batch_write_item(self, RequestItems):
+        self.calls += 1
+        for requests in RequestItems.values():
+            for request in requests:
+                item = request["PutRequest"]["Item"]
+                self.write_units += math.ceil(_size(item) / 1024)
+                self.items.append(item)
+        return {}
+
+    def query(self, **kwargs):
+        self.calls += 1
+        session_id = kwargs["ExpressionAttributeValues"][":session_id"]["S"]
+        items = sorted(
+            (item for item in self.items if item["SessionId"]["S"] == session_id),
+            key=lambda item: int(item["Sequence"]["N"]),
+            reverse=True,
+        )[: kwargs["Limit"]]
+        self.read_units += math.ceil(sum(_size(item) for item in items) / 4096) or 1
+        return {"Items": items}
+
+
+def _turn(index):
+    return (
+        HumanMessage(content=f"Question {index} about the digital vignette?"),
+        AIMessage(content=("The digital vignette costs 40 francs. " * 60)[:ANSWER_CHARACTERS]),
+    )
+
+
+def main():
+    print(f"{TURNS} turns with answers of {ANSWER_CHARACTERS} characters")
+
+    messages = []
+    write_units = read_units = calls = 0
+    largest = 0
+    for index in range(TURNS):
+        # Read the whole item, then rewrite it after the question and after the answer
+        item_size = _size(messages_to_dict(messages))
+        read_units += math.ceil(item_size / 4096) or 1
+        calls += 1
+        for message in _turn(index):
+            messages.append(message)
+            item_size = _size(messages_to_dict(messages))
+            write_units += math.ceil(item_size / 1024)
+            calls += 1
+            largest = max(largest, item_size)
+    print(
+        f"{'one item per session':24} write units {write_units:6d}   read units {read_units:5d}   "
+        f"calls {calls:4d}   largest item {largest / 1024:6.1f} KB"
+        + ("   exceeds the 400 KB item limit" if largest > ITEM_LIMIT_BYTES else "")
+    )
+
+    client = CountingClient()
+    dynamodb_message_history._clients[None] = client
+    writer = DynamoDBBatchWriter(flush_interval=3600)
+    history = DynamoDBMessageHistory("memory", "session", max_messages=10, ttl_seconds=86400, writer=writer)
+    for index in range(TURNS):
+        # Every turn reads the history, only the first read queries the table
+        history.messages
+        for message in _turn(index):
+            history.add_message(message)
+        if index % 5 == 4:
+            # About one flush per five turns when users type for a few seconds
+            writer.flush()
+    writer.flush()
+    largest = max(_size(item) for item in client.items)
+    print(
+        f"{'one item per message':24} write units {client.write_units:6d}   read units {client.read_units:5d}   "
+        f"calls {client.calls:4d}   largest item {largest / 1024:6.1f} KB"
+    )
+
+
+if __name__ == "__main__":
+    main()
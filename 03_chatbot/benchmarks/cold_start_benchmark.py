@@ -0,0 +1,190 @@
+""" Benchmark for the time until the first session can use the chatbot after a restart.
+
+Compares a restart with live discovery of the catalogs, the app config and the prompts
+with a restart from the catalog snapshot of the previous run. Live discovery calls a
+local stand-in of the AWS APIs that sleeps API_LATENCY_SECONDS per call, so the catalogs
+are real catalogs with real items and the same fan out as in production. The catalogs
+use the process-wide resource discovery like in production, with a stand-in of the
+Resource Groups Tagging API.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/cold_start_benchmark.py
+"""
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chatbot.catalog import (  # noqa: E402
+    CatalogStore,
+    FlowCatalog,
+    KendraRetrieverItem,
+    MemoryCatalog,
+    ModelCatalog,
+    PromptCatalog,
+    SageMakerModelItem,
+)
+from chatbot.catalog import resource_discovery  # noqa: E402
+from chatbot.catalog.catalog import FRIENDLY_NAME_TAG, fan_out  # noqa: E402
+from chatbot.catalog.catalog_snapshot import CatalogSnapshot  # noqa: E402
+from chatbot.catalog.resource_discovery import (  # noqa: E402
+    MEMORY_TABLE_TAG,
+    TaggedResource,
+    TaggingApiResourceDiscovery,
+)
+from chatbot.catalog.retriever_catalog import RetrieverCatalog  # noqa: E402
+from chatbot.config import AppConfigProvider  # noqa: E402
+
+API_LATENCY_SECONDS = 0.08
+REGIONS = ["eu-west-1", "us-east-1"]
+INDICES_PER_REGION = 8
+ENDPOINTS_PER_REGION = 6
+PROMPTS = [
+    "prompts/anthropic_claude_chat.yaml",
+    "prompts/anthropic_claude_rag.yaml",
+    "prompts/condense_question.yaml",
+    "prompts/falcon_chat.yaml",
+    "prompts/default_chat.yaml",
+    "prompts/default_rag.yaml",
+]
+
+
+def _aws_call(result=None):
+    time.sleep(API_LATENCY_SECONDS)
+    return result
+
+
+class SimulatedTaggingApiResourceDiscovery(TaggingApiResourceDiscovery):
+    """One GetResources page per query, with a memory table per region."""
+
+    def _query(self, region, tag_key):
+        _aws_call()
+        with self._lock:
+            self.pages += 1
+        if tag_key != MEMORY_TABLE_TAG:
+            return []
+        return [TaggedResource(f"arn:aws:dynamodb:{region}:123456789012:table/memory", {tag_key: "True"})]
+
+
+class SimulatedRetrieverCatalog(RetrieverCatalog):
+    """Kendra discovery: tagged indices, list indices and data sources per index."""
+
+    def bootstrap(self) -> None:
+        fan_out(
+            {
+                region: partial(self.discovery.get_resources, region, FRIENDLY_NAME_TAG, "kendra:index")
+                for region in self.regions
+            },
+            self.logger,
+            "Tagged indices",
+        )
+        fan_out({region: _aws_call for region in self.regions}, self.logger, "List indices")
+        data_sources = fan_out(
+            {
+                (region, i): partial(_aws_call, [{"Id": f"ds-{i}", "Name": f"Source {i}", "Status": "ACTIVE"}])
+                for region in self.regions
+                for i in range(INDICES_PER_REGION)
+            },
+            self.logger,
+            "Data sources",
+        )
+        for (region, i), sources in data_sources.items():
+            self.append(KendraRetrieverItem(f"Index {region} {i}", f"index-{i}", sources, region))
+
+
+class SimulatedModelCatalog(ModelCatalog):
+    """SageMaker discovery: tagged endpoints and describe endpoint per endpoint."""
+
+    def bootstrap(self) -> None:
+        fan_out({region: _aws_call for region in self.regions}, self.logger, "Tagged endpoints")
+        endpoints = fan_out(
+            {(region, i): _aws_call for region in self.regions for i in range(ENDPOINTS_PER_REGION)},
+            self.logger,
+            "Describe endpoints",
+        )
+        for region, i in endpoints:
+            self.append(SageMakerModelItem(f"Model {i}", f"endpoint-{i}", region=region))
+
+
+def _quiet_logger():
+    import logging
+
+    logger = logging.getLogger("ColdStartBenchmark")
+    logger.setLevel(logging.WARNING)
+    return logger
+
+
+def _load_app_config():
+    _aws_call()  # AWS AppConfig
+    return AppConfigProvider(None, None, None)
+
+
+def _first_session(store: CatalogStore):
+    """Loads everything that the first session needs, like chatbot_app and sidebar do."""
+    app_config = store.get_value(("app_config",), _load_app_config)
+    store.get_value(("aws_account_id",), partial(_aws_call, "123456789012"))
+    store.get_value(("prompt",), partial(PromptCatalog.preloaded, PROMPTS))
+    loaders = {
+        ("flow",): lambda: FlowCatalog(
+            "123456789012", REGIONS, _quiet_logger(), app_config.config.flow_config.parameters.flows
+        ),
+        ("retriever",): lambda: SimulatedRetrieverCatalog(
+            "123456789012", REGIONS, app_config, _quiet_logger()
+        ),
+        ("model",): lambda: SimulatedModelCatalog(
+            REGIONS, [], app_config.config.llm_config.parameters, _quiet_logger()
+        ),
+        ("memory",): lambda: MemoryCatalog("123456789012", REGIONS, _quiet_logger()),
+    }
+    # The sidebar bootstraps the catalogs one after the other
+    for key, factory in loaders.items():
+        store.get_view(key, factory)
+
+
+def _wait_for(condition, timeout=60):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError()
+        time.sleep(0.005)
+    return time.perf_counter() - start
+
+
+def main():
+    print(
+        f"{len(REGIONS)} regions, {INDICES_PER_REGION} indices and {ENDPOINTS_PER_REGION} endpoints "
+        f"per region, {API_LATENCY_SECONDS * 1000:.0f} ms per AWS API call"
+    )
+    # The process-wide discovery of the catalogs, it holds locks and is not part of the snapshot
+    resource_discovery._resource_discovery = SimulatedTaggingApiResourceDiscovery(logger=_quiet_logger())
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot = CatalogSnapshot(os.path.join(directory, "snapshot.pickle"), _quiet_logger())
+
+        live_store = CatalogStore(snapshot=snapshot)
+        start = time.perf_counter()
+        _first_session(live_store)
+        live_seconds = time.perf_counter() - start
+        _wait_for(lambda: os.path.exists(snapshot.path) and not live_store._snapshot_writing)
+        print(f"live discovery       first session ready after {live_seconds * 1000:8.1f} ms")
+        print(f"snapshot file size   {os.path.getsize(snapshot.path) / 1024:8.1f} KiB")
+
+        # A new store is a restarted container that finds the snapshot of the previous run
+        restarted_store = CatalogStore(snapshot=snapshot)
+        start = time.perf_counter()
+        _first_session(restarted_store)
+        snapshot_seconds = time.perf_counter() - start
+        reconcile_seconds = _wait_for(lambda: restarted_store.stats().refreshes == 7)
+        print(f"snapshot             first session ready after {snapshot_seconds * 1000:8.1f} ms")
+        print(f"                     {restarted_store.stats().snapshot_hits} lookups answered from the snapshot")
+        print(
+            f"                     background reconcile done {reconcile_seconds * 1000:8.1f} ms later"
+        )
+        print(f"speedup              {live_seconds / snapshot_seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
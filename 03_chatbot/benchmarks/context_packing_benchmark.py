@@ -0,0 +1,120 @@
+""" Benchmark for packing retrieved documents into the token budget of a model.
+
+Every question retrieves between 2 and 10 documents of very different lengths. The
+fixed character limit cuts every document at maxCharacterLimit characters, so the
+prompt overflows the context window if many long documents are retrieved and wastes it
+if few short ones are. The packer fills the context window with the best documents
+instead. The stand-in tokenizer takes a few milliseconds per call like a tokenizer of
+a Hugging Face model, the packer only calls it close to the budget.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/context_packing_benchmark.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chatbot.helpers.context_packer import (  # noqa: E402
+    ContextBudget,
+    ContextPacker,
+    TokenCounter,
+    trim_to_characters,
+)
+from langchain.schema import Document  # noqa: E402
+
+QUESTIONS = 300
+CONTEXT_WINDOW = 8192
+ANSWER_TOKENS = 512
+MAX_CHARACTER_LIMIT = 10000
+TOKENIZER_SECONDS = 0.003
+VOCABULARY = (
+    "the federal council decided on measures to reduce energy prices for households and "
+    "companies while the parliament discusses the budget of the next year in its session"
+).split()
+
+
+class SlowTokenizerLLM:
+    """Stand-in of a model whose tokenizer is slow, about 4.2 characters per token."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_num_tokens(self, text):
+        self.calls += 1
+        time.sleep(TOKENIZER_SECONDS)
+        return int(len(text) / 4.2) + 1
+
+
+def _document(rng):
+    sentences = []
+    for _ in range(rng.choice([3, 10, 40, 120])):
+        words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 25))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return Document(page_content=" ".join(sentences))
+
+
+def _questions(rng):
+    prompt = "Answer the question from the documents.\n" + " ".join(
+        rng.choice(VOCABULARY) for _ in range(rng.randint(20, 400))
+    )
+    return prompt, [_document(rng) for _ in range(rng.randint(2, 10))]
+
+
+def _report(name, llm, results, milliseconds):
+    overflows = sum(1 for tokens in results if tokens > CONTEXT_WINDOW)
+    used = [min(tokens, CONTEXT_WINDOW) / CONTEXT_WINDOW for tokens in results]
+    milliseconds.sort()
+    print(
+        f"{name:28} prompt overflows {overflows:4d} of {len(results)}   context used "
+        f"{statistics.mean(used):5.2f}   counting mean {statistics.mean(milliseconds):6.2f} ms  "
+        f"p95 {milliseconds[int(len(milliseconds) * 0.95)]:6.2f} ms   tokenizer calls {llm.calls}"
+    )
+
+
+def main():
+    rng = random.Random(15)
+    questions = [_questions(rng) for _ in range(QUESTIONS)]
+    print(f"{QUESTIONS} questions, context window {CONTEXT_WINDOW} tokens, {ANSWER_TOKENS} for the answer")
+
+    llm = SlowTokenizerLLM()
+    results, milliseconds = [], []
+    for prompt, documents in questions:
+        start_time = time.perf_counter()
+        kept = [trim_to_characters(document.page_content, MAX_CHARACTER_LIMIT) for document in documents]
+        milliseconds.append((time.perf_counter() - start_time) * 1000)
+        results.append(llm.get_num_tokens(prompt + "".join(kept)) + ANSWER_TOKENS)
+    llm.calls = 0
+    _report(f"maxCharacterLimit {MAX_CHARACTER_LIMIT}", llm, results, milliseconds)
+
+    llm = SlowTokenizerLLM()
+    packer = ContextPacker(ContextBudget(context_window=CONTEXT_WINDOW, answer_tokens=ANSWER_TOKENS), TokenCounter(llm))
+    results, milliseconds = [], []
+    for prompt, documents in questions:
+        start_time = time.perf_counter()
+        packed, _ = packer.pack(documents, prompt)
+        milliseconds.append((time.perf_counter() - start_time) * 1000)
+        calls = llm.calls
+        results.append(llm.get_num_tokens(prompt + "".join(d.page_content for d in packed)) + ANSWER_TOKENS)
+        llm.calls = calls
+    _report("token budget packer", llm, results, milliseconds)
+
+    llm = SlowTokenizerLLM()
+    results, milliseconds = [], []
+    for prompt, documents in questions:
+        start_time = time.perf_counter()
+        budget = CONTEXT_WINDOW - ANSWER_TOKENS - llm.get_num_tokens(prompt)
+        tokens = 0
+        for document in documents:
+            tokens += llm.get_num_tokens(document.page_content)
+        milliseconds.append((time.perf_counter() - start_time) * 1000)
+        results.append(min(tokens, budget) + CONTEXT_WINDOW - budget)
+    _report("exact counts of every text", llm, results, milliseconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+""" Benchmark for the history tokens that the conversation memory passes to the model.
+
+A conversation of 30 turns alternates short answers with answers of about 4,000
+characters. The window of the last three turns passes whatever these turns add up
+to, the token-bounded memory at most its budget: the recent messages that fit and a
+summary of the older ones. The stand-in summarizer takes 800 ms like a remote model
+call, the benchmark shows that the turns do not wait for it.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/conversation_memory_benchmark.py
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chatbot.helpers.context_packer import TokenCounter  # noqa: E402
+from chatbot.helpers.conversation_memory import TokenBudgetSummaryMemory  # noqa: E402
+from langchain.llms.fake import FakeListLLM  # noqa: E402
+from langchain.memory import ConversationBufferWindowMemory  # noqa: E402
+from langchain_community.chat_message_histories import StreamlitChatMessageHistory  # noqa: E402
+from langchain.schema.messages import get_buffer_string  # noqa: E402
+
+TURNS = 30
+MAX_TOKENS = 2000
+SUMMARY_SECONDS = 0.8
+
+
+class SlowSummarizer(FakeListLLM):
+    """Local stand-in of the chat model that summarizes."""
+
+    def _call(self, *args, **kwargs):
+        time.sleep(SUMMARY_SECONDS)
+        return "The user asks about the digital vignette, its price and where to buy it. " * 3
+
+
+def _turn(index):
+    answer = "The digital vignette costs 40 francs and is valid for one year. "
+    return (
+        {"question": f"Question {index} about the digital vignette?"},
+        {"answer": answer * (60 if index % 2 else 1)},
+    )
+
+
+def _run(name, memory, counter):
+    tokens = []
+    milliseconds = []
+    for index in range(TURNS):
+        start_time = time.perf_counter()
+        history = memory.load_memory_variables({})["chat_history"]
+        inputs, outputs = _turn(index)
+        memory.save_context(inputs, outputs)
+        milliseconds.append((time.perf_counter() - start_time) * 1000)
+        tokens.append(counter.count(get_buffer_string(history)))
+        # The user reads the answer before asking the next question
+        time.sleep(SUMMARY_SECONDS * 1.5)
+    print(
+        f"{name:16} history tokens mean {statistics.mean(tokens):6.0f}  max {max(tokens):6d}   "
+        f"memory per turn mean {statistics.mean(milliseconds):5.1f} ms"
+    )
+
+
+def main():
+    llm = SlowSummarizer(responses=[""])
+    counter = TokenCounter(llm)
+    print(f"{TURNS} turns, token budget {MAX_TOKENS}, summary call {SUMMARY_SECONDS * 1000:.0f} ms")
+    _run(
+        "window of 3",
+        ConversationBufferWindowMemory(
+            memory_key="chat_history",
+            chat_memory=StreamlitChatMessageHistory(key="window"),
+            return_messages=True,
+            k=3,
+            output_key="answer",
+        ),
+        counter,
+    )
+    _run(
+        "token budget",
+        TokenBudgetSummaryMemory(
+            llm=llm,
+            token_counter=counter,
+            memory_key="chat_history",
+            chat_memory=StreamlitChatMessageHistory(key="summary"),
+            return_messages=True,
+            output_key="answer",
+            max_tokens=MAX_TOKENS,
+        ),
+        counter,
+    )
+
+
+if __name__ == "__main__":
+    main()
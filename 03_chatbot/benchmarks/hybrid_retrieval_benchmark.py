@@ -0,0 +1,211 @@
+""" Benchmark for recall and latency of hybrid BM25 and k-NN retrieval.
+
+An in-memory stand-in of an OpenSearch index holds synthetic filings. Every filing
+carries an identifier like a ticker or an article number and talks about a few topics
+in varying words. The stand-in embedding maps words to topics, like an embedding model
+maps synonyms close together, but does not represent identifiers. Two kinds of
+questions are asked:
+
+- exact: names the identifier of the filing and one topic, BM25 finds these.
+- paraphrase: describes the topics of the filing in other words, k-NN finds these.
+
+Every search sleeps like a round trip to OpenSearch, the k-NN search also like a
+query embedding call, so the latency shows the effect of running both concurrently.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/hybrid_retrieval_benchmark.py
+"""
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import zlib
+from collections import Counter, defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chatbot.open_search.hybrid_search import HybridSearchConfig, fuse, hybrid_search  # noqa: E402
+from langchain.schema import Document  # noqa: E402
+
+LEXICAL_LATENCY_SECONDS = 0.015
+VECTOR_LATENCY_SECONDS = 0.025
+DOCUMENTS = 3000
+QUESTIONS = 200
+K = 3
+DIMENSIONS = 128
+TOPICS = [
+    ["revenue", "sales", "turnover"],
+    ["profit", "earnings", "income"],
+    ["debt", "liabilities", "borrowing"],
+    ["risk", "exposure", "uncertainty"],
+    ["growth", "expansion", "increase"],
+    ["dividend", "payout", "distribution"],
+    ["merger", "acquisition", "takeover"],
+    ["lawsuit", "litigation", "dispute"],
+    ["employees", "workforce", "staff"],
+    ["cloud", "datacenter", "hosting"],
+    ["retail", "stores", "shops"],
+    ["energy", "power", "electricity"],
+    ["shipping", "logistics", "delivery"],
+    ["advertising", "marketing", "promotion"],
+    ["research", "development", "innovation"],
+    ["tax", "levy", "duty"],
+    ["inflation", "prices", "costs"],
+    ["guidance", "outlook", "forecast"],
+    ["buyback", "repurchase", "redemption"],
+    ["regulation", "compliance", "oversight"],
+    ["currency", "exchange", "forex"],
+    ["subscription", "membership", "plan"],
+    ["hardware", "devices", "equipment"],
+    ["security", "protection", "safety"],
+    ["pharma", "drugs", "medicine"],
+]
+FILLER = ["the", "company", "reported", "about", "its", "in", "quarter", "and", "noted", "the", "period"]
+WORD_TOPIC = {word: topic for topic, words in enumerate(TOPICS) for word in words}
+
+
+class InMemoryIndex:
+    """Stand-in of an OpenSearch index with BM25 and exact k-NN search."""
+
+    def __init__(self, documents, k1=1.2, b=0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.terms = [Counter(_tokenize(document.page_content)) for document in documents]
+        self.lengths = [sum(terms.values()) for terms in self.terms]
+        self.average_length = sum(self.lengths) / len(self.lengths)
+        self.postings = defaultdict(list)
+        for position, terms in enumerate(self.terms):
+            for term in terms:
+                self.postings[term].append(position)
+        self.vectors = np.stack([_embed(document.page_content) for document in documents])
+
+    def lexical_search(self, query, k):
+        time.sleep(LEXICAL_LATENCY_SECONDS)
+        scores = defaultdict(float)
+        for term in set(_tokenize(query)):
+            postings = self.postings.get(term, [])
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position in postings:
+                frequency = self.terms[position][term]
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / self.average_length)
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [(self.documents[position], score) for position, score in best]
+
+    def vector_search(self, query, k):
+        time.sleep(VECTOR_LATENCY_SECONDS)
+        similarities = self.vectors @ _embed(query)
+        best = np.argsort(-similarities)[:k]
+        return [(self.documents[position], float(similarities[position])) for position in best]
+
+
+def _tokenize(text):
+    return [token.strip("?.,:").lower() for token in text.split()]
+
+
+def _embed(text):
+    vector = np.zeros(DIMENSIONS)
+    for token in _tokenize(text):
+        if token in WORD_TOPIC:
+            vector[WORD_TOPIC[token]] += 1.0
+        elif not any(character.isdigit() for character in token):
+            # Other words only add a little noise, identifiers are not represented
+            vector[len(TOPICS) + zlib.crc32(token.encode()) % (DIMENSIONS - len(TOPICS))] += 0.1
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def _corpus(rng):
+    documents = []
+    for number in range(DOCUMENTS):
+        identifier = f"{''.join(rng.choice('ABCDEFGHKMNPRSTXZ') for _ in range(3))}-{number:04d}"
+        topics = rng.sample(range(len(TOPICS)), 3)
+        words = [rng.choice(TOPICS[topic]) for topic in topics] + rng.sample(FILLER, 5)
+        rng.shuffle(words)
+        documents.append(
+            (
+                Document(
+                    page_content=f"Filing {identifier}: " + " ".join(words),
+                    metadata={"source": f"s3://filings/{identifier}.pdf"},
+                ),
+                identifier,
+                topics,
+                words,
+            )
+        )
+    return documents
+
+
+def _questions(rng, corpus):
+    questions = []
+    for document, identifier, topics, words in rng.sample(corpus, QUESTIONS):
+        if len(questions) % 2 == 0:
+            question = f"What did {identifier} say about {rng.choice(TOPICS[topics[0]])}?"
+            questions.append(("exact", question, document))
+        else:
+            # Other words for the same topics
+            synonyms = [rng.choice([word for word in TOPICS[topic] if word not in words]) for topic in topics]
+            questions.append(("paraphrase", f"Which filing covers {' and '.join(synonyms)}?", document))
+    return questions
+
+
+def _run(name, search, questions):
+    hits = defaultdict(list)
+    latencies = []
+    for kind, question, relevant in questions:
+        start = time.perf_counter()
+        docs = search(question)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = relevant.metadata["source"] in {doc.metadata["source"] for doc in docs}
+        hits[kind].append(found)
+        hits["all"].append(found)
+    recall = {kind: sum(values) / len(values) for kind, values in hits.items()}
+    latencies.sort()
+    print(
+        f"{name:22} recall@{K} {recall['all']:5.2f} (exact {recall['exact']:4.2f}, "
+        f"paraphrase {recall['paraphrase']:4.2f})   latency mean {statistics.mean(latencies):6.1f} ms"
+        f"  p95 {latencies[int(len(latencies) * 0.95)]:6.1f} ms"
+    )
+
+
+def main():
+    rng = random.Random(7)
+    corpus = _corpus(rng)
+    index = InMemoryIndex([document for document, *_ in corpus])
+    questions = _questions(rng, corpus)
+    print(
+        f"{DOCUMENTS} documents, {QUESTIONS} questions, {LEXICAL_LATENCY_SECONDS * 1000:.0f} ms per "
+        f"BM25 query, {VECTOR_LATENCY_SECONDS * 1000:.0f} ms per embedding and k-NN query"
+    )
+
+    def sequential(question):
+        # Both queries one after the other, for comparison with the concurrent hybrid search
+        config = HybridSearchConfig(enabled=True)
+        lexical = index.lexical_search(question, config.num_candidates(K))
+        vector = index.vector_search(question, config.num_candidates(K))
+        return [document for document, _ in fuse(lexical, vector, config)[:K]]
+
+    _run("k-NN only", lambda question: [doc for doc, _ in index.vector_search(question, K)], questions)
+    _run("BM25 only", lambda question: [doc for doc, _ in index.lexical_search(question, K)], questions)
+    _run("hybrid rrf sequential", sequential, questions)
+    for name, config in {
+        "hybrid rrf": HybridSearchConfig(enabled=True),
+        "hybrid rrf 0.3 BM25": HybridSearchConfig(enabled=True, lexical_weight=0.3),
+        "hybrid weighted": HybridSearchConfig(enabled=True, fusion="weighted"),
+        "hybrid weighted 0.3": HybridSearchConfig(enabled=True, fusion="weighted", lexical_weight=0.3),
+    }.items():
+        _run(
+            name,
+            lambda question: hybrid_search(question, K, index.lexical_search, index.vector_search, config),
+            questions,
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+""" Benchmark for the client-side rate limiter under a burst of requests.
+
+A local stand-in of the bedrock-runtime client enforces a quota of 120 requests per
+minute like Amazon Bedrock: a bucket of 120 requests that refills with 2 requests per
+second, requests beyond it are throttled. 60 sessions send 4 questions each within one
+second, every answer takes 200 ms. The benchmark compares:
+
+- retries: the client retries a throttled request up to 4 attempts with exponential
+  backoff and jitter, like the pooled clients without budgets.
+- rate limiter: requestsPerMinute of 120, at most 20 waiting requests. Requests that do
+  not fit into the queue are rejected at once with the expected wait.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/rate_limiter_benchmark.py
+"""
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# The benchmark prints its own summary instead of an EMF record per request
+os.environ.setdefault("LATENCY_METRICS_EMF", "false")
+
+from botocore.exceptions import ClientError  # noqa: E402
+from chatbot.helpers.rate_limiter import (  # noqa: E402
+    RATE_LIMIT_OWNER,
+    RateLimitedBedrockClient,
+    RateLimiter,
+    RateLimitExceeded,
+)
+
+QUOTA_PER_MINUTE = 120
+SESSIONS = 60
+QUESTIONS = 4
+ANSWER_SECONDS = 0.2
+MAX_ATTEMPTS = 4
+BODY = json.dumps({"inputText": "question", "textGenerationConfig": {"maxTokenCount": 256}})
+
+
+class FakeBedrockRuntime:
+    """Local stand-in of the bedrock-runtime client with a requests per minute quota."""
+
+    def __init__(self):
+        self.level = QUOTA_PER_MINUTE
+        self.updated = time.monotonic()
+        self.calls = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, **kwargs):
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(QUOTA_PER_MINUTE, self.level + (now - self.updated) * QUOTA_PER_MINUTE / 60)
+            self.updated = now
+            self.calls += 1
+            if self.level < 1:
+                self.throttled += 1
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "InvokeModel")
+            self.level -= 1
+        time.sleep(ANSWER_SECONDS)
+        return {"body": io.BytesIO(b'{"results": [{"outputText": "answer"}]}'), "ResponseMetadata": {}}
+
+
+class RetryingClient:
+    """A client that retries throttled requests with exponential backoff and jitter."""
+
+    def __init__(self, client):
+        self.client = client
+        self.rng = random.Random(5)
+
+    def invoke_model(self, **kwargs):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                return self.client.invoke_model(**kwargs)
+            except ClientError:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                time.sleep(self.rng.uniform(0, 0.5 * 2**attempt))
+
+
+def _run(name, service, client):
+    answered, rejected, failed = [], [], []
+    lock = threading.Lock()
+
+    def session(index):
+        RATE_LIMIT_OWNER.set(f"session-{index}")
+        time.sleep(index / SESSIONS)
+        for _ in range(QUESTIONS):
+            start_time = time.perf_counter()
+            try:
+                client.invoke_model(body=BODY, modelId="amazon.titan-text-express-v1")
+                outcome = answered
+            except RateLimitExceeded:
+                outcome = rejected
+            except ClientError:
+                outcome = failed
+            with lock:
+                outcome.append((time.perf_counter() - start_time) * 1000)
+
+    with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+        list(executor.map(session, range(SESSIONS)))
+    answered.sort()
+    print(
+        f"{name:13} answered {len(answered):3d} (p50 {answered[len(answered) // 2]:6.0f} ms, "
+        f"p95 {answered[int(len(answered) * 0.95)]:6.0f} ms)  "
+        f"rejected {len(rejected):3d} (mean {sum(rejected) / max(1, len(rejected)):4.0f} ms)  "
+        f"failed {len(failed):3d} (mean {sum(failed) / max(1, len(failed)):5.0f} ms)  "
+        f"requests sent {service.calls:3d}, throttled {service.throttled:3d}"
+    )
+
+
+def main():
+    print(f"{SESSIONS * QUESTIONS} questions of {SESSIONS} sessions, quota of {QUOTA_PER_MINUTE} requests per minute")
+    service = FakeBedrockRuntime()
+    _run("retries", service, RetryingClient(service))
+    service = FakeBedrockRuntime()
+    limiter = RateLimiter("benchmark", requests_per_minute=QUOTA_PER_MINUTE, max_queue=20, max_wait=60)
+    _run("rate limiter", service, RateLimitedBedrockClient(service, limiter, max_attempts=MAX_ATTEMPTS))
+
+
+if __name__ == "__main__":
+    main()
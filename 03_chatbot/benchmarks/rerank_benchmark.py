@@ -0,0 +1,127 @@
+""" Benchmark for the added latency and the saved prompt tokens of the rerank stage.
+
+Every question has one relevant passage among the candidates of the retriever. The
+stand-in retriever ranks it anywhere among the candidates, like a vector search that
+finds the right passage but not at the top. Without reranking, the prompt gets the
+first candidates, with reranking it gets the best candidates after the rerank stage.
+The embedding reranker uses a local hashing embedding, the cross-encoder reranker
+only runs if sentence-transformers is installed.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/rerank_benchmark.py
+"""
+import importlib.util
+import os
+import random
+import statistics
+import sys
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# The benchmark prints its own summary instead of an EMF record per rerank
+os.environ.setdefault("LATENCY_METRICS_EMF", "false")
+
+from chatbot.helpers.reranker import (  # noqa: E402
+    CrossEncoderReranker,
+    EmbeddingReranker,
+    LexicalReranker,
+    RerankConfig,
+    RerankStage,
+    approximate_num_tokens,
+)
+from langchain.schema import Document  # noqa: E402
+from langchain.schema.embeddings import Embeddings  # noqa: E402
+
+QUESTIONS = 200
+KEEP = 3
+WORDS_PER_PASSAGE = 180
+SUBJECTS = [
+    "digital vignette", "customs tariffs", "asylum procedure", "pension reform", "energy prices",
+    "railway expansion", "vaccination campaign", "research funding", "export controls", "wildfire",
+    "humanitarian aid", "tax treaty", "cyber security", "water quality", "tourism statistics",
+]
+VOCABULARY = (
+    "the federal council government canton office report measure decision citizens economy "
+    "week year new agreement support program public national international minister parliament "
+    "announced increase reduce plan project meeting budget law change service region data"
+).split()
+
+
+class HashingEmbeddings(Embeddings):
+    """Local stand-in of an embedding model."""
+
+    def _embed(self, text):
+        vector = np.zeros(256)
+        for token in text.lower().split():
+            vector[zlib.crc32(token.encode()) % 256] += 1.0
+        return list(vector / (np.linalg.norm(vector) or 1.0))
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def _passage(rng, subject):
+    words = [rng.choice(VOCABULARY) for _ in range(WORDS_PER_PASSAGE)]
+    for _ in range(6):
+        words.insert(rng.randrange(len(words)), subject)
+    return " ".join(words) + "."
+
+
+def _candidates(rng, candidates):
+    subject = rng.choice(SUBJECTS)
+    relevant = Document(page_content=_passage(rng, subject), metadata={"relevant": True})
+    # Distractors share the vocabulary but talk about other subjects
+    documents = [
+        Document(page_content=_passage(rng, rng.choice([other for other in SUBJECTS if other != subject])))
+        for _ in range(candidates - 1)
+    ]
+    documents.insert(rng.randrange(candidates), relevant)
+    return f"What is new about the {subject}?", documents
+
+
+def _run(name, stage, questions, keep=KEEP):
+    hits, latencies, saved, prompt_tokens = [], [], [], []
+    for question, documents in questions:
+        if stage is None:
+            kept = documents[:keep]
+            latencies.append(0.0)
+            saved.append(sum(approximate_num_tokens(document.page_content) for document in documents[keep:]))
+        else:
+            kept, report = stage.run(question, documents)
+            latencies.append(report.milliseconds)
+            saved.append(report.tokens_saved)
+        hits.append(any(document.metadata.get("relevant") for document in kept))
+        prompt_tokens.append(sum(approximate_num_tokens(document.page_content) for document in kept))
+    latencies.sort()
+    print(
+        f"{name:26} relevant in prompt {sum(hits) / len(hits):5.2f}   added latency mean "
+        f"{statistics.mean(latencies):6.2f} ms  p95 {latencies[int(len(latencies) * 0.95)]:6.2f} ms   "
+        f"prompt tokens {statistics.mean(prompt_tokens):6.0f}   tokens saved {statistics.mean(saved):6.0f}"
+    )
+
+
+def main():
+    rng = random.Random(11)
+    config = RerankConfig(enabled=True, over_fetch=5)
+    candidates = config.num_candidates(KEEP)
+    questions = [_candidates(rng, candidates) for _ in range(QUESTIONS)]
+    print(f"{QUESTIONS} questions, {candidates} candidates, keeping {KEEP}")
+
+    _run(f"top {KEEP} of the retriever", None, questions)
+    _run(f"top {candidates} of the retriever", None, questions, keep=candidates)
+    _run("lexical reranker", RerankStage(LexicalReranker(), KEEP), questions)
+    _run("embedding reranker", RerankStage(EmbeddingReranker(HashingEmbeddings()), KEEP), questions)
+    if importlib.util.find_spec("sentence_transformers") is None:
+        print("cross-encoder reranker     skipped, sentence-transformers is not installed")
+        return
+    _run("cross-encoder reranker", RerankStage(CrossEncoderReranker(config.model), KEEP), questions)
+
+
+if __name__ == "__main__":
+    main()
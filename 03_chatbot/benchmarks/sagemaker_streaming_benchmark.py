@@ -0,0 +1,123 @@
+""" Benchmark for the time to first token of a SageMaker TGI endpoint with streaming.
+
+A local stand-in of the SageMaker runtime client plays a TGI endpoint that takes
+300 ms for the prompt and 30 ms per generated token. It sends the tokens as
+server-sent events, split into payload parts of random size like SageMaker does, and
+stops with a stop word after 60 tokens. The benchmark compares when the user sees the
+first text of the answer with and without streaming.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/sagemaker_streaming_benchmark.py
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chatbot.catalog.model_catalog_item_sagemaker import SageMakerModelItem  # noqa: E402
+from chatbot.helpers.sagemaker_streaming_endpoint import SagemakerStreamingEndpoint  # noqa: E402
+from langchain.callbacks.base import BaseCallbackHandler  # noqa: E402
+
+RUNS = 10
+PROMPT_SECONDS = 0.3
+TOKEN_SECONDS = 0.03
+TOKENS = 60
+
+
+def _events(rng):
+    """Server-sent events of a TGI endpoint, split into payload parts of random size."""
+    tokens = [f" token{index}" for index in range(TOKENS)] + ["\n", "[|Human|]", " ignored"]
+    data = b""
+    for index, text in enumerate(tokens):
+        event = {"token": {"id": index, "text": text, "special": False}, "generated_text": None}
+        data += b"data:" + json.dumps(event).encode("utf-8") + b"\n\n"
+        while len(data) > 24:
+            size = rng.randint(1, 24)
+            yield data[:size]
+            data = data[size:]
+    yield data
+
+
+class FakeSageMakerRuntime:
+    """Local stand-in of the SageMaker runtime client with a TGI endpoint."""
+
+    def __init__(self, seed: int = 7):
+        self.rng = random.Random(seed)
+
+    def _stream(self):
+        time.sleep(PROMPT_SECONDS)
+        token_bytes = 0
+        for part in _events(self.rng):
+            token_bytes += len(part)
+            # About one token per event of 80 bytes
+            if token_bytes >= 80:
+                time.sleep(TOKEN_SECONDS)
+                token_bytes = 0
+            yield {"PayloadPart": {"Bytes": part}}
+
+    def invoke_endpoint_with_response_stream(self, **kwargs):
+        return {"Body": self._stream()}
+
+    def invoke_endpoint(self, **kwargs):
+        data = b"".join(event["PayloadPart"]["Bytes"] for event in self._stream())
+        text = "".join(
+            json.loads(line[len(b"data:") :])["token"]["text"]
+            for line in data.split(b"\n")
+            if line.startswith(b"data:")
+        )
+        return {"Body": _Body(json.dumps([{"generated_text": text}]).encode("utf-8"))}
+
+
+class _Body:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class FirstTokenHandler(BaseCallbackHandler):
+    def __init__(self):
+        self.first_token_at = None
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+
+def _run(name, streaming):
+    llm = SagemakerStreamingEndpoint(
+        client=FakeSageMakerRuntime(),
+        endpoint_name="falcon-40b",
+        region_name="eu-west-1",
+        content_handler=SageMakerModelItem.content_handler,
+        streaming=streaming,
+    )
+    first_text = []
+    total = []
+    for _ in range(RUNS):
+        handler = FirstTokenHandler()
+        start_time = time.perf_counter()
+        text = llm("What is the capital of Switzerland?", callbacks=[handler])
+        end_time = time.perf_counter()
+        first_text.append(((handler.first_token_at or end_time) - start_time) * 1000)
+        total.append((end_time - start_time) * 1000)
+    print(
+        f"{name:12} first text after mean {statistics.mean(first_text):6.0f} ms   "
+        f"complete after mean {statistics.mean(total):6.0f} ms   stop word in answer {'[|Human|]' in text}"
+    )
+
+
+def main():
+    print(f"{RUNS} answers of {TOKENS} tokens, prompt {PROMPT_SECONDS * 1000:.0f} ms, {TOKEN_SECONDS * 1000:.0f} ms per token")
+    _run("blocking", streaming=False)
+    _run("streaming", streaming=True)
+
+
+if __name__ == "__main__":
+    main()
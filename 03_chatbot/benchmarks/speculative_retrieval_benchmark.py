@@ -0,0 +1,124 @@
+""" Benchmark for speculative retrieval while the follow-up question is condensed.
+
+The stand-in condensation LLM takes 600 ms, the stand-in retriever 250 ms and the
+stand-in embedding model 50 ms, all sleep like remote calls. Half of the follow-up questions are close to their condensed
+version, the other half only make sense with the chat history and are rewritten. The
+benchmark compares the time until the documents are ready without speculation, where
+retrieval waits for the condensation, with speculative retrieval.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/speculative_retrieval_benchmark.py
+"""
+import os
+import itertools
+import random
+import statistics
+import sys
+import time
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# The benchmark prints its own summary instead of an EMF record per turn
+os.environ.setdefault("LATENCY_METRICS_EMF", "false")
+
+from chatbot.helpers.metrics import EVENT_COUNTERS  # noqa: E402
+from chatbot.helpers.speculative_retrieval import SpeculativeRetrieval  # noqa: E402
+from langchain.schema import Document  # noqa: E402
+from langchain.schema.embeddings import Embeddings  # noqa: E402
+
+TURNS = 40
+CONDENSE_SECONDS = 0.6
+RETRIEVE_SECONDS = 0.25
+EMBED_SECONDS = 0.05
+SUBJECTS = ["digital vignette", "customs tariffs", "asylum procedure", "pension reform", "energy prices"]
+
+
+class HashingEmbeddings(Embeddings):
+    """Local stand-in of an embedding model."""
+
+    def _embed(self, text):
+        vector = np.zeros(256)
+        for token in text.lower().replace("?", "").split():
+            vector[zlib.crc32(token.encode()) % 256] += 1.0
+        return list(vector / (np.linalg.norm(vector) or 1.0))
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(EMBED_SECONDS)
+        return self._embed(text)
+
+
+_searches = itertools.count()
+
+
+def _retrieve(question):
+    next(_searches)
+    time.sleep(RETRIEVE_SECONDS)
+    return [Document(page_content=f"Passage about {question}")]
+
+
+def _turns(rng):
+    turns = []
+    for _ in range(TURNS):
+        subject = rng.choice(SUBJECTS)
+        if rng.random() < 0.5:
+            # Already standalone, the condensation only rephrases it slightly
+            question = f"What changes for the {subject} next year?"
+            condensed = f"What changes for the {subject} next year in Switzerland?"
+        else:
+            question = "And what does it cost?"
+            condensed = f"What does the {subject} cost?"
+        turns.append((question, condensed))
+    return turns
+
+
+def _condense(condensed):
+    time.sleep(CONDENSE_SECONDS)
+    return condensed
+
+
+def _report(name, milliseconds):
+    milliseconds.sort()
+    print(
+        f"{name:24} documents ready after mean {statistics.mean(milliseconds):6.0f} ms  "
+        f"p95 {milliseconds[int(len(milliseconds) * 0.95)]:6.0f} ms"
+    )
+
+
+def main():
+    turns = _turns(random.Random(17))
+    print(f"{TURNS} follow-up questions, condensation {CONDENSE_SECONDS * 1000:.0f} ms, retrieval {RETRIEVE_SECONDS * 1000:.0f} ms")
+
+    milliseconds = []
+    for _, condensed in turns:
+        start_time = time.perf_counter()
+        _retrieve(_condense(condensed))
+        milliseconds.append((time.perf_counter() - start_time) * 1000)
+    _report("sequential", milliseconds)
+
+    speculative_retrieval = SpeculativeRetrieval(HashingEmbeddings(), similarity_threshold=0.8)
+    searches_before = next(_searches)
+    milliseconds = []
+    for question, condensed in turns:
+        start_time = time.perf_counter()
+        speculation = speculative_retrieval.start(question, _retrieve)
+        new_question = _condense(condensed)
+        outcome = speculative_retrieval.resolve(speculation, new_question, _retrieve)
+        if outcome.documents is None:
+            _retrieve(new_question)
+        milliseconds.append((time.perf_counter() - start_time) * 1000)
+    _report("speculative", milliseconds)
+    searches = next(_searches) - searches_before - 1
+
+    counts = {key[0]: count for key, count in EVENT_COUNTERS.counts("speculative_retrieval").items()}
+    hits = counts.get("speculative_retrieval_hit", 0)
+    print(f"hit rate {hits / TURNS:.2f}, extra searches {searches - TURNS}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+""" Benchmark for rendering streamed tokens in the chat UI.
+
+Runs a Streamlit script with Streamlit's AppTest that streams an LLM response below a
+long chat history, once by re-rendering the whole history for every token and once by
+rendering only the in-flight message into a placeholder with the coalescing StreamHandler.
+
+Run from the 03_chatbot directory:
+
+    poetry run python benchmarks/streaming_render_benchmark.py
+"""
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+HISTORY_MESSAGES = 60
+TOKENS = 300
+TOKEN_INTERVAL_SECONDS = 0.002
+
+
+def _app():
+    import time
+
+    import streamlit as st
+    from chatbot.ui.chat_messages import (
+        ChatHistory,
+        ChatMessage,
+        ChatParticipant,
+        DebugMessage,
+    )
+    from chatbot.ui.stream_handler import StreamHandler
+
+    mode = st.session_state["mode"]
+    chat_history = ChatHistory("Benchmark")
+    for i in range(st.session_state["history_messages"] // 3):
+        chat_history.add_chat_message(ChatMessage(ChatParticipant.USER, f"Question {i}?"))
+        chat_history.add_chat_message(ChatMessage(ChatParticipant.BOT, f"Answer {i}. " * 40))
+        chat_history.add_chat_message(
+            DebugMessage(ChatParticipant.DEBUGGER, f"Prompt {i}\n\x1b[1mBold\x1b[0m " * 20)
+        )
+
+    response_container = st.empty()
+    with response_container.container():
+        chat_history.write()
+        stream_placeholder = st.empty()
+
+    durations = []
+
+    def render_full_history(text: str):
+        start = time.perf_counter()
+        with response_container.container():
+            chat_history.write()
+            with st.chat_message("assistant"):
+                ChatMessage(ChatParticipant.BOT, text).write()
+        durations.append(time.perf_counter() - start)
+
+    def render_in_flight_message(text: str):
+        start = time.perf_counter()
+        with stream_placeholder.container():
+            with st.chat_message("assistant"):
+                ChatMessage(ChatParticipant.BOT, text).write()
+        durations.append(time.perf_counter() - start)
+
+    if mode == "full":
+        # Previous behavior: render everything for every token
+        handler = StreamHandler(render_full_history, min_interval_seconds=0)
+    else:
+        handler = StreamHandler(render_in_flight_message)
+
+    handler.on_llm_start({}, [])
+    start = time.perf_counter()
+    for i in range(st.session_state["tokens"]):
+        time.sleep(st.session_state["token_interval"])
+        handler.on_llm_new_token(f"token{i} ")
+    handler.on_llm_end(None)
+    st.session_state["stream_seconds"] = time.perf_counter() - start
+    st.session_state["durations"] = durations
+
+
+def _run(mode: str):
+    app = AppTest.from_function(_app, default_timeout=300)
+    app.session_state["mode"] = mode
+    app.session_state["history_messages"] = HISTORY_MESSAGES
+    app.session_state["tokens"] = TOKENS
+    app.session_state["token_interval"] = TOKEN_INTERVAL_SECONDS
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception)
+    durations = app.session_state["durations"]
+    render_ms = sum(durations) * 1000
+    print(
+        f"{mode:<12} renders {len(durations):4d}   render time {render_ms:9.1f} ms   "
+        f"per token {render_ms / TOKENS:7.3f} ms   per render {statistics.mean(durations) * 1000:7.3f} ms   "
+        f"stream wall time {app.session_state['stream_seconds'] * 1000:8.1f} ms"
+    )
+
+
+def main():
+    print(
+        f"{HISTORY_MESSAGES} history messages, {TOKENS} tokens, "
+        f"one token every {TOKEN_INTERVAL_SECONDS * 1000:.0f} ms"
+    )
+    _run("full")
+    _run("incremental")
+
+
+if __name__ == "__main__":
+    main()
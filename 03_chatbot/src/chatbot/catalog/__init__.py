@@ -1,5 +1,14 @@
 from .catalog import Catalog, CatalogById, CatalogItem  # noqa
 from .catalog_item import CatalogItem  # noqa
+from .catalog_snapshot import SNAPSHOT_VERSION, CatalogSnapshot  # noqa
+from .catalog_store import CATALOG_STORE, CatalogStore  # noqa
+from .resource_discovery import (  # noqa
+    LocalResourceDiscovery,
+    ResourceDiscovery,
+    TaggedResource,
+    TaggingApiResourceDiscovery,
+    get_resource_discovery,
+)
 
 from .memory_catalog_item_dynamodb_table import (  # noqa
     DynamoDBTableMemoryItem,
@@ -38,6 +47,7 @@ from .agent_chain_catalog import (
 
 from .retriever_catalog_item_kendra import KendraRetrieverItem, RetrieverCatalogItem
 from .retriever_catalog_item_open_search import OpenSearchRetrieverItem, RetrieverCatalogItem
+from .retriever_catalog_item_federated import FederatedRetrieverItem
 from .retriever_catalog import (
     Catalog,
     RetrieverCatalog,
@@ -1,14 +1,119 @@
 """ Module for catalogs that contain base items. """
+import copy
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
 from dataclasses import dataclass
-from typing import Dict, List, TypeVar
+from logging import Logger
+from typing import Callable, Dict, Hashable, List, Optional, TypeVar
+
+from botocore.config import Config
+from chatbot.helpers import ChatbotEnvironment, ChatbotEnvironmentVariables
 
 from .catalog_item import CatalogItem
 
 T = TypeVar("T", bound=CatalogItem)
+K = TypeVar("K", bound=Hashable)
+R = TypeVar("R")
 
 FRIENDLY_NAME_TAG = "genie:friendly-name"
 
+_environment = ChatbotEnvironment()
+
+BOOTSTRAP_MAX_WORKERS = int(_environment.get_env_variable(ChatbotEnvironmentVariables.BootstrapMaxWorkers))
+""" Maximum number of concurrent AWS API calls per fan out during bootstrap. """
+
+BOOTSTRAP_CALL_TIMEOUT = float(_environment.get_env_variable(ChatbotEnvironmentVariables.BootstrapCallTimeout))
+""" Seconds a single AWS API call may take during bootstrap. """
+
+BOOTSTRAP_DEADLINE = float(_environment.get_env_variable(ChatbotEnvironmentVariables.BootstrapDeadline))
+""" Seconds after which a fan out stops waiting and continues with partial results. """
+
+BOOTSTRAP_CLIENT_CONFIG = Config(
+    connect_timeout=BOOTSTRAP_CALL_TIMEOUT,
+    read_timeout=BOOTSTRAP_CALL_TIMEOUT,
+    retries={"max_attempts": 2, "mode": "standard"},
+    max_pool_connections=BOOTSTRAP_MAX_WORKERS,
+)
+""" Config for boto3 clients that catalogs use during bootstrap. """
+
+
+def fan_out(
+    calls: Dict[K, Callable[[], R]],
+    logger: Logger,
+    description: str,
+    max_workers: int = BOOTSTRAP_MAX_WORKERS,
+    deadline: Optional[float] = BOOTSTRAP_DEADLINE,
+) -> Dict[K, R]:
+    """Runs independent calls, e.g. AWS API calls per resource, on a bounded thread pool.
+
+    Calls that fail or do not finish before the deadline are logged and left out of
+    the result, so that a catalog can bootstrap with the resources that it could reach.
+    Create boto3 clients before the fan out, creating them is not thread-safe.
+
+    Args:
+        calls: Calls by key.
+        logger: Logger for failures and timing.
+        description: Describes the calls in log messages.
+        max_workers: Maximum number of concurrent calls.
+        deadline: Seconds after which the fan out stops waiting for calls.
+            None waits for all calls, e.g. for calls that fan out with a deadline themselves.
+
+    Returns:
+        The results of the successful calls by key, in the order of calls.
+
+    Example:
+        ```python
+        tags = fan_out(
+            {arn: lambda arn=arn: client.list_tags(ResourceArn=arn)["Tags"] for arn in arns},
+            logger,
+            "SageMaker endpoint tags",
+        )
+        ```
+    """
+    if not calls:
+        return {}
+
+    durations: Dict[K, float] = {}
+
+    def timed(key: K, call: Callable[[], R]) -> R:
+        start = time.perf_counter()
+        try:
+            return call()
+        finally:
+            durations[key] = time.perf_counter() - start
+
+    start_time = time.perf_counter()
+    executor = ThreadPoolExecutor(
+        max_workers=min(max_workers, len(calls)), thread_name_prefix="catalog-bootstrap"
+    )
+    futures = {key: executor.submit(timed, key, call) for key, call in calls.items()}
+    done, not_done = wait(futures.values(), timeout=deadline)
+    # Do not wait for calls that exceeded the deadline
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results: Dict[K, R] = {}
+    failures = 0
+    for key, future in futures.items():
+        if future not in done:
+            continue
+        try:
+            results[key] = future.result()
+        except Exception as error:
+            failures += 1
+            logger.info("%s: call for %s failed. %s", description, key, error)
+
+    logger.info(
+        "%s: %s calls, %s failed, %s timed out, %.2f seconds wall-clock, %.2f seconds summed API time",
+        description,
+        len(calls),
+        failures,
+        len(not_done),
+        time.perf_counter() - start_time,
+        sum(durations.values()),
+    )
+    return results
+
 
 @dataclass
 class Catalog(ABC, List[T]):
@@ -34,6 +139,32 @@ class Catalog(ABC, List[T]):
         """
         return [item.friendly_name for item in self]
 
+    def session_view(self) -> "Catalog[T]":
+        """Returns a copy of the catalog with session views of its items.
+
+        Bootstrapped catalogs are shared between sessions, see CatalogStore.
+        Sessions change selections on the items of their view only.
+        """
+        view = copy.copy(self)
+        view[:] = [item.session_view() for item in self]
+        return view
+
+    def __getstate__(self) -> dict:
+        # The resource discovery is process-wide and holds locks, it cannot be pickled
+        # into the catalog snapshot. The loading process uses its own, see __setstate__.
+        state = self.__dict__.copy()
+        if "discovery" in state:
+            state["discovery"] = None
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if "discovery" in state:
+            # Imported here, the resource discovery module imports this module
+            from .resource_discovery import get_resource_discovery
+
+            self.discovery = get_resource_discovery()
+
 
 @dataclass
 class CatalogById(ABC, Dict[str, T]):
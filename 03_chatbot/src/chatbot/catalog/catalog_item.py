@@ -1,5 +1,5 @@
 """ Abstract base class that represents a catalog item. """
-
+import copy
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from typing import Generic, TypeVar
@@ -17,5 +17,13 @@ class CatalogItem(ABC, Generic[T]):
     def get_instance(self) -> T:
         """Returns an instance of the item."""
 
+    def session_view(self) -> "CatalogItem[T]":
+        """Returns a copy of the item that a session can change selections on.
+
+        The copy shares the discovered resources with the item. Items that change
+        mutable attributes in place, e.g. dictionaries, copy them here.
+        """
+        return copy.copy(self)
+
     def __str__(self):
         return self.friendly_name
@@ -0,0 +1,110 @@
+""" Module that persists the discovered catalogs and configuration across restarts.
+
+When the chatbot restarts, the first session would wait for the discovery of all
+catalogs, the AWS AppConfig fetch and the prompt loading. The catalog store writes the
+last successful state to a local snapshot file instead and serves it right after the
+restart, while it reconciles the state with AWS in the background.
+"""
+import os
+import pickle
+import tempfile
+import threading
+import time
+from logging import Logger, getLogger
+from typing import Any, Dict, Hashable, Optional
+
+SNAPSHOT_VERSION = 1
+""" Version of the snapshot format. Snapshots of other versions are ignored.
+
+Increase it when the snapshot can no longer be read by the current code, e.g. when
+attributes of catalog items are renamed. """
+
+
+class CatalogSnapshot:
+    """Thread-safe snapshot file of values by key.
+
+    Every value is pickled separately, so that a value whose class changed does not
+    invalidate the other values of the snapshot. Only the chatbot itself may write the
+    file, loading a pickle runs code of the classes that it references.
+
+    Args:
+        path: Path of the snapshot file.
+        logger: Logger for snapshots that cannot be read or written.
+
+    Example:
+        ```python
+        snapshot = CatalogSnapshot("/tmp/genie-catalog-snapshot.pickle")
+        snapshot.save({("model", ("eu-west-1",)): model_catalog})
+        snapshot.load()[("model", ("eu-west-1",))]
+        ```
+    """
+
+    def __init__(self, path: str, logger: Logger = getLogger("CatalogSnapshotLogger")):
+        self.path = path
+        self.logger = logger
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[Hashable, Any]:
+        """Returns the values of the snapshot, or no values if there is no readable snapshot."""
+        try:
+            with open(self.path, "rb") as file:
+                snapshot = pickle.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as error:
+            self.logger.warning("Ignoring unreadable catalog snapshot %s. %s", self.path, error)
+            return {}
+
+        if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+            self.logger.warning(
+                "Ignoring catalog snapshot %s with version %s, expected version %s",
+                self.path,
+                snapshot.get("version") if isinstance(snapshot, dict) else None,
+                SNAPSHOT_VERSION,
+            )
+            return {}
+
+        values = {}
+        for key, pickled_value in snapshot["values"].items():
+            try:
+                values[key] = pickle.loads(pickled_value)
+            except Exception as error:
+                self.logger.warning("Ignoring value %s of the catalog snapshot. %s", key, error)
+        self.logger.info(
+            "Loaded %s values from catalog snapshot %s of %s",
+            len(values),
+            self.path,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["created_at"])),
+        )
+        return values
+
+    def save(self, values: Dict[Hashable, Any]):
+        """Replaces the snapshot with values. Values that cannot be pickled are left out."""
+        pickled_values = {}
+        for key, value in values.items():
+            try:
+                pickled_values[key] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as error:
+                self.logger.info("Leaving value %s out of the catalog snapshot. %s", key, error)
+        snapshot = {"version": SNAPSHOT_VERSION, "created_at": time.time(), "values": pickled_values}
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                # Write to a temporary file first, so that a restart never sees half a snapshot
+                descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                try:
+                    with os.fdopen(descriptor, "wb") as file:
+                        pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(temporary_path, self.path)
+                except BaseException:
+                    os.unlink(temporary_path)
+                    raise
+            except OSError as error:
+                self.logger.warning("Cannot write catalog snapshot %s. %s", self.path, error)
+
+
+def get_catalog_snapshot(path: Optional[str]) -> Optional[CatalogSnapshot]:
+    """Returns the snapshot for path, None if path is empty."""
+    return CatalogSnapshot(path) if path else None
@@ -0,0 +1,329 @@
+""" Module that contains a process-wide store of bootstrapped catalogs.
+
+Bootstrapping the model, retriever and memory catalogs discovers resources with many
+AWS API calls. Streamlit runs every browser session in the same Python process, so
+the store bootstraps every catalog once and shares it between sessions. Sessions get
+views of the shared catalogs whose items can hold per-session selections.
+A snapshot file keeps the catalogs across restarts.
+"""
+import pickle
+import threading
+import time
+from dataclasses import dataclass
+from logging import Logger, getLogger
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from chatbot.helpers import ChatbotEnvironment, ChatbotEnvironmentVariables
+
+from .catalog import Catalog
+from .catalog_snapshot import CatalogSnapshot, get_catalog_snapshot
+from .resource_discovery import get_resource_discovery
+
+C = TypeVar("C", bound=Catalog)
+V = TypeVar("V")
+
+
+@dataclass
+class CatalogStoreStats:
+    """Counters that describe how often catalogs are bootstrapped."""
+
+    hits: int = 0
+    """ Lookups answered with a fresh catalog. """
+    stale_hits: int = 0
+    """ Lookups answered with a stale catalog while it is refreshed in the background. """
+    snapshot_hits: int = 0
+    """ First lookups after a restart answered from the snapshot. """
+    bootstraps: int = 0
+    """ Catalogs bootstrapped while a session waited for them. """
+    refreshes: int = 0
+    """ Catalogs bootstrapped in the background. """
+    unchanged_refreshes: int = 0
+    """ Background refreshes that found the same catalog and kept the current one. """
+    refresh_failures: int = 0
+    """ Background refreshes that failed and kept the stale catalog. """
+    size: int = 0
+
+
+def _same_value(current: Any, refreshed: Any) -> bool:
+    """Returns whether a refreshed value equals the current one.
+
+    Catalogs compare only their dataclass fields, not their items, so values are compared
+    by their pickled state like in the snapshot. Values that cannot be pickled differ.
+    """
+    try:
+        return pickle.dumps(current, protocol=pickle.HIGHEST_PROTOCOL) == pickle.dumps(
+            refreshed, protocol=pickle.HIGHEST_PROTOCOL
+        )
+    except Exception:
+        return False
+
+
+@dataclass
+class _Entry:
+    value: Any
+    loaded_at: float
+    stale: bool = False
+    refreshing: bool = False
+
+
+class CatalogStore:
+    """Thread-safe store of bootstrapped catalogs with stale-while-revalidate refresh.
+
+    A catalog older than the time to live is still returned, while a background thread
+    bootstraps a new one that replaces it once it is complete. A refreshed catalog that
+    equals the current one does not replace it, so sessions keep their views. Only the first lookup of
+    a catalog waits for its bootstrap, concurrent lookups of the same key wait for the
+    same bootstrap.
+
+    With a snapshot, the store persists its catalogs after every bootstrap. After a
+    restart, the first lookups get the catalogs of the snapshot right away and the
+    store reconciles them with AWS in the background.
+
+    Besides catalogs, the store holds other values that all sessions share, e.g. the
+    app config, see get_value.
+
+    Args:
+        ttl_seconds: Seconds after which a catalog is refreshed in the background.
+            0 never refreshes catalogs.
+        snapshot: Optional snapshot that persists the catalogs across restarts.
+        logger: Logger for refreshes.
+
+    Example:
+        ```python
+        model_catalog = CATALOG_STORE.get_view(
+            ("model", tuple(regions)),
+            lambda: ModelCatalog(regions, bedrock_config, logger, llm_config),
+        )
+        ```
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 900,
+        snapshot: Optional[CatalogSnapshot] = None,
+        logger: Logger = getLogger("CatalogStoreLogger"),
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.snapshot = snapshot
+        self.logger = logger
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._lock = threading.Lock()
+        self._bootstrap_locks: Dict[Hashable, threading.Lock] = {}
+        # Own lock, loading the snapshot unpickles catalog items that may call AWS APIs
+        self._snapshot_load_lock = threading.Lock()
+        self._stats = CatalogStoreStats()
+        # Loaded on first use, loading a snapshot imports the modules of the catalog items
+        self._snapshot_values: Optional[Dict[Hashable, Any]] = None
+        self._snapshot_dirty = False
+        self._snapshot_writing = False
+
+    @staticmethod
+    def _bootstrap(factory: Callable[[], C]) -> C:
+        catalog = factory()
+        catalog.bootstrap()
+        return catalog
+
+    def _is_stale(self, entry: _Entry) -> bool:
+        return entry.stale or (
+            self.ttl_seconds > 0 and time.monotonic() - entry.loaded_at > self.ttl_seconds
+        )
+
+    def _pop_snapshot_value(self, key: Hashable) -> Tuple[bool, Any]:
+        if self.snapshot is None:
+            return False, None
+        with self._snapshot_load_lock:
+            if self._snapshot_values is None:
+                values = self.snapshot.load()
+                with self._lock:
+                    self._snapshot_values = values
+        with self._lock:
+            if key not in self._snapshot_values:
+                return False, None
+            return True, self._snapshot_values.pop(key)
+
+    def get_value(self, key: Hashable, loader: Callable[[], V]) -> V:
+        """Returns the shared value for key. Callers must not modify it.
+
+        Args:
+            key: Identifies the value.
+            loader: Loads the value if the store does not hold it yet or it is stale.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._is_stale(entry):
+                    self._stats.hits += 1
+                    return entry.value
+                self._stats.stale_hits += 1
+                if not entry.refreshing:
+                    entry.refreshing = True
+                    threading.Thread(
+                        target=self._refresh,
+                        args=(key, loader),
+                        name="catalog-refresh",
+                        daemon=True,
+                    ).start()
+                return entry.value
+            bootstrap_lock = self._bootstrap_locks.setdefault(key, threading.Lock())
+
+        with bootstrap_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                return entry.value
+
+            found, value = self._pop_snapshot_value(key)
+            if found:
+                with self._lock:
+                    # Stale right away, so that it is reconciled in the background
+                    self._entries[key] = _Entry(value, time.monotonic(), stale=True, refreshing=True)
+                    self._stats.snapshot_hits += 1
+                    self._bootstrap_locks.pop(key, None)
+                threading.Thread(
+                    target=self._refresh,
+                    args=(key, loader),
+                    name="catalog-refresh",
+                    daemon=True,
+                ).start()
+                return value
+
+            value = loader()
+            with self._lock:
+                self._entries[key] = _Entry(value, time.monotonic())
+                self._stats.bootstraps += 1
+                self._bootstrap_locks.pop(key, None)
+            self._schedule_snapshot()
+            return value
+
+    def get(self, key: Hashable, factory: Callable[[], C]) -> C:
+        """Returns the shared catalog for key. Callers must not modify it or its items.
+
+        Args:
+            key: Identifies the catalog, e.g. its type and the regions it discovers.
+            factory: Creates the catalog that is bootstrapped if the store does not hold it yet.
+        """
+        return self.get_value(key, lambda: self._bootstrap(factory))
+
+    def get_view(self, key: Hashable, factory: Callable[[], C]) -> C:
+        """Returns a view of the shared catalog for key that a session can modify.
+
+        See get and Catalog.session_view.
+        """
+        return self.get(key, factory).session_view()
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Returns the value for key without loading or refreshing it, None if there is none."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None else None
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]):
+        start_time = time.time()
+        try:
+            value = loader()
+        except Exception as error:
+            self.logger.warning("Refreshing catalog %s failed, keeping the stale catalog. %s", key, error)
+            with self._lock:
+                self._stats.refresh_failures += 1
+                entry = self._entries.get(key)
+                if entry is not None:
+                    # Retry after another time to live instead of with every lookup
+                    entry.loaded_at = time.monotonic()
+                    entry.stale = False
+                    entry.refreshing = False
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+        unchanged = entry is not None and _same_value(entry.value, value)
+        with self._lock:
+            self._stats.refreshes += 1
+            if unchanged and self._entries.get(key) is entry:
+                # Sessions replace their views when the shared catalog is replaced
+                entry.loaded_at = time.monotonic()
+                entry.stale = False
+                entry.refreshing = False
+                self._stats.unchanged_refreshes += 1
+            else:
+                unchanged = False
+                self._entries[key] = _Entry(value, time.monotonic())
+        if unchanged:
+            self.logger.info("Refreshed catalog %s in %s seconds, unchanged", key, time.time() - start_time)
+            return
+        self.logger.info("Refreshed catalog %s in %s seconds", key, time.time() - start_time)
+        self._schedule_snapshot()
+
+    def _schedule_snapshot(self):
+        """Writes the snapshot in the background, one write at a time with the latest values."""
+        if self.snapshot is None:
+            return
+        with self._lock:
+            self._snapshot_dirty = True
+            if self._snapshot_writing:
+                return
+            self._snapshot_writing = True
+        threading.Thread(target=self._write_snapshot, name="catalog-snapshot", daemon=True).start()
+
+    def _write_snapshot(self):
+        while True:
+            with self._lock:
+                if not self._snapshot_dirty:
+                    self._snapshot_writing = False
+                    return
+                self._snapshot_dirty = False
+                values = {key: entry.value for key, entry in self._entries.items()}
+            self.snapshot.save(values)
+
+    def save_snapshot(self):
+        """Writes the snapshot in the background, e.g. after a value changed in place like
+        a prompt catalog that loaded another prompt."""
+        self._schedule_snapshot()
+
+    def invalidate(
+        self, predicate: Optional[Callable[[Hashable], bool]] = None, drop: bool = False
+    ) -> int:
+        """Invalidates catalogs, e.g. after resources were created or deleted.
+
+        Args:
+            predicate: Invalidates only the keys for which the predicate returns True.
+                Invalidates all catalogs if no predicate is given.
+            drop: Removes the catalogs, so that the next lookup waits for a new bootstrap.
+                Otherwise the next lookup refreshes them in the background.
+
+        Returns:
+            The number of invalidated catalogs.
+        """
+        # Otherwise the next bootstrap would find the resources of the cached tag queries
+        get_resource_discovery().invalidate()
+        with self._lock:
+            keys = [key for key in self._entries if predicate is None or predicate(key)]
+            for key in keys:
+                if drop:
+                    del self._entries[key]
+                else:
+                    self._entries[key].stale = True
+            return len(keys)
+
+    def stats(self) -> CatalogStoreStats:
+        """Returns a snapshot of the store counters."""
+        with self._lock:
+            return CatalogStoreStats(
+                hits=self._stats.hits,
+                stale_hits=self._stats.stale_hits,
+                snapshot_hits=self._stats.snapshot_hits,
+                bootstraps=self._stats.bootstraps,
+                refreshes=self._stats.refreshes,
+                unchanged_refreshes=self._stats.unchanged_refreshes,
+                refresh_failures=self._stats.refresh_failures,
+                size=len(self._entries),
+            )
+
+
+_environment = ChatbotEnvironment()
+
+CATALOG_STORE = CatalogStore(
+    ttl_seconds=float(_environment.get_env_variable(ChatbotEnvironmentVariables.CatalogTTL)),
+    snapshot=get_catalog_snapshot(
+        _environment.get_env_variable(ChatbotEnvironmentVariables.CatalogSnapshotPath)
+    ),
+)
+""" Process-wide store of bootstrapped catalogs that all sessions share. """
@@ -5,7 +5,7 @@ import time
 from dataclasses import dataclass
 from logging import Logger, getLogger
 from operator import itemgetter
-from typing import List
+from typing import List, Optional
 
 import boto3
 import botocore
@@ -13,7 +13,7 @@ import botocore
 from .catalog import FRIENDLY_NAME_TAG, Catalog
 from .flow_catalog_item_simple_chat import SimpleChatFlowItem
 from .flow_catalog_item_upload_file import DocUploadItem
-from .flow_catalog_item_rag import RagItem
+from .flow_catalog_item_rag import RETRIEVAL_AUGMENTED_GENERATION, RagItem
 from .flow_catalog_item_agent import AgentsItem
 
 @dataclass
@@ -26,15 +26,20 @@ class FlowCatalog(Catalog):
 
     logger: Logger
 
+    flow_config: dict
+    """ Flows section of the flow config. """
+
     def __init__(
         self,
         account_id,
         regions: list,
         logger: Logger = getLogger("FlowCatalogLogger"),
+        flow_config: Optional[dict] = None,
     ) -> None:
         self.regions = regions
         self.account_id = account_id
         self.logger = logger
+        self.flow_config = flow_config or {}
         super().__init__()
 
     def _add_simple_chat_flow_option(self) -> None:
@@ -44,7 +49,7 @@ class FlowCatalog(Catalog):
         self.append(DocUploadItem())
         
     def _add_rag_option(self) -> None:
-        self.append(RagItem())
+        self.append(RagItem(self.flow_config.get(RETRIEVAL_AUGMENTED_GENERATION)))
 
     def _add_agent_option(self) -> None:
         self.append(AgentsItem())
@@ -55,18 +55,34 @@ class AgentsItem(FlowCatalogItem):
         chat_prompt = prompt_catalog[agent_chain.get_prompt_path()].get_instance()
         llm = model.get_instance()
 
+        cache_key = None
+        if model.cache_key is not None:
+            cache_key = (
+                self.friendly_name,
+                model.cache_key,
+                str(agent_chain),
+                agent_chain.get_prompt_path(),
+            )
+
         if agent_chain_type =="TOOLS":
             agent_chain = agent_chain.get_instance()
             return MRKLApp(
                 prompt=chat_prompt,
                 llm=llm,
-                agent_chain=agent_chain
+                agent_chain=agent_chain,
+                cache_key=cache_key,
             )
         else:
             sql_llm  = sql_model.get_instance()
+            if cache_key is not None and sql_model.cache_key is not None:
+                # Connecting to the database and reading its schema is the expensive part
+                cache_key += (sql_connection_uri, sql_model.cache_key)
+            else:
+                cache_key = None
             return SQLMRKLApp(
                 prompt=chat_prompt,
                 llm=llm,
                 sql_connection_uri=sql_connection_uri,
-                sql_llm=sql_llm
+                sql_llm=sql_llm,
+                cache_key=cache_key,
             )
@@ -1,7 +1,10 @@
 """ Module that contains a class that represents a File Upload retriever catalog item. """
-from dataclasses import dataclass
+import copy
+from dataclasses import asdict, dataclass
+from typing import Dict, Hashable, Iterable, Optional, Tuple
 
 from langchain.chains.base import Chain
+from langchain.schema.embeddings import Embeddings
 
 from chatbot.catalog.flow_catalog_item_simple_chat import SimpleChatFlowItem
 
@@ -9,12 +12,26 @@ from .flow_catalog_item import FlowCatalogItem
 from .retriever_catalog_item import RetrieverCatalogItem
 from .catalog import CatalogById
 from .model_catalog_item import ModelCatalogItem
-from chatbot.llm_app import BaseLLMApp, LLMApp, RAGApp
+from chatbot.llm_app import LLM_APP_CACHE, BaseLLMApp, LLMApp, RAGApp
 from .agent_chain_catalog_item import AgentChainCatalogItem
+from chatbot.helpers import ChatbotEnvironment, ChatbotEnvironmentVariables
+from chatbot.helpers.condensation_policy import CondensationConfig, CondensationPolicy
+from chatbot.helpers.context_packer import ContextBudget, ContextPacker, get_token_counter
+from chatbot.helpers.lru_cache import freeze
+from chatbot.helpers.reranker import RERANKER_EMBEDDING, RerankConfig, RerankStage, get_reranker
+from chatbot.helpers.semantic_cache import (
+    SemanticCacheBinding,
+    SemanticCacheConfig,
+    get_semantic_answer_cache,
+)
+from chatbot.helpers.speculative_retrieval import SpeculativeRetrieval, SpeculativeRetrievalConfig
+from chatbot.open_search import OPEN_SEARCH_CLIENT_POOL
 
 
 RETRIEVAL_AUGMENTED_GENERATION = "Retrieval Augmented Generation"
 
+CONDENSE_QUESTION_PROMPT = "prompts/condense_question.yaml"
+
 
 @dataclass
 class RagItem(FlowCatalogItem):
@@ -22,8 +39,53 @@ class RagItem(FlowCatalogItem):
     Class that represents using a LLM with a retriever.
     """
 
-    def __init__(self):
+    semantic_cache_config: SemanticCacheConfig
+    """ Configuration of the semantic answer cache, disabled by default. """
+
+    rerank_config: RerankConfig
+    """ Configuration of the rerank stage, disabled by default. """
+
+    condensation_config: CondensationConfig
+    """ Configuration of the condensation of follow-up questions. """
+
+    condensation_model: Optional[ModelCatalogItem]
+    """ Model of the session that condenses follow-up questions, the selected model if None. """
+
+    speculative_retrieval_config: SpeculativeRetrievalConfig
+    """ Configuration of the speculative retrieval, disabled by default. """
+
+    def __init__(self, rag_config: Optional[dict] = None):
         super().__init__(RETRIEVAL_AUGMENTED_GENERATION)
+        self.semantic_cache_config = SemanticCacheConfig.from_dict(
+            (rag_config or {}).get("semanticCache")
+        )
+        self.rerank_config = RerankConfig.from_dict((rag_config or {}).get("rerank"))
+        self.condensation_config = CondensationConfig.from_dict(
+            (rag_config or {}).get("condensation")
+        )
+        self.condensation_model = None
+        self.speculative_retrieval_config = SpeculativeRetrievalConfig.from_dict(
+            (rag_config or {}).get("speculativeRetrieval")
+        )
+
+    def select_condensation_model(
+        self, models: Iterable[ModelCatalogItem], model: Optional[ModelCatalogItem]
+    ) -> None:
+        """Selects the model of the model catalog that condenses follow-up questions.
+
+        Args:
+            models: Models of the session's model catalog.
+            model: Selected model of the session, models in its region are preferred.
+        """
+        self.condensation_model = None
+        if not self.condensation_config.model:
+            return
+        candidates = [item for item in models if _model_id(item) == self.condensation_config.model]
+        same_region = [
+            item for item in candidates if _model_region(item) == _model_region(model)
+        ]
+        if same_region or candidates:
+            self.condensation_model = (same_region or candidates)[0]
 
     def enable_file_upload(self) -> bool:
         return False
@@ -51,12 +113,74 @@ class RagItem(FlowCatalogItem):
             chat_flow = SimpleChatFlowItem()
             return chat_flow.llm_app_factory(model, retriever, prompt_catalog)
         
+        condensation_model = self.condensation_model
+        if condensation_model is None or _model_id(condensation_model) == _model_id(model):
+            condensation_model = model
+        budget = model.context_budget()
+
+        cache_key = None
+        if (
+            model.cache_key is not None
+            and retriever.cache_key is not None
+            and condensation_model.cache_key is not None
+        ):
+            cache_key = (
+                self.friendly_name,
+                model.cache_key,
+                retriever.cache_key,
+                model.rag_prompt_identifier,
+                CONDENSE_QUESTION_PROMPT,
+                (budget.context_window, budget.max_context_tokens, budget.answer_tokens) if budget else None,
+                condensation_model.cache_key,
+                freeze(asdict(self.condensation_config)),
+                freeze(asdict(self.semantic_cache_config)),
+                freeze(asdict(self.rerank_config)),
+                freeze(asdict(self.speculative_retrieval_config)),
+            )
+            # Sessions with the same selection share the app, and with it the instances
+            # of the model, the retriever and the prompts
+            app = LLM_APP_CACHE.get(cache_key)
+            if app is not None:
+                return app
+
+        app = self._rag_app(model, retriever, prompt_catalog, condensation_model, budget, cache_key)
+        if app is not None and cache_key is not None:
+            LLM_APP_CACHE.put(cache_key, app)
+        return app
+
+    def _rag_app(
+        self,
+        model: ModelCatalogItem,
+        retriever: RetrieverCatalogItem,
+        prompt_catalog: CatalogById,
+        condensation_model: ModelCatalogItem,
+        budget: Optional[ContextBudget],
+        cache_key: Optional[Hashable],
+    ) -> Optional[RAGApp]:
         rag_prompt = prompt_catalog[model.rag_prompt_identifier].get_instance()
         llm = model.get_instance()
         condense_question_prompt = prompt_catalog[
-            "prompts/condense_question.yaml"
+            CONDENSE_QUESTION_PROMPT
         ].get_instance()
 
+        retriever, rerank_stage = self._rerank_stage(retriever)
+
+        condense_question_llm = None
+        if condensation_model is not model:
+            condense_question_llm = condensation_model.get_instance()
+        condensation_policy = CondensationPolicy(
+            self.condensation_config, flow=self.friendly_name, model=_model_id(condensation_model)
+        )
+
+        context_packer = None
+        if budget is not None:
+            context_packer = ContextPacker(
+                budget, get_token_counter((type(model).__name__, model.friendly_name), llm)
+            )
+
+        semantic_cache = self._semantic_cache_binding(model, retriever)
+        speculative_retrieval = self._speculative_retrieval(retriever)
+
         retriever = retriever.get_instance()
 
         # Checking if retriever is initialized, if not app will print retriever errors
@@ -66,5 +190,104 @@ class RagItem(FlowCatalogItem):
                 prompt=rag_prompt,
                 llm=llm,
                 condense_question_prompt_template=condense_question_prompt,
+                condense_question_llm=condense_question_llm,
+                condensation_policy=condensation_policy,
                 retriever=retriever,
+                semantic_cache=semantic_cache,
+                rerank_stage=rerank_stage,
+                context_packer=context_packer,
+                speculative_retrieval=speculative_retrieval,
+                cache_key=cache_key,
+            )
+        return None
+
+    def _rerank_stage(
+        self, retriever: RetrieverCatalogItem
+    ) -> Tuple[RetrieverCatalogItem, Optional[RerankStage]]:
+        """Returns the retriever that over-fetches candidates and the stage that reranks them."""
+        config = self.rerank_config
+        if not config.enabled or not hasattr(retriever, "top_k"):
+            return retriever, None
+
+        embeddings = None
+        if config.type == RERANKER_EMBEDDING:
+            embeddings = (
+                self._config_embeddings(config.embedding)
+                or retriever.query_embeddings()
+                or self._config_embeddings()
             )
+        reranker = get_reranker(config, embeddings)
+        if reranker is None:
+            return retriever, None
+
+        keep = config.keep or retriever.top_k
+        # A copy, the session keeps its selection of the number of documents
+        retriever = copy.copy(retriever)
+        retriever.top_k = config.num_candidates(keep)
+        return retriever, RerankStage(reranker, keep)
+
+    def _speculative_retrieval(
+        self, retriever: RetrieverCatalogItem
+    ) -> Optional[SpeculativeRetrieval]:
+        config = self.speculative_retrieval_config
+        if not config.enabled:
+            return None
+
+        embeddings = (
+            self._config_embeddings(config.embedding)
+            or retriever.query_embeddings()
+            or self._config_embeddings()
+        )
+        if embeddings is None:
+            return None
+
+        return SpeculativeRetrieval(
+            embeddings=embeddings,
+            similarity_threshold=config.similarity_threshold,
+            flow=self.friendly_name,
+            index=retriever.friendly_name,
+        )
+
+    def _semantic_cache_binding(
+        self, model: ModelCatalogItem, retriever: RetrieverCatalogItem
+    ) -> Optional[SemanticCacheBinding]:
+        config = self.semantic_cache_config
+        # Answers can only be shared between sessions that use the same index, model and prompt
+        if not config.enabled or retriever.cache_key is None or model.cache_key is None:
+            return None
+
+        embeddings = retriever.query_embeddings() or self._config_embeddings()
+        if embeddings is None:
+            return None
+
+        return SemanticCacheBinding(
+            cache=get_semantic_answer_cache(config),
+            embeddings=embeddings,
+            partition=(retriever.cache_key, model.cache_key, model.rag_prompt_identifier),
+            index_key=retriever.cache_key,
+            similarity_threshold=config.similarity_threshold,
+            index_fingerprint=retriever.index_fingerprint_function(),
+            index_check_interval=config.index_check_interval,
+        )
+
+    def _config_embeddings(self, embedding: Optional[Dict[str, str]] = None) -> Optional[Embeddings]:
+        embedding = embedding or self.semantic_cache_config.embedding
+        if not embedding:
+            return None
+        environment = ChatbotEnvironment()
+        region = (
+            embedding.get("region")
+            or environment.get_env_variable(ChatbotEnvironmentVariables.AmazonBedrockRegion)
+            or environment.get_env_variable(ChatbotEnvironmentVariables.AWSRegion)
+        )
+        return OPEN_SEARCH_CLIENT_POOL.get_embeddings(embedding["type"], embedding["model"], region)
+
+
+def _model_id(model: Optional[ModelCatalogItem]) -> Optional[str]:
+    # Bedrock models have a model id, SageMaker models an endpoint name
+    return getattr(model, "model_id", None) or getattr(model, "endpoint_name", None)
+
+
+def _model_region(model: Optional[ModelCatalogItem]) -> Optional[str]:
+    region = getattr(getattr(model, "config", None), "region", None) or getattr(model, "region", None)
+    return getattr(region, "value", region)
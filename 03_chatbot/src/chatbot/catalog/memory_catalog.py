@@ -1,15 +1,13 @@
 """ Module that contains catalog for chat history memory. """
-import logging
-import sys
 import time
 from dataclasses import dataclass
+from functools import partial
 from logging import Logger, getLogger
-from typing import List
+from typing import List, Optional
 
-import boto3
-
-from .catalog import Catalog
+from .catalog import Catalog, fan_out
 from .memory_catalog_item_dynamodb_table import DynamoDBTableMemoryItem
+from .resource_discovery import MEMORY_TABLE_TAG, ResourceDiscovery, get_resource_discovery
 
 
 @dataclass
@@ -22,15 +20,20 @@ class MemoryCatalog(Catalog):
 
     logger: Logger
 
+    discovery: ResourceDiscovery
+    """ Finds the tagged DynamoDB tables. """
+
     def __init__(
         self,
         account_id: str,
         regions: list,
         logger: Logger = getLogger("MemoryCatalogLogger"),
+        discovery: Optional[ResourceDiscovery] = None,
     ) -> None:
         self.regions = regions
         self.account_id = account_id
         self.logger = logger
+        self.discovery = discovery or get_resource_discovery()
         super().__init__()
 
     def _get_dynamodb_memory_table(self, account):
@@ -38,27 +41,24 @@ class MemoryCatalog(Catalog):
         start_time = time.time()
         self.logger.info("Retrieving DynamoDB memory table...")
 
-        memory_tables = []
-
-        for region in self.regions:
-            dynamodb_client = boto3.client("dynamodb", region)
-
-            paginator = dynamodb_client.get_paginator("list_tables")
-            tables = paginator.paginate().build_full_result()["TableNames"]
-
-            table_name_to_arn = (
-                lambda table_name, region: f"arn:aws:dynamodb:{region}:{account}:table/{table_name}"
+        resources_by_region = fan_out(
+            {
+                region: partial(
+                    self.discovery.get_resources, region, MEMORY_TABLE_TAG, "dynamodb:table"
+                )
+                for region in self.regions
+            },
+            self.logger,
+            "DynamoDB memory tables",
+        )
+        # Sorted by name like ListTables, so that the first table is the same with every bootstrap
+        memory_tables = [
+            DynamoDBTableMemoryItem(table_name=table_name, region=region)
+            for region in self.regions
+            for table_name in sorted(
+                resource.resource_id for resource in resources_by_region.get(region, [])
             )
-            genaix_dynamodb_tag_filter = lambda tag: tag["Key"] == "genie:memory-table"
-            for table_name in tables:
-                table_arn = table_name_to_arn(table_name, region=region)
-                tags_paginator = dynamodb_client.get_paginator("list_tags_of_resource")
-                tags = tags_paginator.paginate(
-                    ResourceArn=table_arn
-                ).build_full_result()["Tags"]
-                genaix_tags = list(filter(genaix_dynamodb_tag_filter, tags))
-                if len(genaix_tags) > 0:
-                    memory_tables.append(DynamoDBTableMemoryItem(table_name=table_name))
+        ]
 
         self.logger.info(
             "%s DynamoDB tables retrieved in %s seconds",
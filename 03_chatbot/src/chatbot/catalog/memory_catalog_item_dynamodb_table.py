@@ -1,6 +1,8 @@
 """ from.Module that contains a class that represents a OpenSearch retriever catalog item. """
 from dataclasses import dataclass
+from typing import Optional
 
+from chatbot.helpers.dynamodb_message_history import get_message_history, has_sequence_key
 from langchain.memory.chat_message_histories import DynamoDBChatMessageHistory
 from langchain.schema import BaseChatMessageHistory
 
@@ -9,16 +11,29 @@ from .memory_catalog_item import MemoryCatalogItem
 
 @dataclass
 class DynamoDBTableMemoryItem(MemoryCatalogItem):
-    """Class that represents a Amazon DynamoDB table memory catalog item."""
+    """Class that represents a Amazon DynamoDB table memory catalog item.
+
+    Tables with the sort key Sequence store one item per message, see
+    DynamoDBMessageHistory. Tables with only the partition key SessionId store the
+    whole history of a session in one item.
+    """
 
     table_name: str
     """ DynamoDB table name """
 
-    def __init__(self, table_name):
+    region: Optional[str] = None
+    """ AWS region of the table, the default region if None. """
+
+    def __init__(self, table_name, region=None):
         super().__init__(f"Memory table: {table_name}")
         self.table_name = table_name
+        self.region = region
 
     def get_instance(self, session_id) -> BaseChatMessageHistory:
+        # Items of catalog snapshots from before the region was added have no region
+        region = getattr(self, "region", None)
+        if has_sequence_key(self.table_name, region):
+            return get_message_history(self.table_name, session_id, region)
         return DynamoDBChatMessageHistory(
             table_name=self.table_name, session_id=session_id
         )
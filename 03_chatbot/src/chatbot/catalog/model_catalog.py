@@ -2,6 +2,7 @@
 import re
 import time
 from dataclasses import dataclass
+from functools import partial
 from logging import Logger, getLogger
 from typing import Dict, List, Optional
 
@@ -9,10 +10,12 @@ import boto3
 import botocore
 from chatbot.config import AmazonBedrock, LLMConfig, FlowConfig
 from chatbot.helpers import get_boto_session
+from chatbot.helpers.bedrock_hedging import BEDROCK_HEDGING
 
 from .model_catalog_item_bedrock import BedrockModelItem
-from .catalog import FRIENDLY_NAME_TAG, Catalog
+from .catalog import BOOTSTRAP_CLIENT_CONFIG, FRIENDLY_NAME_TAG, Catalog, fan_out
 from .model_catalog_item_sagemaker import SageMakerModelItem
+from .resource_discovery import ResourceDiscovery, get_resource_discovery
 
 
 @dataclass
@@ -27,19 +30,24 @@ class ModelCatalog(Catalog):
 
     logger: Logger
 
+    discovery: ResourceDiscovery
+    """ Finds the tagged SageMaker endpoints. """
+
     def __init__(
         self,
         regions: list,
         bedrock_config: List[AmazonBedrock],
         llm_config: Dict[str, LLMConfig],
         logger: Logger = getLogger("ModelCatalogLogger"),
-        callbacks = []
+        callbacks = [],
+        discovery: Optional[ResourceDiscovery] = None,
     ) -> None:
         self.regions = regions
         self.bedrock_config = bedrock_config
         self.logger = logger
         self.llm_config = llm_config
         self.callbacks = callbacks
+        self.discovery = discovery or get_resource_discovery()
         super().__init__()
 
     def get_llm_config(
@@ -54,124 +62,186 @@ class ModelCatalog(Catalog):
 
         return None
 
-    def _get_bedrock_models(self, config_model_id_regexs: List[re.Pattern]):
+    def _get_bedrock_models(self, config_model_id_regexs: List[re.Pattern]) -> List[BedrockModelItem]:
         """Get list of Bedrock models available in the account."""
 
         start_time = time.time()
         self.logger.info("Retrieving Bedrock models in...")
-        models = []
-        for bedrock_config in self.bedrock_config:
-            region = bedrock_config.parameters.region.value
-            endpoint_url = bedrock_config.parameters.endpoint_url
-            iam_config = bedrock_config.parameters.iam
-
-            session = get_boto_session(iam_config, region)
-
-            try:
-                bedrock_client = session.client(
-                    "bedrock", region, endpoint_url=endpoint_url
-                )
-                foundation_models = bedrock_client.list_foundation_models(
-                    byOutputModality="TEXT"
-                )["modelSummaries"]
-
-                def sort_list_by_string(matching_str = "", model_list = []):
-                    for i, model in enumerate(model_list):
-                        if(matching_str in model["modelId"]):
-                            model_list = [model_list[i]] + model_list[:i] + model_list[i+1:]
-                    return model_list
-                
-                # surface anthropic models first, then ai21, then others
-                foundation_models = sort_list_by_string("ai21", foundation_models)
-                foundation_models = sort_list_by_string("anthropic", foundation_models)
-
-                # check the models in config file and apply only if config available
-                # also checking only for ON_DEMAND modelds, filtering FINE_TUNNING and PROVISIONED out
-                for fm in foundation_models:
-                    llm_config=self.get_llm_config(
-                        fm["modelId"], config_model_id_regexs
-                    )
-                    if not llm_config or fm["inferenceTypesSupported"] != ["ON_DEMAND"] or fm["modelId"] in bedrock_config.parameters.hide_models:
-                        continue
-
-                    models += [
-                        BedrockModelItem(
-                            model_id=fm["modelId"],
-                            llm_config=self.get_llm_config(
-                                fm["modelId"], config_model_id_regexs
-                            ),
-                            bedrock_config=bedrock_config.parameters,
-                            callbacks=self.callbacks,
-                            supports_streaming= ("responseStreamingSupported" in fm) and fm["responseStreamingSupported"]
-                        )
-                    ]
-
-            except (
-                botocore.exceptions.EndpointConnectionError,
-                botocore.exceptions.NoCredentialsError,
-                botocore.exceptions.ConnectTimeoutError,
-            ) as err:
-                self.logger.info(
-                    "No Amazon Bedrock models retrieved in %s.\n%s", region, err
-                )
-            except botocore.exceptions.ClientError as err:
-                self.logger.error(
-                    "There was an error while retrieving models from Amazon Bedrock.\n%s",
-                    err,
-                )
-            except botocore.exceptions.UnknownServiceError as err:
-                self.logger.info("Running without Amazon Bedrock.\n%s", err)
+        models_by_config = fan_out(
+            {
+                index: partial(self._get_bedrock_models_for_config, bedrock_config, config_model_id_regexs)
+                for index, bedrock_config in enumerate(self.bedrock_config)
+            },
+            self.logger,
+            "Bedrock models",
+        )
+        models = [model for config_models in models_by_config.values() for model in config_models]
+        if BEDROCK_HEDGING:
+            models += self._get_hedged_bedrock_models(models)
         self.logger.info(
             "%s Bedrock models retrieved in %s seconds",
             len(models),
             time.time() - start_time,
         )
-        self += models
+        return models
+
+    def _get_hedged_bedrock_models(self, models: List[BedrockModelItem]) -> List[BedrockModelItem]:
+        """Get one model per model ID that is available in several regions, which hedges
+        its requests across these regions."""
+        models_by_id: Dict[str, List[BedrockModelItem]] = {}
+        for model in models:
+            models_by_id.setdefault(model.model_id, []).append(model)
+        return [
+            BedrockModelItem(
+                model_id=model_id,
+                llm_config=regional_models[0].llm_config,
+                bedrock_config=regional_models[0].config,
+                callbacks=self.callbacks,
+                supports_streaming=all(model.supports_streaming for model in regional_models),
+                failover_configs=[model.config for model in regional_models[1:]],
+            )
+            for model_id, regional_models in models_by_id.items()
+            if len(regional_models) > 1
+        ]
+
+    def _get_bedrock_models_for_config(
+        self, bedrock_config: AmazonBedrock, config_model_id_regexs: List[re.Pattern]
+    ) -> List[BedrockModelItem]:
+        """Get list of Bedrock models available for one Amazon Bedrock config."""
+        models = []
+        region = bedrock_config.parameters.region.value
+        endpoint_url = bedrock_config.parameters.endpoint_url
+        iam_config = bedrock_config.parameters.iam
+
+        session = get_boto_session(iam_config, region)
+
+        try:
+            bedrock_client = session.client(
+                "bedrock", region, endpoint_url=endpoint_url, config=BOOTSTRAP_CLIENT_CONFIG
+            )
+            foundation_models = bedrock_client.list_foundation_models(
+                byOutputModality="TEXT"
+            )["modelSummaries"]
+
+            def sort_list_by_string(matching_str = "", model_list = []):
+                for i, model in enumerate(model_list):
+                    if(matching_str in model["modelId"]):
+                        model_list = [model_list[i]] + model_list[:i] + model_list[i+1:]
+                return model_list
+            
+            # surface anthropic models first, then ai21, then others
+            foundation_models = sort_list_by_string("ai21", foundation_models)
+            foundation_models = sort_list_by_string("anthropic", foundation_models)
+
+            # check the models in config file and apply only if config available
+            # also checking only for ON_DEMAND modelds, filtering FINE_TUNNING and PROVISIONED out
+            for fm in foundation_models:
+                llm_config=self.get_llm_config(
+                    fm["modelId"], config_model_id_regexs
+                )
+                if not llm_config or fm["inferenceTypesSupported"] != ["ON_DEMAND"] or fm["modelId"] in bedrock_config.parameters.hide_models:
+                    continue
 
-    def _get_sagemaker_models(self):
+                models += [
+                    BedrockModelItem(
+                        model_id=fm["modelId"],
+                        llm_config=self.get_llm_config(
+                            fm["modelId"], config_model_id_regexs
+                        ),
+                        bedrock_config=bedrock_config.parameters,
+                        callbacks=self.callbacks,
+                        supports_streaming= ("responseStreamingSupported" in fm) and fm["responseStreamingSupported"]
+                    )
+                ]
+
+        except (
+            botocore.exceptions.EndpointConnectionError,
+            botocore.exceptions.NoCredentialsError,
+            botocore.exceptions.ConnectTimeoutError,
+        ) as err:
+            self.logger.info(
+                "No Amazon Bedrock models retrieved in %s.\n%s", region, err
+            )
+        except botocore.exceptions.ClientError as err:
+            self.logger.error(
+                "There was an error while retrieving models from Amazon Bedrock.\n%s",
+                err,
+            )
+        except botocore.exceptions.UnknownServiceError as err:
+            self.logger.info("Running without Amazon Bedrock.\n%s", err)
+        return models
+
+    def _get_sagemaker_models(self, config_model_id_regexs: List[re.Pattern]) -> List[SageMakerModelItem]:
         """Get list of SageMaker models available in the account that are part of Genie."""
         start_time = time.time()
         self.logger.info("Retrieving SageMaker models...")
 
-        models = []
+        resources_by_region = fan_out(
+            {
+                region: partial(
+                    self.discovery.get_resources, region, FRIENDLY_NAME_TAG, "sagemaker:endpoint"
+                )
+                for region in self.regions
+            },
+            self.logger,
+            "Tagged SageMaker endpoints",
+        )
 
-        for region in self.regions:
-            sagemaker_client = boto3.client("sagemaker", region)
+        # Own session, the default session is not thread-safe and models bootstrap concurrently
+        session = boto3.Session()
+        sagemaker_clients = {
+            region: session.client("sagemaker", region, config=BOOTSTRAP_CLIENT_CONFIG)
+            for region in resources_by_region
+        }
 
-            paginator = sagemaker_client.get_paginator("list_endpoints")
-            endpoints = paginator.paginate(
-                StatusEquals="InService"
-            ).build_full_result()["Endpoints"]
+        def describe_endpoint(sagemaker_client, endpoint_name):
+            return sagemaker_client.describe_endpoint(EndpointName=endpoint_name)
 
-            for endpoint in endpoints:
-                tags = sagemaker_client.list_tags(ResourceArn=endpoint["EndpointArn"])[
-                    "Tags"
-                ]
-                tags_dict = {tag["Key"]: tag["Value"] for tag in tags}
-
-                if FRIENDLY_NAME_TAG in tags_dict:
-                    friendly_name = tags_dict[FRIENDLY_NAME_TAG]
-
-                    chat_prompt_identifier = "prompts/falcon_chat.yaml"
-                    if "genie:prompt-chat" in tags_dict:
-                        chat_prompt_identifier = tags_dict["genie:prompt-chat"]
-                    rag_prompt_identifier = "prompts/falcon_instruct_rag.yaml"
-                    if "genie:prompt-rag" in tags_dict:
-                        rag_prompt_identifier = tags_dict["genie:prompt-rag"]
-                    async_endpoint_s3 = None
-                    if "genie:async-endpoint-s3" in tags_dict:
-                        async_endpoint_s3 = tags_dict["genie:async-endpoint-s3"]
-
-                    models.append(
-                        SageMakerModelItem(
-                            model_name=friendly_name,
-                            endpoint_name=endpoint["EndpointName"],
-                            region=region,
-                            chat_prompt_identifier=chat_prompt_identifier,
-                            rag_prompt_identifier=rag_prompt_identifier,
-                            async_endpoint_s3=async_endpoint_s3,
-                        )
+        # Details only for the tagged endpoints
+        endpoints = fan_out(
+            {
+                resource: partial(
+                    describe_endpoint, sagemaker_clients[region], resource.resource_id
+                )
+                for region, resources in resources_by_region.items()
+                for resource in resources
+            },
+            self.logger,
+            "SageMaker endpoints",
+        )
+        # ARNs contain the endpoint name in lower case, the description has the actual name
+        tags_by_endpoint = {
+            (resource.region, endpoint["EndpointName"]): resource.tags
+            for resource, endpoint in endpoints.items()
+            if endpoint["EndpointStatus"] == "InService"
+        }
+
+        models = []
+        for (region, endpoint_name), tags_dict in tags_by_endpoint.items():
+            if FRIENDLY_NAME_TAG in tags_dict:
+                friendly_name = tags_dict[FRIENDLY_NAME_TAG]
+
+                chat_prompt_identifier = "prompts/falcon_chat.yaml"
+                if "genie:prompt-chat" in tags_dict:
+                    chat_prompt_identifier = tags_dict["genie:prompt-chat"]
+                rag_prompt_identifier = "prompts/falcon_instruct_rag.yaml"
+                if "genie:prompt-rag" in tags_dict:
+                    rag_prompt_identifier = tags_dict["genie:prompt-rag"]
+                async_endpoint_s3 = None
+                if "genie:async-endpoint-s3" in tags_dict:
+                    async_endpoint_s3 = tags_dict["genie:async-endpoint-s3"]
+
+                models.append(
+                    SageMakerModelItem(
+                        model_name=friendly_name,
+                        endpoint_name=endpoint_name,
+                        region=region,
+                        chat_prompt_identifier=chat_prompt_identifier,
+                        rag_prompt_identifier=rag_prompt_identifier,
+                        async_endpoint_s3=async_endpoint_s3,
+                        llm_config=self.get_llm_config(endpoint_name, config_model_id_regexs),
                     )
+                )
 
         self.logger.info(
             "%s SageMaker models retrieved in %s seconds",
@@ -179,11 +249,19 @@ class ModelCatalog(Catalog):
             time.time() - start_time,
         )
         self.logger.info(models)
-
-        self += models
+        return models
 
     def bootstrap(self) -> None:
         """Bootstraps the catalog."""
         model_id_regex = list(map(re.compile, self.llm_config.keys()))
-        self._get_bedrock_models(model_id_regex)
-        self._get_sagemaker_models()
+        models = fan_out(
+            {
+                "bedrock": partial(self._get_bedrock_models, model_id_regex),
+                "sagemaker": partial(self._get_sagemaker_models, model_id_regex),
+            },
+            self.logger,
+            "Model catalog",
+            deadline=None,
+        )
+        self += models.get("bedrock", [])
+        self += models.get("sagemaker", [])
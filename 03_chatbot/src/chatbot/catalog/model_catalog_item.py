@@ -1,6 +1,8 @@
 """ Abstract base class that represents a catalog item. """
 from dataclasses import dataclass
+from typing import Hashable, Optional
 
+from chatbot.helpers.context_packer import ContextBudget
 from langchain.llms.base import LLM
 
 from .catalog_item import CatalogItem
@@ -21,3 +23,36 @@ class ModelCatalogItem(CatalogItem[LLM]):
 
     streaming_on: bool = False
     """ Whether the model is streaming the response. """
+
+    @property
+    def cache_key(self) -> Optional[Hashable]:
+        """ Identifies the LLM that get_instance returns, so that chains using it can be cached.
+        None if the LLM cannot be shared between sessions. """
+        return None
+
+    def context_budget(self) -> Optional[ContextBudget]:
+        """ Returns the token budget of the prompt from the llmConfig of the model.
+        None if neither contextWindow nor maxContextTokens are configured for the model. """
+        llm_config = getattr(self, "llm_config", None)
+        if llm_config is None:
+            return None
+        parameters = llm_config.parameters
+        if not parameters.context_window and not parameters.max_context_tokens:
+            return None
+        return ContextBudget(
+            context_window=parameters.context_window,
+            max_context_tokens=parameters.max_context_tokens,
+            answer_tokens=parameters.max_token_count or 512,
+        )
+
+    def estimated_wait(self) -> Optional[float]:
+        """ Returns the seconds a request to the model is expected to wait for the rate limit.
+        None if the model is not rate limited. """
+        return None
+
+    def session_view(self) -> "ModelCatalogItem":
+        view = super().session_view()
+        # The sidebar changes model parameters, e.g. the temperature, in place
+        if isinstance(getattr(self, "model_kwargs", None), dict):
+            view.model_kwargs = dict(self.model_kwargs)
+        return view
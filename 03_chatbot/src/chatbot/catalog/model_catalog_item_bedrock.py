@@ -1,12 +1,19 @@
-from typing import Optional
+from typing import Hashable, List, Optional
 
 import boto3
 from chatbot.config import AmazonBedrockParameters, LLMConfig, LLMConfigParameters
-from chatbot.helpers import get_boto_session
+from chatbot.helpers.aws_client_pool import AWS_CLIENT_POOL
+from chatbot.helpers.bedrock_hedging import (
+    BEDROCK_HEDGE_DELAY,
+    BEDROCK_HEDGE_PERCENTILE,
+    HedgedBedrockClient,
+)
 from langchain.llms.base import LLM
 from langchain_community.chat_models import BedrockChat
 #from langchain.llms.bedrock import Bedrock
 from chatbot.helpers import Bedrock
+from chatbot.helpers.lru_cache import freeze
+from chatbot.helpers.rate_limiter import RateLimitedBedrockClient, RateLimiter, get_rate_limiter
 
 from .model_catalog_item import ModelCatalogItem
 
@@ -28,6 +35,8 @@ class BedrockModelItem(ModelCatalogItem):
     [''ai21', 'stability, 'anthropic', 'cohere', 'amazon']"""
     model_kwargs: dict
     """ Model kwargs """
+    failover_configs: List[AmazonBedrockParameters]
+    """ Amazon Bedrock configurations of further regions that answer hedged requests """
 
     llm_config: LLMConfig
 
@@ -38,6 +47,7 @@ class BedrockModelItem(ModelCatalogItem):
         llm_config: Optional[LLMConfig],
         supports_streaming: bool = False,
         callbacks = [],
+        failover_configs: Optional[List[AmazonBedrockParameters]] = None,
         **model_kwargs,
     ):
         if llm_config is None:
@@ -49,6 +59,7 @@ class BedrockModelItem(ModelCatalogItem):
 
         self.llm_config = llm_config
         self.config = bedrock_config
+        self.failover_configs = failover_configs or []
         self.model_kwargs = model_kwargs
         self.model_id = model_id
         self.model_provider = model_id.split(".")[0]
@@ -65,24 +76,82 @@ class BedrockModelItem(ModelCatalogItem):
             streaming_on=supports_streaming
         )
 
-    def get_instance(self) -> LLM:
-        region = self.config.region.value
-        endpoint_url = self.config.endpoint_url
+    @property
+    def configs(self) -> List[AmazonBedrockParameters]:
+        """ Amazon Bedrock configurations of all regions of the model, the own one first """
+        # Items of catalog snapshots taken before hedging have no failover configs
+        return [self.config] + getattr(self, "failover_configs", [])
+
+    @property
+    def cache_key(self) -> Optional[Hashable]:
+        return (
+            "bedrock",
+            self.model_id,
+            tuple(
+                (
+                    config.region.value,
+                    config.endpoint_url,
+                    freeze(config.iam.parameters.to_dict()) if config.iam else None,
+                )
+                for config in self.configs
+            ),
+            freeze(self.model_kwargs),
+            self.supports_streaming and self.streaming_on,
+        )
 
-        iam_config = self.config.iam
+    def _rate_limiter(self, config: AmazonBedrockParameters) -> Optional[RateLimiter]:
+        parameters = self.llm_config.parameters
+        # LLM configs of catalog snapshots taken before rate limiting have no budgets
+        return get_rate_limiter(
+            self.model_id,
+            config.region.value,
+            getattr(parameters, "requests_per_minute", None),
+            getattr(parameters, "tokens_per_minute", None),
+        )
+
+    def _client(self, config: AmazonBedrockParameters, retry: bool = True):
+        """ Returns the bedrock-runtime client of a region, rate limited if the model has budgets """
+        limiter = self._rate_limiter(config)
+        region = config.region.value
+        if limiter is None:
+            # Pooled, so a turn neither creates a client nor resolves credentials
+            return AWS_CLIENT_POOL.get_client(
+                "bedrock-runtime", region, config.endpoint_url, config.iam, max_attempts=None if retry else 1
+            )
+        # Throttled requests are retried through the queue of the limiter, not by the client
+        client = AWS_CLIENT_POOL.get_client("bedrock-runtime", region, config.endpoint_url, config.iam, max_attempts=1)
+        return RateLimitedBedrockClient(client, limiter, max_attempts=AWS_CLIENT_POOL.max_attempts if retry else 1)
 
-        session = get_boto_session(iam_config, region)
+    def estimated_wait(self) -> Optional[float]:
+        limiters = [limiter for limiter in map(self._rate_limiter, self.configs) if limiter]
+        if not limiters:
+            return None
+        # A hedged request goes to the region with the shortest queue first
+        return min(limiter.estimated_wait() for limiter in limiters)
+
+    def get_instance(self) -> LLM:
+        configs = self.configs
+        if len(configs) > 1:
+            # Failing over beats retrying a throttled region, so every region gets one attempt
+            client = HedgedBedrockClient(
+                {config.region.value: self._client(config, retry=False) for config in configs},
+                percentile=BEDROCK_HEDGE_PERCENTILE,
+                default_delay=BEDROCK_HEDGE_DELAY,
+                retry_clients={config.region.value: self._client(config) for config in configs},
+            )
+        else:
+            client = self._client(self.config)
 
         if self.model_id.startswith("anthropic.claude-3") or self.model_id.startswith("anthropic.claude-v2"):
             return BedrockChat(
-                client=session.client("bedrock-runtime", region, endpoint_url=endpoint_url),
+                client=client,
                 model_id=self.model_id,
                 streaming=self.supports_streaming and self.streaming_on,
                 callbacks=self.callbacks,
             )
 
         return Bedrock(
-            client=session.client("bedrock-runtime", region, endpoint_url=endpoint_url),
+            client=client,
             model_id=self.model_id,
             # region_name=region,
             model_kwargs=self.model_kwargs,
@@ -127,7 +196,8 @@ class BedrockModelItem(ModelCatalogItem):
                 }
 
     def _set_default_display_model_name(self):
+        regions = ", ".join(config.region.value for config in self.configs)
         if self.model_provider == "amazon":
-            self.display_model_name = f"(limited preview) Bedrock - {self.model_id.replace(':','.')} - ({self.config.region.value})"
+            self.display_model_name = f"(limited preview) Bedrock - {self.model_id.replace(':','.')} - ({regions})"
         else:
-            self.display_model_name = f"Bedrock - {self.model_id.replace(':','.')} - ({self.config.region.value})"
+            self.display_model_name = f"Bedrock - {self.model_id.replace(':','.')} - ({regions})"
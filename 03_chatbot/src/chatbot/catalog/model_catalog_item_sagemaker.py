@@ -2,14 +2,18 @@
 """
 import json
 import re
-from typing import List
+from typing import Hashable, List, Optional
 
-from langchain import SagemakerEndpoint
 from langchain.llms.base import LLM
 from langchain.llms.sagemaker_endpoint import LLMContentHandler
 
+from chatbot.config import LLMConfig
+
 from .model_catalog_item import ModelCatalogItem
+from chatbot.helpers.aws_client_pool import AWS_CLIENT_POOL
 from chatbot.helpers.sagemaker_async_endpoint import SagemakerAsyncEndpoint
+from chatbot.helpers.sagemaker_streaming_endpoint import SagemakerStreamingEndpoint
+from chatbot.helpers.lru_cache import freeze
 
 
 class SageMakerModelItem(ModelCatalogItem):
@@ -21,6 +25,7 @@ class SageMakerModelItem(ModelCatalogItem):
         chat_prompt_identifier: Amazon S3 URI, local path, or LangChainHub path that stores langchain prompt template to use when chatting with the model. Default: "prompts/falcon_chat.yaml"
         rag_prompt_identifier: Amazon S3 URI, local path, or LangChainHub path that stores langchain prompt template to use when using document retrieval. Default: "prompts/falcon_instruct_rag.yaml"
         region: AWS region where the model is running. Default: us-east-1
+        llm_config: Optional llmConfig of the endpoint, e.g. its context window.
         model_kwargs: Keyword arguments to pass to the model during inference.
 
     Example:
@@ -44,6 +49,8 @@ class SageMakerModelItem(ModelCatalogItem):
     """S3 bucket used by the Asynchronous Sagemaker Endpoint"""
     model_kwargs: dict
     """ SageMaker model kwargs """
+    llm_config: Optional[LLMConfig]
+    """ llmConfig that matches the endpoint name """
 
     def __init__(
         self,
@@ -53,15 +60,21 @@ class SageMakerModelItem(ModelCatalogItem):
         rag_prompt_identifier: str = "prompts/falcon_instruct_rag.yaml",
         region: str = "us-east-1",
         async_endpoint_s3: str | None = None,
+        llm_config: Optional[LLMConfig] = None,
         **model_kwargs,
     ):
         super().__init__(
-            f"SageMaker - {model_name}", chat_prompt_identifier, rag_prompt_identifier
+            f"SageMaker - {model_name}",
+            chat_prompt_identifier,
+            rag_prompt_identifier,
+            # Real-time TGI endpoints stream with InvokeEndpointWithResponseStream
+            supports_streaming=async_endpoint_s3 is None,
         )
         self.region = region
         self.endpoint_name = endpoint_name
         self.model_name = model_name
         self.async_endpoint_s3 = async_endpoint_s3
+        self.llm_config = llm_config
         self.model_kwargs = model_kwargs
 
     class ContentHandler(LLMContentHandler):
@@ -104,9 +117,22 @@ class SageMakerModelItem(ModelCatalogItem):
         stop_words=["[|Human|]", "<|endoftext|>", "[|AI|]", "Best regards"]
     )
 
+    @property
+    def cache_key(self) -> Optional[Hashable]:
+        return (
+            "sagemaker",
+            self.endpoint_name,
+            self.region,
+            self.async_endpoint_s3,
+            freeze(self.model_kwargs),
+            self.supports_streaming and self.streaming_on,
+        )
+
     def get_instance(self) -> LLM:
         if self.async_endpoint_s3 is None:
-            llm_sagemaker = SagemakerEndpoint(
+            llm_sagemaker = SagemakerStreamingEndpoint(
+                client=AWS_CLIENT_POOL.get_client("sagemaker-runtime", self.region),
+                streaming=self.supports_streaming and self.streaming_on,
                 endpoint_name=self.endpoint_name,
                 region_name=self.region,
                 content_handler=self.content_handler,
@@ -116,6 +142,7 @@ class SageMakerModelItem(ModelCatalogItem):
             inputs = (self.async_endpoint_s3).replace("s3://", "").split("/", 1)
             input_bucket, input_prefix = inputs[0], inputs[1]
             llm_sagemaker = SagemakerAsyncEndpoint(
+                    client=AWS_CLIENT_POOL.get_client("sagemaker-runtime", self.region),
                     endpoint_name=self.endpoint_name,
                     region_name=self.region,
                     content_handler=self.content_handler,
@@ -4,7 +4,7 @@ import os
 import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Union
+from typing import Iterable, Union
 
 import boto3
 import yaml
@@ -23,6 +23,20 @@ basedir = os.path.join(dirname, "../")
 class PromptCatalog(CatalogById[PromptCatalogItem]):
     """Class to get and load prompt templates."""
 
+    @classmethod
+    def preloaded(cls, identifiers: Iterable[str]) -> "PromptCatalog":
+        """Returns a prompt catalog with the given prompts loaded, e.g. to refresh a shared catalog.
+
+        Prompts that cannot be loaded are left out and retried on first use.
+        """
+        catalog = cls()
+        for identifier in identifiers:
+            try:
+                catalog[identifier]
+            except Exception:
+                continue
+        return catalog
+
     def _retrieve(self, key: str) -> PromptCatalogItem:
         prompt = self._load_prompt(key)
         return PromptCatalogItem(friendly_name=key, prompt=prompt)
@@ -0,0 +1,201 @@
+""" Module that discovers the AWS resources of the chatbot by their genie:* tags.
+
+Catalogs used to list every resource of a service and then call the tag API of the
+service once per resource. The Resource Groups Tagging API returns all resources that
+carry a tag key, across services and with all of their tags, in a few pages. Catalogs
+then only fetch details of the resources that matched.
+"""
+import json
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from logging import Logger, getLogger
+from typing import Dict, Iterable, List, Optional
+
+import boto3
+from chatbot.helpers import ChatbotEnvironment, ChatbotEnvironmentVariables
+from chatbot.helpers.lru_cache import LRUCache
+
+from .catalog import BOOTSTRAP_CLIENT_CONFIG
+
+MEMORY_TABLE_TAG = "genie:memory-table"
+
+
+@dataclass(frozen=True)
+class TaggedResource:
+    """An AWS resource and its tags.
+
+    Example:
+        ```python
+        resource = TaggedResource(
+            "arn:aws:kendra:eu-west-1:123456789012:index/0123-abcd",
+            {"genie:friendly-name": "AWS documentation"},
+        )
+        resource.resource_type  # "kendra:index"
+        resource.resource_id  # "0123-abcd"
+        ```
+    """
+
+    arn: str
+    tags: Dict[str, str] = field(default_factory=dict, compare=False, hash=False)
+
+    @property
+    def service(self) -> str:
+        return self.arn.split(":", 5)[2]
+
+    @property
+    def region(self) -> str:
+        return self.arn.split(":", 5)[3]
+
+    @property
+    def resource_type(self) -> str:
+        """Resource type in the format of the Resource Groups Tagging API, e.g. sagemaker:endpoint."""
+        resource = self.arn.split(":", 5)[5]
+        return f"{self.service}:{resource.split('/', 1)[0].split(':', 1)[0]}"
+
+    @property
+    def resource_id(self) -> str:
+        """Name or id of the resource, e.g. the DynamoDB table name."""
+        resource = self.arn.split(":", 5)[5]
+        return resource.split("/", 1)[1] if "/" in resource else resource.split(":", 1)[-1]
+
+
+class ResourceDiscovery(ABC):
+    """Finds AWS resources by tag key."""
+
+    @abstractmethod
+    def _find(self, region: str, tag_key: str) -> List[TaggedResource]:
+        """Returns all resources of a region that carry tag_key, across services."""
+
+    def invalidate(self) -> int:
+        """Forgets the resources found so far, e.g. after resources were created or deleted.
+
+        Returns:
+            The number of forgotten queries.
+        """
+        return 0
+
+    def get_resources(self, region: str, tag_key: str, resource_type: str) -> List[TaggedResource]:
+        """Returns the resources of a type that carry a tag key.
+
+        Args:
+            region: AWS region of the resources.
+            tag_key: Tag key that the resources carry, e.g. genie:friendly-name.
+            resource_type: Resource type, e.g. sagemaker:endpoint, kendra:index,
+                es:domain or dynamodb:table.
+        """
+        return [
+            resource
+            for resource in self._find(region, tag_key)
+            if resource.resource_type == resource_type
+        ]
+
+
+class TaggingApiResourceDiscovery(ResourceDiscovery):
+    """Finds resources with the Resource Groups Tagging API.
+
+    One paginated GetResources query per region and tag key answers the lookups of all
+    services. Results are cached for a short time, so that the model, retriever and
+    memory catalogs that bootstrap together share the queries.
+
+    Args:
+        ttl_seconds: Seconds that the resources of a query are reused.
+        logger: Logger for the number of queried pages.
+    """
+
+    def __init__(self, ttl_seconds: float = 60, logger: Logger = getLogger("ResourceDiscoveryLogger")):
+        self.logger = logger
+        self._cache: LRUCache[List[TaggedResource]] = LRUCache(max_size=64, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self.pages = 0
+        """ Number of GetResources pages queried so far. """
+
+    def _query(self, region: str, tag_key: str) -> List[TaggedResource]:
+        # Own session, the default session is not thread-safe and catalogs bootstrap concurrently
+        client = boto3.Session().client(
+            "resourcegroupstaggingapi", region, config=BOOTSTRAP_CLIENT_CONFIG
+        )
+        resources = []
+        pages = 0
+        for page in client.get_paginator("get_resources").paginate(
+            TagFilters=[{"Key": tag_key}], ResourcesPerPage=100
+        ):
+            pages += 1
+            resources += [
+                TaggedResource(
+                    mapping["ResourceARN"],
+                    {tag["Key"]: tag["Value"] for tag in mapping.get("Tags", [])},
+                )
+                for mapping in page["ResourceTagMappingList"]
+            ]
+        with self._lock:
+            self.pages += pages
+        self.logger.info(
+            "%s resources tagged with %s in %s found with %s GetResources pages",
+            len(resources),
+            tag_key,
+            region,
+            pages,
+        )
+        return resources
+
+    def _find(self, region: str, tag_key: str) -> List[TaggedResource]:
+        return self._cache.get_or_create(
+            (region, tag_key), lambda: self._query(region, tag_key)
+        )
+
+    def invalidate(self) -> int:
+        return self._cache.invalidate()
+
+
+class LocalResourceDiscovery(ResourceDiscovery):
+    """Stand-in that finds resources in a fixed list, e.g. for tests and local development.
+
+    Args:
+        resources: Resources with their tags.
+
+    Example:
+        ```python
+        discovery = LocalResourceDiscovery.from_file("resources.json")
+        # resources.json: [{"arn": "arn:aws:dynamodb:eu-west-1:123456789012:table/memory",
+        #                   "tags": {"genie:memory-table": "True"}}]
+        ```
+    """
+
+    def __init__(self, resources: Iterable[TaggedResource]):
+        self.resources = list(resources)
+
+    @classmethod
+    def from_file(cls, path: str) -> "LocalResourceDiscovery":
+        """Reads resources from a JSON file with a list of objects with arn and tags."""
+        with open(path, encoding="utf-8") as file:
+            return cls(TaggedResource(item["arn"], item.get("tags", {})) for item in json.load(file))
+
+    def _find(self, region: str, tag_key: str) -> List[TaggedResource]:
+        return [
+            resource
+            for resource in self.resources
+            if resource.region == region and tag_key in resource.tags
+        ]
+
+
+_resource_discovery: Optional[ResourceDiscovery] = None
+_resource_discovery_lock = threading.Lock()
+
+
+def get_resource_discovery() -> ResourceDiscovery:
+    """Returns the process-wide resource discovery.
+
+    LocalResourceDiscovery with the resources of the file in RESOURCE_DISCOVERY_FILE
+    if it is set, TaggingApiResourceDiscovery otherwise.
+    """
+    global _resource_discovery
+    with _resource_discovery_lock:
+        if _resource_discovery is None:
+            path = ChatbotEnvironment().get_env_variable(
+                ChatbotEnvironmentVariables.ResourceDiscoveryFile
+            )
+            _resource_discovery = (
+                LocalResourceDiscovery.from_file(path) if path else TaggingApiResourceDiscovery()
+            )
+        return _resource_discovery
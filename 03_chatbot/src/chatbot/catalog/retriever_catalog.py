@@ -3,17 +3,19 @@
 import logging
 import time
 from dataclasses import dataclass
+from functools import partial
 from logging import Logger, getLogger
-from operator import itemgetter
-from typing import List
+from typing import List, Optional
 
 import boto3
 import botocore
 import botocore.exceptions
 
-from .catalog import FRIENDLY_NAME_TAG, Catalog
+from .catalog import BOOTSTRAP_CALL_TIMEOUT, BOOTSTRAP_CLIENT_CONFIG, FRIENDLY_NAME_TAG, Catalog, fan_out
 from .retriever_catalog_item_kendra import KendraRetrieverItem
+from .retriever_catalog_item_federated import FEDERATED_SEARCH_CONFIG, FederatedRetrieverItem
 from .retriever_catalog_item_open_search import OpenSearchRetrieverItem
+from .resource_discovery import ResourceDiscovery, get_resource_discovery
 from ..fin_analyzer.retriever_catalog_item_fin_analyzer import FinAnalyzerRetrieverItem
 from chatbot.open_search import get_credentials, get_open_search_index_list
 from chatbot.config import AppConfig
@@ -31,7 +33,8 @@ class RetrieverCatalog(Catalog):
 
     app_config: AppConfig
 
-
+    discovery: ResourceDiscovery
+    """ Finds the tagged Kendra indices and OpenSearch domains. """
 
     def __init__(
         self,
@@ -39,22 +42,69 @@ class RetrieverCatalog(Catalog):
         regions: list,
         app_config: AppConfig,
         logger: Logger = getLogger("RetrieverCatalogLogger"),
+        discovery: Optional[ResourceDiscovery] = None,
     ) -> None:
         self.regions = regions
         self.account_id = account_id
         self.logger = logger
         self.app_config = app_config
+        self.discovery = discovery or get_resource_discovery()
         super().__init__()
 
-    def _get_kendra_indices(self, account):
+    def _get_kendra_index_item(self, kendra_client, region, index_id, tags_dict):
+        """Get the Kendra retriever of a tagged index if it has active data sources."""
+        response = kendra_client.list_data_sources(IndexId=index_id)
+        data_sources = response["SummaryItems"]
+
+        while "NextToken" in response:
+            next_token = response.get("NextToken")
+            response = kendra_client.list_data_sources(
+                IndexId=index_id, NextToken=next_token
+            )
+            data_sources += response["SummaryItems"]
+
+        active_data_sources = list(
+            filter(lambda x: x["Status"] == "ACTIVE", data_sources)
+        )
+        if len(active_data_sources) == 0:
+            return None
+        return KendraRetrieverItem(
+            index_id=index_id,
+            friendly_name=tags_dict[FRIENDLY_NAME_TAG],
+            region=region,
+            data_sources=active_data_sources,
+        )
+
+    def _get_kendra_indices(self, account) -> List[KendraRetrieverItem]:
         """Get list of kendra indices that contain a "friendly-name" tag."""
 
         start_time = time.time()
         self.logger.info("Retrieving Kendra indices...")
-        index_summary_items = []
 
-        for region in self.regions:
-            kendra_client = boto3.client("kendra", region)
+        resources_by_region = fan_out(
+            {
+                region: partial(
+                    self.discovery.get_resources, region, FRIENDLY_NAME_TAG, "kendra:index"
+                )
+                for region in self.regions
+            },
+            self.logger,
+            "Tagged Kendra indices",
+        )
+        tags_by_index = {
+            (region, resource.resource_id): resource.tags
+            for region, resources in resources_by_region.items()
+            for resource in resources
+        }
+
+        # Own session, the default session is not thread-safe and retrievers bootstrap concurrently
+        session = boto3.Session()
+        kendra_clients = {
+            region: session.client("kendra", region, config=BOOTSTRAP_CLIENT_CONFIG)
+            for region in {region for region, _ in tags_by_index}
+        }
+
+        def list_indices(kendra_client):
             response = kendra_client.list_indices()
             index_summary_items = response["IndexConfigurationSummaryItems"]
 
@@ -62,264 +112,291 @@ class RetrieverCatalog(Catalog):
                 next_token = response.get("NextToken")
                 response = kendra_client.list_indices(NextToken=next_token)
                 index_summary_items += response["IndexConfigurationSummaryItems"]
+            return index_summary_items
+
+        index_summary_items_by_region = fan_out(
+            {
+                region: partial(list_indices, kendra_client)
+                for region, kendra_client in kendra_clients.items()
+            },
+            self.logger,
+            "Kendra indices",
+        )
 
-            # Filter out active indices
-            for index in filter(lambda x: x["Status"] == "ACTIVE", index_summary_items):
-                index_id = index["Id"]
-
-                kendra_index_arn = f"arn:aws:kendra:{region}:{account}:index/{index_id}"
-                tags = kendra_client.list_tags_for_resource(
-                    ResourceARN=kendra_index_arn
-                )["Tags"]
-                tags_dict = {tag["Key"]: tag["Value"] for tag in tags}
-                if FRIENDLY_NAME_TAG in tags_dict:
-                    response = kendra_client.list_data_sources(IndexId=index_id)
-                    data_sources = response["SummaryItems"]
-
-                    while "NextToken" in response:
-                        next_token = response.get("NextToken")
-                        response = kendra_client.list_data_sources(
-                            IndexId=index_id, NextToken=next_token
-                        )
-                        data_sources += response["SummaryItems"]
-
-                    active_data_sources = list(
-                        filter(lambda x: x["Status"] == "ACTIVE", data_sources)
-                    )
-                    if len(active_data_sources) > 0:
-                        self.append(
-                            KendraRetrieverItem(
-                                index_id=index_id,
-                                friendly_name=tags_dict[FRIENDLY_NAME_TAG],
-                                region=region,
-                                data_sources=active_data_sources,
-                            )
-                        )
+        # Filter out active indices, details only for the tagged ones
+        kendra_index_items = fan_out(
+            {
+                (region, index["Id"]): partial(
+                    self._get_kendra_index_item,
+                    kendra_clients[region],
+                    region,
+                    index["Id"],
+                    tags_by_index[(region, index["Id"])],
+                )
+                for region, index_summary_items in index_summary_items_by_region.items()
+                for index in filter(lambda x: x["Status"] == "ACTIVE", index_summary_items)
+                if (region, index["Id"]) in tags_by_index
+            },
+            self.logger,
+            "Kendra index data sources",
+        )
+        kendra_indices = [item for item in kendra_index_items.values() if item is not None]
 
         self.logger.info(
             "%s Kendra indices retrieved in %s seconds",
-            len(self),
+            len(kendra_indices),
             time.time() - start_time,
         )
+        return kendra_indices
 
-    def _get_open_search_indices(self, account):
-        """Get list of OpenSearch indices that contain a "friendly-name" tag."""
-        start_time = time.time()
-        self.logger.info("Retrieving OpenSearch indices...")
-        opensearch_indices = []
+    def _get_open_search_domains(self, region, open_search_client, domain_names):
+        """Get the OpenSearch domains of a region or None if OpenSearch cannot be reached."""
+        self.logger.info("OpenSearch region: %s", region)
+        self.logger.info("OpenSearch domain names: %s", domain_names)
 
-        for region in self.regions:
-            # Get OpenSearch domains
-            self.logger.info("OpenSearch region: %s", region)
-            open_search_client = boto3.client("opensearch", region)
+        self.logger.info("describe_domains...")
+        domains = []
+        # DescribeDomains accepts up to 5 domain names per call
+        for i in range(0, len(domain_names), 5):
             try:
-                response = open_search_client.list_domain_names(EngineType="OpenSearch")
+                response = open_search_client.describe_domains(DomainNames=domain_names[i:i + 5])
             except (
                 botocore.exceptions.ClientError,
                 botocore.exceptions.ConnectTimeoutError,
             ):
                 self.logger.info(
-                    f"Not using OpenSearch in region {region}. Cannot connect to OpenSearch to list domains."
+                    f"Not using OpenSearch in region {region}. Cannot connect to OpenSearch to describe domains."
                 )
-                continue
-            self.logger.info("OpenSearch response: %s", response)
-
-            domain_names = [
-                name_dict["DomainName"] for name_dict in response["DomainNames"]
-            ]
-            self.logger.info("OpenSearch domain names: %s", domain_names)
+                return None
+            domains += response["DomainStatusList"]
+        # The tagging API returns Elasticsearch domains too
+        return [
+            domain for domain in domains
+            if domain.get("EngineVersion", "OpenSearch").startswith("OpenSearch")
+        ]
+
+    def _get_open_search_domain_item(
+        self, region, domain, tags_dict, sagemaker_client, secrets_manager_client
+    ):
+        """Get the OpenSearch retriever of a tagged domain if it has indices."""
+        domain_arn = domain["ARN"]
+        self.logger.info("domain: %s", domain_arn)
+
+        friendly_name_tag_value = tags_dict.get(FRIENDLY_NAME_TAG)
+        secrets_tag_value = tags_dict.get("genie:secrets-id")
+        embedding_sagemaker_name = tags_dict.get("genie:sagemaker-embedding-endpoint-name")
+
+        vpc_endpoint_value = tags_dict.get("genie:chatbot_vpc_endpoint")
+
+        if (
+            friendly_name_tag_value
+            and secrets_tag_value
+            # We can have bedrock now
+            # and embedding_sagemaker_name
+        ):
 
-            self.logger.info("describe_domains...")
             try:
-                response = open_search_client.describe_domains(DomainNames=domain_names)
+                embedding_endpoint = sagemaker_client.describe_endpoint(
+                    EndpointName=embedding_sagemaker_name
+                )
             except (
                 botocore.exceptions.ClientError,
                 botocore.exceptions.ConnectTimeoutError,
             ):
                 self.logger.info(
-                    f"Not using OpenSearch in region {region}. Cannot connect to OpenSearch to describe domains."
+                    f"Cannot connect to embeddings endpoint {embedding_sagemaker_name} on Amazon SageMaker for OpenSearch domain {domain_arn}."
                 )
-                continue
-            domains = response["DomainStatusList"]
+                # No need to skip, as we can have Bedrock embeddings
+                # return None
+
+            # # No need to skip as bedrock can be used
+            # if (
+            #     not embedding_endpoint
+            #     or "EndpointStatus" not in embedding_endpoint
+            #     or embedding_endpoint["EndpointStatus"] != "InService"
+            # ):
+            #     self.logger.info(
+            #         f"Ignoring OpenSearch domain {domain_arn} because embeddings endpoint {embedding_sagemaker_name} on Amazon SageMaker is not in service."
+            #     )
+            #     return None
 
-            sagemaker_client = boto3.client("sagemaker", region)
-            secrets_manager_client = boto3.client("secretsmanager", region)
+            try:
+                secret = get_credentials(
+                    secrets_tag_value, region, client=secrets_manager_client
+                )
+                os_http_auth = (secret["user"] or "admin", secret["password"])
+            except (
+                botocore.exceptions.ClientError,
+                botocore.exceptions.ConnectTimeoutError,
+            ):
+                self.logger.info(
+                    f"Cannot get credentials for OpenSearch domain from AWS Secrets Manager. Ignoring OpenSearch domain {domain_arn}."
+                )
+                return None
 
-            active_domain_filter = (
-                lambda domain: not domain["Processing"] and domain["Created"]
-            )
-            for domain in filter(active_domain_filter, domains):
-                domain_arn = domain["ARN"]
-                self.logger.info("domain: %s", domain_arn)
-                try:
-                    tags = open_search_client.list_tags(ARN=domain_arn)["TagList"]
-                except (
-                    botocore.exceptions.ClientError,
-                    botocore.exceptions.ConnectTimeoutError,
-                ):
-                    self.logger.info(
-                        f"Cannot connect to OpenSearch to list tags for {domain_arn}."
-                    )
-                    continue
-                tags_keys = list(map(itemgetter("Key"), tags))
-                
-                
-                def get_genai_tag_value_by_key(tags, key):
-                    if key not in tags_keys:
+            try:
+                #vpc_id = self.environment.get_env_variable(ChatbotEnvironmentVariables.Vpc)
+
+                endpoint = None
+                if vpc_endpoint_value:
+                    # get the VPC endpoint for the domain
+
+                    # next_token = None
+
+                    # list_endpoint_response = open_search_client.list_vpc_endpoints_for_domain(
+                    #     DomainName=domain["DomainName"],
+                    #     NextToken=next_token
+                    # )
+                    # if 'NextToken' in list_endpoint_response:
+                    #     next_token = list_endpoint_response['NextToken']
+                    # else: 
+                    #     next_token = None
+                    # available_vpc_endpoint_ids = [vpc_endpoint['VpcEndpointId']  for vpc_endpoint in list_endpoint_response['VpcEndpointSummaryList'] if vpc_endpoint['VpcEndpointOwner'] == account and vpc_endpoint['Status'] == "ACTIVE"]
+                    # describe_vpc_endpoints_response = open_search_client.describe_vpc_endpoints(
+                    #     VpcEndpointIds=available_vpc_endpoint_ids
+                    # )
+                    # vpc_endpoints_in_vpc = [vpc_endpoint for vpc_endpoint in describe_vpc_endpoints_response['VpcEndpoints'] if vpc_endpoint['VpcOptions']['VPCId'] == vpc_id]
+                    endpoint = vpc_endpoint_value
+                else:
+                    if 'Endpoint' in domain:
+                        endpoint=domain['Endpoint']
+                    elif 'EndpointV2' in domain:
+                        endpoint=domain['EndpointV2']
+                    elif 'Endpoints' in domain:
+                        endpoint = domain['Endpoints']['vpc']
+                    else:
+                        self.logger.info(
+                            f"Cannot get endpoint for OpenSearch domain. Ignoring OpenSearch domain {domain_arn}."
+                        )
                         return None
-                    return tags[list(map(itemgetter("Key"), tags)).index(key)][
-                        "Value"
-                    ]
 
-                friendly_name_tag_value = get_genai_tag_value_by_key(
-                    tags, FRIENDLY_NAME_TAG
+                if endpoint:
+                    domain['Endpoint'] = endpoint
+
+                    data_sources = get_open_search_index_list(
+                        region, domain, os_http_auth, request_timeout=BOOTSTRAP_CALL_TIMEOUT
+                    )                    
+
+                    # Get the corresponding flow configuration and update with required information
+                    rag_config = self.app_config.flow_config.parameters.flows["Retrieval Augmented Generation"]                            
+
+                    if friendly_name_tag_value in rag_config:
+                        # Copy, the flow config is shared and credentials must not end up in it
+                        embedding_config = dict(rag_config[friendly_name_tag_value])
+                    else: 
+                        embedding_config = {}
+
+                    embedding_config["endpoint"] = f"https://{domain['Endpoint']}"
+                    embedding_config["region"] = region
+
+                    # taking first badrock region, not sure why there should be more than 1 in the setup
+                    embedding_config["bedrock_region"] = self.app_config.amazon_bedrock[0].parameters.region.value
+                    embedding_config["http_auth"] = os_http_auth
+                    embedding_config["secret_id"] = secrets_tag_value
+                    embedding_config["default_embadding_name"] = embedding_sagemaker_name
+
+                    if data_sources:
+                        return OpenSearchRetrieverItem(
+                            friendly_name=friendly_name_tag_value,
+                            data_sources = data_sources,
+                            rag_config=rag_config,
+                            embedding_config=embedding_config,
+                        )
+
+
+            except (
+                opensearchpy.ImproperlyConfigured,
+                opensearchpy.OpenSearchException
+            ) as e:
+                self.logger.info(
+                    f"Cannot connect to OpenSearch domain. Ignoring OpenSearch domain {domain_arn}. {str(e)}"
                 )
-                secrets_tag_value = get_genai_tag_value_by_key(
-                    tags, "genie:secrets-id"
+                return None
+
+        return None
+
+    def _get_open_search_indices(self, account) -> List[OpenSearchRetrieverItem]:
+        """Get list of OpenSearch indices that contain a "friendly-name" tag."""
+        start_time = time.time()
+        self.logger.info("Retrieving OpenSearch indices...")
+
+        resources_by_region = fan_out(
+            {
+                region: partial(
+                    self.discovery.get_resources, region, FRIENDLY_NAME_TAG, "es:domain"
                 )
-                embedding_sagemaker_name = get_genai_tag_value_by_key(
-                    tags,
-                    "genie:sagemaker-embedding-endpoint-name",
+                for region in self.regions
+            },
+            self.logger,
+            "Tagged OpenSearch domains",
+        )
+        tags_by_domain_arn = {
+            resource.arn: resource.tags
+            for resources in resources_by_region.values()
+            for resource in resources
+        }
+
+        # Own session, the default session is not thread-safe and retrievers bootstrap concurrently
+        session = boto3.Session()
+        clients = {
+            region: {
+                service: session.client(service, region, config=BOOTSTRAP_CLIENT_CONFIG)
+                for service in ("opensearch", "sagemaker", "secretsmanager")
+            }
+            for region, resources in resources_by_region.items()
+            if resources
+        }
+
+        # Details only for the tagged domains
+        domains_by_region = fan_out(
+            {
+                region: partial(
+                    self._get_open_search_domains,
+                    region,
+                    region_clients["opensearch"],
+                    [resource.resource_id for resource in resources_by_region[region]],
                 )
+                for region, region_clients in clients.items()
+            },
+            self.logger,
+            "OpenSearch domains",
+        )
 
-                vpc_endpoint_value = get_genai_tag_value_by_key(
-                    tags,
-                    "genie:chatbot_vpc_endpoint",
+        active_domain_filter = (
+            lambda domain: not domain["Processing"] and domain["Created"]
+        )
+        open_search_domain_items = fan_out(
+            {
+                (region, domain["ARN"]): partial(
+                    self._get_open_search_domain_item,
+                    region,
+                    domain,
+                    tags_by_domain_arn.get(domain["ARN"], {}),
+                    clients[region]["sagemaker"],
+                    clients[region]["secretsmanager"],
                 )
+                for region, domains in domains_by_region.items()
+                if domains
+                for domain in filter(active_domain_filter, domains)
+            },
+            self.logger,
+            "OpenSearch domain indices",
+        )
+        opensearch_indices = [
+            item for item in open_search_domain_items.values() if item is not None
+        ]
 
-                if (
-                    friendly_name_tag_value
-                    and secrets_tag_value
-                    # We can have bedrock now
-                    # and embedding_sagemaker_name
-                ):
-                    
-                    try:
-                        embedding_endpoint = sagemaker_client.describe_endpoint(
-                            EndpointName=embedding_sagemaker_name
-                        )
-                    except (
-                        botocore.exceptions.ClientError,
-                        botocore.exceptions.ConnectTimeoutError,
-                    ):
-                        self.logger.info(
-                            f"Cannot connect to embeddings endpoint {embedding_sagemaker_name} on Amazon SageMaker for OpenSearch domain {domain_arn}."
-                        )
-                        # No need to skip, as we can have Bedrock embeddings
-                        # continue
-
-                    # # No need to skip as bedrock can be used
-                    # if (
-                    #     not embedding_endpoint
-                    #     or "EndpointStatus" not in embedding_endpoint
-                    #     or embedding_endpoint["EndpointStatus"] != "InService"
-                    # ):
-                    #     self.logger.info(
-                    #         f"Ignoring OpenSearch domain {domain_arn} because embeddings endpoint {embedding_sagemaker_name} on Amazon SageMaker is not in service."
-                    #     )
-                    #     continue
-
-                    try:
-                        secret = get_credentials(secrets_tag_value, region)
-                        os_http_auth = (secret["user"] or "admin", secret["password"])
-                    except (
-                        botocore.exceptions.ClientError,
-                        botocore.exceptions.ConnectTimeoutError,
-                    ):
-                        self.logger.info(
-                            f"Cannot get credentials for OpenSearch domain from AWS Secrets Manager. Ignoring OpenSearch domain {domain_arn}."
-                        )
-                        continue
-                    
-                    try:
-                        #vpc_id = self.environment.get_env_variable(ChatbotEnvironmentVariables.Vpc)
-
-                        endpoint = None
-                        if vpc_endpoint_value:
-                            # get the VPC endpoint for the domain
-
-                            # next_token = None
-
-                            # list_endpoint_response = open_search_client.list_vpc_endpoints_for_domain(
-                            #     DomainName=domain["DomainName"],
-                            #     NextToken=next_token
-                            # )
-                            # if 'NextToken' in list_endpoint_response:
-                            #     next_token = list_endpoint_response['NextToken']
-                            # else: 
-                            #     next_token = None
-                            # available_vpc_endpoint_ids = [vpc_endpoint['VpcEndpointId']  for vpc_endpoint in list_endpoint_response['VpcEndpointSummaryList'] if vpc_endpoint['VpcEndpointOwner'] == account and vpc_endpoint['Status'] == "ACTIVE"]
-                            # describe_vpc_endpoints_response = open_search_client.describe_vpc_endpoints(
-                            #     VpcEndpointIds=available_vpc_endpoint_ids
-                            # )
-                            # vpc_endpoints_in_vpc = [vpc_endpoint for vpc_endpoint in describe_vpc_endpoints_response['VpcEndpoints'] if vpc_endpoint['VpcOptions']['VPCId'] == vpc_id]
-                            endpoint = vpc_endpoint_value
-                        else:
-                            if 'Endpoint' in domain:
-                                endpoint=domain['Endpoint']
-                            elif 'EndpointV2' in domain:
-                                endpoint=domain['EndpointV2']
-                            elif 'Endpoints' in domain:
-                                endpoint = domain['Endpoints']['vpc']
-                            else:
-                                self.logger.info(
-                                    f"Cannot get endpoint for OpenSearch domain. Ignoring OpenSearch domain {domain_arn}."
-                                )
-                                continue
-
-                        if endpoint:
-                            domain['Endpoint'] = endpoint
-
-                            secret = get_credentials(secrets_tag_value, region)
-                            os_http_auth = (secret["user"] or "admin", secret["password"])
-                            data_sources = get_open_search_index_list(region, domain, os_http_auth)                    
-
-                            # Get the corresponding flow configuration and update with required information
-                            rag_config = self.app_config.flow_config.parameters.flows["Retrieval Augmented Generation"]                            
-                            
-                            if friendly_name_tag_value in rag_config:
-                                embedding_config = rag_config[friendly_name_tag_value]
-                            else: 
-                                embedding_config = {}
-
-                            embedding_config["endpoint"] = f"https://{domain['Endpoint']}"
-                            embedding_config["region"] = region
-
-                            # taking first badrock region, not sure why there should be more than 1 in the setup
-                            embedding_config["bedrock_region"] = self.app_config.amazon_bedrock[0].parameters.region.value
-                            embedding_config["http_auth"] = os_http_auth
-                            embedding_config["default_embadding_name"] = embedding_sagemaker_name
-                            
-                            if data_sources:
-                                opensearch_indices.append(
-                                    OpenSearchRetrieverItem(
-                                        friendly_name=friendly_name_tag_value,
-                                        data_sources = data_sources,
-                                        rag_config=rag_config,
-                                        embedding_config=embedding_config,
-                                    )
-                                )
-
-
-                    except (
-                        opensearchpy.ImproperlyConfigured,
-                        opensearchpy.OpenSearchException
-                    ) as e:
-                        self.logger.info(
-                            f"Cannot connect to OpenSearch domain. Ignoring OpenSearch domain {domain_arn}. {str(e)}"
-                        )
-                        continue
-
-        self += opensearch_indices
         self.logger.info(
             "%s OpenSearch indices retrieved in %s seconds",
             len(opensearch_indices),
             time.time() - start_time,
         )
+        return opensearch_indices
 
-    def _get_fin_analyzer_indices(self, account):
+    def _get_fin_analyzer_indices(self, account) -> List[FinAnalyzerRetrieverItem]:
         """Get list of FinAnalyzer indices, based on application config (appconfig.json)."""
-        
+        fin_analyzer_indices = []
+
         # Checking Finance Analyzer configuration in appconfig.json
         flows = self.app_config.flow_config.parameters.flows
         if "Retrieval Augmented Generation" in flows:
@@ -334,14 +411,14 @@ class RetrieverCatalog(Catalog):
             self.logger.info(
                 f"Skipping Finance Analyzer indices due to missing configuration."
             )
-            return
+            return fin_analyzer_indices
 
         start_time = time.time()
         logging.info("Retrieving FinAnalyzer indices...")
 
         for region in self.regions:
             try:
-                self.append(
+                fin_analyzer_indices.append(
                     FinAnalyzerRetrieverItem(
                         index_id="FinAnalyzer",
                         config=config,
@@ -355,12 +432,34 @@ class RetrieverCatalog(Catalog):
 
         logging.info(
             "%s FinAnalyzer indices retrieved in %s seconds",
-            len(self),
+            len(fin_analyzer_indices),
             time.time() - start_time,
         )
+        return fin_analyzer_indices
 
     def bootstrap(self) -> None:
-        """Bootstraps the catalog."""
-        self._get_kendra_indices(self.account_id)
-        self._get_open_search_indices(self.account_id)
-        self._get_fin_analyzer_indices(self.account_id)
+        """Bootstraps the catalog.
+
+        Kendra, OpenSearch and FinAnalyzer are discovered concurrently. Each of them
+        fans out its AWS API calls with a deadline, so the catalog contains the
+        retrievers that could be reached in time. If federatedSearch is enabled, a
+        federated retriever over the Kendra and OpenSearch retrievers comes last.
+        """
+        retrievers = fan_out(
+            {
+                "kendra": partial(self._get_kendra_indices, self.account_id),
+                "opensearch": partial(self._get_open_search_indices, self.account_id),
+                "finanalyzer": partial(self._get_fin_analyzer_indices, self.account_id),
+            },
+            self.logger,
+            "Retrievers",
+            deadline=None,
+        )
+        for source in ("kendra", "opensearch", "finanalyzer"):
+            self += retrievers.get(source, [])
+
+        rag = self.app_config.flow_config.parameters.flows.get("Retrieval Augmented Generation", {})
+        federated_config = rag.get(FEDERATED_SEARCH_CONFIG)
+        sources = retrievers.get("kendra", []) + retrievers.get("opensearch", [])
+        if federated_config and federated_config.get("enabled") and len(sources) > 1:
+            self.append(FederatedRetrieverItem.from_config(sources, federated_config))
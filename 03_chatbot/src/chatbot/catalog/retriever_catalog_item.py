@@ -1,10 +1,11 @@
 """ Module that contains an abstract base class that represents a retriever catalog item.
 """
 from dataclasses import dataclass
-from typing import Any, List, Tuple, Union
+from typing import Any, Callable, Hashable, List, Optional, Tuple, Union
 
 from chatbot.llm_app import BaseLLMApp, LLMApp, RAGApp
 from langchain.schema import BaseRetriever
+from langchain.schema.embeddings import Embeddings
 
 from .catalog import CatalogById
 from .catalog_item import CatalogItem
@@ -26,3 +27,19 @@ class RetrieverCatalogItem(CatalogItem[BaseRetriever]):
     @current_filter.setter
     def current_filter(self, value: List[Tuple[str, Any]]):
         pass
+
+    @property
+    def cache_key(self) -> Optional[Hashable]:
+        """ Identifies the retriever and its current selection, so that chains using it can be cached.
+        None if the retriever keeps state between turns and cannot be shared between sessions. """
+        return None
+
+    def index_fingerprint_function(self) -> Optional[Callable[[], Hashable]]:
+        """ Returns a function that returns a value which changes when the selected index is re-ingested.
+        None if re-ingestion cannot be detected. """
+        return None
+
+    def query_embeddings(self) -> Optional[Embeddings]:
+        """ Returns the embeddings that the retriever uses for queries.
+        None if the retriever does not embed queries itself. """
+        return None
@@ -0,0 +1,132 @@
+""" Module that contains a class that represents a federated retriever catalog item. """
+import copy
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union
+
+from chatbot.helpers.federated_retriever import FederatedRetriever
+from chatbot.helpers.logger import TECHNICAL_LOGGER_NAME
+from chatbot.helpers.metrics import record_count
+from langchain.schema import BaseRetriever
+
+from .retriever_catalog_item import RetrieverCatalogItem
+from .retriever_catalog_item_kendra import KendraRetrieverItem
+from .retriever_catalog_item_open_search import OpenSearchRetrieverItem
+
+FEDERATED_SEARCH_CONFIG = "federatedSearch"
+""" Key of the federated search config in the Retrieval Augmented Generation flow config. """
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+
+@dataclass
+class FederatedRetrieverItem(RetrieverCatalogItem):
+    """Class that represents a retriever catalog item that searches Kendra indices
+    and OpenSearch indices of other retriever catalog items together."""
+
+    sources: List[Union[KendraRetrieverItem, OpenSearchRetrieverItem]]
+    """ Kendra and OpenSearch retriever catalog items to search. Shared, never changed. """
+
+    deadline_seconds: float
+    """ Seconds to wait for the knowledge bases, slower ones are left out. """
+
+    rrf_k: int
+    """ Rank constant of reciprocal rank fusion. """
+
+    _selected_data_sources: List[Tuple[str, Any]]
+    """ Kendra indices and OpenSearch indices that are selected. All if none are selected. """
+
+    def __init__(self, friendly_name, sources, deadline_seconds=8, rrf_k=60, top_k=3):
+        super().__init__(friendly_name)
+        self.sources = sources
+        self.deadline_seconds = deadline_seconds
+        self.rrf_k = rrf_k
+        self.top_k = top_k
+        self._selected_data_sources = []
+
+    @staticmethod
+    def from_config(sources, config: dict) -> "FederatedRetrieverItem":
+        """Creates the item from the federatedSearch section of the Retrieval Augmented Generation flow config."""
+        return FederatedRetrieverItem(
+            config.get("friendlyName", "All knowledge bases"),
+            sources,
+            deadline_seconds=float(config.get("deadlineSeconds", 8)),
+            rrf_k=int(config.get("rrfK", 60)),
+        )
+
+    @property
+    def available_filter_options(self) -> Union[List[Tuple[str, Any]], None]:
+        options = []
+        for position, source in enumerate(self.sources):
+            if isinstance(source, OpenSearchRetrieverItem):
+                options += [
+                    (f"{source.friendly_name} / {name}", (position, name))
+                    for name, _ in source.available_filter_options
+                ]
+            else:
+                options.append((source.friendly_name, (position, None)))
+        return options
+
+    @property
+    def current_filter(self) -> List[Tuple[str, Any]]:
+        return list(self._selected_data_sources)
+
+    @current_filter.setter
+    def current_filter(self, value: List[Tuple[str, Any]]):
+        available = self.available_filter_options
+        self._selected_data_sources = [option for option in value if option in available]
+
+    @property
+    def cache_key(self) -> Optional[Hashable]:
+        return (
+            "federated",
+            self.friendly_name,
+            tuple(option[1] for option in self._selected_data_sources),
+            self.top_k,
+        )
+
+    def _source_retrievers(self) -> Dict[str, BaseRetriever]:
+        """Returns the retrievers of the selected sources by name.
+
+        Sources whose retriever cannot be created, e.g. because the domain is unreachable,
+        are left out. Only if none of them can be created the first error is raised.
+        """
+        selected = self._selected_data_sources or self.available_filter_options
+        index_names: Dict[int, List[str]] = {}
+        for _, (position, index_name) in selected:
+            index_names.setdefault(position, [])
+            if index_name is not None:
+                index_names[position].append(index_name)
+
+        retrievers = {}
+        errors: List[Exception] = []
+        for position, names in index_names.items():
+            # A session view, the sources are shared with other sessions
+            source = copy.copy(self.sources[position])
+            source.top_k = self.top_k
+            if isinstance(source, OpenSearchRetrieverItem):
+                source.current_filter = [
+                    option for option in source.available_filter_options if option[0] in names
+                ]
+            else:
+                source.current_filter = source.available_filter_options
+            name = source.friendly_name
+            if name in retrievers:
+                name = f"{name} ({source.region})"
+            try:
+                retrievers[name] = source.get_instance()
+            except Exception as error:
+                logger.warning("Leaving out knowledge base %s. %s", name, error)
+                record_count("federated_retrieval_source_error", index=name, Error=type(error).__name__)
+                errors.append(error)
+        if not retrievers and errors:
+            raise errors[0]
+        return retrievers
+
+    def get_instance(self) -> BaseRetriever:
+        return FederatedRetriever(
+            retrievers=self._source_retrievers(),
+            k=self.top_k,
+            deadline_seconds=self.deadline_seconds,
+            rrf_k=self.rrf_k,
+        )
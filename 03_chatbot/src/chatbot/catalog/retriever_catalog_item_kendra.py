@@ -1,6 +1,6 @@
 """ Module that contains a class that represents a Kendra retriever catalog item. """
 from dataclasses import dataclass, field
-from typing import Any, List, Tuple, Union
+from typing import Any, Callable, Hashable, List, Optional, Tuple, Union
 
 from langchain.retrievers.kendra import AmazonKendraRetriever
 from langchain.schema import BaseRetriever
@@ -54,6 +54,28 @@ class KendraRetrieverItem(RetrieverCatalogItem):
         )
         self._selected_data_sources = selected_and_part_of_index
 
+    @property
+    def cache_key(self) -> Optional[Hashable]:
+        return (
+            "kendra",
+            self.index_id,
+            self.region,
+            tuple(src[1]["Id"] for src in self._selected_data_sources),
+            self.top_k,
+        )
+
+    def index_fingerprint_function(self) -> Optional[Callable[[], Hashable]]:
+        index_id = self.index_id
+        region = self.region
+
+        def fingerprint() -> Hashable:
+            # Syncing a data source changes the number or size of the indexed documents
+            response = boto3.client("kendra", region_name=region).describe_index(Id=index_id)
+            statistics = response["IndexStatistics"]["TextDocumentStatistics"]
+            return (statistics["IndexedTextDocumentsCount"], statistics["IndexedTextBytes"])
+
+        return fingerprint
+
     def get_instance(self) -> BaseRetriever:
         data_src_filters = [
             {
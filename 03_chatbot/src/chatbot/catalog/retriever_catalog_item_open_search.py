@@ -1,12 +1,19 @@
 """ Module that contains a class that represents a OpenSearch retriever catalog item. """
 from dataclasses import dataclass
-from typing import List
-
-from chatbot.open_search import OpenSearchIndexRetriever
+from typing import Any, Callable, Hashable, List, Optional, Tuple, Union
+
+from chatbot.open_search import (
+    OPEN_SEARCH_CLIENT_POOL,
+    MultiIndexOpenSearchRetriever,
+    OpenSearchIndexRetriever,
+    get_credentials,
+    get_embedding_spec,
+)
+from chatbot.helpers.lru_cache import freeze
 from langchain.schema import BaseRetriever
+from langchain.schema.embeddings import Embeddings
 
 from .retriever_catalog_item import RetrieverCatalogItem
-from typing import Any, List, Tuple, Union
 import streamlit as st
 
 @dataclass
@@ -48,6 +55,28 @@ class OpenSearchRetrieverItem(RetrieverCatalogItem):
         self.embedding_config = embedding_config
         self.top_k = top_k
 
+    def __copy__(self):
+        # Session views keep the credentials, see __getstate__
+        view = self.__class__.__new__(self.__class__)
+        view.__dict__.update(self.__dict__)
+        return view
+
+    def __getstate__(self):
+        # Credentials are not written to the catalog snapshot
+        state = self.__dict__.copy()
+        state["embedding_config"] = {
+            key: value for key, value in self.embedding_config.items() if key != "http_auth"
+        }
+        return state
+
+    def __setstate__(self, state):
+        # Read the credentials again when the catalog snapshot is loaded
+        self.__dict__.update(state)
+        secret_id = self.embedding_config.get("secret_id")
+        if "http_auth" not in self.embedding_config and secret_id:
+            secret = get_credentials(secret_id, self.region)
+            self.embedding_config["http_auth"] = (secret["user"] or "admin", secret["password"])
+
     @property
     def available_filter_options(self) -> Union[List[Tuple[str, Any]], None]:
         return [(data_src["index"], data_src) for data_src in self._data_sources]
@@ -66,11 +95,57 @@ class OpenSearchRetrieverItem(RetrieverCatalogItem):
         self._selected_data_sources = selected_and_part_of_index
 
 
+    @property
+    def cache_key(self) -> Optional[Hashable]:
+        return (
+            "opensearch",
+            self.friendly_name,
+            self.embedding_config["endpoint"],
+            tuple(src[0] for src in self._selected_data_sources),
+            self.top_k,
+            # Character limits, timeouts, hybrid search and embeddings of the indices
+            freeze(self.rag_config),
+            freeze({key: value for key, value in self.embedding_config.items() if key != "http_auth"}),
+        )
+
+    def index_fingerprint_function(self) -> Optional[Callable[[], Hashable]]:
+        if len(self._selected_data_sources) == 0:
+            return None
+        index_names = ",".join(src[0] for src in self._selected_data_sources)
+        endpoint = self.embedding_config["endpoint"]
+        http_auth = self.embedding_config["http_auth"]
+        region = self.region
+
+        def fingerprint() -> Hashable:
+            # A re-ingested index gets a new uuid or a new document count
+            client = OPEN_SEARCH_CLIENT_POOL.get_client(endpoint, region, http_auth)
+            response = client.cat.indices(index=index_names, format="json", h="index,uuid,docs.count")
+            return tuple(sorted((item["index"], item["uuid"], item["docs.count"]) for item in response))
+
+        return fingerprint
+
+    def query_embeddings(self) -> Optional[Embeddings]:
+        embeddings = {
+            get_embedding_spec(src[0], self.embedding_config) for src in self._selected_data_sources
+        }
+        # Indices with different embedding models have no common query embedding
+        if len(embeddings) != 1:
+            return None
+        return OPEN_SEARCH_CLIENT_POOL.get_embeddings(*embeddings.pop())
+
     def get_instance(self) -> BaseRetriever:
-        if len(self._selected_data_sources) != 1:
-            st.error('Please select exactly one data source.')
+        if len(self._selected_data_sources) == 0:
+            st.error('Please select at least one data source.')
             return None
-        
+
+        if len(self._selected_data_sources) > 1:
+            return MultiIndexOpenSearchRetriever(
+                [src[0] for src in self._selected_data_sources],
+                rag_config=self.rag_config,
+                embedding_config=self.embedding_config,
+                k=self.top_k,
+            )
+
         index_name = self._selected_data_sources[0][0]
 
         retriever = OpenSearchIndexRetriever(
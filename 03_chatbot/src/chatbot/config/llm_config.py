@@ -40,6 +40,20 @@ class LLMConfigParameters:
     options. The result is more stable and repetitive completions.
     """
     top_p: Optional[float] = None
+    """Number of tokens of the model's context window. Retrieved documents are packed into
+    what the prompt, the chat history and the answer leave of it.
+    """
+    context_window: Optional[int] = None
+    """Maximum number of tokens of retrieved documents in the prompt."""
+    max_context_tokens: Optional[int] = None
+    """Requests per minute that the chatbot process sends to the model per region at most.
+    Further requests wait in a queue.
+    """
+    requests_per_minute: Optional[int] = None
+    """Prompt and answer tokens per minute that the chatbot process sends to the model per
+    region at most. Further requests wait in a queue.
+    """
+    tokens_per_minute: Optional[int] = None
 
     @staticmethod
     def from_dict(obj: Any) -> "LLMConfigParameters":
@@ -52,8 +66,21 @@ class LLMConfigParameters:
         )
         temperature = from_union([from_float, from_none], obj.get("temperature"))
         top_p = from_union([from_float, from_none], obj.get("topP"))
+        context_window = from_union([from_int, from_none], obj.get("contextWindow"))
+        max_context_tokens = from_union([from_int, from_none], obj.get("maxContextTokens"))
+        requests_per_minute = from_union([from_int, from_none], obj.get("requestsPerMinute"))
+        tokens_per_minute = from_union([from_int, from_none], obj.get("tokensPerMinute"))
         return LLMConfigParameters(
-            chat_prompt, max_token_count, rag_prompt, stop_sequence, temperature, top_p
+            chat_prompt,
+            max_token_count,
+            rag_prompt,
+            stop_sequence,
+            temperature,
+            top_p,
+            context_window,
+            max_context_tokens,
+            requests_per_minute,
+            tokens_per_minute,
         )
 
     def to_dict(self) -> dict:
@@ -68,6 +95,14 @@ class LLMConfigParameters:
         )
         result["temperature"] = from_union([to_float, from_none], self.temperature)
         result["topP"] = from_union([to_float, from_none], self.top_p)
+        result["contextWindow"] = from_union([from_int, from_none], self.context_window)
+        result["maxContextTokens"] = from_union(
+            [from_int, from_none], self.max_context_tokens
+        )
+        result["requestsPerMinute"] = from_union(
+            [from_int, from_none], self.requests_per_minute
+        )
+        result["tokensPerMinute"] = from_union([from_int, from_none], self.tokens_per_minute)
         return result
 
 
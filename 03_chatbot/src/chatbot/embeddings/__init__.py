@@ -1 +1,2 @@
 from .sagemaker_endpoint_embeddings import SageMakerEndpointEmbeddings
+from .cached_embeddings import CachedEmbeddings, QUERY_EMBEDDING_CACHE, QUERY_EMBEDDING_STORE
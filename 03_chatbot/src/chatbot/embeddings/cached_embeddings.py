@@ -0,0 +1,184 @@
+""" Module that contains a cache for query embeddings.
+
+Every user question is embedded before the knowledge base is searched. Identical
+questions are common, e.g. the prompt hints send the same text again and again, so
+query embeddings are cached in memory and optionally in a SQLite file on disk.
+"""
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from chatbot.helpers import ChatbotEnvironment, ChatbotEnvironmentVariables
+from chatbot.helpers.logger import TECHNICAL_LOGGER_NAME
+from chatbot.helpers.lru_cache import CacheStats, LRUCache
+from chatbot.helpers.metrics import record_count, record_latency, turn_dimensions
+from langchain.schema.embeddings import Embeddings
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+
+def normalize_query(text: str) -> str:
+    """Normalizes unicode and whitespace so that equivalent queries share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class SQLiteEmbeddingStore:
+    """On-disk tier of the embedding cache that survives restarts of the chatbot.
+
+    Args:
+        path: Path of the SQLite database file.
+        ttl_seconds: Optional number of seconds after which an embedding expires.
+    """
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            if ttl_seconds is not None:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE created_at < ?", (time.time() - ttl_seconds,)
+                )
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """Returns the embedding for a key or None if it is not stored or expired."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (
+                self.ttl_seconds is not None and time.time() - row[1] > self.ttl_seconds
+            ):
+                self._stats.misses += 1
+                return None
+            self._stats.hits += 1
+        vector = array("d")
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def put(self, key: str, vector: List[float]):
+        """Stores an embedding."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                (key, array("d", vector).tobytes(), time.time()),
+            )
+
+    def stats(self) -> CacheStats:
+        """Returns a snapshot of the store counters."""
+        with self._lock:
+            size = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return CacheStats(hits=self._stats.hits, misses=self._stats.misses, size=size)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that cache query embeddings of another embeddings client.
+
+    Document embeddings are not cached because documents are embedded once during ingestion.
+
+    Args:
+        embeddings: Embeddings client that computes the embeddings on a cache miss.
+        model_id: Id of the embeddings model, part of the cache key.
+        prefix: Prefix that the embeddings client adds to queries, part of the cache key.
+        memory_cache: In-memory tier, usually shared by all embeddings clients.
+        disk_store: Optional on-disk tier.
+
+    Example:
+        ```python
+        embeddings = CachedEmbeddings(BedrockEmbeddings(model_id="amazon.titan-embed-text-v1"), "amazon.titan-embed-text-v1")
+        embeddings.embed_query("What is Amazon Bedrock?")
+        ```
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_id: str,
+        prefix: str = "",
+        memory_cache: Optional[LRUCache[Tuple[float, ...]]] = None,
+        disk_store: Optional[SQLiteEmbeddingStore] = None,
+    ):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.prefix = prefix
+        self.memory_cache = memory_cache if memory_cache is not None else QUERY_EMBEDDING_CACHE
+        self.disk_store = disk_store if disk_store is not None else QUERY_EMBEDDING_STORE
+
+    def _key(self, text: str) -> Hashable:
+        return (self.model_id, self.prefix, normalize_query(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        # The same dimensions as the retrieval metrics of the chat turn
+        dimensions = turn_dimensions()
+        flow, index = dimensions.get("flow", ""), dimensions.get("index", "")
+        vector = self.memory_cache.get(key)
+        if vector is not None:
+            record_count("embedding_cache_hit", flow=flow, model=self.model_id, index=index, tier="memory")
+            return list(vector)
+
+        disk_key = "\x1f".join(key)
+        if self.disk_store is not None:
+            vector = self.disk_store.get(disk_key)
+            if vector is not None:
+                record_count("embedding_cache_hit", flow=flow, model=self.model_id, index=index, tier="disk")
+        if vector is None:
+            record_count("embedding_cache_miss", flow=flow, model=self.model_id, index=index)
+            start = time.perf_counter()
+            vector = self.embeddings.embed_query(text)
+            record_latency(
+                "embedding", (time.perf_counter() - start) * 1000, flow=flow, model=self.model_id, index=index
+            )
+            if self.disk_store is not None:
+                self.disk_store.put(disk_key, vector)
+        self.memory_cache.put(key, tuple(vector))
+        return list(vector)
+
+    def stats(self) -> Dict[str, CacheStats]:
+        """Returns the hit and miss counters of the cache tiers.
+
+        The tiers are shared by all embeddings clients, embed_query counts the hits and
+        misses of a model in the embedding_cache_hit and embedding_cache_miss metrics.
+        """
+        stats = {"memory": self.memory_cache.stats()}
+        if self.disk_store is not None:
+            stats["disk"] = self.disk_store.stats()
+        return stats
+
+
+_environment = ChatbotEnvironment()
+_ttl_seconds = float(_environment.get_env_variable(ChatbotEnvironmentVariables.EmbeddingCacheTTL)) or None
+
+
+def _create_disk_store() -> Optional[SQLiteEmbeddingStore]:
+    path = _environment.get_env_variable(ChatbotEnvironmentVariables.EmbeddingCachePath)
+    if not path:
+        return None
+    try:
+        return SQLiteEmbeddingStore(path, ttl_seconds=_ttl_seconds)
+    except sqlite3.Error as error:
+        logger.warning(f"Cannot open embedding cache {path}, caching in memory only: {error}")
+        return None
+
+
+QUERY_EMBEDDING_CACHE: LRUCache[Tuple[float, ...]] = LRUCache(
+    max_size=int(_environment.get_env_variable(ChatbotEnvironmentVariables.EmbeddingCacheSize)),
+    ttl_seconds=_ttl_seconds,
+)
+""" Process-wide in-memory tier of the query embedding cache. """
+
+QUERY_EMBEDDING_STORE: Optional[SQLiteEmbeddingStore] = _create_disk_store()
+""" Process-wide on-disk tier of the query embedding cache, only if EMBEDDING_CACHE_PATH is set. """
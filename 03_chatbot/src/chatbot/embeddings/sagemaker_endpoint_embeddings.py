@@ -1,4 +1,7 @@
 class SageMakerEndpointEmbeddings:
+    query_prefix = "passage: "
+    """ Prefix that embed_query adds to the query. """
+
     def __init__(self, embeddings_predictor):
         self.embeddings_predictor = embeddings_predictor
 
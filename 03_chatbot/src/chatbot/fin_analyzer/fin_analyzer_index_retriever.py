@@ -9,6 +9,7 @@ from tabulate import tabulate
 # Streamlit plot integration
 from plotnine import *
 
+from chatbot.helpers.context_packer import trim_to_characters
 from chatbot.helpers.logger import TECHNICAL_LOGGER_NAME
 from langchain.schema import BaseRetriever, Document
 
@@ -25,7 +26,8 @@ class FinAnalyzerIndexRetriever(BaseRetriever):
         announcement_df: Announcements dataframe.
         prices_df: Daily prices dataframe.
         announcement_filter: User selected filter on GUI.
-        max_character_limit: Maximum character limit for each document. Default: 80000
+        max_character_limit: Maximum character limit for each document, cut at a sentence boundary.
+            Default: 80000. The context packer of the model fits the documents into its token budget.
 
     Example:
         ```python
@@ -114,7 +116,7 @@ class FinAnalyzerIndexRetriever(BaseRetriever):
                 row["symbol"], 
                 row["form"],
                 row.date_full, 
-                row.content[:int(min(self.max_character_limit, len(row.content)))], 
+                trim_to_characters(row.content, self.max_character_limit),
                 # tabulate(open_change_before, headers='keys', tablefmt='pipe', showindex=False),
                 # tabulate(open_change_after, headers='keys', tablefmt='pipe', showindex=False)
             )
@@ -100,7 +100,6 @@ class FinAnalyzerRetrieverItem(RetrieverCatalogItem):
     def read_from_s3(self, bucket, key, format):
         obj = s3_client.get_object(Bucket=bucket, Key=key)
         data = obj['Body'].read().decode('utf-8')
-        print(data)
         
         if format == "csv":
             return pd.read_csv(StringIO(data))
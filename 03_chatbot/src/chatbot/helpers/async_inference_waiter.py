@@ -0,0 +1,322 @@
+""" Module that waits for the results of asynchronous SageMaker inference requests.
+
+An asynchronous endpoint writes the result of a request to Amazon S3, to the output
+location on success and to the failure location on error. Instead of every waiting
+turn polling S3 on its own, one waiter per process tracks all requests in flight:
+
+- With ASYNC_INFERENCE_QUEUE_URL, it long-polls an Amazon SQS queue that is subscribed
+  to the success and error topics of the endpoint's notification config, and reads the
+  result as soon as the notification arrives.
+- Otherwise, it checks the output location with HEAD requests, starting after 100 ms
+  and backing off exponentially with jitter up to one check per second. Failures are
+  rare, the failure location is checked only with every fourth check. With a queue,
+  the same polling runs with longer intervals as a backstop for lost notifications.
+
+Every request has a deadline, after which waiting fails with a TimeoutError.
+"""
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from .aws_client_pool import AWS_CLIENT_POOL
+from .environment_variables import ChatbotEnvironment, ChatbotEnvironmentVariables
+from .logger import TECHNICAL_LOGGER_NAME
+from .metrics import record_latency
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+_NOT_FOUND_CODES = ("404", "NoSuchKey", "NotFound")
+
+
+class AsyncInferenceError(Exception):
+    """The asynchronous endpoint reported that the inference failed."""
+
+
+def split_s3_url(url: str) -> Tuple[str, str]:
+    """Returns the bucket and key of an s3://bucket/key URL."""
+    bucket, _, key = url.replace("s3://", "", 1).partition("/")
+    return bucket, key
+
+
+@dataclass
+class _Request:
+    inference_id: str
+    region: Optional[str]
+    output_location: str
+    failure_location: Optional[str]
+    started_at: float
+    deadline: float
+    interval: float
+    checks: int = 0
+    future: Future = field(default_factory=Future)
+
+
+class AsyncInferenceWaiter:
+    """Waits for the results of all asynchronous inference requests of the process.
+
+    Args:
+        s3_client: Returns the S3 client of a region.
+        sqs_client: SQS client of the notification queue, None polls S3 only.
+        queue_url: URL of the SQS queue that receives the endpoint notifications.
+        initial_interval: Seconds before the first check of a request without queue.
+        max_interval: Maximum seconds between two checks of a request without queue.
+        backoff: Factor by which the interval grows after every check.
+        failure_check_every: Checks of the output location per check of the failure location.
+        backstop_interval: Seconds between two checks of a request with queue.
+        max_workers: Maximum number of concurrent S3 requests.
+        stale_notification_age: Seconds after which a notification that no request of the
+            process waits for is deleted from the queue. Until then, it becomes visible
+            again for the other processes that share the queue. At least the longest
+            timeout of a request of the process.
+
+    Example:
+        ```python
+        response = client.invoke_endpoint_async(EndpointName=name, InputLocation=url, InferenceId=inference_id)
+        output = ASYNC_INFERENCE_WAITER.wait(
+            inference_id, response["OutputLocation"], response.get("FailureLocation"), region, timeout=180
+        )
+        ```
+    """
+
+    def __init__(
+        self,
+        s3_client: Callable[[Optional[str]], Any],
+        sqs_client: Any = None,
+        queue_url: Optional[str] = None,
+        initial_interval: float = 0.1,
+        max_interval: float = 1.0,
+        backoff: float = 1.5,
+        failure_check_every: int = 4,
+        backstop_interval: float = 10.0,
+        max_workers: int = 8,
+        stale_notification_age: float = 900.0,
+    ):
+        self.s3_client = s3_client
+        self.sqs_client = sqs_client if queue_url else None
+        self.queue_url = queue_url
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.failure_check_every = failure_check_every
+        self.backstop_interval = backstop_interval
+        self.max_workers = max_workers
+        self.stale_notification_age = stale_notification_age
+        self._requests: Dict[str, _Request] = {}
+        self._schedule: List[Tuple[float, int, _Request]] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.s3_requests = 0
+        """ Number of S3 HEAD and GET requests. """
+        self.notifications = 0
+        """ Number of notifications that completed a request. """
+        self.stale_notifications = 0
+        """ Number of deleted notifications that no request waited for. """
+
+    def wait(
+        self,
+        inference_id: str,
+        output_location: str,
+        failure_location: Optional[str],
+        region: Optional[str],
+        timeout: float,
+    ) -> bytes:
+        """Blocks until the result of a request is available and returns it.
+
+        Raises:
+            AsyncInferenceError: The endpoint wrote the request to the failure location.
+            TimeoutError: There was no result within timeout seconds.
+        """
+        now = time.monotonic()
+        interval = self.backstop_interval if self.sqs_client else self.initial_interval
+        request = _Request(
+            inference_id, region, output_location, failure_location, now, now + timeout, interval
+        )
+        with self._condition:
+            self._start()
+            self.stale_notification_age = max(self.stale_notification_age, timeout + self.max_interval)
+            self._requests[inference_id] = request
+            self._push(request, now + interval)
+        try:
+            # The waiter enforces the deadline, the grace covers a check in progress
+            return request.future.result(timeout=timeout + self.max_interval)
+        finally:
+            with self._condition:
+                self._requests.pop(inference_id, None)
+
+    def _start(self):
+        if self._threads:
+            return
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="async-inference-poll"
+        )
+        self._threads.append(threading.Thread(target=self._run_schedule, name="async-inference-waiter", daemon=True))
+        if self.sqs_client:
+            self._threads.append(
+                threading.Thread(target=self._run_notifications, name="async-inference-notifications", daemon=True)
+            )
+        for thread in self._threads:
+            thread.start()
+
+    def _push(self, request: _Request, due: float):
+        heapq.heappush(self._schedule, (min(due, request.deadline), next(self._order), request))
+        self._condition.notify_all()
+
+    def _run_schedule(self):
+        while True:
+            with self._condition:
+                while not self._schedule:
+                    self._condition.wait()
+                due, _, request = self._schedule[0]
+                now = time.monotonic()
+                if due > now:
+                    self._condition.wait(due - now)
+                    continue
+                heapq.heappop(self._schedule)
+            if not request.future.done():
+                self._executor.submit(self._check, request)
+
+    def _check(self, request: _Request):
+        try:
+            output = self._read_if_exists(request.region, request.output_location)
+            if output is not None:
+                self._complete(request, output, "poll")
+                return
+            request.checks += 1
+            now = time.monotonic()
+            if request.failure_location and (
+                request.checks % self.failure_check_every == 0 or now >= request.deadline
+            ):
+                failure = self._read_if_exists(request.region, request.failure_location)
+                if failure is not None:
+                    self._fail(request, AsyncInferenceError(failure.decode("utf-8", "replace")))
+                    return
+            if now >= request.deadline:
+                self._fail(
+                    request,
+                    TimeoutError(f"No result for inference {request.inference_id} after {now - request.started_at:.0f} s"),
+                )
+                return
+            if self.sqs_client is None:
+                request.interval = min(self.max_interval, request.interval * self.backoff)
+            with self._condition:
+                # Full jitter spreads the checks of requests that started together
+                self._push(request, now + random.uniform(request.interval / 2, request.interval))
+        except Exception as error:
+            self._fail(request, error)
+
+    def _read_if_exists(self, region: Optional[str], url: str) -> Optional[bytes]:
+        bucket, key = split_s3_url(url)
+        client = self.s3_client(region)
+        try:
+            self.s3_requests += 1
+            client.head_object(Bucket=bucket, Key=key)
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") in _NOT_FOUND_CODES:
+                return None
+            raise
+        self.s3_requests += 1
+        return client.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+    def _run_notifications(self):
+        while True:
+            try:
+                response = self.sqs_client.receive_message(
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=10,
+                    WaitTimeSeconds=20,
+                    AttributeNames=["SentTimestamp"],
+                )
+            except Exception as error:
+                logger.warning("Could not receive async inference notifications. %s", error)
+                time.sleep(1)
+                continue
+            for message in response.get("Messages", []):
+                try:
+                    handled = self._handle_notification(message)
+                except Exception as error:
+                    logger.warning("Deleting unreadable async inference notification. %s", error)
+                    handled = True
+                if handled:
+                    try:
+                        self.sqs_client.delete_message(
+                            QueueUrl=self.queue_url, ReceiptHandle=message["ReceiptHandle"]
+                        )
+                    except Exception as error:
+                        logger.warning("Could not delete async inference notification. %s", error)
+
+    def _handle_notification(self, message: dict) -> bool:
+        """Completes the request of a notification, returns whether to delete the notification."""
+        body = json.loads(message["Body"])
+        if "Message" in body:
+            # Without raw message delivery, SNS wraps the notification
+            body = json.loads(body["Message"])
+        with self._condition:
+            request = self._requests.get(body.get("inferenceId"))
+        if request is None:
+            # Another chatbot process may wait for it, it becomes visible again for them.
+            # Nobody waits for it any more once it is older than the longest wait.
+            sent_at = int(message.get("Attributes", {}).get("SentTimestamp", 0)) / 1000
+            if time.time() - sent_at > self.stale_notification_age:
+                self.stale_notifications += 1
+                return True
+            return False
+        if request.future.done():
+            return True
+        self._executor.submit(self._resolve_notification, request, body)
+        return True
+
+    def _resolve_notification(self, request: _Request, body: dict):
+        try:
+            if body.get("invocationStatus") == "Completed":
+                output_location = body.get("responseParameters", {}).get("outputLocation") or request.output_location
+                bucket, key = split_s3_url(output_location)
+                self.s3_requests += 1
+                output = self.s3_client(request.region).get_object(Bucket=bucket, Key=key)["Body"].read()
+                self.notifications += 1
+                self._complete(request, output, "notification")
+            else:
+                self.notifications += 1
+                self._fail(request, AsyncInferenceError(body.get("failureReason", "Inference failed")))
+        except Exception as error:
+            self._fail(request, error)
+
+    def _complete(self, request: _Request, output: bytes, source: str):
+        if request.future.done():
+            return
+        request.future.set_result(output)
+        record_latency(
+            "async_inference_wait",
+            (time.monotonic() - request.started_at) * 1000,
+            source=source,
+        )
+
+    def _fail(self, request: _Request, error: Exception):
+        if not request.future.done():
+            request.future.set_exception(error)
+
+
+def _sqs_client(queue_url: str):
+    # https://sqs.<region>.amazonaws.com/<account>/<name>
+    host = queue_url.split("//", 1)[-1].split("/", 1)[0]
+    region = host.split(".")[1] if host.startswith("sqs.") else None
+    return AWS_CLIENT_POOL.get_client("sqs", region)
+
+
+_queue_url = ChatbotEnvironment().get_env_variable(ChatbotEnvironmentVariables.AsyncInferenceQueueUrl) or None
+ASYNC_INFERENCE_WAITER = AsyncInferenceWaiter(
+    s3_client=lambda region: AWS_CLIENT_POOL.get_client("s3", region),
+    sqs_client=_sqs_client(_queue_url) if _queue_url else None,
+    queue_url=_queue_url,
+)
+""" Process-wide waiter of all asynchronous inference requests. """
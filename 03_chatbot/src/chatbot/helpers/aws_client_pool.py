@@ -0,0 +1,138 @@
+""" Module that contains a process-wide pool of boto3 clients for model invocations.
+
+Creating a boto3 client loads the service model and builds its endpoint resolver and
+connection pool, and a new session resolves credentials again, with an STS call for an
+assumed IAM role. The model catalog items create a model on every turn, so the pool
+keeps one client per service, region, endpoint URL and IAM identity. The session of
+an identity is shared too: its credentials are cached and refreshed shortly before
+they expire. boto3 clients are thread-safe, all sessions of the chatbot share them.
+"""
+import threading
+from typing import Any, Dict, Hashable, Optional, Tuple, Union
+
+import boto3
+from botocore.config import Config
+
+from chatbot.config import Iam
+
+from .aws_helpers import get_boto_session
+from .environment_variables import ChatbotEnvironment, ChatbotEnvironmentVariables
+from .metrics import record_count
+
+ClientKey = Tuple[Hashable, ...]
+
+
+def iam_identity(iam_config: Union[Iam, None]) -> Hashable:
+    """Returns the IAM identity that a session of iam_config uses, see get_boto_session."""
+    if not iam_config:
+        return ("default",)
+    if iam_config.parameters.profile:
+        return ("profile", iam_config.parameters.profile)
+    if iam_config.parameters.role_arn:
+        return ("role", iam_config.parameters.role_arn)
+    return ("default",)
+
+
+class AWSClientPool:
+    """Creates boto3 clients once per service, region, endpoint URL and IAM identity.
+
+    Clients use adaptive retries, which back off on throttling errors before they are
+    sent, and a connection pool large enough for the concurrent turns of all sessions.
+
+    Args:
+        max_pool_connections: Connections each client keeps open at most.
+        max_attempts: Attempts of a request including the first one.
+
+    Example:
+        ```python
+        client = AWS_CLIENT_POOL.get_client("bedrock-runtime", region, endpoint_url, iam_config)
+        ```
+    """
+
+    def __init__(self, max_pool_connections: int = 50, max_attempts: int = 4):
+        self.max_attempts = max_attempts
+        self.config = Config(
+            max_pool_connections=max_pool_connections,
+            retries={"total_max_attempts": max_attempts, "mode": "adaptive"},
+        )
+        self._sessions: Dict[Hashable, boto3.Session] = {}
+        self._clients: Dict[ClientKey, Any] = {}
+        # Creating sessions and clients is not thread-safe, using them is
+        self._lock = threading.Lock()
+        self.session_creations = 0
+        self.client_creations: Dict[ClientKey, int] = {}
+        """ Number of clients created per key, 1 per key unless the pool was cleared. """
+
+    def get_session(self, iam_config: Union[Iam, None], region: Optional[str] = None) -> boto3.Session:
+        """Returns the shared session of the IAM identity of iam_config."""
+        identity = iam_identity(iam_config)
+        with self._lock:
+            return self._get_session(identity, iam_config, region)
+
+    def _get_session(self, identity: Hashable, iam_config: Union[Iam, None], region: Optional[str]):
+        if identity not in self._sessions:
+            session = get_boto_session(iam_config, region)
+            # Resolve the credentials once, boto3 refreshes them before they expire
+            session.get_credentials()
+            self._sessions[identity] = session
+            self.session_creations += 1
+        return self._sessions[identity]
+
+    def get_client(
+        self,
+        service_name: str,
+        region: Optional[str],
+        endpoint_url: Optional[str] = None,
+        iam_config: Union[Iam, None] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        """Returns the shared client of a service for a region, endpoint URL and IAM config.
+
+        max_attempts overrides the attempts of the pool, e.g. 1 for clients whose caller
+        fails over to another region instead of retrying.
+        """
+        identity = iam_identity(iam_config)
+        key = (service_name, region, endpoint_url, identity)
+        config = self.config
+        if max_attempts is not None:
+            key += (max_attempts,)
+            config = self.config.merge(Config(retries={"total_max_attempts": max_attempts, "mode": "adaptive"}))
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            if key not in self._clients:
+                session = self._get_session(identity, iam_config, region)
+                self._clients[key] = session.client(
+                    service_name, region_name=region, endpoint_url=endpoint_url, config=config
+                )
+                self.client_creations[key] = self.client_creations.get(key, 0) + 1
+                record_count(
+                    "aws_client_created", service=service_name, region=region or "-", identity=str(identity)
+                )
+            return self._clients[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of pooled clients and of created sessions and clients."""
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "client_creations": sum(self.client_creations.values()),
+                "session_creations": self.session_creations,
+            }
+
+    def clear(self):
+        """Drops all clients and sessions, e.g. after the IAM configuration changed."""
+        with self._lock:
+            self._clients.clear()
+            self._sessions.clear()
+
+
+_environment = ChatbotEnvironment()
+AWS_CLIENT_POOL = AWSClientPool(
+    max_pool_connections=int(
+        _environment.get_env_variable(ChatbotEnvironmentVariables.AWSClientMaxPoolConnections)
+    ),
+    max_attempts=int(_environment.get_env_variable(ChatbotEnvironmentVariables.AWSClientMaxAttempts)),
+)
+""" Process-wide pool of the clients that invoke models. """
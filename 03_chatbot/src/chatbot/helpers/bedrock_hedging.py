@@ -0,0 +1,300 @@
+""" Module that sends Amazon Bedrock requests to several regions to cut the tail latency.
+
+A model that is available in several Bedrock regions can answer from any of them. The
+hedged client sends a request to the region with the lowest recent latency first. If
+that region has not returned the first token after the usual latency of the region,
+a percentile of its recent times to first token, the same request goes to the next
+region as well. The first region that responds answers, the other stream is closed.
+Throttled requests fail over to the next region right away.
+
+The hedged client has the interface of the bedrock-runtime client that the LangChain
+Bedrock models use, so it works for Bedrock and BedrockChat.
+"""
+import contextvars
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from .environment_variables import ChatbotEnvironment, ChatbotEnvironmentVariables
+from .logger import TECHNICAL_LOGGER_NAME
+from .metrics import record_count, record_latency
+from .rate_limiter import RateLimitExceeded
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+THROTTLING_ERROR_CODES = (
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Own pool, a hedged turn blocks up to two threads until the first token
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="bedrock-hedging")
+        return _executor
+
+
+def is_throttling(error: BaseException) -> bool:
+    """Returns whether an error means that the region cannot take the request now, because
+    Bedrock throttled it or the rate limiter of the region rejected it."""
+    if isinstance(error, RateLimitExceeded):
+        return True
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+@dataclass
+class _RegionLatency:
+    ewma: Optional[float] = None
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=200))
+    throttled_until: float = 0.0
+
+
+class RegionLatencies:
+    """Exponentially weighted moving averages and recent samples of the time to first token
+    of a model per region, shared by all sessions of the process.
+
+    Args:
+        alpha: Weight of a new sample in the moving average.
+        throttle_cooldown: Seconds a throttled region is the last choice.
+    """
+
+    def __init__(self, alpha: float = 0.2, throttle_cooldown: float = 30.0):
+        self.alpha = alpha
+        self.throttle_cooldown = throttle_cooldown
+        self._regions: Dict[Tuple[str, str, str], _RegionLatency] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: Tuple[str, str, str]) -> _RegionLatency:
+        if key not in self._regions:
+            self._regions[key] = _RegionLatency()
+        return self._regions[key]
+
+    def record(self, model_id: str, region: str, operation: str, milliseconds: float):
+        """Adds the time to first token, or the latency of a request without streaming."""
+        with self._lock:
+            latency = self._get((model_id, region, operation))
+            latency.ewma = (
+                milliseconds
+                if latency.ewma is None
+                else self.alpha * milliseconds + (1 - self.alpha) * latency.ewma
+            )
+            latency.samples.append(milliseconds)
+
+    def record_throttling(self, model_id: str, region: str, operation: str):
+        with self._lock:
+            self._get((model_id, region, operation)).throttled_until = time.monotonic() + self.throttle_cooldown
+
+    def order(self, model_id: str, regions: List[str], operation: str) -> List[str]:
+        """Returns the regions by increasing moving average, throttled regions last.
+
+        Regions without samples come first, so that every region gets measured.
+        """
+        now = time.monotonic()
+        with self._lock:
+            latencies = {region: self._get((model_id, region, operation)) for region in regions}
+            return sorted(
+                regions,
+                key=lambda region: (
+                    latencies[region].throttled_until > now,
+                    latencies[region].ewma if latencies[region].ewma is not None else -1.0,
+                ),
+            )
+
+    def percentile(self, model_id: str, region: str, operation: str, percentile: float, min_samples: int) -> Optional[float]:
+        """Returns a percentile of the recent samples in milliseconds, None with too few samples."""
+        with self._lock:
+            samples = list(self._get((model_id, region, operation)).samples)
+        if len(samples) < min_samples:
+            return None
+        return float(np.percentile(samples, percentile))
+
+
+REGION_LATENCIES = RegionLatencies()
+""" Process-wide latencies of the Bedrock regions. """
+
+_environment = ChatbotEnvironment()
+BEDROCK_HEDGING = _environment.get_env_variable(ChatbotEnvironmentVariables.BedrockHedging).lower() == "true"
+BEDROCK_HEDGE_PERCENTILE = float(_environment.get_env_variable(ChatbotEnvironmentVariables.BedrockHedgePercentile))
+BEDROCK_HEDGE_DELAY = float(_environment.get_env_variable(ChatbotEnvironmentVariables.BedrockHedgeDelay))
+
+
+class HedgedBedrockClient:
+    """bedrock-runtime client that hedges invoke_model and invoke_model_with_response_stream
+    across the clients of several regions.
+
+    Args:
+        clients: bedrock-runtime clients by region. They should not retry throttled
+            requests themselves, so that the request fails over right away.
+        percentile: Percentile of the recent times to first token of the primary region
+            after which the backup request is sent.
+        default_delay: Seconds after which the backup request is sent while the primary
+            region has fewer than min_samples samples.
+        min_samples: Samples of the primary region needed to use the percentile.
+        latencies: Latencies that select the primary region.
+        retry_clients: Clients by region that retry throttled requests. When every region
+            throttled a request, it is sent once more with the retrying client of the
+            first region, so hedging never fails where a single region would have retried.
+
+    Example:
+        ```python
+        client = HedgedBedrockClient({"us-east-1": us_client, "us-west-2": us_west_client})
+        llm = BedrockChat(client=client, model_id="anthropic.claude-v2", streaming=True)
+        ```
+    """
+
+    def __init__(
+        self,
+        clients: Dict[str, Any],
+        percentile: float = 95.0,
+        default_delay: float = 2.0,
+        min_samples: int = 20,
+        latencies: RegionLatencies = REGION_LATENCIES,
+        retry_clients: Optional[Dict[str, Any]] = None,
+    ):
+        self.clients = clients
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.latencies = latencies
+        self.retry_clients = retry_clients or {}
+
+    def invoke_model(self, **kwargs) -> Dict[str, Any]:
+        return self._hedge("invoke_model", kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs) -> Dict[str, Any]:
+        return self._hedge("invoke_model_with_response_stream", kwargs)
+
+    def _delay(self, model_id: str, region: str, operation: str) -> float:
+        milliseconds = self.latencies.percentile(model_id, region, operation, self.percentile, self.min_samples)
+        return self.default_delay if milliseconds is None else milliseconds / 1000
+
+    def _start(self, region: str, operation: str, kwargs: dict) -> Future:
+        """Sends the request to a region, the future completes with the first event of a stream."""
+
+        def call():
+            start_time = time.perf_counter()
+            response = getattr(self.clients[region], operation)(**kwargs)
+            first_event = None
+            if operation == "invoke_model_with_response_stream":
+                events = iter(response["body"])
+                first_event = next(events, None)
+                response = {**response, "body": events, "_stream": response["body"]}
+            return response, first_event, (time.perf_counter() - start_time) * 1000
+
+        # The rate limiters queue the request for the session of the calling thread
+        return _get_executor().submit(contextvars.copy_context().run, call)
+
+    def _hedge(self, operation: str, kwargs: dict) -> Dict[str, Any]:
+        model_id = kwargs.get("modelId", "")
+        regions = self.latencies.order(model_id, list(self.clients), operation)
+        pending: Dict[Future, str] = {}
+        started: Dict[Future, float] = {}
+        remaining = iter(regions)
+        last_error: Optional[BaseException] = None
+
+        def start_next() -> bool:
+            region = next(remaining, None)
+            if region is None:
+                return False
+            future = self._start(region, operation, kwargs)
+            pending[future] = region
+            started[future] = time.perf_counter()
+            return True
+
+        start_next()
+        hedged = False
+        while pending:
+            timeout = None
+            if not hedged and len(pending) == 1:
+                timeout = self._delay(model_id, next(iter(pending.values())), operation)
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # The primary is slower than usual, send the backup request
+                hedged = start_next()
+                if hedged:
+                    record_count("bedrock_hedge_sent", model=model_id)
+                continue
+            for future in done:
+                region = pending.pop(future)
+                try:
+                    response, first_event, milliseconds = future.result()
+                except Exception as error:
+                    last_error = error
+                    if is_throttling(error):
+                        self.latencies.record_throttling(model_id, region, operation)
+                        record_count("bedrock_failover_throttled", model=model_id, region=region)
+                    else:
+                        logger.warning("Bedrock request in %s failed. %s", region, error)
+                    # Fail over to the next region right away
+                    if not pending:
+                        start_next()
+                    continue
+                self.latencies.record(model_id, region, operation, milliseconds)
+                record_latency(
+                    "bedrock_time_to_first_response", milliseconds, model=model_id, region=region, hedged=hedged
+                )
+                for other, other_region in pending.items():
+                    self._discard(other, model_id, other_region, operation, started[other])
+                return self._response(response, first_event)
+        if isinstance(last_error, ClientError) and is_throttling(last_error) and regions[0] in self.retry_clients:
+            return getattr(self.retry_clients[regions[0]], operation)(**kwargs)
+        raise last_error or RuntimeError(f"No region answered the request for {model_id}")
+
+    def _discard(self, future: Future, model_id: str, region: str, operation: str, start_time: float):
+        """Closes the response body of a request that lost the race and records its latency.
+
+        Without the latencies of the losers, a slow region would keep the samples of
+        its few fast answers and stay the primary region.
+        """
+        if future.cancel():
+            # Still queued for a thread, the region has not seen the request
+            return
+
+        def done(future: Future):
+            try:
+                response, _, milliseconds = future.result()
+            except Exception as error:
+                if is_throttling(error):
+                    self.latencies.record_throttling(model_id, region, operation)
+                else:
+                    # E.g. a read timeout, the region took at least until the error
+                    self.latencies.record(
+                        model_id, region, operation, (time.perf_counter() - start_time) * 1000
+                    )
+                return
+            self.latencies.record(model_id, region, operation, milliseconds)
+            if operation == "invoke_model_with_response_stream":
+                response["_stream"].close()
+            else:
+                # The unread StreamingBody holds its connection until it is closed
+                response["body"].close()
+
+        future.add_done_callback(done)
+
+    @staticmethod
+    def _response(response: Dict[str, Any], first_event: Any) -> Dict[str, Any]:
+        if "_stream" not in response:
+            return response
+        response = dict(response)
+        response.pop("_stream")
+        events = response["body"]
+        response["body"] = itertools.chain([] if first_event is None else [first_event], events)
+        return response
+
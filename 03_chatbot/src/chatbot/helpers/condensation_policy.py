@@ -0,0 +1,129 @@
+""" Module that decides whether a follow-up question is condensed with the LLM.
+
+Condensing the chat history and the follow-up question into a standalone question
+costs a full LLM call before retrieval can start. It is not needed on the first turn
+and not for questions that do not refer to the conversation, e.g. "What is the
+capital of Switzerland?". The policy skips the call for these questions, the
+remaining questions can be condensed by a smaller and faster model.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, FrozenSet, Optional
+
+from .metrics import record_count
+
+CONDENSATION_SKIPPED_NO_HISTORY = "condensation_skipped_no_history"
+CONDENSATION_SKIPPED_STANDALONE = "condensation_skipped_standalone"
+CONDENSATION_LLM = "condensation_llm"
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+REFERRING_WORDS = frozenset(
+    """
+    it its it's itself they them their theirs themselves this that these those he him his she her
+    hers there then above previous previously former latter same such another other others
+    else further also too again instead
+    er sie es ihm ihn ihr ihre ihren ihrem ihres sein seine seinen seinem seiner dies diese dieser
+    dieses diesen diesem dort damals davon dazu darüber darauf dabei damit dafür
+    dagegen daraus darin oben vorher vorherige vorherigen frühere früheren gleiche gleichen solche
+    andere anderen weitere weiteren auch noch nochmal
+    """.split()
+)
+""" Words of English and German follow-up questions that refer to the conversation. """
+
+CONTINUATION_PREFIXES = (
+    "and ", "but ", "or ", "so ", "what about", "how about", "and what", "what else", "any other",
+    "und ", "aber ", "oder ", "also ", "was ist mit", "wie ist es mit", "und was", "was noch",
+)
+""" Beginnings of follow-up questions that continue the previous turn. """
+
+
+def is_standalone(
+    question: str, min_words: int = 4, referring_words: FrozenSet[str] = REFERRING_WORDS
+) -> bool:
+    """Returns whether a question can be answered without the chat history.
+
+    A cheap heuristic that errs on the side of condensing: short questions, questions
+    with pronouns or other words that refer to the conversation and questions that
+    continue the previous turn are not standalone.
+
+    Args:
+        question: Follow-up question of the user.
+        min_words: Questions with fewer words are not standalone.
+        referring_words: Lower case words that refer to the conversation.
+
+    Example:
+        ```python
+        is_standalone("What is the price of the digital vignette in 2024?")  # True
+        is_standalone("And how much does it cost?")  # False
+        ```
+    """
+    text = " ".join(question.lower().split())
+    words = _WORD_PATTERN.findall(text)
+    if len(words) < min_words:
+        return False
+    if text.startswith(CONTINUATION_PREFIXES):
+        return False
+    return not any(word in referring_words for word in words)
+
+
+@dataclass
+class CondensationConfig:
+    """The condensation section of the Retrieval Augmented Generation flow config."""
+
+    skip_standalone: bool = False
+    """ Skip condensing follow-up questions that the heuristic considers standalone. """
+    min_words: int = 4
+    """ Follow-up questions with fewer words are always condensed. """
+    model: Optional[str] = None
+    """ Model id of a smaller, faster model of the model catalog that condenses the questions. """
+    extra_referring_words: FrozenSet[str] = field(default_factory=frozenset)
+    """ Additional lower case words that refer to the conversation, e.g. for other languages. """
+
+    @staticmethod
+    def from_dict(obj: Any) -> "CondensationConfig":
+        if not isinstance(obj, dict):
+            return CondensationConfig()
+        return CondensationConfig(
+            skip_standalone=bool(obj.get("skipStandalone", False)),
+            min_words=int(obj.get("minWords", 4)),
+            model=obj.get("model"),
+            extra_referring_words=frozenset(word.lower() for word in obj.get("referringWords", [])),
+        )
+
+
+@dataclass
+class CondensationPolicy:
+    """Decides per turn whether the question is condensed and counts the decisions.
+
+    Args:
+        config: Condensation config of the flow.
+        flow: Flow for the counters.
+        model: Model id of the model that condenses, for the counters.
+
+    Example:
+        ```python
+        policy = CondensationPolicy(CondensationConfig(skip_standalone=True), flow, model_id)
+        if policy.decide(question, chat_history_str) == CONDENSATION_LLM:
+            question = question_generator.run(question=question, chat_history=chat_history_str)
+        ```
+    """
+
+    config: CondensationConfig = field(default_factory=CondensationConfig)
+    flow: str = ""
+    model: str = ""
+
+    def decide(self, question: str, chat_history_str: str) -> str:
+        """Returns CONDENSATION_SKIPPED_NO_HISTORY, CONDENSATION_SKIPPED_STANDALONE or CONDENSATION_LLM."""
+        if not chat_history_str:
+            decision = CONDENSATION_SKIPPED_NO_HISTORY
+        elif self.config.skip_standalone and is_standalone(
+            question,
+            self.config.min_words,
+            REFERRING_WORDS | self.config.extra_referring_words,
+        ):
+            decision = CONDENSATION_SKIPPED_STANDALONE
+        else:
+            decision = CONDENSATION_LLM
+        record_count(decision, flow=self.flow, model=self.model)
+        return decision
@@ -0,0 +1,251 @@
+""" Module that packs retrieved documents into the token budget of the model's prompt.
+
+Cutting every document at a fixed number of characters ignores how many documents
+were retrieved and how large the context window of the model is. The packer fills the
+context window with the highest ranked documents instead and leaves room for the
+prompt template, the chat history and the answer. The last document that fits only in
+part is cut at a sentence boundary.
+"""
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain.schema.language_model import BaseLanguageModel
+
+from .logger import TECHNICAL_LOGGER_NAME
+from .lru_cache import LRUCache
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+DEFAULT_CHARACTERS_PER_TOKEN = 3.5
+""" Characters per token before the tokenizer of a model was sampled, on the safe side for English text. """
+
+_SENTENCE_END = re.compile(r"[.!?;:](?=\s|$)|\n\s*\n")
+
+
+def trim_to_characters(text: str, max_characters: int) -> str:
+    """Returns the longest prefix of text with at most max_characters that ends at a
+    sentence boundary, or at a word boundary if not even one sentence fits."""
+    if len(text) <= max_characters:
+        return text
+    prefix = text[:max_characters]
+    sentence_ends = [match.end() for match in _SENTENCE_END.finditer(prefix)]
+    if sentence_ends:
+        return prefix[: sentence_ends[-1]].rstrip()
+    word_end = prefix.rfind(" ")
+    return prefix[:word_end].rstrip() if word_end > 0 else prefix
+
+
+class TokenCounter:
+    """Counts tokens with a fast approximation that is calibrated with the model's tokenizer.
+
+    Tokenizers of some models are slow to load or not available at all, e.g. they are
+    downloaded on first use. The counter therefore estimates tokens from the number of
+    characters and samples get_num_tokens of the model in the background to learn the
+    characters per token of the model. Once the tokenizer answered, exact counts are
+    used where the estimate is not good enough, see count.
+
+    Args:
+        llm: Language model whose get_num_tokens is the tokenizer.
+        samples: Number of texts to sample for the calibration.
+    """
+
+    def __init__(self, llm: BaseLanguageModel, samples: int = 16):
+        self.llm = llm
+        self.samples = samples
+        self.characters_per_token = DEFAULT_CHARACTERS_PER_TOKEN
+        self._sampled_characters = 0
+        self._sampled_tokens = 0
+        self._pending_samples = 0
+        self._tokenizer_available: Optional[bool] = None
+        self._exact_counts: LRUCache[int] = LRUCache(max_size=4096)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="token-counter")
+
+    @property
+    def exact(self) -> bool:
+        """Whether the tokenizer of the model answered and exact counts are available."""
+        return bool(self._tokenizer_available)
+
+    def _count_exactly(self, text: str) -> int:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return self._exact_counts.get_or_create(key, lambda: self.llm.get_num_tokens(text))
+
+    def _sample(self, text: str):
+        try:
+            tokens = self._count_exactly(text)
+        except Exception as error:
+            logger.info("Estimating tokens of %s without its tokenizer. %s", type(self.llm).__name__, error)
+            with self._lock:
+                self._tokenizer_available = False
+            return
+        with self._lock:
+            self._tokenizer_available = True
+            self._sampled_characters += len(text)
+            self._sampled_tokens += max(tokens, 1)
+            self.characters_per_token = self._sampled_characters / self._sampled_tokens
+
+    def approximate(self, text: str) -> int:
+        """Returns the estimated number of tokens and samples the text for the calibration."""
+        with self._lock:
+            if (
+                self._tokenizer_available is not False
+                and self._pending_samples < self.samples
+                and len(text) > 200
+            ):
+                self._pending_samples += 1
+                self._executor.submit(self._sample, text)
+            return int(len(text) / self.characters_per_token) + 1
+
+    def count(self, text: str, limit: Optional[int] = None) -> int:
+        """Returns the number of tokens of text.
+
+        Args:
+            text: Text to count.
+            limit: If the estimate is close to limit, the tokenizer counts exactly.
+                Estimates far below or above the limit are returned as they are.
+        """
+        estimate = self.approximate(text)
+        if limit is None or not self.exact or abs(estimate - limit) > 0.15 * limit:
+            return estimate
+        try:
+            return self._count_exactly(text)
+        except Exception:
+            return estimate
+
+
+_token_counters: Dict[Hashable, TokenCounter] = {}
+_token_counters_lock = threading.Lock()
+
+
+def get_token_counter(key: Hashable, llm: BaseLanguageModel) -> TokenCounter:
+    """Returns the process-wide token counter of a model.
+
+    Args:
+        key: Identifies the tokenizer, e.g. the model id.
+        llm: Language model to count with if there is no counter for key yet.
+    """
+    with _token_counters_lock:
+        if key not in _token_counters:
+            _token_counters[key] = TokenCounter(llm)
+        return _token_counters[key]
+
+
+@dataclass
+class ContextBudget:
+    """Token budget of the prompt of a model, from the llmConfig of the model.
+
+    Args:
+        context_window: Tokens of the model's context window, None if unknown.
+        max_context_tokens: Maximum tokens of retrieved documents in the prompt, None for no maximum.
+        answer_tokens: Tokens to leave for the answer.
+    """
+
+    context_window: Optional[int] = None
+    max_context_tokens: Optional[int] = None
+    answer_tokens: int = 512
+
+    def document_tokens(self, prompt_tokens: int) -> Optional[int]:
+        """Returns the tokens left for documents next to a prompt without documents, None if unlimited."""
+        budgets = []
+        if self.context_window:
+            # 5% margin for the separators and the formatting of the documents
+            budgets.append(int(0.95 * (self.context_window - self.answer_tokens - prompt_tokens)))
+        if self.max_context_tokens:
+            budgets.append(self.max_context_tokens)
+        return max(min(budgets), 0) if budgets else None
+
+
+@dataclass
+class PackReport:
+    """What the packer kept of the retrieved documents."""
+
+    documents: int
+    packed: int
+    trimmed: int
+    tokens: int
+    budget: int
+
+    def __str__(self) -> str:
+        return (
+            f"Packed {self.packed} of {self.documents} documents into {self.tokens} of "
+            f"{self.budget} context tokens, {self.trimmed} trimmed"
+        )
+
+
+@dataclass
+class ContextPacker:
+    """Fits the highest ranked documents into the token budget of a model.
+
+    Args:
+        budget: Token budget of the model.
+        counter: Token counter of the model.
+        min_trimmed_tokens: A document is only trimmed if at least this many tokens of it fit.
+
+    Example:
+        ```python
+        packer = ContextPacker(
+            ContextBudget(context_window=200_000, answer_tokens=1024),
+            get_token_counter(model_id, llm),
+        )
+        docs, report = packer.pack(docs, prompt_without_documents)
+        ```
+    """
+
+    budget: ContextBudget
+    counter: TokenCounter
+    min_trimmed_tokens: int = 50
+
+    def pack(self, documents: List[Document], prompt: str) -> Tuple[List[Document], Optional[PackReport]]:
+        """Returns the documents that fit the budget next to the prompt, best first.
+
+        Args:
+            documents: Retrieved documents, best first.
+            prompt: The prompt without documents, including the chat history and the question.
+
+        Returns:
+            The packed documents and a report, no report if the budget is unlimited.
+        """
+        budget = self.budget.document_tokens(self.counter.count(prompt))
+        if budget is None:
+            return documents, None
+
+        packed = []
+        trimmed = 0
+        remaining = budget
+        for document in documents:
+            tokens = self.counter.count(document.page_content, limit=remaining)
+            if tokens <= remaining:
+                packed.append(document)
+                remaining -= tokens
+                continue
+            if remaining >= self.min_trimmed_tokens:
+                text = self._trim(document.page_content, remaining)
+                if text:
+                    packed.append(Document(page_content=text, metadata=document.metadata))
+                    remaining -= self.counter.count(text)
+                    trimmed += 1
+            # Lower ranked documents never push out higher ranked content
+            break
+
+        return packed, PackReport(
+            documents=len(documents),
+            packed=len(packed),
+            trimmed=trimmed,
+            tokens=budget - remaining,
+            budget=budget,
+        )
+
+    def _trim(self, text: str, max_tokens: int) -> str:
+        max_characters = int(max_tokens * self.counter.characters_per_token)
+        for _ in range(5):
+            trimmed = trim_to_characters(text, max_characters)
+            if not trimmed or self.counter.count(trimmed, limit=max_tokens) <= max_tokens:
+                return trimmed
+            max_characters = int(max_characters * 0.9)
+        return ""
@@ -0,0 +1,238 @@
+""" Module that contains a conversation memory bounded by tokens with a rolling summary.
+
+A window of the last k turns ignores how long the turns are: long answers can fill
+the context window, short exchanges leave it empty. This memory keeps as many recent
+messages as fit into a token budget and folds older messages into a summary. The
+summary is updated in the background after an answer, so no turn waits for it, and
+is cached alongside the session in the chat history backend.
+"""
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain.prompts import BasePromptTemplate
+from langchain.schema import BaseChatMessageHistory
+from langchain.schema.language_model import BaseLanguageModel
+from langchain.schema.messages import BaseMessage, SystemMessage, get_buffer_string
+
+from .context_packer import TokenCounter
+from .logger import TECHNICAL_LOGGER_NAME
+from .lru_cache import LRUCache
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="conversation-summary")
+        return _executor
+
+
+def keyed_messages(history: BaseChatMessageHistory) -> Tuple[List[BaseMessage], List[int]]:
+    """Returns the messages of a session and keys that increase with their position in the session.
+
+    Backends that return only the most recent messages of a session implement keyed_messages,
+    e.g. DynamoDBMessageHistory with the sequence numbers of the messages. Messages of other
+    backends are keyed by their position, so these backends must return all messages.
+    """
+    if hasattr(history, "keyed_messages"):
+        return history.keyed_messages()
+    messages = history.messages
+    return messages, list(range(len(messages)))
+
+
+@dataclass
+class ConversationSummary:
+    """Summary of the messages of a session that left the token budget."""
+
+    text: str = ""
+    through: Optional[int] = None
+    """ Key of the most recent message that is part of the summary, see keyed_messages. """
+
+
+_session_summaries: LRUCache[ConversationSummary] = LRUCache(max_size=4096)
+_object_summaries: "weakref.WeakKeyDictionary[BaseChatMessageHistory, ConversationSummary]" = (
+    weakref.WeakKeyDictionary()
+)
+_summaries_lock = threading.Lock()
+
+
+def load_summary(history: BaseChatMessageHistory) -> ConversationSummary:
+    """Returns the summary of a session from its chat history backend.
+
+    Backends that implement load_summary and save_summary store the summary with the
+    session, e.g. DynamoDBMessageHistory. For other backends the summary is kept in the
+    memory of the process, per session id or per history object, and is lost on restart.
+    Histories without a session id that cannot be weakly referenced or hashed, e.g.
+    ChatMessageHistory, cannot keep a summary, see can_keep_summary.
+    """
+    if hasattr(history, "load_summary"):
+        return history.load_summary() or ConversationSummary()
+    session_id = getattr(history, "session_id", None)
+    with _summaries_lock:
+        if session_id is not None:
+            return _session_summaries.get(session_id) or ConversationSummary()
+        try:
+            return _object_summaries.get(history) or ConversationSummary()
+        except TypeError:
+            return ConversationSummary()
+
+
+def can_keep_summary(history: BaseChatMessageHistory) -> bool:
+    """Returns whether the summary of a session can be kept, see load_summary."""
+    if hasattr(history, "save_summary") or getattr(history, "session_id", None) is not None:
+        return True
+    with _summaries_lock:
+        try:
+            _object_summaries.get(history)
+            return True
+        except TypeError:
+            return False
+
+
+def save_summary(history: BaseChatMessageHistory, summary: ConversationSummary):
+    """Stores the summary of a session in its chat history backend, see load_summary."""
+    if hasattr(history, "save_summary"):
+        history.save_summary(summary)
+        return
+    session_id = getattr(history, "session_id", None)
+    with _summaries_lock:
+        if session_id is not None:
+            _session_summaries.put(session_id, summary)
+        else:
+            try:
+                _object_summaries[history] = summary
+            except TypeError:
+                pass
+
+
+_folding: Set[Any] = set()
+_folding_lock = threading.Lock()
+
+
+class TokenBudgetSummaryMemory(BaseChatMemory):
+    """Conversation memory that keeps the recent messages that fit into a token budget
+    and a rolling summary of the older messages.
+
+    The memory variable holds the summary as a system message, followed by the most
+    recent messages, oldest first. After every answer, the messages that no longer fit
+    are folded into the summary in the background with the summary prompt. Chat histories
+    that cannot keep a summary, see can_keep_summary, only pass the recent messages,
+    instead of summarizing all older messages again after every answer.
+
+    Args:
+        llm: Language model that summarizes.
+        token_counter: Counts the tokens of the messages and the summary.
+        max_tokens: Token budget of the summary and the recent messages.
+        max_messages: Maximum number of recent messages. Must be below the number of
+            messages that the chat history backend returns, so that every message is
+            folded into the summary before the backend stops returning it.
+
+    Example:
+        ```python
+        memory = TokenBudgetSummaryMemory(
+            llm=llm,
+            token_counter=get_token_counter(model_id, llm),
+            chat_memory=message_history,
+            memory_key="chat_history",
+            return_messages=True,
+            output_key="answer",
+            max_tokens=2000,
+        )
+        ```
+    """
+
+    llm: BaseLanguageModel
+    token_counter: TokenCounter
+    max_tokens: int = 2000
+    max_messages: int = 6
+    memory_key: str = "history"
+    summary_prompt: BasePromptTemplate = SUMMARY_PROMPT
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _split(
+        self, messages: List[BaseMessage], summary: ConversationSummary
+    ) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+        """Returns the messages that do not fit into the budget and the ones that do."""
+        remaining = self.max_tokens - (self.token_counter.count(summary.text) if summary.text else 0)
+        start = len(messages)
+        while start > 0 and len(messages) - start < self.max_messages:
+            tokens = self.token_counter.count(get_buffer_string([messages[start - 1]]))
+            if tokens > remaining:
+                break
+            remaining -= tokens
+            start -= 1
+        return messages[:start], messages[start:]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        summary = load_summary(self.chat_memory)
+        _, recent = self._split(self.chat_memory.messages, summary)
+        messages: List[BaseMessage] = (
+            [SystemMessage(content=summary.text)] if summary.text else []
+        ) + recent
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        if not can_keep_summary(self.chat_memory):
+            return
+        key = getattr(self.chat_memory, "session_id", None) or id(self.chat_memory)
+        with _folding_lock:
+            if key in _folding:
+                # The running fold picks the new messages up with the next answer
+                return
+            _folding.add(key)
+        # Read on the calling thread, some backends only work on the thread of the session
+        messages, message_keys = keyed_messages(self.chat_memory)
+        _get_executor().submit(self._fold, key, messages, message_keys, load_summary(self.chat_memory))
+
+    def _fold(
+        self,
+        key: Any,
+        messages: List[BaseMessage],
+        message_keys: List[int],
+        summary: ConversationSummary,
+    ):
+        try:
+            old, _ = self._split(messages, summary)
+            # Messages up to the last folded one are part of the summary already
+            new = [
+                (message_key, message)
+                for message_key, message in zip(message_keys, old)
+                if summary.through is None or message_key > summary.through
+            ]
+            if not new:
+                return
+            text = self.llm.predict(
+                self.summary_prompt.format(
+                    summary=summary.text, new_lines=get_buffer_string([message for _, message in new])
+                )
+            ).strip()
+            save_summary(self.chat_memory, ConversationSummary(text, new[-1][0]))
+        except Exception as error:
+            logger.warning("Could not summarize the conversation. %s", error)
+        finally:
+            with _folding_lock:
+                _folding.discard(key)
+
+    def clear(self) -> None:
+        super().clear()
+        save_summary(self.chat_memory, ConversationSummary())
@@ -0,0 +1,150 @@
+""" Module that contains the conversational retrieval chain of the retrieval augmented generation flow. """
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.manager import CallbackManagerForChainRun, Callbacks
+from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain.schema import Document
+
+from .condensation_policy import CONDENSATION_LLM, CONDENSATION_SKIPPED_STANDALONE, CondensationPolicy
+from .context_packer import ContextPacker
+from .logger.latency_handler import CONDENSE_QUESTION_TAG, GENERATION_TAG, SPECULATIVE_RETRIEVAL_TAG
+from .reranker import RerankStage
+from .semantic_cache import SemanticCacheBinding
+from .speculative_retrieval import SpeculativeRetrieval
+
+
+class GenieConversationalRetrievalChain(ConversationalRetrievalChain):
+    """ConversationalRetrievalChain that can answer from a semantic cache, rerank documents
+    and pack them into the token budget of the model.
+
+    The chat history is condensed into a standalone question first, unless the condensation
+    policy decides that the question already is one. With speculative retrieval, documents
+    for the raw question are retrieved meanwhile. Similar standalone questions then get the
+    cached answer without retrieval and generation. Otherwise the retrieved documents are
+    optionally reranked and packed before they go into the prompt.
+    """
+
+    semantic_cache: Optional[SemanticCacheBinding] = None
+    """ Optional partition of the semantic answer cache to use. """
+
+    rerank_stage: Optional[RerankStage] = None
+    """ Optional rerank stage that keeps the most relevant of the retrieved documents. """
+
+    context_packer: Optional[ContextPacker] = None
+    """ Optional packer that fits the documents into the token budget of the model. """
+
+    condensation_policy: Optional[CondensationPolicy] = None
+    """ Optional policy that decides whether the question is condensed. Without a policy,
+    every question with chat history is condensed. """
+
+    speculative_retrieval: Optional[SpeculativeRetrieval] = None
+    """ Optional retrieval for the raw question while the question is condensed. """
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        question = inputs["question"]
+        get_chat_history = self.get_chat_history or _get_chat_history
+        chat_history_str = get_chat_history(inputs["chat_history"])
+
+        if self.condensation_policy is not None:
+            decision = self.condensation_policy.decide(question, chat_history_str)
+        else:
+            decision = CONDENSATION_LLM if chat_history_str else None
+        if decision == CONDENSATION_SKIPPED_STANDALONE:
+            _run_manager.on_text(
+                f"Skipped condensing the standalone question: {question}", verbose=self.verbose
+            )
+
+        speculation = None
+        if decision == CONDENSATION_LLM and self.speculative_retrieval is not None:
+            speculation = self.speculative_retrieval.start(
+                question,
+                partial(self._speculative_docs, callbacks=_run_manager.get_child(SPECULATIVE_RETRIEVAL_TAG)),
+            )
+
+        if decision == CONDENSATION_LLM:
+            new_question = self.question_generator.run(
+                question=question,
+                chat_history=chat_history_str,
+                callbacks=_run_manager.get_child(CONDENSE_QUESTION_TAG),
+            )
+        else:
+            new_question = question
+
+        docs = None
+        embedding = None
+        if speculation is not None:
+            outcome = self.speculative_retrieval.resolve(
+                speculation, new_question, partial(self._get_docs, inputs=inputs, run_manager=_run_manager)
+            )
+            _run_manager.on_text(str(outcome), verbose=self.verbose)
+            docs = outcome.documents
+            if (
+                self.semantic_cache is not None
+                and self.semantic_cache.embeddings is self.speculative_retrieval.embeddings
+            ):
+                embedding = outcome.embedding
+
+        if self.semantic_cache is not None:
+            cached, embedding = self.semantic_cache.lookup(new_question, embedding)
+            if cached is not None:
+                _run_manager.on_text(
+                    f"Semantic cache hit with similarity {cached.similarity:.3f} for: {cached.question}",
+                    verbose=self.verbose,
+                )
+                return self._output(cached.answer, cached.source_documents, new_question)
+
+        if docs is None:
+            docs = self._get_docs(new_question, inputs, run_manager=_run_manager)
+        if self.rerank_stage is not None:
+            docs, report = self.rerank_stage.run(new_question, docs)
+            _run_manager.on_text(str(report), verbose=self.verbose)
+
+        new_inputs = inputs.copy()
+        if self.rephrase_question:
+            new_inputs["question"] = new_question
+        new_inputs["chat_history"] = chat_history_str
+        if self.context_packer is not None:
+            docs, report = self.context_packer.pack(docs, self._prompt_without_documents(new_inputs))
+            if report is not None:
+                _run_manager.on_text(str(report), verbose=self.verbose)
+
+        if self.response_if_no_docs_found is not None and len(docs) == 0:
+            return self._output(self.response_if_no_docs_found, docs, new_question)
+
+        answer = self.combine_docs_chain.run(
+            input_documents=docs, callbacks=_run_manager.get_child(GENERATION_TAG), **new_inputs
+        )
+        if self.semantic_cache is not None:
+            self.semantic_cache.store(new_question, embedding, answer, docs)
+        return self._output(answer, docs, new_question)
+
+    def _speculative_docs(self, question: str, callbacks: Callbacks = None) -> List[Document]:
+        # Runs in another thread, the callbacks record it as speculative retrieval of the chat turn
+        return self._reduce_tokens_below_limit(
+            self.retriever.get_relevant_documents(question, callbacks=callbacks)
+        )
+
+    def _prompt_without_documents(self, inputs: Dict[str, Any]) -> str:
+        """Returns the prompt of the combine documents chain with the inputs but without documents."""
+        llm_chain = getattr(self.combine_docs_chain, "llm_chain", None)
+        if llm_chain is None:
+            return "\n".join(str(value) for value in inputs.values() if isinstance(value, str))
+        document_variable_name = getattr(self.combine_docs_chain, "document_variable_name", "context")
+        values = {name: inputs.get(name, "") for name in llm_chain.prompt.input_variables}
+        values[document_variable_name] = ""
+        return llm_chain.prompt.format(**values)
+
+    def _output(self, answer: str, docs, new_question: str) -> Dict[str, Any]:
+        output: Dict[str, Any] = {self.output_key: answer}
+        if self.return_source_documents:
+            output["source_documents"] = docs
+        if self.return_generated_question:
+            output["generated_question"] = new_question
+        return output
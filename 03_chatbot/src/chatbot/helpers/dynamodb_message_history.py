@@ -0,0 +1,410 @@
+""" Module that stores the chat history in Amazon DynamoDB with one item per message.
+
+LangChain's DynamoDBChatMessageHistory keeps the whole history of a session in one item
+and rewrites it with every message, so writes grow with the conversation and long chats
+hit the 400 KB item limit. Here every message is its own item with the session id as
+partition key and a sequence number as sort key:
+
+- Reads query the last messages of a session with Limit, newest first, once per
+  session and process. Afterwards the history keeps the tail of the session in memory.
+- Writes are buffered and flushed with BatchWriteItem in the background, at the latest
+  after CHAT_HISTORY_FLUSH_INTERVAL seconds and when the process exits.
+- Every message carries an expiry time, so DynamoDB's time to live removes old sessions.
+
+The summary of TokenBudgetSummaryMemory is stored in the item with sequence 0 of a session.
+"""
+import atexit
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from langchain.schema import BaseChatMessageHistory
+from langchain.schema.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from .conversation_memory import ConversationSummary
+from .environment_variables import ChatbotEnvironment, ChatbotEnvironmentVariables
+from .logger import TECHNICAL_LOGGER_NAME
+from .lru_cache import LRUCache
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+SESSION_ID_KEY = "SessionId"
+SEQUENCE_KEY = "Sequence"
+MESSAGE_ATTRIBUTE = "Message"
+EXPIRES_AT_ATTRIBUTE = "ExpiresAt"
+""" Attribute that the time to live of the table is configured on. """
+SUMMARY_SEQUENCE = 0
+""" Sequence of the item that holds the conversation summary, messages have larger sequences. """
+SUMMARY_ATTRIBUTE = "Summary"
+THROUGH_ATTRIBUTE = "Through"
+
+BATCH_WRITE_LIMIT = 25
+""" Maximum number of requests of one BatchWriteItem call. """
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+_clients: Dict[Optional[str], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _get_client(region: Optional[str]):
+    # boto3 clients are thread-safe, one per region is shared by all sessions
+    with _clients_lock:
+        if region not in _clients:
+            _clients[region] = boto3.session.Session().client("dynamodb", region_name=region)
+        return _clients[region]
+
+
+_sequence_keys: Dict[Tuple[Optional[str], str], bool] = {}
+_sequence_keys_lock = threading.Lock()
+
+
+def has_sequence_key(table_name: str, region: Optional[str] = None) -> bool:
+    """Returns whether a table has the session id as partition key and a sequence number
+    as sort key, so that it can store one item per message. The answer is cached per process.
+
+    Tables that cannot be described are treated as tables without sequence key.
+    """
+    key = (region, table_name)
+    with _sequence_keys_lock:
+        if key in _sequence_keys:
+            return _sequence_keys[key]
+    try:
+        table = _get_client(region).describe_table(TableName=table_name)["Table"]
+        key_schema = {element["KeyType"]: element["AttributeName"] for element in table["KeySchema"]}
+        result = key_schema.get("HASH") == SESSION_ID_KEY and key_schema.get("RANGE") == SEQUENCE_KEY
+    except Exception as error:
+        logger.warning("Could not describe the chat history table %s. %s", table_name, error)
+        result = False
+    with _sequence_keys_lock:
+        _sequence_keys[key] = result
+    return result
+
+
+class DynamoDBBatchWriter:
+    """Buffers put requests and writes them with BatchWriteItem in the background.
+
+    One writer is shared by all sessions of the process. Requests are written when
+    25 of them are buffered, after flush_interval seconds, and when the process exits.
+    Unprocessed items are retried with exponential backoff.
+
+    Args:
+        flush_interval: Seconds a request waits in the buffer at most.
+        max_attempts: Attempts to write unprocessed items before they are dropped.
+    """
+
+    def __init__(self, flush_interval: float = 1.0, max_attempts: int = 5):
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._buffer: Dict[Tuple[Optional[str], str], List[dict]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        """ Number of BatchWriteItem calls. """
+
+    def put(self, region: Optional[str], table_name: str, item: dict):
+        """Buffers an item to put into a table, replacing a buffered item with the same key."""
+        key = (item[SESSION_ID_KEY]["S"], item[SEQUENCE_KEY]["N"])
+        with self._lock:
+            requests = self._buffer.setdefault((region, table_name), [])
+            # BatchWriteItem rejects batches with two items of the same key, e.g. two summaries
+            requests[:] = [
+                request
+                for request in requests
+                if (
+                    request["PutRequest"]["Item"][SESSION_ID_KEY]["S"],
+                    request["PutRequest"]["Item"][SEQUENCE_KEY]["N"],
+                )
+                != key
+            ]
+            requests.append({"PutRequest": {"Item": item}})
+            full = len(requests) >= BATCH_WRITE_LIMIT
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="chat-history-writer", daemon=True
+                )
+                self._thread.start()
+        if full:
+            self._wake_up.set()
+
+    def discard(self, region: Optional[str], table_name: str, session_id: str):
+        """Drops the buffered items of a session, e.g. before the session is cleared."""
+        with self._lock:
+            requests = self._buffer.get((region, table_name), [])
+            requests[:] = [
+                request
+                for request in requests
+                if request["PutRequest"]["Item"][SESSION_ID_KEY]["S"] != session_id
+            ]
+
+    def _run(self):
+        while True:
+            self._wake_up.wait(self.flush_interval)
+            self._wake_up.clear()
+            try:
+                self.flush()
+            except Exception as error:
+                logger.warning("Could not write the chat history. %s", error)
+
+    def flush(self):
+        """Writes all buffered items."""
+        with self._flush_lock:
+            with self._lock:
+                buffer, self._buffer = self._buffer, {}
+            for (region, table_name), requests in buffer.items():
+                for start in range(0, len(requests), BATCH_WRITE_LIMIT):
+                    self._write(region, table_name, requests[start : start + BATCH_WRITE_LIMIT])
+
+    def _write(self, region: Optional[str], table_name: str, requests: List[dict]):
+        client = _get_client(region)
+        request_items = {table_name: requests}
+        for attempt in range(self.max_attempts):
+            self.batches += 1
+            try:
+                response = client.batch_write_item(RequestItems=request_items)
+                request_items = response.get("UnprocessedItems") or {}
+                if not request_items:
+                    return
+            except Exception as error:
+                logger.warning("Could not write the chat history to %s. %s", table_name, error)
+            # Throttled or failed, back off with jitter before the items are retried
+            time.sleep(random.uniform(0, min(2.0, 0.05 * 2**attempt)))
+        logger.warning(
+            "Dropped %s chat history messages of table %s after %s attempts",
+            len(request_items.get(table_name, [])),
+            table_name,
+            self.max_attempts,
+        )
+
+
+_environment = ChatbotEnvironment()
+BATCH_WRITER = DynamoDBBatchWriter(
+    flush_interval=float(
+        _environment.get_env_variable(ChatbotEnvironmentVariables.ChatHistoryFlushInterval)
+    )
+)
+""" Process-wide writer of all chat history messages. """
+atexit.register(BATCH_WRITER.flush)
+
+
+class DynamoDBMessageHistory(BaseChatMessageHistory):
+    """Chat message history that stores one DynamoDB item per message.
+
+    The table needs the partition key SessionId (string) and the sort key Sequence
+    (number), and time to live on the attribute ExpiresAt.
+
+    Args:
+        table_name: DynamoDB table name.
+        session_id: Id of the chat session.
+        region: AWS region of the table.
+        max_messages: Number of most recent messages to read and keep in memory.
+        ttl_seconds: Seconds after which a message expires. 0 keeps messages forever.
+        writer: Writer that buffers the messages.
+
+    Example:
+        ```python
+        history = get_message_history("genie-memory-table", session_id, region="eu-west-1")
+        history.add_user_message("What is the digital vignette?")
+        history.messages  # the last messages, without reading the table again
+        ```
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        session_id: str,
+        region: Optional[str] = None,
+        max_messages: int = 10,
+        ttl_seconds: int = 0,
+        writer: DynamoDBBatchWriter = BATCH_WRITER,
+    ):
+        self.table_name = table_name
+        self.session_id = session_id
+        self.region = region
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.writer = writer
+        self._tail: Optional[Deque[BaseMessage]] = None
+        self._sequences: Deque[int] = deque(maxlen=max_messages)
+        """ Sequence numbers of the messages of the tail. """
+        self._summary: Optional[ConversationSummary] = None
+        self._last_sequence = 0
+        self._lock = threading.Lock()
+
+    def _read_tail(self) -> Tuple[Deque[BaseMessage], Deque[int]]:
+        response = _get_client(self.region).query(
+            TableName=self.table_name,
+            KeyConditionExpression=f"{SESSION_ID_KEY} = :session_id AND {SEQUENCE_KEY} > :summary",
+            ExpressionAttributeValues={
+                ":session_id": {"S": self.session_id},
+                ":summary": {"N": str(SUMMARY_SEQUENCE)},
+            },
+            ProjectionExpression=f"{SEQUENCE_KEY}, {MESSAGE_ATTRIBUTE}",
+            ScanIndexForward=False,
+            Limit=self.max_messages,
+        )
+        items = [
+            {name: _deserializer.deserialize(value) for name, value in item.items()}
+            for item in reversed(response.get("Items", []))
+        ]
+        if items:
+            self._last_sequence = int(items[-1][SEQUENCE_KEY])
+        return (
+            deque(
+                messages_from_dict([json.loads(item[MESSAGE_ATTRIBUTE]) for item in items]),
+                maxlen=self.max_messages,
+            ),
+            deque((int(item[SEQUENCE_KEY]) for item in items), maxlen=self.max_messages),
+        )
+
+    def _load_tail(self):
+        # Called with the lock held, reads the table once per session and process
+        if self._tail is None:
+            try:
+                self._tail, self._sequences = self._read_tail()
+            except Exception as error:
+                logger.warning("Could not read the chat history of %s. %s", self.session_id, error)
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore
+        """The last max_messages messages of the session, oldest first."""
+        with self._lock:
+            self._load_tail()
+            return list(self._tail or [])
+
+    def keyed_messages(self) -> Tuple[List[BaseMessage], List[int]]:
+        """The last max_messages messages of the session and their sequence numbers, oldest first."""
+        with self._lock:
+            self._load_tail()
+            if self._tail is None:
+                return [], []
+            return list(self._tail), list(self._sequences)
+
+    def _next_sequence(self) -> int:
+        # Milliseconds keep the order across restarts without reading the last sequence first
+        self._last_sequence = max(self._last_sequence + 1, time.time_ns() // 1_000_000)
+        return self._last_sequence
+
+    def add_message(self, message: BaseMessage) -> None:
+        """Adds a message to the tail in memory and buffers it for the table."""
+        with self._lock:
+            # Messages added before the first read keep their order behind the stored ones
+            self._load_tail()
+            sequence = self._next_sequence()
+            item = {
+                SESSION_ID_KEY: self.session_id,
+                SEQUENCE_KEY: sequence,
+                MESSAGE_ATTRIBUTE: json.dumps(message_to_dict(message)),
+            }
+            if self._tail is not None:
+                self._tail.append(message)
+                self._sequences.append(sequence)
+        self._put(item)
+
+    def _put(self, item: Dict[str, Any]):
+        if self.ttl_seconds > 0:
+            item[EXPIRES_AT_ATTRIBUTE] = int(time.time() + self.ttl_seconds)
+        self.writer.put(
+            self.region,
+            self.table_name,
+            {name: _serializer.serialize(value) for name, value in item.items()},
+        )
+
+    def load_summary(self) -> Optional[ConversationSummary]:
+        """Returns the conversation summary of the session, read once per session and process."""
+        with self._lock:
+            if self._summary is None:
+                try:
+                    item = _get_client(self.region).get_item(
+                        TableName=self.table_name,
+                        Key={
+                            SESSION_ID_KEY: {"S": self.session_id},
+                            SEQUENCE_KEY: {"N": str(SUMMARY_SEQUENCE)},
+                        },
+                    ).get("Item")
+                except Exception as error:
+                    logger.warning("Could not read the summary of %s. %s", self.session_id, error)
+                    return None
+                item = {name: _deserializer.deserialize(value) for name, value in (item or {}).items()}
+                through = item.get(THROUGH_ATTRIBUTE)
+                # Summaries written before messages were keyed by sequence have a hash
+                self._summary = ConversationSummary(
+                    item.get(SUMMARY_ATTRIBUTE, ""), int(through) if isinstance(through, Decimal) else None
+                )
+            return self._summary
+
+    def save_summary(self, summary: ConversationSummary):
+        """Buffers the conversation summary of the session for the table."""
+        with self._lock:
+            self._summary = summary
+        item = {
+            SESSION_ID_KEY: self.session_id,
+            SEQUENCE_KEY: SUMMARY_SEQUENCE,
+            SUMMARY_ATTRIBUTE: summary.text,
+        }
+        if summary.through is not None:
+            item[THROUGH_ATTRIBUTE] = summary.through
+        self._put(item)
+
+    def clear(self) -> None:
+        """Deletes all messages of the session."""
+        self.writer.discard(self.region, self.table_name, self.session_id)
+        client = _get_client(self.region)
+        paginator = client.get_paginator("query")
+        pages = paginator.paginate(
+            TableName=self.table_name,
+            KeyConditionExpression=f"{SESSION_ID_KEY} = :session_id",
+            ExpressionAttributeValues={":session_id": {"S": self.session_id}},
+            ProjectionExpression=f"{SESSION_ID_KEY}, {SEQUENCE_KEY}",
+        )
+        keys = [item for page in pages for item in page.get("Items", [])]
+        for start in range(0, len(keys), BATCH_WRITE_LIMIT):
+            client.batch_write_item(
+                RequestItems={
+                    self.table_name: [
+                        {"DeleteRequest": {"Key": key}} for key in keys[start : start + BATCH_WRITE_LIMIT]
+                    ]
+                }
+            )
+        with self._lock:
+            self._tail = deque(maxlen=self.max_messages)
+            self._sequences = deque(maxlen=self.max_messages)
+            self._summary = ConversationSummary()
+
+
+_histories: LRUCache[DynamoDBMessageHistory] = LRUCache(max_size=4096)
+
+
+def get_message_history(
+    table_name: str, session_id: str, region: Optional[str] = None
+) -> DynamoDBMessageHistory:
+    """Returns the history of a session. Streamlit reruns the app script on every
+    interaction, the history of a session is kept across reruns so that it is read once.
+
+    Args:
+        table_name: DynamoDB table name.
+        session_id: Id of the chat session.
+        region: AWS region of the table.
+    """
+    return _histories.get_or_create(
+        (region, table_name, session_id),
+        lambda: DynamoDBMessageHistory(
+            table_name,
+            session_id,
+            region=region,
+            max_messages=int(
+                _environment.get_env_variable(ChatbotEnvironmentVariables.ChatHistoryReadLimit)
+            ),
+            ttl_seconds=int(_environment.get_env_variable(ChatbotEnvironmentVariables.ChatHistoryTTL)),
+        ),
+    )
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from enum import Enum
 from typing import Dict
 
@@ -17,6 +18,37 @@ class ChatbotEnvironmentVariables(Enum):
     AWSAppConfigProfile = "AWS_APP_CONFIG_PROFILE"
     AppPrefix = "APP_PREFIX"
     SERPAPI_API_KEY = "SERPAPI_API_KEY"
+    ChainCacheSize = "CHAIN_CACHE_SIZE"
+    OpenSearchPoolSize = "OPENSEARCH_POOL_SIZE"
+    OpenSearchHealthCheckInterval = "OPENSEARCH_HEALTH_CHECK_INTERVAL"
+    EmbeddingCacheSize = "EMBEDDING_CACHE_SIZE"
+    EmbeddingCacheTTL = "EMBEDDING_CACHE_TTL"
+    EmbeddingCachePath = "EMBEDDING_CACHE_PATH"
+    LatencyMetricsEMF = "LATENCY_METRICS_EMF"
+    BootstrapMaxWorkers = "BOOTSTRAP_MAX_WORKERS"
+    BootstrapCallTimeout = "BOOTSTRAP_CALL_TIMEOUT"
+    BootstrapDeadline = "BOOTSTRAP_DEADLINE"
+    CatalogTTL = "CATALOG_TTL"
+    ResourceDiscoveryFile = "RESOURCE_DISCOVERY_FILE"
+    CatalogSnapshotPath = "CATALOG_SNAPSHOT_PATH"
+    ChatHistoryReadLimit = "CHAT_HISTORY_READ_LIMIT"
+    ChatHistoryFlushInterval = "CHAT_HISTORY_FLUSH_INTERVAL"
+    ChatHistoryTTL = "CHAT_HISTORY_TTL"
+    ConversationMemory = "CONVERSATION_MEMORY"
+    ConversationMemoryTokens = "CONVERSATION_MEMORY_TOKENS"
+    ConversationMemoryMessages = "CONVERSATION_MEMORY_MESSAGES"
+    AWSClientMaxPoolConnections = "AWS_CLIENT_MAX_POOL_CONNECTIONS"
+    AWSClientMaxAttempts = "AWS_CLIENT_MAX_ATTEMPTS"
+    AsyncInferenceQueueUrl = "ASYNC_INFERENCE_QUEUE_URL"
+    AsyncInferenceDeadline = "ASYNC_INFERENCE_DEADLINE"
+    EndpointStateTTL = "ENDPOINT_STATE_TTL"
+    AsyncInferenceBatchSize = "ASYNC_INFERENCE_BATCH_SIZE"
+    AsyncInferenceBatchWindow = "ASYNC_INFERENCE_BATCH_WINDOW"
+    BedrockHedging = "BEDROCK_HEDGING"
+    BedrockHedgePercentile = "BEDROCK_HEDGE_PERCENTILE"
+    BedrockHedgeDelay = "BEDROCK_HEDGE_DELAY"
+    RateLimitMaxQueue = "RATE_LIMIT_MAX_QUEUE"
+    RateLimitMaxWait = "RATE_LIMIT_MAX_WAIT"
 
 
 class ChatbotEnvironment:
@@ -30,7 +62,40 @@ class ChatbotEnvironment:
         ChatbotEnvironmentVariables.AmazonBedrockRegion: None,
         ChatbotEnvironmentVariables.AWSRegion: "eu-west-1",
         ChatbotEnvironmentVariables.AppPrefix: "genie",
-        ChatbotEnvironmentVariables.SERPAPI_API_KEY: ""
+        ChatbotEnvironmentVariables.SERPAPI_API_KEY: "",
+        ChatbotEnvironmentVariables.ChainCacheSize: "32",
+        ChatbotEnvironmentVariables.OpenSearchPoolSize: "10",
+        ChatbotEnvironmentVariables.OpenSearchHealthCheckInterval: "60",
+        ChatbotEnvironmentVariables.EmbeddingCacheSize: "1024",
+        ChatbotEnvironmentVariables.EmbeddingCacheTTL: "86400",
+        ChatbotEnvironmentVariables.EmbeddingCachePath: "",
+        ChatbotEnvironmentVariables.LatencyMetricsEMF: "true",
+        ChatbotEnvironmentVariables.BootstrapMaxWorkers: "16",
+        ChatbotEnvironmentVariables.BootstrapCallTimeout: "10",
+        ChatbotEnvironmentVariables.BootstrapDeadline: "30",
+        ChatbotEnvironmentVariables.CatalogTTL: "900",
+        ChatbotEnvironmentVariables.ResourceDiscoveryFile: "",
+        ChatbotEnvironmentVariables.CatalogSnapshotPath: os.path.join(
+            tempfile.gettempdir(), "genie-catalog-snapshot.pickle"
+        ),
+        ChatbotEnvironmentVariables.ChatHistoryReadLimit: "10",
+        ChatbotEnvironmentVariables.ChatHistoryFlushInterval: "1",
+        ChatbotEnvironmentVariables.ChatHistoryTTL: "2592000",
+        ChatbotEnvironmentVariables.ConversationMemory: "window",
+        ChatbotEnvironmentVariables.ConversationMemoryTokens: "2000",
+        ChatbotEnvironmentVariables.ConversationMemoryMessages: "6",
+        ChatbotEnvironmentVariables.AWSClientMaxPoolConnections: "50",
+        ChatbotEnvironmentVariables.AWSClientMaxAttempts: "4",
+        ChatbotEnvironmentVariables.AsyncInferenceQueueUrl: "",
+        ChatbotEnvironmentVariables.AsyncInferenceDeadline: "180",
+        ChatbotEnvironmentVariables.EndpointStateTTL: "60",
+        ChatbotEnvironmentVariables.AsyncInferenceBatchSize: "1",
+        ChatbotEnvironmentVariables.AsyncInferenceBatchWindow: "0.05",
+        ChatbotEnvironmentVariables.BedrockHedging: "false",
+        ChatbotEnvironmentVariables.BedrockHedgePercentile: "95",
+        ChatbotEnvironmentVariables.BedrockHedgeDelay: "2",
+        ChatbotEnvironmentVariables.RateLimitMaxQueue: "20",
+        ChatbotEnvironmentVariables.RateLimitMaxWait: "60",
     }
 
     def get_env_variable(self, variable_name: ChatbotEnvironmentVariables) -> str:
@@ -0,0 +1,135 @@
+""" Module that contains a retriever that searches several knowledge bases at once.
+
+Kendra indices and OpenSearch indices rank documents with scores that cannot be
+compared, so their results are merged with reciprocal rank fusion. The same document
+is often ingested into several knowledge bases, so results are deduplicated by their
+source URL or title.
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Hashable, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from chatbot.open_search.hybrid_search import ScoredDocuments, reciprocal_rank_fusion
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever, Document
+
+from .logger import TECHNICAL_LOGGER_NAME
+from .metrics import record_latency
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Own pool, knowledge bases fan out to the index and hybrid search pools themselves
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="federated-search")
+        return _executor
+
+
+def source_key(document: Document) -> Hashable:
+    """Returns the identity of a document across knowledge bases.
+
+    The source URL without fragment and trailing slash, the title if there is no
+    source, and the content if there is neither.
+    """
+    source = document.metadata.get("source")
+    if source:
+        parts = urlsplit(str(source).strip())
+        return (
+            "source",
+            urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, "")),
+        )
+    title = document.metadata.get("title")
+    if title:
+        return ("title", " ".join(str(title).lower().split()))
+    return ("content", document.page_content)
+
+
+class FederatedRetriever(BaseRetriever):
+    """Retriever that searches several knowledge bases concurrently and fuses the results.
+
+    Knowledge bases that do not answer before the deadline are left out, so a slow
+    backend delays the answer by at most deadline_seconds. The latency of every
+    knowledge base is written to the debug output of the chat.
+
+    Args:
+        retrievers: Retrievers by the name of their knowledge base.
+        k: Number of documents to return.
+        deadline_seconds: Seconds to wait for the knowledge bases.
+        rrf_k: Rank constant of reciprocal rank fusion.
+
+    Example:
+        ```python
+        retriever = FederatedRetriever(
+            retrievers={"Kendra - Demo": kendra_retriever, "OpenSearch - Demo": open_search_retriever},
+            k=5,
+            deadline_seconds=8,
+        )
+        ```
+    """
+
+    retrievers: Dict[str, BaseRetriever]
+    k: int = 3
+    deadline_seconds: float = 8
+    rrf_k: int = 60
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        start_time = time.perf_counter()
+        finished_at: Dict[str, float] = {}
+
+        def search(name: str, retriever: BaseRetriever) -> ScoredDocuments:
+            try:
+                # Only the ranks matter for the fusion
+                return [(document, 0.0) for document in retriever.get_relevant_documents(query)]
+            finally:
+                finished_at[name] = time.perf_counter()
+
+        executor = _get_executor()
+        futures: Dict[str, Future] = {
+            # In the context of the chat turn, e.g. for the embedding metrics of the knowledge bases
+            name: executor.submit(contextvars.copy_context().run, search, name, retriever)
+            for name, retriever in self.retrievers.items()
+        }
+        wait(futures.values(), timeout=self.deadline_seconds)
+
+        rankings: List[ScoredDocuments] = []
+        errors: List[Exception] = []
+        report = []
+        for name, future in futures.items():
+            if not future.done():
+                future.cancel()
+                report.append(f"{name}: left out, no answer within {self.deadline_seconds} seconds")
+                record_latency("federated_retrieval", self.deadline_seconds * 1000, index=name, outcome="timeout")
+                continue
+            milliseconds = (finished_at[name] - start_time) * 1000
+            error = future.exception()
+            if error is not None:
+                logger.warning("Leaving out knowledge base %s. %s", name, error)
+                report.append(f"{name}: left out after {milliseconds:.0f} ms, {error}")
+                record_latency("federated_retrieval", milliseconds, index=name, outcome="error")
+                errors.append(error)
+                continue
+            ranking = future.result()
+            rankings.append(ranking)
+            report.append(f"{name}: {len(ranking)} documents in {milliseconds:.0f} ms")
+            record_latency("federated_retrieval", milliseconds, index=name, outcome="ok")
+
+        run_manager.on_text(
+            f"Federated retrieval from {len(rankings)} of {len(futures)} knowledge bases in "
+            f"{(time.perf_counter() - start_time) * 1000:.0f} ms\n" + "\n".join(report)
+        )
+        if not rankings and errors:
+            raise errors[0]
+        fused = reciprocal_rank_fusion(rankings, [1.0] * len(rankings), self.rrf_k, key=source_key)
+        return [document for document, _ in fused[: self.k]]
@@ -0,0 +1,160 @@
+""" This module includes a LangChain callback handler that measures the latency of every stage of a chat turn."""
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import LLMResult
+
+from chatbot.helpers.metrics import record_latency
+
+CONDENSE_QUESTION_TAG = "condense_question"
+GENERATION_TAG = "generation"
+SPECULATIVE_RETRIEVAL_TAG = "speculative_retrieval"
+
+_TAGGED_STAGES = (CONDENSE_QUESTION_TAG, GENERATION_TAG)
+
+
+class LatencyCallbackHandler(BaseCallbackHandler):
+    """LangChain callback handler that records the latency of the stages of a chat turn.
+
+    Stages:
+        turn: The outermost chain of the turn.
+        condense_question: Condensing the chat history into a standalone question.
+        retrieval: Retriever calls, including the query embedding. Speculative retrievals
+            for the raw question have the Speculative property.
+        generation: Answering the question from the retrieved documents.
+        llm: Every LLM call.
+        time_to_first_token: Time until a streaming LLM returns its first token.
+        tool: Every tool call of an agent.
+
+    Embedding calls are recorded by the embeddings themselves because they do not
+    report to LangChain callbacks.
+
+    Args:
+        flow: Flow of the chat turn.
+        model: Language model of the chat turn.
+        index: Knowledge base index of the chat turn.
+    """
+
+    def __init__(self, flow: str = "", model: str = "", index: str = ""):
+        self.flow = flow
+        self.model = model
+        self.index = index
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, stage: Optional[str], **extra):
+        with self._lock:
+            self._runs[run_id] = {"stage": stage, "start": time.perf_counter(), **extra}
+
+    def _end(self, run_id: UUID, **properties):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None or run["stage"] is None:
+            return
+        self._record(run["stage"], (time.perf_counter() - run["start"]) * 1000, **properties)
+
+    def _record(self, stage: str, milliseconds: float, **properties):
+        record_latency(
+            stage,
+            milliseconds,
+            flow=self.flow,
+            model=self.model,
+            index=self.index,
+            **properties,
+        )
+
+    def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        tags: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> None:
+        """Starts the turn or a tagged stage."""
+        stage = next((tag for tag in tags or [] if tag in _TAGGED_STAGES), None)
+        if parent_run_id is None:
+            stage = "turn"
+        self._start(run_id, stage)
+
+    def on_chain_end(self, outputs: Dict[str, Any], *, run_id: UUID, **kwargs: Any) -> None:
+        """Records the turn or a tagged stage."""
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        """Records the turn or a tagged stage as failed."""
+        self._end(run_id, Error=type(error).__name__)
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        """Starts an LLM call."""
+        self._start(run_id, "llm", first_token=True)
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any
+    ) -> Any:
+        """Starts a chat model call."""
+        self._start(run_id, "llm", first_token=True)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        """Records the time to the first token."""
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None or not run["first_token"]:
+                return
+            run["first_token"] = False
+            start = run["start"]
+        self._record("time_to_first_token", (time.perf_counter() - start) * 1000)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        """Records an LLM call."""
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        """Records an LLM call as failed."""
+        self._end(run_id, Error=type(error).__name__)
+
+    def on_retriever_start(
+        self,
+        serialized: Dict[str, Any],
+        query: str,
+        *,
+        run_id: UUID,
+        tags: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> None:
+        """Starts a retriever call."""
+        properties = {"Speculative": True} if SPECULATIVE_RETRIEVAL_TAG in (tags or []) else {}
+        self._start(run_id, "retrieval", properties=properties)
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs: Any) -> None:
+        """Records a retriever call."""
+        with self._lock:
+            properties = self._runs.get(run_id, {}).get("properties", {})
+        self._end(run_id, Documents=len(documents), **properties)
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        """Records a retriever call as failed."""
+        self._end(run_id, Error=type(error).__name__)
+
+    def on_tool_start(
+        self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        """Starts a tool call of an agent."""
+        self._start(run_id, "tool", tool=serialized.get("name", ""))
+
+    def on_tool_end(self, output: str, *, run_id: UUID, **kwargs: Any) -> None:
+        """Records a tool call of an agent."""
+        with self._lock:
+            tool = self._runs.get(run_id, {}).get("tool", "")
+        self._end(run_id, Tool=tool)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        """Records a tool call of an agent as failed."""
+        self._end(run_id, Error=type(error).__name__)
@@ -0,0 +1,156 @@
+""" Module that contains a thread-safe least recently used (LRU) cache.
+
+Streamlit runs every browser session in its own thread of the same Python process.
+Objects stored in module level caches are therefore shared by all sessions and
+need to be safe to use from multiple threads.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+def freeze(value: Any) -> Hashable:
+    """Turns nested dictionaries, lists and sets into tuples so that they can be used in cache keys.
+
+    Args:
+        value: The value to freeze, e.g. model kwargs.
+
+    Returns:
+        A hashable representation of value.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(freeze(item) for item in value))
+    return value
+
+
+@dataclass
+class CacheStats:
+    """Counters that describe how effective a cache is."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups that were answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LRUCache(Generic[V]):
+    """Thread-safe LRU cache with an optional time to live for its entries.
+
+    Args:
+        max_size: Maximum number of entries. The least recently used entry is evicted
+            when the cache is full.
+        ttl_seconds: Optional number of seconds after which an entry expires.
+
+    Example:
+        ```python
+        cache = LRUCache(max_size=32)
+        chain = cache.get_or_create(("rag", "anthropic.claude-v2"), build_chain)
+        ```
+    """
+
+    def __init__(self, max_size: int = 128, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._creation_locks: Dict[Hashable, threading.Lock] = {}
+        self._stats = CacheStats()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return (
+            self.ttl_seconds is not None
+            and time.monotonic() - created_at > self.ttl_seconds
+        )
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Returns the value for a key or None if the key is not cached or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry[0]):
+                if entry is not None:
+                    del self._entries[key]
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: V) -> None:
+        """Stores a value and evicts the least recently used entries if necessary."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], V]) -> V:
+        """Returns the cached value for key or creates, stores and returns it.
+
+        Concurrent callers that miss on the same key wait for a single call to factory.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            creation_lock = self._creation_locks.setdefault(key, threading.Lock())
+        with creation_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and not self._is_expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    return entry[1]
+            value = factory()
+            self.put(key, value)
+        with self._lock:
+            self._creation_locks.pop(key, None)
+        return value
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Removes entries from the cache.
+
+        Args:
+            predicate: Removes only the keys for which the predicate returns True.
+                Removes all entries if no predicate is given.
+
+        Returns:
+            The number of removed entries.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate is None or predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> CacheStats:
+        """Returns a snapshot of the cache counters."""
+        with self._lock:
+            return CacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                size=len(self._entries),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._is_expired(entry[0])
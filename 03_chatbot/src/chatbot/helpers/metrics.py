@@ -0,0 +1,235 @@
+""" Module that records latency and count metrics of the chatbot.
+
+Latencies are kept in an in-process histogram and counts in in-process counters.
+Both are written to stdout in the CloudWatch embedded metric format (EMF), so that
+CloudWatch Logs turns them into metrics and percentiles per stage, model and index
+can be computed offline.
+"""
+import contextvars
+import json
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from .environment_variables import ChatbotEnvironment, ChatbotEnvironmentVariables
+
+LATENCY_METRIC_NAME = "Latency"
+COUNT_METRIC_NAME = "Count"
+DIMENSION_NAMES = ("Stage", "Flow", "Model", "Index")
+
+DimensionKey = Tuple[str, str, str, str]
+
+
+def _percentile(sorted_samples: List[float], percentile: float) -> float:
+    index = min(len(sorted_samples) - 1, max(0, round(percentile / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+class LatencyHistogram:
+    """Thread-safe store of recent latency samples per stage, flow, model and index.
+
+    Args:
+        max_samples: Number of most recent samples kept per combination of dimensions.
+    """
+
+    def __init__(self, max_samples: int = 2048):
+        self.max_samples = max_samples
+        self._samples: Dict[DimensionKey, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: DimensionKey, milliseconds: float):
+        """Adds a sample."""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.max_samples)
+            samples.append(milliseconds)
+
+    def percentiles(
+        self, stage: Optional[str] = None, percentiles: Tuple[float, ...] = (50, 95, 99)
+    ) -> Dict[DimensionKey, Dict[str, float]]:
+        """Returns the count and percentiles per combination of dimensions.
+
+        Args:
+            stage: Only report this stage.
+            percentiles: Percentiles to compute.
+
+        Example:
+            ```python
+            LATENCY_HISTOGRAM.percentiles("retrieval")
+            # {("retrieval", "Retrieval Augmented Generation", "anthropic.claude-v2", "my-index"):
+            #     {"count": 10, "p50": 80.1, "p95": 120.3, "p99": 130.0}}
+            ```
+        """
+        with self._lock:
+            snapshot = {
+                key: sorted(samples)
+                for key, samples in self._samples.items()
+                if samples and (stage is None or key[0] == stage)
+            }
+        return {
+            key: {
+                "count": len(samples),
+                **{f"p{p:g}": _percentile(samples, p) for p in percentiles},
+            }
+            for key, samples in snapshot.items()
+        }
+
+    def clear(self):
+        """Removes all samples."""
+        with self._lock:
+            self._samples.clear()
+
+
+LATENCY_HISTOGRAM = LatencyHistogram()
+""" Process-wide histogram of all recorded latencies. """
+
+
+class EventCounters:
+    """Thread-safe counters of events per stage, flow, model and index."""
+
+    def __init__(self):
+        self._counts: Dict[DimensionKey, int] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, key: DimensionKey, count: int = 1):
+        """Adds count to the counter of key."""
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + count
+
+    def counts(self, stage_prefix: Optional[str] = None) -> Dict[DimensionKey, int]:
+        """Returns the counts per combination of dimensions.
+
+        Args:
+            stage_prefix: Only report stages that start with this prefix.
+
+        Example:
+            ```python
+            EVENT_COUNTERS.counts("condensation")
+            # {("condensation_skipped_no_history", "Retrieval Augmented Generation", "anthropic.claude-v2", "-"): 12,
+            #  ("condensation_llm", "Retrieval Augmented Generation", "anthropic.claude-instant-v1", "-"): 5}
+            ```
+        """
+        with self._lock:
+            return {
+                key: count
+                for key, count in self._counts.items()
+                if stage_prefix is None or key[0].startswith(stage_prefix)
+            }
+
+    def clear(self):
+        """Resets all counters."""
+        with self._lock:
+            self._counts.clear()
+
+
+EVENT_COUNTERS = EventCounters()
+""" Process-wide counters of all recorded events. """
+
+_environment = ChatbotEnvironment()
+_namespace = _environment.get_env_variable(ChatbotEnvironmentVariables.AppPrefix)
+_emit_emf = (
+    _environment.get_env_variable(ChatbotEnvironmentVariables.LatencyMetricsEMF).lower() == "true"
+)
+
+
+_turn_dimensions: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar(
+    "metric_dimensions", default={}
+)
+
+
+@contextmanager
+def metric_dimensions(flow: str = "", model: str = "", index: str = "") -> Iterator[None]:
+    """Sets the dimensions of the chat turn for the metrics of shared clients.
+
+    Clients that are shared by all flows and knowledge bases, e.g. the pooled embeddings,
+    read them with turn_dimensions. Thread pools that work for the turn have to run their
+    tasks in a copy of the context of the turn.
+
+    Example:
+        ```python
+        with metric_dimensions(flow="RAG", model="anthropic.claude-v2", index="kendra:docs"):
+            app.generate_response(prompt, memory)
+        ```
+    """
+    token = _turn_dimensions.set({"flow": flow, "model": model, "index": index})
+    try:
+        yield
+    finally:
+        _turn_dimensions.reset(token)
+
+
+def turn_dimensions() -> Dict[str, str]:
+    """Returns the dimensions of the current chat turn, see metric_dimensions."""
+    return _turn_dimensions.get()
+
+
+def record_latency(
+    stage: str,
+    milliseconds: float,
+    flow: str = "",
+    model: str = "",
+    index: str = "",
+    **properties,
+):
+    """Records the latency of a stage in the histogram and as EMF record on stdout.
+
+    Args:
+        stage: Stage of the chat turn, e.g. retrieval or time_to_first_token.
+        milliseconds: Latency of the stage.
+        flow: Flow of the chat turn.
+        model: Language model or embedding model.
+        index: Knowledge base index.
+        properties: Additional properties for the EMF record that are not dimensions.
+    """
+    key = (stage, flow or "-", model or "-", index or "-")
+    LATENCY_HISTOGRAM.record(key, milliseconds)
+    _write_emf(key, LATENCY_METRIC_NAME, "Milliseconds", round(milliseconds, 3), properties)
+
+
+def record_count(
+    stage: str,
+    count: int = 1,
+    flow: str = "",
+    model: str = "",
+    index: str = "",
+    **properties,
+):
+    """Records the number of events of a stage in the counters and as EMF record on stdout.
+
+    Args:
+        stage: Event, e.g. condensation_skipped_standalone.
+        count: Number of events.
+        flow: Flow of the chat turn.
+        model: Language model or embedding model.
+        index: Knowledge base index.
+        properties: Additional properties for the EMF record that are not dimensions.
+    """
+    key = (stage, flow or "-", model or "-", index or "-")
+    EVENT_COUNTERS.increment(key, count)
+    _write_emf(key, COUNT_METRIC_NAME, "Count", count, properties)
+
+
+def _write_emf(key: DimensionKey, metric_name: str, unit: str, value: float, properties: dict):
+    if not _emit_emf:
+        return
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": _namespace,
+                    "Dimensions": [list(DIMENSION_NAMES), ["Stage"]],
+                    "Metrics": [{"Name": metric_name, "Unit": unit}],
+                }
+            ],
+        },
+        **properties,
+        **dict(zip(DIMENSION_NAMES, key)),
+        metric_name: value,
+    }
+    sys.stdout.write(json.dumps(record, default=str) + "\n")
+    sys.stdout.flush()
@@ -0,0 +1,109 @@
+""" Module that collects concurrent requests into batches.
+
+Sessions of the chatbot run in their own threads. When several of them call the same
+model at about the same time, a batch can answer them with one invocation. The batcher
+keeps the first request of a batch waiting for at most a short window, or until the
+batch is full, and then dispatches all requests of the batch together.
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Generic, Hashable, List, Optional, TypeVar
+
+from .metrics import record_count
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class _Batch(Generic[T]):
+    items: List[T] = field(default_factory=list)
+    futures: List[Future] = field(default_factory=list)
+    full: threading.Event = field(default_factory=threading.Event)
+
+
+class MicroBatcher(Generic[T, R]):
+    """Dispatches the items that arrive for the same key within a window as one batch.
+
+    Items with different keys, e.g. different endpoints or model parameters, are never
+    batched together. A batch is dispatched max_wait seconds after its first item
+    arrived or as soon as it has max_batch_size items.
+
+    Args:
+        dispatch: Returns the results of a batch of items with the same key, in order.
+        max_batch_size: Maximum number of items per batch.
+        max_wait: Seconds the first item of a batch waits for more items at most.
+        name: Name of the batcher for the metrics and its threads.
+        max_workers: Maximum number of batches in flight.
+
+    Example:
+        ```python
+        batcher = MicroBatcher(lambda key, prompts: invoke(key, prompts), max_batch_size=8, max_wait=0.05)
+        answer = batcher.submit(endpoint_name, prompt).result()
+        ```
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[[Hashable, List[T]], List[R]],
+        max_batch_size: int = 8,
+        max_wait: float = 0.05,
+        name: str = "micro_batch",
+        max_workers: int = 16,
+    ):
+        self.dispatch = dispatch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.max_workers = max_workers
+        self._open: Dict[Hashable, _Batch[T]] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.batches = 0
+        """ Number of dispatched batches. """
+        self.items = 0
+        """ Number of dispatched items. """
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+            return self._executor
+
+    def submit(self, key: Hashable, item: T) -> "Future[R]":
+        """Adds an item to the open batch of its key and returns the future of its result."""
+        future: Future = Future()
+        with self._lock:
+            batch = self._open.get(key)
+            first = batch is None
+            if first:
+                batch = self._open[key] = _Batch()
+            batch.items.append(item)
+            batch.futures.append(future)
+            if len(batch.items) >= self.max_batch_size:
+                # Later items of the key open the next batch
+                del self._open[key]
+                batch.full.set()
+        if first:
+            self._get_executor().submit(self._run, key, batch)
+        return future
+
+    def _run(self, key: Hashable, batch: _Batch[T]):
+        batch.full.wait(self.max_wait)
+        with self._lock:
+            if self._open.get(key) is batch:
+                del self._open[key]
+            self.batches += 1
+            self.items += len(batch.items)
+        record_count(f"{self.name}_items", len(batch.items))
+        try:
+            results = self.dispatch(key, batch.items)
+            if len(results) != len(batch.items):
+                raise ValueError(f"Batch of {len(batch.items)} items returned {len(results)} results")
+        except Exception as error:
+            for future in batch.futures:
+                future.set_exception(error)
+            return
+        for future, result in zip(batch.futures, results):
+            future.set_result(result)
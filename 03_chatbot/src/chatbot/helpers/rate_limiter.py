@@ -0,0 +1,382 @@
+""" Module that limits the request and token rate of the chatbot process per model and region.
+
+Amazon Bedrock throttles the requests of an account per model and region by requests and
+tokens per minute. All sessions of a chatbot process share these quotas, so one rate
+limiter per model and region, with token buckets for the configured budgets, queues the
+requests of all sessions before they are sent:
+
+- Waiting requests are served round-robin by session, so one session that sends many
+  requests cannot hold back the others.
+- The queue is bounded. A request is rejected with RateLimitExceeded when the queue is
+  full or its estimated wait is too long, instead of adding to the load that caused
+  the throttling.
+- A request reserves its prompt tokens, estimated from the request body, and its answer
+  tokens. The reservation is settled with the token counts that Bedrock reports.
+- A throttling error of Bedrock empties the buckets, the next requests wait for them to
+  refill. The request is retried through the queue instead of right away.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Hashable, Iterator, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from .context_packer import DEFAULT_CHARACTERS_PER_TOKEN
+from .environment_variables import ChatbotEnvironment, ChatbotEnvironmentVariables
+from .logger import TECHNICAL_LOGGER_NAME
+from .metrics import record_count, record_latency
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+RATE_LIMIT_OWNER: contextvars.ContextVar[Optional[Hashable]] = contextvars.ContextVar(
+    "RATE_LIMIT_OWNER", default=None
+)
+""" Session on whose behalf the current thread sends requests, the thread if not set. """
+
+_ANSWER_TOKEN_KEYS = ("max_tokens_to_sample", "max_tokens", "maxTokens", "maxTokenCount", "max_gen_len")
+_INVOCATION_METRICS = b"amazon-bedrock-invocationMetrics"
+_THROTTLING_CODES = ("ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException")
+
+
+class RateLimitExceeded(Exception):
+    """The request was rejected because too many requests wait for the model.
+
+    Args:
+        message: Description of the rejection.
+        retry_after: Estimated seconds until the request would be sent.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+THROTTLED_RETRY_AFTER = 1.0
+""" Seconds to retry after when the service throttled all attempts, it does not tell how long. """
+
+
+def find_rate_limit_exceeded(error: BaseException) -> Optional[RateLimitExceeded]:
+    """Returns the RateLimitExceeded that caused error, LangChain wraps it into a ValueError.
+
+    A throttling error of the service that remained after all attempts counts as well.
+    """
+    while error is not None:
+        if isinstance(error, RateLimitExceeded):
+            return error
+        if _is_throttling(error):
+            return RateLimitExceeded(str(error), retry_after=THROTTLED_RETRY_AFTER)
+        error = error.__cause__ or error.__context__
+    return None
+
+
+class TokenBucket:
+    """Bucket that refills capacity per minute continuously up to capacity.
+
+    Args:
+        per_minute: Capacity and refill per minute.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount: float) -> float:
+        """Returns the seconds until amount has flowed into the bucket beyond its level."""
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+@dataclass
+class _Waiter:
+    owner: Hashable
+    tokens: int
+
+
+@dataclass
+class Reservation:
+    """Requests and tokens that an acquired request took from the buckets."""
+
+    tokens: int
+    waited: float
+    settled: bool = False
+
+
+class RateLimiter:
+    """Requests and tokens per minute budget of a model in a region, shared by all sessions.
+
+    Args:
+        name: Model and region, for the metrics.
+        requests_per_minute: Requests per minute, None for no limit.
+        tokens_per_minute: Prompt and answer tokens per minute, None for no limit.
+        max_queue: Maximum number of waiting requests.
+        max_wait: Maximum seconds that a request waits, requests with a longer estimated
+            wait are rejected.
+
+    Example:
+        ```python
+        limiter = RateLimiter("anthropic.claude-v2/us-east-1", requests_per_minute=100, tokens_per_minute=50000)
+        reservation = limiter.acquire(tokens=1500)
+        ...
+        limiter.settle(reservation, tokens=900)
+        ```
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_queue: int = 20,
+        max_wait: float = 60.0,
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        # Waiting requests per owner, the first owner is served next
+        self._queues: "OrderedDict[Hashable, Deque[_Waiter]]" = OrderedDict()
+        self._waiting = 0
+        self._queued_tokens = 0
+        self._condition = threading.Condition()
+        self.rejections = 0
+        """ Number of rejected requests. """
+
+    def _buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket]
+
+    def _refill(self, now: float):
+        for bucket in self._buckets():
+            bucket.refill(now)
+
+    def _seconds_until(self, requests: int, tokens: int) -> float:
+        seconds = 0.0
+        if self.requests:
+            seconds = max(seconds, self.requests.seconds_until(requests))
+        if self.tokens:
+            seconds = max(seconds, self.tokens.seconds_until(tokens))
+        return seconds
+
+    def estimated_wait(self, tokens: int = 0) -> float:
+        """Returns the estimated seconds a new request with tokens would wait."""
+        with self._condition:
+            self._refill(time.monotonic())
+            return self._seconds_until(self._waiting + 1, self._queued_tokens + tokens)
+
+    @property
+    def waiting(self) -> int:
+        """Number of waiting requests."""
+        return self._waiting
+
+    def acquire(self, tokens: int, owner: Optional[Hashable] = None) -> Reservation:
+        """Blocks until the request can be sent and takes it from the budgets.
+
+        Raises:
+            RateLimitExceeded: The queue is full or the request would wait longer than max_wait.
+        """
+        owner = owner if owner is not None else RATE_LIMIT_OWNER.get()
+        owner = owner if owner is not None else threading.get_ident()
+        start_time = time.monotonic()
+        with self._condition:
+            self._refill(start_time)
+            estimate = self._seconds_until(self._waiting + 1, self._queued_tokens + tokens)
+            if estimate > 0 and (self._waiting >= self.max_queue or estimate > self.max_wait):
+                self.rejections += 1
+                record_count("rate_limit_rejected", model=self.name)
+                raise RateLimitExceeded(
+                    f"{self._waiting} requests wait for {self.name}, the next one would wait about {estimate:.0f} s",
+                    retry_after=estimate,
+                )
+            waiter = _Waiter(owner, tokens)
+            self._queues.setdefault(owner, deque()).append(waiter)
+            self._waiting += 1
+            self._queued_tokens += tokens
+            served = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    head = next(iter(self._queues.values()))[0]
+                    if head is waiter:
+                        # A request larger than the bucket goes when it is full, and overdraws it
+                        seconds = self._seconds_until(1, min(tokens, self.tokens.capacity) if self.tokens else 0)
+                        if seconds <= 0:
+                            break
+                    else:
+                        # Woken up when the head was served
+                        seconds = None
+                    if now - start_time > self.max_wait + 1:
+                        # The budgets shrank while waiting, e.g. after throttling
+                        raise RateLimitExceeded(
+                            f"Waited more than {self.max_wait:.0f} s for {self.name}", retry_after=self.max_wait
+                        )
+                    self._condition.wait(seconds if seconds is not None else self.max_wait)
+                if self.requests:
+                    self.requests.level -= 1
+                if self.tokens:
+                    self.tokens.level -= tokens
+                served = True
+            finally:
+                self._dequeue(waiter, served)
+        waited = time.monotonic() - start_time
+        if waited > 0.001:
+            record_latency("rate_limit_wait", waited * 1000, model=self.name)
+        return Reservation(tokens, waited)
+
+    def _dequeue(self, waiter: _Waiter, served: bool):
+        queue = self._queues[waiter.owner]
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.owner]
+        elif served:
+            # The owner's next request goes to the back, after the requests of the others
+            self._queues.move_to_end(waiter.owner)
+        self._waiting -= 1
+        self._queued_tokens -= waiter.tokens
+        self._condition.notify_all()
+
+    def settle(self, reservation: Reservation, tokens: int):
+        """Corrects the reserved tokens of a request by the tokens it actually used.
+
+        Only the first settlement of a reservation counts, 0 returns all reserved tokens,
+        e.g. for a request that failed.
+        """
+        if not self.tokens:
+            return
+        with self._condition:
+            if reservation.settled:
+                return
+            reservation.settled = True
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reservation.tokens - tokens)
+            self._condition.notify_all()
+
+    def throttled(self):
+        """Empties the budgets after the service throttled a request."""
+        with self._condition:
+            for bucket in self._buckets():
+                bucket.level = min(bucket.level, 0)
+        record_count("rate_limit_throttled", model=self.name)
+
+
+_environment = ChatbotEnvironment()
+RATE_LIMIT_MAX_QUEUE = int(_environment.get_env_variable(ChatbotEnvironmentVariables.RateLimitMaxQueue))
+RATE_LIMIT_MAX_WAIT = float(_environment.get_env_variable(ChatbotEnvironmentVariables.RateLimitMaxWait))
+
+_rate_limiters: Dict[Tuple[str, str, Optional[int], Optional[int]], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    model_id: str, region: str, requests_per_minute: Optional[int], tokens_per_minute: Optional[int]
+) -> Optional[RateLimiter]:
+    """Returns the process-wide rate limiter of a model in a region, None without budgets."""
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    key = (model_id, region, requests_per_minute, tokens_per_minute)
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(
+                f"{model_id}/{region}",
+                requests_per_minute,
+                tokens_per_minute,
+                max_queue=RATE_LIMIT_MAX_QUEUE,
+                max_wait=RATE_LIMIT_MAX_WAIT,
+            )
+        return _rate_limiters[key]
+
+
+def estimate_tokens(body: Any) -> int:
+    """Estimates the prompt and answer tokens of the body of an InvokeModel request."""
+    text = body.decode("utf-8", "replace") if isinstance(body, bytes) else str(body)
+    answer_tokens = 0
+    try:
+        request = json.loads(text)
+        parameters = {**request, **(request.get("textGenerationConfig") or {})}
+        answer_tokens = next(
+            (int(parameters[key]) for key in _ANSWER_TOKEN_KEYS if isinstance(parameters.get(key), int)), 0
+        )
+    except (ValueError, AttributeError):
+        pass
+    return int(len(text) / DEFAULT_CHARACTERS_PER_TOKEN) + answer_tokens
+
+
+def _is_throttling(error: BaseException) -> bool:
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in _THROTTLING_CODES
+
+
+class RateLimitedBedrockClient:
+    """bedrock-runtime client that sends invoke_model and invoke_model_with_response_stream
+    through a rate limiter.
+
+    Args:
+        client: bedrock-runtime client that does not retry throttled requests itself.
+        limiter: Rate limiter of the model and region of the client.
+        max_attempts: Attempts of a request including the first one. Every attempt
+            waits in the queue of the limiter.
+    """
+
+    def __init__(self, client: Any, limiter: RateLimiter, max_attempts: int = 1):
+        self.client = client
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+
+    def invoke_model(self, **kwargs) -> Dict[str, Any]:
+        response, reservation = self._invoke("invoke_model", kwargs)
+        headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        tokens = [headers.get(f"x-amzn-bedrock-{kind}-token-count") for kind in ("input", "output")]
+        if all(tokens):
+            self.limiter.settle(reservation, sum(map(int, tokens)))
+        return response
+
+    def invoke_model_with_response_stream(self, **kwargs) -> Dict[str, Any]:
+        response, reservation = self._invoke("invoke_model_with_response_stream", kwargs)
+        return {**response, "body": self._settle_stream(response["body"], reservation)}
+
+    def _invoke(self, operation: str, kwargs: dict) -> Tuple[Dict[str, Any], Reservation]:
+        tokens = estimate_tokens(kwargs.get("body", ""))
+        for attempt in range(1, self.max_attempts + 1):
+            reservation = self.limiter.acquire(tokens)
+            try:
+                return getattr(self.client, operation)(**kwargs), reservation
+            except ClientError as error:
+                if not _is_throttling(error):
+                    # The request did not use the reserved tokens
+                    self.limiter.settle(reservation, 0)
+                    raise
+                # Returned before the budgets are emptied, so that the next attempt still waits
+                self.limiter.settle(reservation, 0)
+                self.limiter.throttled()
+                if attempt == self.max_attempts:
+                    raise
+                logger.info("%s throttled, attempt %s of %s", self.limiter.name, attempt, self.max_attempts)
+            except Exception:
+                self.limiter.settle(reservation, 0)
+                raise
+
+    def _settle_stream(self, events: Any, reservation: Reservation) -> Iterator[dict]:
+        # The last chunk of a stream reports the token counts of the request
+        try:
+            for event in events:
+                data = event.get("chunk", {}).get("bytes", b"")
+                if _INVOCATION_METRICS in data:
+                    metrics = json.loads(data).get("amazon-bedrock-invocationMetrics", {})
+                    self.limiter.settle(
+                        reservation, metrics.get("inputTokenCount", 0) + metrics.get("outputTokenCount", 0)
+                    )
+                yield event
+        finally:
+            # Streams that fail or are closed early, e.g. of a hedged request that lost,
+            # end without the token counts
+            self.limiter.settle(reservation, 0)
+            if hasattr(events, "close"):
+                events.close()
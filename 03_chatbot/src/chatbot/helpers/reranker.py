@@ -0,0 +1,274 @@
+""" Module that reranks retrieved documents before they are stuffed into the prompt.
+
+The retriever fetches more candidates than the prompt gets. A reranker that compares
+every candidate with the question keeps the best of them, so the prompt gets fewer
+but more relevant documents and fewer tokens.
+
+Rerankers:
+- lexical: BM25 over the candidates, CPU only and without any model.
+- embedding: cosine similarity of question and candidate embeddings.
+- cross-encoder: a small local cross-encoder model that reads question and candidate
+  together. Needs the optional sentence-transformers package.
+"""
+import logging
+import math
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+
+from .logger import TECHNICAL_LOGGER_NAME
+from .metrics import record_latency
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+RERANKER_LEXICAL = "lexical"
+RERANKER_EMBEDDING = "embedding"
+RERANKER_CROSS_ENCODER = "cross-encoder"
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class RerankConfig:
+    """The rerank section of the Retrieval Augmented Generation flow config."""
+
+    enabled: bool = False
+    type: str = RERANKER_LEXICAL
+    """ lexical, embedding or cross-encoder. """
+    over_fetch: float = 3
+    """ The retriever fetches over_fetch times the number of documents to keep. """
+    keep: int = 0
+    """ Documents to keep after reranking. 0 keeps the number of retrieved documents of the sidebar. """
+    model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    """ Hugging Face model id or local path of the cross-encoder. """
+    embedding: Optional[Dict[str, str]] = None
+    """ Embedding type, model and optional region for retrievers that do not embed queries themselves. """
+
+    @staticmethod
+    def from_dict(obj: Any) -> "RerankConfig":
+        if not isinstance(obj, dict):
+            return RerankConfig()
+        reranker_type = obj.get("type", RERANKER_LEXICAL)
+        if reranker_type not in (RERANKER_LEXICAL, RERANKER_EMBEDDING, RERANKER_CROSS_ENCODER):
+            raise ValueError(
+                f"Unknown reranker {reranker_type}, use {RERANKER_LEXICAL}, "
+                f"{RERANKER_EMBEDDING} or {RERANKER_CROSS_ENCODER}"
+            )
+        return RerankConfig(
+            enabled=bool(obj.get("enabled", False)),
+            type=reranker_type,
+            over_fetch=float(obj.get("overFetch", 3)),
+            keep=int(obj.get("keep", 0)),
+            model=obj.get("model", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+            embedding=obj.get("embedding"),
+        )
+
+    def num_candidates(self, keep: int) -> int:
+        """Returns the number of documents to retrieve to keep keep documents."""
+        return max(keep, math.ceil(keep * self.over_fetch))
+
+
+class Reranker(ABC):
+    """Scores documents by their relevance for a question."""
+
+    name: str = ""
+
+    @abstractmethod
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        """Returns a relevance score for every document, higher is more relevant."""
+
+    def rerank(self, query: str, documents: List[Document], keep: int) -> List[Tuple[Document, float]]:
+        """Returns the keep most relevant documents with their scores, most relevant first.
+
+        Documents with the same score keep the order of the retriever.
+        """
+        if not documents:
+            return []
+        scores = self.score(query, documents)
+        order = sorted(range(len(documents)), key=lambda position: (-scores[position], position))
+        return [(documents[position], scores[position]) for position in order[:keep]]
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalReranker(Reranker):
+    """Reranks with BM25, the inverse document frequencies come from the candidates.
+
+    Args:
+        k1: Term frequency saturation.
+        b: Document length normalization.
+    """
+
+    name = RERANKER_LEXICAL
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        terms = [Counter(_tokenize(document.page_content)) for document in documents]
+        lengths = [sum(counts.values()) for counts in terms]
+        average_length = (sum(lengths) / len(lengths)) or 1.0
+        scores = [0.0] * len(documents)
+        for term in set(_tokenize(query)):
+            frequency_in_documents = sum(1 for counts in terms if term in counts)
+            if frequency_in_documents == 0:
+                continue
+            idf = math.log(
+                1 + (len(documents) - frequency_in_documents + 0.5) / (frequency_in_documents + 0.5)
+            )
+            for position, counts in enumerate(terms):
+                frequency = counts.get(term, 0)
+                if frequency:
+                    norm = self.k1 * (1 - self.b + self.b * lengths[position] / average_length)
+                    scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+
+class EmbeddingReranker(Reranker):
+    """Reranks by the cosine similarity of the question and the candidate embeddings.
+
+    All candidates are embedded with one embed_documents call.
+
+    Args:
+        embeddings: Embeddings for the question and the candidates.
+    """
+
+    name = RERANKER_EMBEDDING
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        document_vectors = np.asarray(
+            self.embeddings.embed_documents([document.page_content for document in documents]),
+            dtype=np.float32,
+        )
+        norms = np.linalg.norm(document_vectors, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        return list((document_vectors @ query_vector) / np.where(norms == 0, 1.0, norms))
+
+
+_cross_encoders: Dict[str, Any] = {}
+_cross_encoders_lock = threading.Lock()
+
+
+class CrossEncoderReranker(Reranker):
+    """Reranks with a small local cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2.
+
+    All question and candidate pairs are scored in one batch. The model is loaded once
+    per process and shared by all sessions.
+
+    Args:
+        model: Hugging Face model id or local path of the cross-encoder.
+    """
+
+    name = RERANKER_CROSS_ENCODER
+
+    def __init__(self, model: str):
+        self.model_name = model
+
+    def _model(self):
+        with _cross_encoders_lock:
+            if self.model_name not in _cross_encoders:
+                try:
+                    from sentence_transformers import CrossEncoder
+                except ImportError:
+                    raise ModuleNotFoundError(
+                        "Could not import sentence_transformers python package. "
+                        "Please install it with `pip install sentence-transformers` "
+                        "to use the cross-encoder reranker."
+                    )
+                start_time = time.time()
+                _cross_encoders[self.model_name] = CrossEncoder(self.model_name, device="cpu")
+                logger.info(
+                    "Loaded cross-encoder %s in %s seconds", self.model_name, time.time() - start_time
+                )
+            return _cross_encoders[self.model_name]
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        pairs = [(query, document.page_content) for document in documents]
+        return [float(score) for score in self._model().predict(pairs, batch_size=len(pairs))]
+
+
+def approximate_num_tokens(text: str) -> int:
+    """Returns the approximate number of tokens of a text, about 4 characters per token."""
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class RerankReport:
+    """What a rerank cost and saved."""
+
+    candidates: int
+    kept: int
+    milliseconds: float
+    tokens_saved: int
+    """ Approximate prompt tokens of the candidates that were dropped. """
+
+    def __str__(self) -> str:
+        return (
+            f"Reranked {self.candidates} candidates to {self.kept} in {self.milliseconds:.0f} ms, "
+            f"saving about {self.tokens_saved} prompt tokens"
+        )
+
+
+@dataclass
+class RerankStage:
+    """Rerank stage between retriever and the chain that stuffs documents into the prompt.
+
+    Args:
+        reranker: Reranker to score the candidates with.
+        keep: Number of documents to keep.
+    """
+
+    reranker: Reranker
+    keep: int
+
+    def run(self, query: str, documents: List[Document]) -> Tuple[List[Document], RerankReport]:
+        """Returns the keep most relevant documents and a report of the added latency and saved tokens."""
+        start_time = time.perf_counter()
+        kept = [document for document, _ in self.reranker.rerank(query, documents, self.keep)]
+        milliseconds = (time.perf_counter() - start_time) * 1000
+
+        kept_ids = {id(document) for document in kept}
+        report = RerankReport(
+            candidates=len(documents),
+            kept=len(kept),
+            milliseconds=milliseconds,
+            tokens_saved=sum(
+                approximate_num_tokens(document.page_content)
+                for document in documents
+                if id(document) not in kept_ids
+            ),
+        )
+        record_latency(
+            "rerank",
+            milliseconds,
+            model=self.reranker.name,
+            candidates=report.candidates,
+            tokens_saved=report.tokens_saved,
+        )
+        return kept, report
+
+
+def get_reranker(config: RerankConfig, embeddings: Optional[Embeddings] = None) -> Optional[Reranker]:
+    """Returns the configured reranker, None if it needs embeddings and there are none."""
+    if config.type == RERANKER_CROSS_ENCODER:
+        return CrossEncoderReranker(config.model)
+    if config.type == RERANKER_EMBEDDING:
+        if embeddings is None:
+            logger.warning("Skipping the embedding reranker, there are no embeddings for the knowledge base")
+            return None
+        return EmbeddingReranker(embeddings)
+    return LexicalReranker()
@@ -4,43 +4,48 @@ and GitHub snippet https://gist.github.com/dgallitelli/bdce9c5b3eb5e3948924d1632
 """
 
 """Wrapper around Sagemaker InvokeEndpointAsync API."""
+import functools
+import io
+import json
 from abc import abstractmethod
-from typing import Any, List, Optional
+from typing import Any, List, Optional, Tuple
 from langchain.callbacks.manager import CallbackManagerForLLMRun
 from langchain.llms.utils import enforce_stop_tokens
 from langchain.llms.sagemaker_endpoint import SagemakerEndpoint
-import boto3, time, os, uuid
-from botocore.exceptions import ClientError
-
-def wait_inference_file(output_url, failure_url, s3_client=None):
-    s3_client = boto3.client("s3") if s3_client == None else s3_client
-    bucket = output_url.split("/")[2]
-    output_prefix = "/".join(output_url.split("/")[3:])
-    failure_prefix = "/".join(failure_url.split("/")[3:])
-    while True:
-        try:
-            response = s3_client.get_object(Bucket=bucket, Key=output_prefix)
-            print(response)
-            return response
-        except ClientError as ex:
-            if ex.response['Error']['Code'] == 'NoSuchKey':
-                try:
-                    response = s3_client.get_object(Bucket=bucket, Key=failure_prefix)
-                    raise Exception(response['Body'].read().decode('utf-8'))
-                except ClientError as ex:
-                    if ex.response['Error']['Code'] == 'NoSuchKey':
-                        # Wait for file to be generated
-                        print("Waiting for file to be generated...")
-                        time.sleep(2)
-                        continue
-                    else:
-                        raise
-            else:
-                raise
-
-        except Exception as e:
-            print(e.__dict__)
-            raise
+import boto3, os, uuid
+
+from .async_inference_waiter import ASYNC_INFERENCE_WAITER
+from .aws_client_pool import AWS_CLIENT_POOL
+from .environment_variables import ChatbotEnvironment, ChatbotEnvironmentVariables
+from .lru_cache import LRUCache, freeze
+from .micro_batcher import MicroBatcher
+
+_environment = ChatbotEnvironment()
+ENDPOINT_STATES: LRUCache[bool] = LRUCache(
+    max_size=256,
+    ttl_seconds=float(_environment.get_env_variable(ChatbotEnvironmentVariables.EndpointStateTTL)),
+)
+""" Whether an asynchronous endpoint has running instances, by region and endpoint name. """
+ASYNC_INFERENCE_DEADLINE = float(
+    _environment.get_env_variable(ChatbotEnvironmentVariables.AsyncInferenceDeadline)
+)
+""" Seconds to wait for the result of an asynchronous inference request. """
+
+
+ASYNC_INFERENCE_BATCH_SIZE = int(
+    _environment.get_env_variable(ChatbotEnvironmentVariables.AsyncInferenceBatchSize)
+)
+""" Maximum number of prompts per asynchronous inference request, 1 disables batching. """
+ASYNC_INFERENCE_BATCH_WINDOW = float(
+    _environment.get_env_variable(ChatbotEnvironmentVariables.AsyncInferenceBatchWindow)
+)
+""" Seconds a prompt waits for other prompts to the same endpoint at most. """
+
+
+@functools.lru_cache(maxsize=None)
+def _account_id() -> str:
+    return boto3.client("sts").get_caller_identity()["Account"]
+
 
 class SagemakerAsyncEndpoint(SagemakerEndpoint):
     input_bucket: str = ""
@@ -60,13 +65,55 @@ class SagemakerAsyncEndpoint(SagemakerEndpoint):
         """
         super().__init__(**kwargs)
         region = self.region_name
-        account = boto3.client("sts").get_caller_identity()["Account"]
-        self.input_bucket = f'sagemaker-{region}-{account}' if input_bucket == "" else input_bucket
+        self.input_bucket = f'sagemaker-{region}-{_account_id()}' if input_bucket == "" else input_bucket
         self.input_prefix = f'async-endpoint-outputs/{self.endpoint_name}' if input_prefix == "" else input_prefix
         self.max_request_timeout = max_request_timeout
-        self.s3_client = boto3.client("s3")
-        self.sm_client = boto3.client("sagemaker")
+        self.s3_client = AWS_CLIENT_POOL.get_client("s3", region)
+        self.sm_client = AWS_CLIENT_POOL.get_client("sagemaker", region)
+
+    def _endpoint_is_running(self) -> bool:
+        def describe() -> bool:
+            response = self.sm_client.describe_endpoint(EndpointName=self.endpoint_name)
+            return response["ProductionVariants"][0]["CurrentInstanceCount"] > 0
+
+        return ENDPOINT_STATES.get_or_create((self.region_name, self.endpoint_name), describe)
         
+    def _invoke(self, body: bytes) -> bytes:
+        """Sends one request to the async endpoint and returns its output."""
+        _endpoint_kwargs = self.endpoint_kwargs or {}
+        inference_id = str(uuid.uuid4())
+        request_key = os.path.join(self.input_prefix, f"request-{inference_id}")
+        self.s3_client.put_object(Body=body, Bucket=self.input_bucket, Key=request_key)
+        response = self.client.invoke_endpoint_async(
+            EndpointName=self.endpoint_name,
+            InputLocation="s3://{}/{}".format(self.input_bucket, request_key),
+            ContentType=self.content_handler.content_type,
+            Accept=self.content_handler.accepts,
+            InferenceId=inference_id,
+            InvocationTimeoutSeconds=self.max_request_timeout, # timeout 
+            **_endpoint_kwargs,
+        )
+
+        # Wait for the output in S3, see ASYNC_INFERENCE_WAITER
+        return ASYNC_INFERENCE_WAITER.wait(
+            response.get("InferenceId", inference_id),
+            response["OutputLocation"],
+            response.get("FailureLocation"),
+            self.region_name,
+            timeout=ASYNC_INFERENCE_DEADLINE,
+        )
+
+    def _batch_key(self, model_kwargs: dict):
+        return (
+            self.region_name,
+            self.endpoint_name,
+            self.input_bucket,
+            self.input_prefix,
+            type(self.content_handler),
+            freeze(model_kwargs),
+            freeze(self.endpoint_kwargs or {}),
+        )
+
     def _call(
         self,
         prompt: str,
@@ -93,15 +140,14 @@ class SagemakerAsyncEndpoint(SagemakerEndpoint):
         content_type = self.content_handler.content_type
         accepts = self.content_handler.accepts
 
-        # Verify if the endpoint is running
-        response = self.sm_client.describe_endpoint(EndpointName=self.endpoint_name)
-        endpoint_is_running = response["ProductionVariants"][0]["CurrentInstanceCount"] > 0
+        # Verify if the endpoint is running, the state is cached for ENDPOINT_STATE_TTL seconds
+        endpoint_is_running = self._endpoint_is_running()
 
         # If the endpoint is not running, send an empty request to "wake up" the endpoint
-        test_data = b""
-        test_key = os.path.join(self.input_prefix, "test")
-        self.s3_client.put_object(Body=test_data, Bucket=self.input_bucket, Key=test_key)
         if not endpoint_is_running:
+            test_data = b""
+            test_key = os.path.join(self.input_prefix, "test")
+            self.s3_client.put_object(Body=test_data, Bucket=self.input_bucket, Key=test_key)
             self.client.invoke_endpoint_async(
                 EndpointName=self.endpoint_name,
                 InputLocation="s3://{}/{}".format(self.input_bucket, test_key),
@@ -110,28 +156,58 @@ class SagemakerAsyncEndpoint(SagemakerEndpoint):
                 InvocationTimeoutSeconds=self.max_request_timeout, # timeout of 60 seconds to detect if it's not running yet
                 **_endpoint_kwargs,
             )
+            # Describe the endpoint again on the next call to notice when it runs
+            ENDPOINT_STATES.invalidate(lambda key: key == (self.region_name, self.endpoint_name))
             text = "Endpoint is not running, waking it up. - It will take about 10 minutes from the first wake up attempt."
+        elif ASYNC_INFERENCE_BATCHER is not None and content_type == "application/json":
+            # Concurrent prompts of other sessions with the same parameters share one request
+            text = ASYNC_INFERENCE_BATCHER.submit(
+                self._batch_key(_model_kwargs), (self, prompt, _model_kwargs)
+            ).result()
+            if stop is not None:
+                text = enforce_stop_tokens(text, stop)
         else:
-            print("Endpoint is running! Proceeding to inference.")
-        
-            # Send request to the async endpoint
-            request_key = os.path.join(self.input_prefix, f"request-{str(uuid.uuid4())}")
-            self.s3_client.put_object(Body=body, Bucket=self.input_bucket, Key=request_key)
-            response = self.client.invoke_endpoint_async(
-                EndpointName=self.endpoint_name,
-                InputLocation="s3://{}/{}".format(self.input_bucket, request_key),
-                ContentType=content_type,
-                Accept=accepts,
-                InvocationTimeoutSeconds=self.max_request_timeout, # timeout 
-                **_endpoint_kwargs,
-            )
-
-            # Read the bytes of the file from S3 in output_url with Boto3
-            output_url = response["OutputLocation"]
-            failure_url = response["FailureLocation"]
-            response = wait_inference_file(output_url, failure_url, self.s3_client)
-            text = self.content_handler.transform_output(response["Body"])
+            output = self._invoke(body)
+            text = self.content_handler.transform_output(io.BytesIO(output))
             if stop is not None:
                 text = enforce_stop_tokens(text, stop)
 
-        return text
\ No newline at end of file
+        return text
+
+def _invoke_batch(key, items: List[Tuple[SagemakerAsyncEndpoint, str, dict]]) -> List[str]:
+    """Answers prompts with the same batch key with one request to the async endpoint.
+
+    The prompts are sent as list in "inputs", with the parameters of the content handler,
+    like Hugging Face text generation pipelines accept them. The outputs are transformed
+    one by one with the content handler.
+    """
+    endpoint = items[0][0]
+    content_handler = endpoint.content_handler
+    if len(items) == 1:
+        _, prompt, model_kwargs = items[0]
+        output = endpoint._invoke(content_handler.transform_input(prompt, model_kwargs))
+        return [content_handler.transform_output(io.BytesIO(output))]
+
+    payloads = [json.loads(content_handler.transform_input(prompt, model_kwargs)) for _, prompt, model_kwargs in items]
+    body = {**payloads[0], "inputs": [payload["inputs"] for payload in payloads]}
+    outputs = json.loads(endpoint._invoke(json.dumps(body).encode("utf-8")))
+    return [
+        # Pipelines return a list of generations per input, or a single generation
+        content_handler.transform_output(io.BytesIO(json.dumps(output if isinstance(output, list) else [output]).encode("utf-8")))
+        for output in outputs
+    ]
+
+
+ASYNC_INFERENCE_BATCHER: Optional[MicroBatcher] = (
+    MicroBatcher(
+        _invoke_batch,
+        max_batch_size=ASYNC_INFERENCE_BATCH_SIZE,
+        max_wait=ASYNC_INFERENCE_BATCH_WINDOW,
+        name="async_inference_batch",
+        # Batches wait for their results in these threads
+        max_workers=64,
+    )
+    if ASYNC_INFERENCE_BATCH_SIZE > 1
+    else None
+)
+""" Process-wide batcher of the prompts to asynchronous endpoints, None if batching is disabled. """
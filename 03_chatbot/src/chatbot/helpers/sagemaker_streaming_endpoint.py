@@ -0,0 +1,191 @@
+""" Module that contains a SageMaker endpoint LLM that streams the tokens of the response.
+
+Text Generation Inference (TGI) endpoints send the generated tokens as server-sent
+events when they are invoked with InvokeEndpointWithResponseStream and "stream": true:
+
+    data:{"token": {"id": 1, "text": " Bern", "special": false}, "generated_text": null}
+
+SageMaker splits the events into payload parts of arbitrary size, a part can end in the
+middle of an event or of a UTF-8 character. Stop words can span several tokens, so the
+text that could be the start of a stop word is held back until the next token decides.
+"""
+import json
+from typing import Any, Iterable, Iterator, List, Optional
+
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.llms.sagemaker_endpoint import SagemakerEndpoint
+from langchain.schema.output import GenerationChunk
+
+
+class TGIStreamParser:
+    """Parses the payload parts of a TGI response stream into token texts.
+
+    Events are separated by new lines, incomplete events are kept until the next part.
+    Special tokens, e.g. <|endoftext|>, are skipped.
+
+    Example:
+        ```python
+        parser = TGIStreamParser()
+        for event in response["Body"]:
+            for text in parser.feed(event["PayloadPart"]["Bytes"]):
+                print(text, end="")
+        ```
+    """
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, data: bytes) -> List[str]:
+        """Returns the token texts of the events that data completes."""
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return [text for text in map(self._parse_line, lines) if text]
+
+    def close(self) -> List[str]:
+        """Returns the token text of an event that the stream did not end with a new line."""
+        line, self._buffer = self._buffer, b""
+        text = self._parse_line(line)
+        return [text] if text else []
+
+    @staticmethod
+    def _parse_line(line: bytes) -> Optional[str]:
+        line = line.strip()
+        if line.startswith(b"data:"):
+            line = line[len(b"data:") :].strip()
+        # Empty lines separate events, other fields of server-sent events carry no tokens
+        if not line.startswith(b"{"):
+            return None
+        event = json.loads(line.decode("utf-8"))
+        token = event.get("token") or {}
+        if token.get("special"):
+            return None
+        return token.get("text")
+
+
+class StopWordFilter:
+    """Passes streamed text on until the first stop word.
+
+    Text that could be the start of a stop word is held back until it is clear whether
+    the stop word follows.
+
+    Args:
+        stop_words: Stop words, the text before the first one of them is passed on.
+    """
+
+    def __init__(self, stop_words: Iterable[str]):
+        self.stop_words = [stop_word for stop_word in stop_words if stop_word]
+        self.stopped = False
+        self._pending = ""
+
+    def push(self, text: str) -> str:
+        """Returns the part of the text that can be passed on."""
+        if self.stopped:
+            return ""
+        self._pending += text
+        positions = [
+            position
+            for position in (self._pending.find(stop_word) for stop_word in self.stop_words)
+            if position >= 0
+        ]
+        if positions:
+            self.stopped = True
+            text, self._pending = self._pending[: min(positions)], ""
+            return text
+        held_back = self._held_back()
+        text = self._pending[: len(self._pending) - held_back]
+        self._pending = self._pending[len(text) :]
+        return text
+
+    def flush(self) -> str:
+        """Returns the text that was held back when the stream ends."""
+        text, self._pending = ("" if self.stopped else self._pending), ""
+        return text
+
+    def _held_back(self) -> int:
+        # Longest end of the pending text that is the beginning of a stop word
+        for length in range(min(len(self._pending), max(map(len, self.stop_words), default=1) - 1), 0, -1):
+            suffix = self._pending[-length:]
+            if any(stop_word.startswith(suffix) for stop_word in self.stop_words):
+                return length
+        return 0
+
+
+class SagemakerStreamingEndpoint(SagemakerEndpoint):
+    """SageMaker endpoint LLM that streams the response of a TGI endpoint token by token.
+
+    The tokens are reported to the on_llm_new_token callbacks, e.g. StreamHandler and
+    the time_to_first_token latency of LatencyCallbackHandler. The stop words of the
+    content handler apply in addition to the stop words of the call.
+
+    Example:
+        ```python
+        llm = SagemakerStreamingEndpoint(
+            endpoint_name="falcon-40b",
+            region_name="eu-west-1",
+            content_handler=content_handler,
+            streaming=True,
+        )
+        ```
+    """
+
+    def _stop_words(self, stop: Optional[List[str]]) -> List[str]:
+        return list(stop or []) + list(getattr(self.content_handler, "stop_words", []))
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        _model_kwargs = {**(self.model_kwargs or {}), **kwargs}
+        body = json.loads(self.content_handler.transform_input(prompt, _model_kwargs))
+        body["stream"] = True
+        response = self.client.invoke_endpoint_with_response_stream(
+            EndpointName=self.endpoint_name,
+            Body=json.dumps(body).encode("utf-8"),
+            ContentType=self.content_handler.content_type,
+            **(self.endpoint_kwargs or {}),
+        )
+        parser = TGIStreamParser()
+        stop_word_filter = StopWordFilter(self._stop_words(stop))
+
+        def chunk(text: str) -> Iterator[GenerationChunk]:
+            if text:
+                if run_manager:
+                    run_manager.on_llm_new_token(text)
+                yield GenerationChunk(text=text)
+
+        def chunks(texts: List[str]) -> Iterator[GenerationChunk]:
+            for text in texts:
+                yield from chunk(stop_word_filter.push(text))
+
+        events = response["Body"]
+        try:
+            for event in events:
+                if "PayloadPart" in event:
+                    yield from chunks(parser.feed(event["PayloadPart"]["Bytes"]))
+                elif "ModelStreamError" in event or "InternalStreamFailure" in event:
+                    error = event.get("ModelStreamError") or event.get("InternalStreamFailure")
+                    raise ValueError(f"Error raised by streaming inference endpoint: {error}")
+                if stop_word_filter.stopped:
+                    # The model may go on until its own stop, the rest is not needed
+                    return
+            yield from chunks(parser.close())
+            yield from chunk(stop_word_filter.flush())
+        finally:
+            if hasattr(events, "close"):
+                events.close()
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        if not self.streaming:
+            return super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+        return "".join(
+            chunk.text for chunk in self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs)
+        )
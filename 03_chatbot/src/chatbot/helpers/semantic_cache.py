@@ -0,0 +1,279 @@
+""" Module that contains a semantic cache for answers of the retrieval augmented generation flow.
+
+Users ask the same questions against the same knowledge base again and again. The
+cache stores the answer and the source documents per standalone question and returns
+them for new questions whose embedding is similar enough to a cached question.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+
+from .logger import TECHNICAL_LOGGER_NAME
+from .lru_cache import CacheStats
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+
+@dataclass
+class SemanticCacheConfig:
+    """The semanticCache section of the Retrieval Augmented Generation flow config."""
+
+    enabled: bool = False
+    similarity_threshold: float = 0.95
+    """ Minimum cosine similarity between two questions to reuse an answer. """
+    ttl_seconds: float = 3600
+    max_entries: int = 512
+    index_check_interval: float = 60
+    """ Seconds between two checks whether an index was re-ingested. """
+    embedding: Optional[Dict[str, str]] = None
+    """ Embedding type, model and optional region for retrievers that do not embed queries themselves. """
+
+    @staticmethod
+    def from_dict(obj: Any) -> "SemanticCacheConfig":
+        if not isinstance(obj, dict):
+            return SemanticCacheConfig()
+        return SemanticCacheConfig(
+            enabled=bool(obj.get("enabled", False)),
+            similarity_threshold=float(obj.get("similarityThreshold", 0.95)),
+            ttl_seconds=float(obj.get("ttlSeconds", 3600)),
+            max_entries=int(obj.get("maxEntries", 512)),
+            index_check_interval=float(obj.get("indexCheckInterval", 60)),
+            embedding=obj.get("embedding"),
+        )
+
+
+@dataclass
+class CachedAnswer:
+    """An answer from the semantic cache."""
+
+    question: str
+    answer: str
+    source_documents: List[Document]
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    created_at: float
+    embedding: np.ndarray
+    answer: str
+    source_documents: List[Document]
+
+
+class SemanticAnswerCache:
+    """Thread-safe cache of answers that is searched by cosine similarity of question embeddings.
+
+    Entries are grouped in partitions, e.g. per index, model and prompt, and are evicted
+    by time to live and least recent use.
+
+    Args:
+        max_entries: Maximum number of answers in the cache.
+        ttl_seconds: Number of seconds after which an answer expires.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[Hashable, str], _Entry]" = OrderedDict()
+        self._index_fingerprints: Dict[Hashable, Tuple[float, Hashable]] = {}
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def _is_expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry.created_at > self.ttl_seconds
+
+    def lookup(
+        self, partition: Hashable, embedding: List[float], threshold: float
+    ) -> Optional[CachedAnswer]:
+        """Returns the answer to the most similar cached question if it is similar enough.
+
+        Args:
+            partition: The partition to search.
+            embedding: Embedding of the standalone question.
+            threshold: Minimum cosine similarity.
+        """
+        query = _normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_similarity = None, -1.0
+            for key, entry in list(self._entries.items()):
+                if self._is_expired(entry, now):
+                    del self._entries[key]
+                    self._stats.evictions += 1
+                    continue
+                if key[0] != partition:
+                    continue
+                similarity = float(np.dot(query, entry.embedding))
+                if similarity > best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None or best_similarity < threshold:
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._stats.hits += 1
+            entry = self._entries[best_key]
+            return CachedAnswer(
+                question=best_key[1],
+                answer=entry.answer,
+                source_documents=list(entry.source_documents),
+                similarity=best_similarity,
+            )
+
+    def store(
+        self,
+        partition: Hashable,
+        question: str,
+        embedding: List[float],
+        answer: str,
+        source_documents: List[Document],
+    ):
+        """Stores the answer to a standalone question."""
+        with self._lock:
+            key = (partition, question)
+            self._entries[key] = _Entry(
+                created_at=time.monotonic(),
+                embedding=_normalize(embedding),
+                answer=answer,
+                source_documents=list(source_documents),
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Removes the answers of all partitions for which the predicate returns True.
+
+        Returns:
+            The number of removed answers.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate is None or predicate(key[0])]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def check_index(
+        self,
+        index_key: Hashable,
+        fingerprint: Callable[[], Optional[Hashable]],
+        interval: float,
+        belongs_to_index: Callable[[Hashable], bool],
+    ):
+        """Invalidates the answers for an index if it was re-ingested since the last check.
+
+        Args:
+            index_key: Identifies the index.
+            fingerprint: Returns a value that changes when the index is re-ingested,
+                e.g. the index uuid and document count.
+            interval: Seconds between two calls to fingerprint.
+            belongs_to_index: Returns True for the partitions of this index.
+        """
+        now = time.monotonic()
+        with self._lock:
+            checked_at, previous = self._index_fingerprints.get(index_key, (None, None))
+            if checked_at is not None and now - checked_at < interval:
+                return
+            # Other threads skip the check while this thread asks the index
+            self._index_fingerprints[index_key] = (now, previous)
+        try:
+            current = fingerprint()
+        except Exception as error:
+            logger.warning(f"Cannot check whether index {index_key} was re-ingested: {error}")
+            return
+        with self._lock:
+            self._index_fingerprints[index_key] = (now, current)
+        if checked_at is not None and current != previous:
+            removed = self.invalidate(belongs_to_index)
+            logger.info(f"Index {index_key} was re-ingested, removed {removed} cached answers.")
+
+    def stats(self) -> CacheStats:
+        """Returns a snapshot of the cache counters."""
+        with self._lock:
+            return CacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                size=len(self._entries),
+            )
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@dataclass
+class SemanticCacheBinding:
+    """Binds a knowledge base, model and prompt to a partition of the semantic cache.
+
+    Args:
+        cache: The cache to use.
+        embeddings: Embeddings to embed standalone questions.
+        partition: Identifies the knowledge base, model and prompt.
+        index_key: Identifies the index, the first element of partition.
+        similarity_threshold: Minimum cosine similarity to reuse an answer.
+        index_fingerprint: Optional function that changes its value when the index is re-ingested.
+        index_check_interval: Seconds between two calls to index_fingerprint.
+    """
+
+    cache: SemanticAnswerCache
+    embeddings: Embeddings
+    partition: Hashable
+    index_key: Hashable
+    similarity_threshold: float = 0.95
+    index_fingerprint: Optional[Callable[[], Optional[Hashable]]] = field(default=None, compare=False)
+    index_check_interval: float = 60
+
+    def lookup(
+        self, question: str, embedding: Optional[List[float]] = None
+    ) -> Tuple[Optional[CachedAnswer], List[float]]:
+        """Looks up a standalone question.
+
+        Args:
+            question: The standalone question.
+            embedding: Embedding of the question with embeddings, if it was already computed.
+
+        Returns:
+            The cached answer or None, and the question embedding to pass to store.
+        """
+        if self.index_fingerprint is not None:
+            self.cache.check_index(
+                self.index_key,
+                self.index_fingerprint,
+                self.index_check_interval,
+                lambda partition: partition[0] == self.index_key,
+            )
+        if embedding is None:
+            embedding = self.embeddings.embed_query(question)
+        return self.cache.lookup(self.partition, embedding, self.similarity_threshold), embedding
+
+    def store(
+        self, question: str, embedding: List[float], answer: str, source_documents: List[Document]
+    ):
+        """Stores the answer to a standalone question."""
+        self.cache.store(self.partition, question, embedding, answer, source_documents)
+
+
+_semantic_answer_cache: Optional[SemanticAnswerCache] = None
+_semantic_answer_cache_lock = threading.Lock()
+
+
+def get_semantic_answer_cache(config: SemanticCacheConfig) -> SemanticAnswerCache:
+    """Returns the process-wide semantic answer cache and creates it on first use."""
+    global _semantic_answer_cache
+    with _semantic_answer_cache_lock:
+        if _semantic_answer_cache is None:
+            _semantic_answer_cache = SemanticAnswerCache(
+                max_entries=config.max_entries, ttl_seconds=config.ttl_seconds or None
+            )
+        return _semantic_answer_cache
@@ -0,0 +1,211 @@
+""" Module that retrieves documents for the raw question while the question is condensed.
+
+Condensing a follow-up question takes a full LLM call, and retrieval waits for it.
+Many follow-up questions are already close to their standalone version, e.g. "What
+does the digital vignette cost in 2024?" after a question about the vignette. Speculative
+retrieval starts retrieval for the raw question together with the condensation and
+reuses its documents if the condensed question turns out to be similar enough. That
+takes one retrieval round-trip off the critical path. Retrieval for the condensed question
+starts together with its embedding, so that a miss does not wait for the comparison
+either. Unless the questions are the same, every speculation costs one extra search.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+
+from .metrics import record_count, record_latency
+
+SPECULATION_HIT = "hit"
+SPECULATION_MISS = "miss"
+SPECULATION_ERROR = "error"
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Own pool, retrievers fan out to the index and federated search pools themselves
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="speculative-retrieval")
+        return _executor
+
+
+@dataclass
+class SpeculativeRetrievalConfig:
+    """The speculativeRetrieval section of the Retrieval Augmented Generation flow config."""
+
+    enabled: bool = False
+    similarity_threshold: float = 0.9
+    """ Minimum cosine similarity of the raw and the condensed question to reuse the documents. """
+    embedding: Optional[Dict[str, str]] = None
+    """ Embedding type, model and optional region for retrievers that do not embed queries themselves. """
+
+    @staticmethod
+    def from_dict(obj: Any) -> "SpeculativeRetrievalConfig":
+        if not isinstance(obj, dict):
+            return SpeculativeRetrievalConfig()
+        return SpeculativeRetrievalConfig(
+            enabled=bool(obj.get("enabled", False)),
+            similarity_threshold=float(obj.get("similarityThreshold", 0.9)),
+            embedding=obj.get("embedding"),
+        )
+
+
+@dataclass
+class Speculation:
+    """Retrieval for the raw question that runs while the question is condensed."""
+
+    question: str
+    started_at: float
+    documents: Future
+    """ Documents for the raw question and the milliseconds it took to retrieve them. """
+    embedding: Future
+    """ Embedding of the raw question. """
+
+
+@dataclass
+class SpeculationOutcome:
+    """Whether the speculative documents are used for the condensed question."""
+
+    outcome: str
+    similarity: float
+    documents: Optional[List[Document]] = None
+    """ Documents to use, None if they have to be retrieved for the condensed question. """
+    embedding: Optional[List[float]] = None
+    """ Embedding of the condensed question, None if it was not computed. """
+    saved_milliseconds: float = 0
+
+    def __str__(self) -> str:
+        if self.outcome == SPECULATION_HIT:
+            return (
+                f"Reused the speculative retrieval, similarity {self.similarity:.3f}, "
+                f"{self.saved_milliseconds:.0f} ms off the critical path"
+            )
+        if self.outcome == SPECULATION_MISS:
+            return f"Retrieving again for the condensed question, similarity {self.similarity:.3f}"
+        return "Retrieving again for the condensed question, the speculative retrieval failed"
+
+
+@dataclass
+class SpeculativeRetrieval:
+    """Starts retrieval for the raw question and decides whether to reuse its documents.
+
+    Args:
+        embeddings: Embeddings that compare the raw and the condensed question.
+        similarity_threshold: Minimum cosine similarity to reuse the documents.
+        flow: Flow for the metrics.
+        index: Knowledge base for the metrics.
+
+    Example:
+        ```python
+        speculation = speculative_retrieval.start(question, retrieve)
+        new_question = question_generator.run(question=question, chat_history=chat_history_str)
+        outcome = speculative_retrieval.resolve(speculation, new_question, retrieve)
+        docs = outcome.documents if outcome.documents is not None else retrieve(new_question)
+        ```
+    """
+
+    embeddings: Embeddings
+    similarity_threshold: float = 0.9
+    flow: str = ""
+    index: str = ""
+
+    def start(self, question: str, retrieve: Callable[[str], List[Document]]) -> Speculation:
+        """Starts retrieving documents and embedding the raw question in the background.
+
+        Both run in the context of the caller, so that retrieve can report to the callbacks
+        and the embeddings to the metrics of the chat turn.
+        """
+
+        def timed_retrieve():
+            start_time = time.perf_counter()
+            documents = retrieve(question)
+            return documents, (time.perf_counter() - start_time) * 1000
+
+        executor = _get_executor()
+        return Speculation(
+            question=question,
+            started_at=time.perf_counter(),
+            documents=executor.submit(contextvars.copy_context().run, timed_retrieve),
+            embedding=executor.submit(contextvars.copy_context().run, self.embeddings.embed_query, question),
+        )
+
+    def resolve(
+        self,
+        speculation: Speculation,
+        question: str,
+        retrieve: Optional[Callable[[str], List[Document]]] = None,
+    ) -> SpeculationOutcome:
+        """Returns the speculative documents if question is similar enough to the raw question.
+
+        Args:
+            speculation: The speculation that start returned.
+            question: The condensed question.
+            retrieve: Optional retrieval for the condensed question. It runs while the condensed
+                question is embedded and its documents are returned on a miss.
+        """
+        retrieval: Optional[Future] = None
+        try:
+            if " ".join(question.lower().split()) == " ".join(speculation.question.lower().split()):
+                similarity = 1.0
+                embedding = speculation.embedding.result()
+            else:
+                if retrieve is not None:
+                    retrieval = _get_executor().submit(contextvars.copy_context().run, retrieve, question)
+                embedding = self.embeddings.embed_query(question)
+                similarity = _cosine_similarity(speculation.embedding.result(), embedding)
+            if similarity < self.similarity_threshold:
+                speculation.documents.cancel()
+                documents = retrieval.result() if retrieval is not None else None
+                return self._record(
+                    SpeculationOutcome(SPECULATION_MISS, similarity, documents, embedding=embedding)
+                )
+
+            waited_at = time.perf_counter()
+            documents, milliseconds = speculation.documents.result()
+            if retrieval is not None:
+                retrieval.cancel()
+            # Only the part of the retrieval that ran before the condensed question arrived is saved
+            saved = max(0.0, milliseconds - (time.perf_counter() - waited_at) * 1000)
+            return self._record(
+                SpeculationOutcome(SPECULATION_HIT, similarity, documents, embedding, saved)
+            )
+        except Exception:
+            return self._record(SpeculationOutcome(SPECULATION_ERROR, 0.0, _result_or_none(retrieval)))
+
+    def _record(self, outcome: SpeculationOutcome) -> SpeculationOutcome:
+        record_count(f"speculative_retrieval_{outcome.outcome}", flow=self.flow, index=self.index)
+        if outcome.outcome == SPECULATION_HIT:
+            record_latency(
+                "speculative_retrieval_saved",
+                outcome.saved_milliseconds,
+                flow=self.flow,
+                index=self.index,
+                similarity=round(outcome.similarity, 3),
+            )
+        return outcome
+
+
+def _result_or_none(future: Optional[Future]) -> Optional[List[Document]]:
+    if future is None or future.cancelled():
+        return None
+    try:
+        return future.result()
+    except Exception:
+        return None
+
+
+def _cosine_similarity(left: List[float], right: List[float]) -> float:
+    left_vector = np.asarray(left, dtype=np.float32)
+    right_vector = np.asarray(right, dtype=np.float32)
+    norm = float(np.linalg.norm(left_vector) * np.linalg.norm(right_vector))
+    return float(left_vector @ right_vector) / norm if norm else 0.0
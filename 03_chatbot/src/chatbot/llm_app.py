@@ -1,13 +1,14 @@
 """ An LLM app represents the logic to interact with a LLM."""
+import math
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import final
+from dataclasses import dataclass, field
+from typing import Hashable, Optional, final
 import warnings
 import pandas as pd
 
 import langchain
 from langchain.callbacks.base import Callbacks
-from langchain.chains import ConversationalRetrievalChain, ConversationChain
+from langchain.chains import ConversationChain
 from langchain.chains.base import Chain
 from langchain.llms.base import LLM
 from langchain.memory import ConversationBufferWindowMemory
@@ -17,8 +18,34 @@ from langchain.agents import Tool, AgentType, initialize_agent
 from langchain.sql_database import SQLDatabase
 from langchain.agents.agent_toolkits import SQLDatabaseToolkit
 
+from chatbot.helpers import ChatbotEnvironment, ChatbotEnvironmentVariables
+from chatbot.helpers.condensation_policy import CondensationPolicy
+from chatbot.helpers.context_packer import ContextPacker, get_token_counter
+from chatbot.helpers.conversation_memory import TokenBudgetSummaryMemory
+from chatbot.helpers.conversational_retrieval_chain import GenieConversationalRetrievalChain
+from chatbot.helpers.lru_cache import LRUCache
+from chatbot.helpers.rate_limiter import find_rate_limit_exceeded
+from chatbot.helpers.reranker import RerankStage
+from chatbot.helpers.semantic_cache import SemanticCacheBinding
+from chatbot.helpers.speculative_retrieval import SpeculativeRetrieval
+
 GLOBAL_LOGGER_NAME = "Genie"
 
+CHAIN_CACHE: LRUCache[Chain] = LRUCache(
+    max_size=int(
+        ChatbotEnvironment().get_env_variable(ChatbotEnvironmentVariables.ChainCacheSize)
+    )
+)
+""" Process-wide cache of compiled chains shared by all sessions. """
+
+LLM_APP_CACHE: LRUCache["LLMApp"] = LRUCache(
+    max_size=int(
+        ChatbotEnvironment().get_env_variable(ChatbotEnvironmentVariables.ChainCacheSize)
+    )
+)
+""" Process-wide cache of LLM apps by cache key. Sessions with the same selection share
+the instances of the model, the retriever and the prompts of an app. """
+
 @dataclass
 class LLMApp(ABC):
     """Base class to interact with an LLM."""
@@ -27,7 +54,12 @@ class LLMApp(ABC):
     """ The prompt template to use when chatting with the LLM."""
     llm: LLM
     """ The LLM this app uses."""
-    
+
+    cache_key: Optional[Hashable] = field(default=None, kw_only=True)
+    """ Identifies the flow, model, retriever and prompts of this app.
+    Apps with the same key share one compiled chain from CHAIN_CACHE.
+    Apps without a key compile their chain on every turn."""
+
     @abstractmethod
     def get_chain(self, memory: BaseMemory, callbacks: Callbacks = None) -> Chain:
         """Get the langchain chain that this LLMApp uses.
@@ -64,6 +96,41 @@ class LLMApp(ABC):
             text = response
         return text
 
+    def get_memory(self, message_history: BaseChatMessageHistory) -> BaseMemory:
+        """Get the conversation memory of a session for one turn.
+
+        CONVERSATION_MEMORY=summary keeps the recent messages that fit into
+        CONVERSATION_MEMORY_TOKENS and a rolling summary of the older ones,
+        otherwise the memory is a window of the last three turns.
+
+        Args:
+            message_history: The message history of the session.
+        """
+        env = ChatbotEnvironment()
+        if env.get_env_variable(ChatbotEnvironmentVariables.ConversationMemory) == "summary":
+            model_id = getattr(self.llm, "model_id", None) or getattr(self.llm, "endpoint_name", None)
+            return TokenBudgetSummaryMemory(
+                llm=self.llm,
+                token_counter=get_token_counter((type(self.llm).__name__, model_id), self.llm),
+                memory_key="chat_history",
+                chat_memory=message_history,
+                return_messages=True,
+                output_key="answer",
+                max_tokens=int(
+                    env.get_env_variable(ChatbotEnvironmentVariables.ConversationMemoryTokens)
+                ),
+                max_messages=int(
+                    env.get_env_variable(ChatbotEnvironmentVariables.ConversationMemoryMessages)
+                ),
+            )
+        return ConversationBufferWindowMemory(
+            memory_key="chat_history",
+            chat_memory=message_history,
+            return_messages=True,
+            k=3,
+            output_key="answer",
+        )  # , human_prefix="[|Human|]", ai_prefix="[|AI|]",return_messages=True)
+
     def run_llm(
         self, query: str, message_history: BaseChatMessageHistory, callbacks=None
     ):
@@ -76,23 +143,49 @@ class LLMApp(ABC):
         Returns:
             The raw respose from the LLM.
         """
-        memory = ConversationBufferWindowMemory(
-            memory_key="chat_history",
-            chat_memory=message_history,
-            return_messages=True,
-            k=3,
-            output_key="answer",
-        )  # , human_prefix="[|Human|]", ai_prefix="[|AI|]",return_messages=True)
-        chain = self.get_chain(memory=memory, callbacks=callbacks)
+        memory = self.get_memory(message_history)
 
         try:
-            response = chain(self.get_input(query))
+            inputs = self.get_input(query)
+            if self.cache_key is None:
+                chain = self.get_chain(memory=memory)
+                response = chain(inputs, callbacks=callbacks)
+            else:
+                # The cached chain is shared between sessions, so it is compiled
+                # without memory and the memory of this session is bound per turn.
+                chain = CHAIN_CACHE.get_or_create(
+                    self.cache_key, lambda: self.get_chain(memory=None)
+                )
+                response = self.run_cached_chain(chain, inputs, memory, callbacks)
         except Exception as e:
             print(e)
-            response = {"answer": "Sorry, there was an error, please try again."}
+            rate_limit_exceeded = find_rate_limit_exceeded(e)
+            if rate_limit_exceeded:
+                response = {
+                    "answer": "The model is busy right now. Please try again in about "
+                    f"{max(1, math.ceil(rate_limit_exceeded.retry_after))} seconds."
+                }
+            else:
+                response = {"answer": "Sorry, there was an error, please try again."}
 
         return response
 
+    def run_cached_chain(
+        self, chain: Chain, inputs: dict, memory: BaseMemory, callbacks: Callbacks = None
+    ):
+        """Runs a chain from the chain cache for one turn.
+
+        Args:
+            chain: The shared chain that has been compiled without memory.
+            inputs: The inputs from get_input.
+            memory: The memory of the current session.
+            callbacks: The callbacks to use for this turn.
+
+        Returns:
+            The raw respose from the chain.
+        """
+        return chain(inputs, callbacks=callbacks)
+
     @final
     def generate_response(
         self, prompt: str, message_history: BaseChatMessageHistory, callbacks=None
@@ -142,20 +235,51 @@ class RAGApp(LLMApp):
 
     retriever: BaseRetriever
 
+    condense_question_llm: Optional[LLM] = None
+    """ Optional smaller, faster LLM that condenses follow-up questions, llm if None. """
+
+    condensation_policy: Optional[CondensationPolicy] = None
+    """ Optional policy that decides whether a follow-up question is condensed. """
+
+    speculative_retrieval: Optional[SpeculativeRetrieval] = None
+    """ Optional retrieval for the raw question while the question is condensed. """
+
+    semantic_cache: Optional[SemanticCacheBinding] = None
+    """ Optional semantic cache that answers questions similar to previous ones. """
+
+    rerank_stage: Optional[RerankStage] = None
+    """ Optional rerank stage between the retriever and the prompt. """
+
+    context_packer: Optional[ContextPacker] = None
+    """ Optional packer that fits the documents into the token budget of the model. """
+
     def get_chain(self, memory, callbacks=None):
         """See base class."""
-        return ConversationalRetrievalChain.from_llm(
+        return GenieConversationalRetrievalChain.from_llm(
+            semantic_cache=self.semantic_cache,
+            rerank_stage=self.rerank_stage,
+            context_packer=self.context_packer,
+            condensation_policy=self.condensation_policy,
+            speculative_retrieval=self.speculative_retrieval,
             return_generated_question=True,
             llm=self.llm,
             retriever=self.retriever,
             memory=memory,
             condense_question_prompt=self.condense_question_prompt_template,
+            condense_question_llm=self.condense_question_llm,
             verbose=False,
             return_source_documents=True,
             combine_docs_chain_kwargs={"prompt": self.prompt},
             callbacks=callbacks,
         )
 
+    def run_cached_chain(self, chain, inputs, memory, callbacks=None):
+        """See base class."""
+        chat_history = memory.load_memory_variables(inputs)
+        response = chain({**inputs, **chat_history}, callbacks=callbacks)
+        memory.save_context(inputs, response)
+        return response
+
     def get_input(self, input_text: str):
         """See base class."""
 
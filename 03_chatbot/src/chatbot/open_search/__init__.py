@@ -1,2 +1,5 @@
 """ This module contains integration with OpenSearch."""
-from .open_search_index_retriever import OpenSearchIndexRetriever, get_credentials, get_open_search_index_list
+from .open_search_index_retriever import OpenSearchIndexRetriever, get_credentials, get_embedding_spec, get_open_search_index_list
+from .open_search_client_pool import OPEN_SEARCH_CLIENT_POOL, OpenSearchClientPool
+from .hybrid_search import HybridSearchConfig, hybrid_search, hybrid_search_with_score
+from .multi_index_retriever import MultiIndexOpenSearchRetriever
@@ -0,0 +1,202 @@
+""" Module that combines lexical BM25 search and k-NN vector search of an OpenSearch index.
+
+Vector search misses exact terms that the embedding model does not represent well,
+e.g. article numbers, tickers or product names. BM25 finds them but misses paraphrases.
+Hybrid search runs both queries concurrently and fuses the two rankings into one.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+
+ScoredDocuments = List[Tuple[Document, float]]
+""" Documents with the score of the search that found them, best first. """
+
+FUSION_RRF = "rrf"
+FUSION_WEIGHTED = "weighted"
+
+
+@dataclass
+class HybridSearchConfig:
+    """The hybridSearch section of an OpenSearch index in the Retrieval Augmented Generation flow config."""
+
+    enabled: bool = False
+    fusion: str = FUSION_RRF
+    """ rrf for reciprocal rank fusion or weighted for weighted min-max normalized scores. """
+    rrf_k: int = 60
+    """ Rank constant of reciprocal rank fusion. Larger values flatten the rank differences. """
+    lexical_weight: float = 0.5
+    """ Weight of the BM25 ranking, the k-NN ranking gets 1 - lexical_weight. """
+    candidates: int = 0
+    """ Documents to fetch from each search before the fusion. 0 fetches 2 * k. """
+    text_field: str = "text"
+    """ Index field with the text of the documents that BM25 searches. """
+
+    @staticmethod
+    def from_dict(obj: Any) -> "HybridSearchConfig":
+        if not isinstance(obj, dict):
+            return HybridSearchConfig()
+        fusion = obj.get("fusion", FUSION_RRF)
+        if fusion not in (FUSION_RRF, FUSION_WEIGHTED):
+            raise ValueError(f"Unknown hybrid search fusion {fusion}, use {FUSION_RRF} or {FUSION_WEIGHTED}")
+        lexical_weight = float(obj.get("lexicalWeight", 0.5))
+        if not 0 <= lexical_weight <= 1:
+            raise ValueError(f"Hybrid search lexicalWeight {lexical_weight} is not between 0 and 1")
+        return HybridSearchConfig(
+            enabled=bool(obj.get("enabled", False)),
+            fusion=fusion,
+            rrf_k=int(obj.get("rrfK", 60)),
+            lexical_weight=lexical_weight,
+            candidates=int(obj.get("candidates", 0)),
+            text_field=obj.get("textField", "text"),
+        )
+
+    def num_candidates(self, k: int) -> int:
+        """Returns the number of documents to fetch from each search for k results."""
+        return max(self.candidates, k) if self.candidates > 0 else 2 * k
+
+
+def document_key(document: Document) -> Hashable:
+    """Returns the identity of a document across the lexical and the vector ranking."""
+    return (document.metadata.get("source"), document.page_content)
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[ScoredDocuments],
+    weights: Sequence[float],
+    rrf_k: int = 60,
+    key: Callable[[Document], Hashable] = document_key,
+) -> ScoredDocuments:
+    """Fuses rankings by the weighted sum of 1 / (rrf_k + rank) of every document.
+
+    Reciprocal rank fusion only uses ranks, so it does not depend on the scales of
+    BM25 scores and vector similarities.
+
+    Args:
+        rankings: Rankings to fuse, best first.
+        weights: Weight of every ranking.
+        rrf_k: Rank constant.
+        key: Identity of a document across the rankings. Documents with the same
+            identity are merged into the best ranked one.
+
+    Returns:
+        The fused ranking with the fused scores, best first.
+    """
+    fused: Dict[Hashable, List[Any]] = {}
+    for ranking, weight in zip(rankings, weights):
+        seen = set()
+        for rank, (document, _) in enumerate(ranking, start=1):
+            document_id = key(document)
+            if document_id in seen:
+                continue
+            seen.add(document_id)
+            entry = fused.setdefault(document_id, [document, 0.0])
+            entry[1] += weight / (rrf_k + rank)
+    return sorted(((document, score) for document, score in fused.values()), key=lambda item: -item[1])
+
+
+def _min_max_normalize(ranking: ScoredDocuments) -> ScoredDocuments:
+    if not ranking:
+        return []
+    scores = [score for _, score in ranking]
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [(document, 1.0) for document, _ in ranking]
+    return [(document, (score - low) / (high - low)) for document, score in ranking]
+
+
+def weighted_score_fusion(rankings: Sequence[ScoredDocuments], weights: Sequence[float]) -> ScoredDocuments:
+    """Fuses rankings by the weighted sum of the min-max normalized scores of every document.
+
+    Args:
+        rankings: Rankings to fuse with their scores, best first.
+        weights: Weight of every ranking.
+
+    Returns:
+        The fused ranking with the fused scores, best first.
+    """
+    fused: Dict[Hashable, List[Any]] = {}
+    for ranking, weight in zip(rankings, weights):
+        for document, score in _min_max_normalize(ranking):
+            entry = fused.setdefault(document_key(document), [document, 0.0])
+            entry[1] += weight * score
+    return sorted(((document, score) for document, score in fused.values()), key=lambda item: -item[1])
+
+
+def fuse(lexical: ScoredDocuments, vector: ScoredDocuments, config: HybridSearchConfig) -> ScoredDocuments:
+    """Fuses the BM25 and the k-NN ranking as configured."""
+    weights = (config.lexical_weight, 1 - config.lexical_weight)
+    if config.fusion == FUSION_WEIGHTED:
+        return weighted_score_fusion((lexical, vector), weights)
+    return reciprocal_rank_fusion((lexical, vector), weights, config.rrf_k)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Shared by all sessions, a pool per query would start a thread per query
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hybrid-search")
+        return _executor
+
+
+def hybrid_search_with_score(
+    query: str,
+    k: int,
+    lexical_search: Callable[[str, int], ScoredDocuments],
+    vector_search: Callable[[str, int], ScoredDocuments],
+    config: HybridSearchConfig,
+) -> ScoredDocuments:
+    """Runs the lexical and the vector search concurrently and returns the top k fused documents.
+
+    Args:
+        query: Query string.
+        k: Number of documents to return.
+        lexical_search: Returns the BM25 ranking for a query and a number of documents.
+        vector_search: Returns the k-NN ranking for a query and a number of documents.
+        config: Hybrid search config of the index.
+
+    Returns:
+        The top k documents with their fused scores, best first.
+
+    Example:
+        ```python
+        docs_and_scores = hybrid_search_with_score(
+            "What is AMZN's operating income?",
+            3,
+            lexical_search=retriever.lexical_search,
+            vector_search=retriever.vector_search,
+            config=HybridSearchConfig(enabled=True),
+        )
+        ```
+    """
+    candidates = config.num_candidates(k)
+    # The lexical query runs in the pool while this thread embeds the query and runs k-NN
+    lexical_future = _get_executor().submit(lexical_search, query, candidates)
+    try:
+        vector = vector_search(query, candidates)
+    except BaseException:
+        lexical_future.cancel()
+        raise
+    lexical = lexical_future.result()
+    return fuse(lexical, vector, config)[:k]
+
+
+def hybrid_search(
+    query: str,
+    k: int,
+    lexical_search: Callable[[str, int], ScoredDocuments],
+    vector_search: Callable[[str, int], ScoredDocuments],
+    config: HybridSearchConfig,
+) -> List[Document]:
+    """Like hybrid_search_with_score, but returns only the documents."""
+    return [
+        document
+        for document, _ in hybrid_search_with_score(query, k, lexical_search, vector_search, config)
+    ]
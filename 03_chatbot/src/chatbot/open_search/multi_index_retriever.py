@@ -0,0 +1,138 @@
+""" Module that contains a retriever that searches several OpenSearch indices at once.
+
+The indices are queried concurrently, every index with its own embedding model, RAG
+config and timeout. The scores of the indices are not comparable, e.g. when the indices
+use different embedding models, so they are min-max normalized per index before the
+documents are merged into one ranking.
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
+
+from chatbot.helpers.logger import TECHNICAL_LOGGER_NAME
+from langchain.schema import BaseRetriever, Document
+
+from .hybrid_search import ScoredDocuments, weighted_score_fusion
+from .open_search_client_pool import OPEN_SEARCH_CLIENT_POOL
+from .open_search_index_retriever import OpenSearchIndexRetriever
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Not the hybrid search pool, index searches wait for hybrid searches in that pool
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="index-fan-out")
+        return _executor
+
+
+class MultiIndexOpenSearchRetriever(BaseRetriever):
+    """Retriever that searches several Amazon OpenSearch indices concurrently.
+
+    Every index keeps its embedding model and rag config from embedding_config. Indices
+    that use the same embedding model share one query embedding. An index that does
+    not answer within its timeoutSeconds is left out of the results.
+
+    Args:
+        index_names: OpenSearch index names.
+        rag_config: Global RAG config, see OpenSearchIndexRetriever.
+        embedding_config: Embedding config of the OpenSearch domain.
+        k: Number of documents to return across all indices. Default: 3
+
+    Example:
+        ```python
+        retriever = MultiIndexOpenSearchRetriever(
+            ["press-releases-en", "press-releases-de"], rag_config, embedding_config, k=5
+        )
+        docs = retriever.get_relevant_documents("How does Switzerland support Ukraine?")
+        ```
+    """
+
+    retrievers: List[OpenSearchIndexRetriever]
+    """ Retrievers of the single indices, every one returns up to k documents. """
+    k: int
+
+    def __init__(self, index_names: List[str], rag_config, embedding_config, k: int = 3):
+        super().__init__(
+            retrievers=[
+                OpenSearchIndexRetriever(index_name, rag_config, embedding_config, k=k)
+                for index_name in index_names
+            ],
+            k=k,
+        )
+
+    def _embed_queries(self, query: str) -> Dict[Tuple[str, str, str], Future]:
+        """Starts one query embedding per embedding model of the indices, in the context of the
+        chat turn for the embedding metrics."""
+        executor = _get_executor()
+        return {
+            embedding: executor.submit(
+                contextvars.copy_context().run, OPEN_SEARCH_CLIENT_POOL.get_embeddings(*embedding).embed_query, query
+            )
+            for embedding in {retriever.embedding for retriever in self.retrievers}
+        }
+
+    @staticmethod
+    def _search(retriever: OpenSearchIndexRetriever, query: str, query_embedding: Future) -> ScoredDocuments:
+        start_time = time.perf_counter()
+        docs_and_scores = retriever.search_with_score(query, query_embedding.result())
+        logger.info(
+            "Index %s returned %s documents in %.0f ms",
+            retriever.index_name,
+            len(docs_and_scores),
+            (time.perf_counter() - start_time) * 1000,
+        )
+        return docs_and_scores
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        """Run search on all OpenSearch indices and get the top k documents across them.
+
+        Args:
+            query: Query string.
+
+        Returns:
+            list of documents from the indices that answered in time that relate to the query.
+        """
+        start_time = time.monotonic()
+        executor = _get_executor()
+        # Embeddings are submitted before the searches that wait for them, so that the
+        # searches never wait for a task that is still queued behind them
+        query_embeddings = self._embed_queries(query)
+        futures = [
+            (retriever, executor.submit(self._search, retriever, query, query_embeddings[retriever.embedding]))
+            for retriever in self.retrievers
+        ]
+
+        rankings: List[ScoredDocuments] = []
+        errors: List[Exception] = []
+        for retriever, future in futures:
+            remaining = start_time + retriever.timeout_seconds - time.monotonic()
+            try:
+                rankings.append(future.result(timeout=max(remaining, 0)))
+            except FutureTimeoutError as error:
+                logger.warning(
+                    "Leaving out index %s, it did not answer within %s seconds",
+                    retriever.index_name,
+                    retriever.timeout_seconds,
+                )
+                errors.append(error)
+            except Exception as error:
+                logger.warning("Leaving out index %s. %s", retriever.index_name, error)
+                errors.append(error)
+
+        if not rankings and errors:
+            raise errors[0]
+        return [doc for doc, _ in weighted_score_fusion(rankings, [1.0] * len(rankings))[: self.k]]
+
+    async def aget_relevant_documents(self, query: str) -> List[Document]:
+        """See base class."""
+        return await super().aget_relevant_documents(query)
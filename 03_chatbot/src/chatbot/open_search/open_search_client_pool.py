@@ -0,0 +1,247 @@
+""" Module that contains a process-wide pool of OpenSearch and embedding clients.
+
+Creating an OpenSearch client for every prompt means a new TLS handshake, a new
+credential resolution and new embedding clients on the hot path. The pool keeps one
+client per endpoint, region and auth identity with keep-alive connections and
+shares it between all Streamlit sessions.
+"""
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Any, Dict, Hashable, Tuple
+
+import boto3
+from chatbot.embeddings import CachedEmbeddings, SageMakerEndpointEmbeddings
+from chatbot.helpers import ChatbotEnvironment, ChatbotEnvironmentVariables
+from chatbot.helpers.aws_client_pool import AWS_CLIENT_POOL
+from chatbot.helpers.logger import TECHNICAL_LOGGER_NAME
+from chatbot.helpers.lru_cache import CacheStats, LRUCache
+from langchain.embeddings import BedrockEmbeddings
+from langchain.schema.embeddings import Embeddings
+from langchain.vectorstores import OpenSearchVectorSearch
+from opensearchpy import AWSV4SignerAuth, OpenSearch, RequestsHttpConnection
+from opensearchpy.exceptions import OpenSearchException
+from sagemaker.session import Session
+
+logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
+
+try:
+    from sagemaker.huggingface.model import HuggingFacePredictor
+except json.decoder.JSONDecodeError:
+    logger.error(
+        "Unable to load HuggingFacePredictor. "
+        + "Most likely there is a problem connecting to Amazon SageMaker. "
+        + "Do you have AWS credentials configured? "
+    )
+    sys.exit(0)
+
+OPEN_SEARCH_TIMEOUT = 300
+
+
+def _host(endpoint: str) -> str:
+    return endpoint.replace("https://", "").rstrip("/")
+
+
+def auth_identity(http_auth: Any) -> Hashable:
+    """Returns a hashable identity for OpenSearch credentials that does not contain secrets.
+
+    Args:
+        http_auth: A (user, password) tuple or an AWSV4SignerAuth.
+
+    Returns:
+        The identity that is used in the pool keys.
+    """
+    if isinstance(http_auth, (tuple, list)):
+        user, password = http_auth
+        return ("basic", user, hashlib.sha256(password.encode("utf-8")).hexdigest())
+    if isinstance(http_auth, AWSV4SignerAuth):
+        return ("sigv4", http_auth.signer.region, http_auth.service)
+    return ("other", id(http_auth))
+
+
+class OpenSearchClientPool:
+    """Thread-safe registry of OpenSearch clients, embedding clients and vector stores.
+
+    Clients are reused as long as they are healthy. A client that was idle for longer
+    than the health check interval is checked with a lightweight request before it is
+    handed out again and replaced if the check fails.
+
+    Args:
+        pool_size: Maximum number of keep-alive connections per OpenSearch client.
+        health_check_interval: Idle seconds after which a client is checked before reuse.
+        max_clients: Maximum number of clients of each kind kept in the pool.
+
+    Example:
+        ```python
+        client = OPEN_SEARCH_CLIENT_POOL.get_client(endpoint, region, http_auth)
+        client.cat.indices(format="json")
+        ```
+    """
+
+    def __init__(self, pool_size: int = 10, health_check_interval: float = 60, max_clients: int = 32):
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
+        self.health_check_failures = 0
+        self._clients: LRUCache[OpenSearch] = LRUCache(max_size=max_clients)
+        self._signer_auths: LRUCache[AWSV4SignerAuth] = LRUCache(max_size=max_clients)
+        self._embeddings: LRUCache[Embeddings] = LRUCache(max_size=max_clients)
+        self._vector_searches: LRUCache[OpenSearchVectorSearch] = LRUCache(max_size=max_clients * 4)
+        self._last_used: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+
+    def get_http_auth(self, region: str, service: str = "aoss") -> AWSV4SignerAuth:
+        """Returns a shared SigV4 auth for the default credentials of this process.
+
+        The credentials from boto3 refresh themselves, so the auth object can be kept.
+        """
+        return self._signer_auths.get_or_create(
+            (region, service),
+            lambda: AWSV4SignerAuth(boto3.Session().get_credentials(), region, service),
+        )
+
+    def _client_key(self, endpoint: str, region: str, http_auth: Any) -> Hashable:
+        return (_host(endpoint), region, auth_identity(http_auth))
+
+    def _create_client(self, endpoint: str, http_auth: Any) -> OpenSearch:
+        return OpenSearch(
+            hosts=[{"host": _host(endpoint), "port": 443}],
+            http_auth=http_auth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=RequestsHttpConnection,
+            pool_maxsize=self.pool_size,
+            timeout=OPEN_SEARCH_TIMEOUT,
+        )
+
+    def _is_healthy(self, client: OpenSearch) -> bool:
+        # OpenSearch Serverless does not support the root endpoint that ping() uses
+        try:
+            client.cat.indices(format="json", h="index")
+            return True
+        except OpenSearchException as error:
+            logger.warning(f"OpenSearch client failed the health check: {error}")
+            return False
+
+    def get_client(self, endpoint: str, region: str, http_auth: Any = None) -> OpenSearch:
+        """Returns a healthy pooled OpenSearch client.
+
+        Args:
+            endpoint: OpenSearch endpoint with or without https:// prefix.
+            region: AWS region of the OpenSearch domain or collection.
+            http_auth: Credentials of the domain. Uses SigV4 for OpenSearch Serverless if not set.
+
+        Returns:
+            An OpenSearch client with keep-alive connections.
+        """
+        http_auth = http_auth or self.get_http_auth(region)
+        key = self._client_key(endpoint, region, http_auth)
+        client = self._clients.get_or_create(key, lambda: self._create_client(endpoint, http_auth))
+
+        now = time.monotonic()
+        with self._lock:
+            last_used = self._last_used.get(key, now)
+            self._last_used[key] = now
+        if now - last_used > self.health_check_interval and not self._is_healthy(client):
+            with self._lock:
+                self.health_check_failures += 1
+            self.discard_client(endpoint, region, http_auth)
+            client = self._clients.get_or_create(key, lambda: self._create_client(endpoint, http_auth))
+        return client
+
+    def discard_client(self, endpoint: str, region: str, http_auth: Any = None):
+        """Removes a client and the vector stores that use it from the pool, e.g. after a connection error."""
+        http_auth = http_auth or self.get_http_auth(region)
+        key = self._client_key(endpoint, region, http_auth)
+        self._clients.invalidate(lambda cached_key: cached_key == key)
+        self._vector_searches.invalidate(lambda cached_key: cached_key[0] == key)
+        with self._lock:
+            self._last_used.pop(key, None)
+
+    def get_embeddings(self, embedding_type: str, model: str, region: str) -> Embeddings:
+        """Returns pooled embeddings for a SageMaker endpoint or Amazon Bedrock model.
+
+        Query embeddings are cached, see CachedEmbeddings.
+
+        Args:
+            embedding_type: Sagemaker or Bedrock.
+            model: SageMaker endpoint name or Amazon Bedrock model id.
+            region: AWS region of the endpoint or of Amazon Bedrock.
+        """
+
+        def create() -> Embeddings:
+            if embedding_type == "Sagemaker":
+                session = Session(boto3.Session(region_name=region))
+                predictor = HuggingFacePredictor(endpoint_name=model, sagemaker_session=session)
+                embeddings = SageMakerEndpointEmbeddings(embeddings_predictor=predictor)
+                return CachedEmbeddings(embeddings, model_id=model, prefix=embeddings.query_prefix)
+            if embedding_type == "Bedrock":
+                bedrock_client = AWS_CLIENT_POOL.get_client("bedrock-runtime", region)
+                embeddings = BedrockEmbeddings(client=bedrock_client, model_id=model)
+                return CachedEmbeddings(embeddings, model_id=model)
+            raise Exception("Embedding type not supported")
+
+        return self._embeddings.get_or_create((embedding_type, model, region), create)
+
+    def get_vector_search(
+        self,
+        index_name: str,
+        endpoint: str,
+        region: str,
+        http_auth: Any,
+        embedding: Tuple[str, str, str],
+    ) -> OpenSearchVectorSearch:
+        """Returns a vector store for an index that uses pooled clients.
+
+        Args:
+            index_name: OpenSearch index name.
+            endpoint: OpenSearch endpoint.
+            region: AWS region of the OpenSearch domain or collection.
+            http_auth: Credentials of the domain. Uses SigV4 for OpenSearch Serverless if not set.
+            embedding: Embedding type, model and region, see get_embeddings.
+        """
+        http_auth = http_auth or self.get_http_auth(region)
+        client = self.get_client(endpoint, region, http_auth)
+        key = (self._client_key(endpoint, region, http_auth), index_name, embedding)
+
+        def create() -> OpenSearchVectorSearch:
+            vector_search = OpenSearchVectorSearch(
+                index_name=index_name,
+                embedding_function=self.get_embeddings(*embedding),
+                opensearch_url=endpoint,
+                http_auth=http_auth,
+                timeout=OPEN_SEARCH_TIMEOUT,
+                connection_class=RequestsHttpConnection,
+                use_ssl=True,
+                verify_certs=True,
+            )
+            # Share the pooled connections instead of the client the vector store created
+            vector_search.client = client
+            return vector_search
+
+        return self._vector_searches.get_or_create(key, create)
+
+    def stats(self) -> Dict[str, CacheStats]:
+        """Returns the hit and miss counters of the pool."""
+        return {
+            "opensearch_clients": self._clients.stats(),
+            "signer_auths": self._signer_auths.stats(),
+            "embeddings": self._embeddings.stats(),
+            "vector_searches": self._vector_searches.stats(),
+        }
+
+
+def _create_default_pool() -> OpenSearchClientPool:
+    environment = ChatbotEnvironment()
+    return OpenSearchClientPool(
+        pool_size=int(environment.get_env_variable(ChatbotEnvironmentVariables.OpenSearchPoolSize)),
+        health_check_interval=float(
+            environment.get_env_variable(ChatbotEnvironmentVariables.OpenSearchHealthCheckInterval)
+        ),
+    )
+
+
+OPEN_SEARCH_CLIENT_POOL: OpenSearchClientPool = _create_default_pool()
+""" Process-wide pool that all OpenSearch retrievers borrow their clients from. """
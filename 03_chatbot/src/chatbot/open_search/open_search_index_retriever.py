@@ -3,39 +3,29 @@ from __future__ import annotations
 
 import json
 import logging
-import sys
-from typing import List, Tuple
+from functools import partial
+from typing import Any, List, Optional, Tuple
 
-import boto3
+from chatbot.helpers.aws_client_pool import AWS_CLIENT_POOL
+from chatbot.helpers.context_packer import trim_to_characters
 from chatbot.helpers.logger import TECHNICAL_LOGGER_NAME
 from langchain.schema import BaseRetriever, Document
 from langchain.vectorstores import OpenSearchVectorSearch
-from opensearchpy import OpenSearch, AWSV4SignerAuth, RequestsHttpConnection
+from opensearchpy import ConnectionError as OpenSearchConnectionError
 
-from sagemaker.huggingface.model import HuggingFacePredictor
-from sagemaker.session import Session
-from chatbot.embeddings import SageMakerEndpointEmbeddings
-from langchain.embeddings import BedrockEmbeddings
+from .hybrid_search import HybridSearchConfig, ScoredDocuments, hybrid_search_with_score
+from .open_search_client_pool import OPEN_SEARCH_CLIENT_POOL
 
 
 logger = logging.getLogger(TECHNICAL_LOGGER_NAME)
 
-try:
-    from sagemaker.huggingface.model import HuggingFacePredictor
-except json.decoder.JSONDecodeError:
-    logger.error(
-        "Unable to load HuggingFacePredictor. "
-        + "Most likely there is a problem connecting to Amazon SageMaker. "
-        + "Do you have AWS credentials configured? "
-    )
-    sys.exit(0)
-
-def get_credentials(secret_id: str, region_name: str) -> str:
+def get_credentials(secret_id: str, region_name: str, client=None) -> str:
     """Retrieve credentials password for given username from AWS SecretsManager.
 
     Args:
         secret_id: AWS Secrets Manager id to retrieve.
         region_name: AWS region name.
+        client: Optional AWS Secrets Manager client to use for the region. Uses the pooled client if not set.
 
     Returns:
         AWS Secrets Manager password.
@@ -45,28 +35,19 @@ def get_credentials(secret_id: str, region_name: str) -> str:
         credentials = get_credentials("username", "us-east-1")
         ```
     """
-    client = boto3.client("secretsmanager", region_name=region_name)
+    client = client or AWS_CLIENT_POOL.get_client("secretsmanager", region_name)
     response = client.get_secret_value(SecretId=secret_id)
     secrets_value = json.loads(response["SecretString"])
     return secrets_value
 
-def get_open_search_index_list(region, domain, os_http_auth = None):
-    # Currently supports only OpenSearch serverless
-    if not os_http_auth:
-        credentials = boto3.Session().get_credentials()
-        os_http_auth = AWSV4SignerAuth(credentials, region, 'aoss')
+def get_open_search_index_list(region, domain, os_http_auth = None, request_timeout = None):
+    # Currently supports only OpenSearch serverless if no credentials are given
+    client = OPEN_SEARCH_CLIENT_POOL.get_client(domain["Endpoint"], region, os_http_auth)
 
-    # client = boto3.client("opensearch", region)
-    client = OpenSearch(
-        hosts=[{"host": domain["Endpoint"].replace("https://", ""), "port": 443}],
-        http_auth=os_http_auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        timeout = 300
-    )
-
-    response = client.cat.indices(format="json")
+    if request_timeout is None:
+        response = client.cat.indices(format="json")
+    else:
+        response = client.cat.indices(format="json", request_timeout=request_timeout)
 
     contains_documents = lambda item: 'docs.count' not in item or item['docs.count'] != '0'
 
@@ -80,7 +61,28 @@ def get_open_search_index_list(region, domain, os_http_auth = None):
     indexes = [item for item in response if is_not_system_index and is_not_hidden and contains_documents]
     return indexes
 
-    
+
+def get_embedding_spec(index_name: str, embedding_config: dict) -> Tuple[str, str, str]:
+    """Returns the embedding type, model and region that an index was ingested with.
+
+    Args:
+        index_name: OpenSearch index name.
+        embedding_config: Embedding config of the OpenSearch domain.
+    """
+    if  index_name in embedding_config and "embedding" in embedding_config[index_name]:
+        embedding_type = embedding_config[index_name]["embedding"]["type"]
+        model = embedding_config[index_name]["embedding"]["model"]
+    else:
+        embedding_type = "Sagemaker"
+        model = embedding_config["default_embadding_name"]
+
+    if embedding_type == "Sagemaker":
+        return (embedding_type, model, embedding_config["region"])
+    if embedding_type == "Bedrock":
+        return (embedding_type, model, embedding_config["bedrock_region"])
+    raise Exception("Embedding type not supported")
+
+
 class OpenSearchIndexRetriever(BaseRetriever):
     """Retriever to search Amazon OpenSearch.
 
@@ -106,12 +108,25 @@ class OpenSearchIndexRetriever(BaseRetriever):
         ```
     """
 
-    max_character_limit: int
+    max_character_limit: Optional[int]
+    """ Characters to keep of every document, cut at a sentence boundary. None keeps whole documents
+    and leaves the budget to the context packer of the model. """
 
     k: int
     opensearchvectorsearch: OpenSearchVectorSearch
     """ Vector search for OpenSearch. """
 
+    index_name: str
+    endpoint: str
+    region: str
+    http_auth: Any
+    embedding: Tuple[str, str, str]
+    """ Embedding type, model and region. """
+    hybrid_search_config: HybridSearchConfig
+    """ Whether and how to combine BM25 with the k-NN search, see hybrid_search. """
+    timeout_seconds: float = 10
+    """ Seconds that a multi-index search waits for this index, see MultiIndexOpenSearchRetriever. """
+
     def __init__(
         self,
         index_name: str,
@@ -121,55 +136,103 @@ class OpenSearchIndexRetriever(BaseRetriever):
     ):
         if index_name in embedding_config and "rag" in embedding_config[index_name]:
             rag_config = embedding_config[index_name]["rag"]
+        hybrid_search_config = HybridSearchConfig.from_dict(
+            embedding_config.get(index_name, {}).get("hybridSearch")
+        )
 
-        # Currently supports only OpenSearch serverless
-        # couldn't do it on upper level due to streamlit issue (deepcopy)
-        if not embedding_config["http_auth"]:
-            credentials = boto3.Session().get_credentials()
-            embedding_config["http_auth"] = AWSV4SignerAuth(credentials, embedding_config["region"], 'aoss')
-
-        if  index_name in embedding_config and "embedding" in embedding_config[index_name]:
-            embedding_type = embedding_config[index_name]["embedding"]["type"]
-            model = embedding_config[index_name]["embedding"]["model"]
-        else:
-            embedding_type = "Sagemaker"
-            model = embedding_config["default_embadding_name"]
-
-        if embedding_type == "Sagemaker":
-            boto3_session = boto3.Session(region_name=embedding_config["region"])
-            session = Session(boto3_session)
-            # replace default endpoint
-            predictor = HuggingFacePredictor(
-                endpoint_name=model, sagemaker_session=session
-            )
+        embedding = get_embedding_spec(index_name, embedding_config)
 
-            embedding_function = SageMakerEndpointEmbeddings(
-                embeddings_predictor=predictor
-            )
-        elif embedding_type == "Bedrock":
-            bedrock_client = boto3.client("bedrock-runtime", region_name=embedding_config["bedrock_region"])
-            embedding_function = BedrockEmbeddings(
-                client=bedrock_client,
-                model_id=model)
-        else:
-            raise Exception("Embedding type not supported")
-
-        
-        opensearchvectorsearch = OpenSearchVectorSearch(
-            index_name=index_name,
-            embedding_function=embedding_function,
-            opensearch_url=embedding_config["endpoint"],
+        # Clients, credentials and embeddings are borrowed from the process-wide pool.
+        # Without http_auth the pool signs requests for OpenSearch serverless.
+        opensearchvectorsearch = OPEN_SEARCH_CLIENT_POOL.get_vector_search(
+            index_name,
+            endpoint=embedding_config["endpoint"],
+            region=embedding_config["region"],
             http_auth=embedding_config["http_auth"],
-            timeout = 300,
-            connection_class = RequestsHttpConnection,
-            use_ssl=True,
-            verify_certs=True
+            embedding=embedding,
         )
         super().__init__(
             k=k,
-            max_character_limit=rag_config["maxCharacterLimit"],
+            max_character_limit=rag_config.get("maxCharacterLimit"),
             opensearchvectorsearch=opensearchvectorsearch,
+            index_name=index_name,
+            endpoint=embedding_config["endpoint"],
+            region=embedding_config["region"],
+            http_auth=embedding_config["http_auth"],
+            embedding=embedding,
+            hybrid_search_config=hybrid_search_config,
+            timeout_seconds=float(rag_config.get("timeoutSeconds", 10)),
+        )
+
+    def vector_search(
+        self, query: str, k: int, query_embedding: Optional[List[float]] = None
+    ) -> ScoredDocuments:
+        """Returns the k nearest documents to the query embedding with their scores.
+
+        Args:
+            query: Query string.
+            k: Number of documents to return.
+            query_embedding: Embedding of the query with the embedding model of the index,
+                if it was already computed. The query is embedded otherwise.
+        """
+        if query_embedding is None:
+            query_embedding = self.opensearchvectorsearch.embedding_function.embed_query(query)
+        return self.opensearchvectorsearch.similarity_search_with_score_by_vector(query_embedding, k=k)
+
+    def lexical_search(self, query: str, k: int) -> ScoredDocuments:
+        """Returns the k best BM25 matches of the query with their scores."""
+        text_field = self.hybrid_search_config.text_field
+        response = self.opensearchvectorsearch.client.search(
+            index=self.index_name,
+            body={
+                "size": k,
+                "query": {"match": {text_field: query}},
+                "_source": {"excludes": ["vector_field"]},
+            },
         )
+        return [
+            (
+                Document(page_content=hit["_source"][text_field], metadata=hit["_source"].get("metadata", {})),
+                hit["_score"],
+            )
+            for hit in response["hits"]["hits"]
+        ]
+
+    def _search_with_score(self, query: str, query_embedding: Optional[List[float]]) -> ScoredDocuments:
+        vector_search = partial(self.vector_search, query_embedding=query_embedding)
+        if self.hybrid_search_config.enabled:
+            return hybrid_search_with_score(
+                query, self.k, self.lexical_search, vector_search, self.hybrid_search_config
+            )
+        return vector_search(query, self.k)
+
+    def search_with_score(
+        self, query: str, query_embedding: Optional[List[float]] = None
+    ) -> ScoredDocuments:
+        """Run search on OpenSearch index and get top k documents with their scores.
+
+        Args:
+            query: Query string.
+            query_embedding: Optional embedding of the query, see vector_search.
+
+        Returns:
+            list of documents from this OpenSearch index that relate to the query, with
+            their k-NN or hybrid scores.
+        """
+        try:
+            docs_and_scores = self._search_with_score(query, query_embedding)
+        except OpenSearchConnectionError:
+            # The pooled connection went stale, retry once with a new client
+            OPEN_SEARCH_CLIENT_POOL.discard_client(self.endpoint, self.region, self.http_auth)
+            self.opensearchvectorsearch = OPEN_SEARCH_CLIENT_POOL.get_vector_search(
+                self.index_name, self.endpoint, self.region, self.http_auth, self.embedding
+            )
+            docs_and_scores = self._search_with_score(query, query_embedding)
+        # limit to max character limit
+        if self.max_character_limit:
+            for doc, _ in docs_and_scores:
+                doc.page_content = trim_to_characters(doc.page_content, self.max_character_limit)
+        return docs_and_scores
 
     def get_relevant_documents(self, query: str) -> List[Document]:
         """Run search on OpenSearch index and get top k documents.
@@ -180,13 +243,7 @@ class OpenSearchIndexRetriever(BaseRetriever):
         Returns:
             list of documents from this OpenSearch index that relate to the query.
         """
-        docs = self.opensearchvectorsearch.similarity_search(query, k=self.k)
-        # limit to max character limit
-        for doc in docs:
-            doc.page_content = doc.page_content[
-                : int(min(self.max_character_limit, len(doc.page_content)))
-            ]
-        return docs
+        return [doc for doc, _ in self.search_with_score(query)]
 
     async def aget_relevant_documents(self, query: str) -> List[Document]:
         """See base class."""
@@ -1,4 +1,5 @@
 """ Entrypoint for chatbot UI. """
+import math
 import os
 import sys
 import uuid
@@ -11,11 +12,14 @@ import streamlit as st
 from babel import Locale
 from botocore.exceptions import ClientError
 from chatbot.catalog import (
+    CATALOG_STORE,
     MemoryCatalog,
     MemoryCatalogItem,
     PromptCatalog,
     PromptCatalogItem,
+    RetrieverCatalogItem,
 )
+from chatbot.catalog.flow_catalog_item_rag import _model_id
 from chatbot.config import (
     AmazonBedrock,
     AmazonBedrockParameters,
@@ -34,7 +38,10 @@ from chatbot.helpers.logger.app_logging import (
     get_llm_logger,
     get_technical_logger,
 )
+from chatbot.helpers.logger.latency_handler import LatencyCallbackHandler
+from chatbot.helpers.metrics import metric_dimensions
 from chatbot.helpers.logger.log_to_ui_handler import LogToUiHandler
+from chatbot.helpers.rate_limiter import RATE_LIMIT_OWNER
 from chatbot.i18n import install_language
 from langchain.memory import StreamlitChatMessageHistory
 from langchain.schema import BaseChatMessageHistory
@@ -48,7 +55,7 @@ from .chat_messages import (
     DebugMessage,
     InfoMessage,
 )
-from .sidebar import write_sidebar
+from .sidebar import SidebarObj, get_session_catalog, write_sidebar
 from .topbar import write_top_bar, write_prompt_hints
 from .stream_handler import StreamHandler
 
@@ -63,6 +70,43 @@ def create_session_id() -> str:
     return str(uuid.uuid4())
 
 
+def _metrics_index_name(retriever: RetrieverCatalogItem) -> str:
+    """Name of the knowledge base and its selected indices in latency metrics."""
+    if retriever is None:
+        return ""
+    selected = ",".join(str(option[0]) for option in retriever.current_filter)
+    return f"{retriever.friendly_name}/{selected}" if selected else retriever.friendly_name
+
+
+def _metric_dimensions(sidebar: SidebarObj) -> Dict[str, str]:
+    """Flow, model and index of the current turn in latency metrics."""
+    return {
+        "flow": sidebar.flow.friendly_name,
+        "model": _model_id(sidebar.model) or "",
+        "index": _metrics_index_name(sidebar.retriever) if sidebar.flow.enable_retriever() else "",
+    }
+
+
+PROMPT_CATALOG_KEY = ("prompt",)
+
+
+def _load_app_config(
+    aws_app_config_app_name: str,
+    aws_app_config_env_name: str,
+    aws_app_config_profile_name: str,
+    bedrock_region: str,
+) -> AppConfigProvider:
+    """Loads the app config that all sessions share."""
+    app_config = AppConfigProvider(
+        aws_app_config_app_name,
+        aws_app_config_env_name,
+        aws_app_config_profile_name,
+    )
+    if bedrock_region:
+        app_config.config.add_amazon_bedrock(bedrock_region)
+    return app_config
+
+
 def write_chatbot(base_dir: str, environment: ChatbotEnvironment):
     """Composes and displays the UI for the chatbot.
 
@@ -75,6 +119,8 @@ def write_chatbot(base_dir: str, environment: ChatbotEnvironment):
     if "session_id" not in st.session_state:
         st.session_state["session_id"] = create_session_id()
     session_id = st.session_state["session_id"]
+    # The rate limiters of the models serve the queued requests of the sessions in turn
+    RATE_LIMIT_OWNER.set(session_id)
 
     language = Locale.parse("en_US")
     gettext = install_language(str(language))
@@ -90,10 +136,19 @@ def write_chatbot(base_dir: str, environment: ChatbotEnvironment):
         aws_app_config_profile_name = environment.get_env_variable(
             ChatbotEnvironmentVariables.AWSAppConfigProfile
         )
-        st.session_state["app_config"] = AppConfigProvider(
+        bedrock_region = environment.get_env_variable(
+            ChatbotEnvironmentVariables.AmazonBedrockRegion
+        )
+        # Shared by all sessions, served from the snapshot after a restart
+        app_config_args = (
             aws_app_config_app_name,
             aws_app_config_env_name,
             aws_app_config_profile_name,
+            bedrock_region,
+        )
+        st.session_state["app_config"] = CATALOG_STORE.get_value(
+            ("app_config", *app_config_args),
+            lambda: _load_app_config(*app_config_args),
         )
     app_config: AppConfigProvider = st.session_state["app_config"]
 
@@ -165,18 +220,13 @@ def write_chatbot(base_dir: str, environment: ChatbotEnvironment):
 
     if "aws_config" not in st.session_state:
         try:
-            account_id = get_current_account_id()
+            account_id = CATALOG_STORE.get_value(("aws_account_id",), get_current_account_id)
             region = environment.get_env_variable(ChatbotEnvironmentVariables.AWSRegion)
             logger.info("AWS account number: %s", account_id)
             logger.info(f"AWS region: {region}")
             st.session_state["aws_config"] = AWSConfig(
                 account_id=account_id, region=region
             )
-            bedrock_region = environment.get_env_variable(
-                ChatbotEnvironmentVariables.AmazonBedrockRegion
-            )
-            if bedrock_region:
-                app_config.config.add_amazon_bedrock(bedrock_region)
 
         except Exception:
             logger.error(
@@ -200,18 +250,20 @@ def write_chatbot(base_dir: str, environment: ChatbotEnvironment):
         if memory and type(memory) is StreamlitChatMessageHistory:
             memory.clear()    
 
-    if "memory_catalog" not in st.session_state:
-        memory_catalog = MemoryCatalog(
+    memory_catalog: List[MemoryCatalogItem] = get_session_catalog(
+        "memory_catalog",
+        ("memory", aws_config.account_id, tuple(regions)),
+        lambda: MemoryCatalog(
             account_id=aws_config.account_id, regions=regions, logger=logger
-        )
-        st.session_state["memory_catalog"] = memory_catalog
-        memory_catalog.bootstrap()
-
-    memory_catalog: List[MemoryCatalogItem] = st.session_state["memory_catalog"]
+        ),
+    )
     
     memory_item = next(iter(memory_catalog or []), None)
+    if "chat_message_history" not in st.session_state:
+        # Kept across reruns, the conversation summary of the session is stored with it
+        st.session_state["chat_message_history"] = StreamlitChatMessageHistory()
     memory = (
-        StreamlitChatMessageHistory()
+        st.session_state["chat_message_history"]
         if memory_item is None
         else memory_item.get_instance(session_id)
     )
@@ -219,16 +271,16 @@ def write_chatbot(base_dir: str, environment: ChatbotEnvironment):
 
     # Layout of input/response containers
     response_container = st.empty()
+    # Placeholder for the in-flight response below the history, set when a prompt is answered
+    stream_placeholder = None
 
     def on_llm_response(text: str):
-        #response_container.empty()
+        # Only the in-flight message is rendered, the history stays untouched until the turn ends
         stream_msg = ChatMessage(ChatParticipant.BOT, text)
-        #chat_history.append_to_previous_message(stream_msg)
-        with response_container.container():
-            chat_history.write()
+        with stream_placeholder.container():
             with st.chat_message(stream_msg.sender.value, avatar=stream_msg.avatar):
                 stream_msg.write()
-            
+
 
     llm_callbacks = [
         StreamHandler(callback=on_llm_response)
@@ -240,14 +292,16 @@ def write_chatbot(base_dir: str, environment: ChatbotEnvironment):
         gettext=gettext,
         aws_config=aws_config,
         logger=logger,
-        llm_callbacks=llm_callbacks,
         show_llm_debug_messages=show_llm_debug_messages,
         app_config=app_config.config,
     )
 
-    if "prompt_catalog" not in st.session_state:
-        st.session_state["prompt_catalog"] = PromptCatalog()
-    prompt_catalog: Dict[PromptCatalogItem] = st.session_state["prompt_catalog"]
+    # Shared by all sessions, refreshes reload the prompts that were loaded so far
+    prompt_catalog: Dict[PromptCatalogItem] = CATALOG_STORE.get_value(
+        PROMPT_CATALOG_KEY,
+        lambda: PromptCatalog.preloaded(list(CATALOG_STORE.peek(PROMPT_CATALOG_KEY) or [])),
+    )
+    loaded_prompts = len(prompt_catalog)
 
     if _sidebar.flow_or_retriever_or_model_or_agent_changed:
         chat_history.add_chat_message(
@@ -299,6 +353,9 @@ def write_chatbot(base_dir: str, environment: ChatbotEnvironment):
             _sidebar.sql_connection_uri,
             _sidebar.sql_model
         )
+        if len(prompt_catalog) != loaded_prompts:
+            # Keep the newly loaded prompts for the next restart
+            CATALOG_STORE.save_snapshot()
         # Required for retriver validations, it will stop and show retriever error
         if not app:
             return
@@ -309,13 +366,32 @@ def write_chatbot(base_dir: str, environment: ChatbotEnvironment):
 
         prompt_msg = ChatMessage(ChatParticipant.USER, prompt)
         chat_history.add_chat_message(prompt_msg)
+
+        with response_container.container():
+            chat_history.write()
+            stream_placeholder = st.empty()
         
-        response = app.generate_response(
-            prompt, memory, callbacks=[llm_log_handler, 
-                                    #    StreamingStdOutCallbackHandler(),
-                                    #    StreamHandler(response_container)
-                                        ]
-        )
+        dimensions = _metric_dimensions(_sidebar)
+        latency_handler = LatencyCallbackHandler(**dimensions)
+
+        estimated_wait = _sidebar.model.estimated_wait() if _sidebar.model else None
+        if estimated_wait and estimated_wait >= 1:
+            stream_placeholder.info(
+                _("Many questions are waiting for this model. Expected wait: about {seconds} seconds.").format(
+                    seconds=math.ceil(estimated_wait)
+                )
+            )
+
+        # Callbacks are passed per turn because the chain can be shared between sessions.
+        # The dimensions are set for the shared embeddings, which do not report to callbacks.
+        with metric_dimensions(**dimensions):
+            response = app.generate_response(
+                prompt, memory, callbacks=[llm_log_handler, 
+                                            latency_handler,
+                                        #    StreamingStdOutCallbackHandler(),
+                                            *llm_callbacks,
+                                            ]
+            )
         chat_history.add_chat_message(ChatMessage(ChatParticipant.BOT, response))
 
         # Adding graph data and fixing no document search option
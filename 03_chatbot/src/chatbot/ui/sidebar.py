@@ -7,6 +7,8 @@ import os
 
 import streamlit as st
 from chatbot.catalog import (
+    CATALOG_STORE,
+    Catalog,
     ModelCatalog,
     ModelCatalogItem,
     RetrieverCatalog,
@@ -15,6 +17,7 @@ from chatbot.catalog import (
     AgentChainCatalogItem,
     FlowCatalog,
     FlowCatalogItem,
+    RagItem,
 )
 from chatbot.config import AppConfig, AWSConfig
 from numpy import ndarray
@@ -49,6 +52,28 @@ def delete_file_from_s3(bucket, object_name):
         logger.error(e)
         return False
 
+def get_session_catalog(state_name: str, key, factory: Callable[[], Catalog]) -> Catalog:
+    """Returns the session view of a catalog from the process-wide catalog store.
+
+    The view is kept in the session state, so that selections on its items survive reruns.
+    It is replaced when the store refreshed the shared catalog.
+
+    Args:
+        state_name: Session state name of the view.
+        key: Key of the catalog in the catalog store.
+        factory: Creates the catalog if the store does not hold it yet.
+    """
+    shared_catalog = CATALOG_STORE.get(key, factory)
+    source_state_name = f"{state_name}_source"
+    if (
+        state_name not in st.session_state
+        or st.session_state.get(source_state_name) is not shared_catalog
+    ):
+        st.session_state[state_name] = shared_catalog.session_view()
+        st.session_state[source_state_name] = shared_catalog
+    return st.session_state[state_name]
+
+
 class SidebarObj():
     def init(self):
         self.flow = None
@@ -70,7 +95,6 @@ def write_sidebar(
         app_config: AppConfig,
         aws_config: AWSConfig,
         logger: Logger,
-        llm_callbacks,
         show_llm_debug_messages: bool = False,
         gettext: Callable[[str], str] = lambda x: x,
     ) -> Tuple[FlowCatalogItem, RetrieverCatalogItem, ModelCatalogItem, bool]:
@@ -86,7 +110,7 @@ def write_sidebar(
         gettext: Translation function.
 
     Side effects:
-        Sets the session state for the retriever and model catalogs.
+        Sets the session state for the session views of the retriever and model catalogs.
 
 
     Returns:
@@ -135,17 +159,16 @@ def write_sidebar(
         _sidebar = SidebarObj()
 
         ########### FLOW STUFF ###############
-        flow_state_name = "flow_catalog"
-        if flow_state_name not in st.session_state:
-            flow_catalog = FlowCatalog(
+        flow_options = get_session_catalog(
+            "flow_catalog",
+            ("flow", aws_config.account_id, tuple(regions)),
+            lambda: FlowCatalog(
                 aws_config.account_id, 
                 regions, 
-                logger
-                )
-            st.session_state[flow_state_name] = flow_catalog
-            flow_catalog.bootstrap()
-
-        flow_options = st.session_state[flow_state_name]
+                logger,
+                flow_config=app_config.flow_config.parameters.flows,
+                ),
+            )
         flow_label = _("Flow")
         flow, flow_changed = __render_dropdown(
             flow_label, "flow", flow_options, params
@@ -206,16 +229,14 @@ def write_sidebar(
         sql_model = None
         sql_model_changed = False
         if flow.enable_agents_chains:
-            agents_chains_state_name = "agents_chains_catalog"
-            if agents_chains_state_name not in st.session_state:
-                agents_chains_catalog = AgentChainCatalog(
+            agents_chains_options = get_session_catalog(
+                "agents_chains_catalog",
+                ("agents_chains", tuple(regions)),
+                lambda: AgentChainCatalog(
                     regions, 
                     logger
-                    )
-                st.session_state[agents_chains_state_name] = agents_chains_catalog
-                agents_chains_catalog.bootstrap()
-
-            agents_chains_options = st.session_state[agents_chains_state_name]
+                    ),
+                )
             agents_chains_label = _("Agent Chains")
             agents_chains, agents_chains_changed = __render_dropdown(
                 agents_chains_label, "agents_chains", agents_chains_options, params
@@ -246,19 +267,17 @@ def write_sidebar(
                                                 )
 
                 ########### SQL TOOL MODEL STUFF ###############
-                sql_model_state_name = "sql_model_catalog"
-                if sql_model_state_name not in st.session_state:
-                    sql_model_catalog = ModelCatalog(
+                # Shares the discovered models with the main model catalog, selections are separate
+                sql_model_options = get_session_catalog(
+                    "sql_model_catalog",
+                    ("model", tuple(regions)),
+                    lambda: ModelCatalog(
                         regions,
                         bedrock_config=app_config.amazon_bedrock or [],
                         logger=logger,
                         llm_config=app_config.llm_config.parameters,
-                        callbacks=llm_callbacks
-                    )
-                    st.session_state[sql_model_state_name] = sql_model_catalog
-                    sql_model_catalog.bootstrap()
-                    print("sql_model_catalog",sql_model_catalog)
-                sql_model_options = st.session_state[sql_model_state_name]
+                    ),
+                )
                 sql_language_model_label = _("SQL Tool Language Model")
                 sql_model, sql_model_changed = __render_dropdown(
                     sql_language_model_label, "sql_model", sql_model_options, params
@@ -268,18 +287,16 @@ def write_sidebar(
         retriever = None
         retriever_changed = False
         if flow.enable_retriever:
-            retriever_state_name = "retriever_catalog"
-            if retriever_state_name not in st.session_state:
-                retriever_catalog = RetrieverCatalog(
+            retriever_options = get_session_catalog(
+                "retriever_catalog",
+                ("retriever", aws_config.account_id, tuple(regions)),
+                lambda: RetrieverCatalog(
                     aws_config.account_id, 
                     regions, 
                     app_config,
                     logger
-                    )
-                st.session_state[retriever_state_name] = retriever_catalog
-                retriever_catalog.bootstrap()
-
-            retriever_options = st.session_state[retriever_state_name]
+                    ),
+                )
             knowledgebase_label = _("Knowledge Base")
             retriever, retriever_changed = __render_dropdown(
                 knowledgebase_label, "retriever", retriever_options, params
@@ -351,23 +368,22 @@ def write_sidebar(
                     )
             
         ########### MAIN MODEL STUFF ###############
-        model_state_name = "model_catalog"
-        if model_state_name not in st.session_state:
-            model_catalog = ModelCatalog(
+        model_options = get_session_catalog(
+            "model_catalog",
+            ("model", tuple(regions)),
+            lambda: ModelCatalog(
                 regions,
                 bedrock_config=app_config.amazon_bedrock or [],
                 logger=logger,
                 llm_config=app_config.llm_config.parameters,
-                callbacks=llm_callbacks
-            )
-            st.session_state[model_state_name] = model_catalog
-            model_catalog.bootstrap()
-            print("model_catalog",model_catalog)
-        model_options = st.session_state[model_state_name]
+            ),
+        )
         language_model_label = _("Language Model")
         model, model_changed = __render_dropdown(
             language_model_label, "model", model_options, params
             )
+        if isinstance(flow, RagItem):
+            flow.select_condensation_model(model_options, model)
         
         st.toggle(
             label=_("Language Model X-Ray ") + "🩻",
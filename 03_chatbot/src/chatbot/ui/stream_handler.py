@@ -1,15 +1,65 @@
+import time
 from dataclasses import dataclass
+from typing import Any, Callable
+
 from langchain.callbacks.base import BaseCallbackHandler
 
 # reference https://github.com/streamlit/StreamlitLangChain/blob/main/streaming_demo.py
 @dataclass
 class StreamHandler(BaseCallbackHandler):
-    
-    def __init__(self, callback, initial_text=""):
+    """Streams the tokens of the in-flight LLM response to a callback.
+
+    Tokens are coalesced, the callback is called at most once per min_interval_seconds
+    unless max_buffered_chars characters are waiting, and once more at the end of every
+    LLM run with the complete text.
+
+    Args:
+        callback: Renders the text of the in-flight response.
+        initial_text: Text to start with.
+        min_interval_seconds: Minimum time between two calls to callback.
+        max_buffered_chars: Number of new characters that trigger a call to callback
+            regardless of the time.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[str], Any],
+        initial_text: str = "",
+        min_interval_seconds: float = 0.05,
+        max_buffered_chars: int = 512,
+    ):
         self.llm_callback = callback
         self.text = initial_text
+        self.min_interval_seconds = min_interval_seconds
+        self.max_buffered_chars = max_buffered_chars
+        self._rendered_length = len(initial_text)
+        self._rendered_at = 0.0
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        # Every LLM run of a chain or agent is a new in-flight message
+        self.text = ""
+        self._rendered_length = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.on_llm_start(serialized, [], **kwargs)
 
     def on_llm_new_token(self, token: str, **kwargs):
         self.text += token
+        now = time.monotonic()
+        if (
+            now - self._rendered_at >= self.min_interval_seconds
+            or len(self.text) - self._rendered_length >= self.max_buffered_chars
+        ):
+            self._render(now)
+
+    def on_llm_end(self, response, **kwargs):
+        if len(self.text) != self._rendered_length:
+            self._render(time.monotonic())
+
+    def on_llm_error(self, error, **kwargs):
+        self.on_llm_end(None, **kwargs)
+
+    def _render(self, now: float):
+        self._rendered_at = now
+        self._rendered_length = len(self.text)
         self.llm_callback(self.text)
-        
\ No newline at end of file
@@ -0,0 +1,192 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from chatbot.helpers.async_inference_waiter import AsyncInferenceError, AsyncInferenceWaiter
+
+OUTPUT = "s3://bucket/output/inference-1.out"
+FAILURE = "s3://bucket/failure/inference-1-error.out"
+
+
+class FakeS3:
+    """Stand-in of the S3 client with objects by bucket and key."""
+
+    def __init__(self):
+        self.objects = {}
+        self.requests = 0
+
+    def put(self, url, body: bytes):
+        bucket, _, key = url.replace("s3://", "", 1).partition("/")
+        self.objects[(bucket, key)] = body
+
+    def head_object(self, Bucket, Key):
+        self.requests += 1
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {}
+
+    def get_object(self, Bucket, Key):
+        self.requests += 1
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+
+class FakeSQS:
+    """Stand-in of the SQS client of the notification queue."""
+
+    def __init__(self):
+        self.messages = []
+        self.deleted = []
+        self._lock = threading.Lock()
+
+    def send(self, body: dict, age_seconds: float = 0):
+        with self._lock:
+            self.messages.append(
+                {
+                    "ReceiptHandle": f"handle-{len(self.messages)}",
+                    "Body": json.dumps({"Message": json.dumps(body)}),
+                    "Attributes": {"SentTimestamp": str(int((time.time() - age_seconds) * 1000))},
+                }
+            )
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds, AttributeNames):
+        time.sleep(0.01)
+        with self._lock:
+            # Messages that are not deleted become visible again
+            return {"Messages": [message for message in self.messages if message["ReceiptHandle"] not in self.deleted]}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        with self._lock:
+            self.deleted.append(ReceiptHandle)
+
+
+def _wait_in_background(waiter, timeout=5):
+    result = {}
+
+    def wait():
+        try:
+            result["output"] = waiter.wait("inference-1", OUTPUT, FAILURE, "eu-west-1", timeout=timeout)
+        except Exception as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    return thread, result
+
+
+def _wait_for_deletes(sqs, count, timeout=1):
+    # Notifications are deleted after they completed the wait
+    deadline = time.monotonic() + timeout
+    while len(sqs.deleted) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_poll_reads_output_from_s3():
+    """
+    Tests that the waiter without queue finds the output with HEAD requests
+    """
+    s3 = FakeS3()
+    waiter = AsyncInferenceWaiter(lambda region: s3, initial_interval=0.01, max_interval=0.05)
+    thread, result = _wait_in_background(waiter)
+    time.sleep(0.2)
+    s3.put(OUTPUT, b'{"generated_text": "answer"}')
+    thread.join()
+
+    assert result["output"] == b'{"generated_text": "answer"}'
+    assert waiter.notifications == 0
+
+
+def test_poll_reads_failure_from_s3():
+    """
+    Tests that a result in the failure location fails the wait
+    """
+    s3 = FakeS3()
+    s3.put(FAILURE, b"Model error")
+    waiter = AsyncInferenceWaiter(lambda region: s3, initial_interval=0.01, max_interval=0.01, failure_check_every=2)
+
+    with pytest.raises(AsyncInferenceError, match="Model error"):
+        waiter.wait("inference-1", OUTPUT, FAILURE, "eu-west-1", timeout=5)
+
+
+def test_wait_times_out():
+    """
+    Tests that waiting fails after the timeout without result
+    """
+    s3 = FakeS3()
+    waiter = AsyncInferenceWaiter(lambda region: s3, initial_interval=0.01, max_interval=0.05)
+    start = time.monotonic()
+
+    with pytest.raises(TimeoutError):
+        waiter.wait("inference-1", OUTPUT, FAILURE, "eu-west-1", timeout=0.3)
+    assert time.monotonic() - start < 1
+
+
+def test_notification_completes_wait():
+    """
+    Tests that a notification completes the wait before the S3 backstop checks
+    """
+    s3 = FakeS3()
+    sqs = FakeSQS()
+    waiter = AsyncInferenceWaiter(lambda region: s3, sqs, "https://sqs.eu-west-1.amazonaws.com/1/queue")
+    thread, result = _wait_in_background(waiter)
+    time.sleep(0.1)
+    s3.put(OUTPUT, b"answer")
+    sqs.send(
+        {
+            "inferenceId": "inference-1",
+            "invocationStatus": "Completed",
+            "responseParameters": {"outputLocation": OUTPUT},
+        }
+    )
+    thread.join()
+    _wait_for_deletes(sqs, 1)
+
+    assert result["output"] == b"answer"
+    assert waiter.notifications == 1
+    # One GET, the backstop has not checked yet
+    assert s3.requests == 1
+    assert sqs.deleted == ["handle-0"]
+
+
+def test_failure_notification_fails_wait():
+    """
+    Tests that an error notification fails the wait
+    """
+    sqs = FakeSQS()
+    waiter = AsyncInferenceWaiter(lambda region: FakeS3(), sqs, "https://sqs.eu-west-1.amazonaws.com/1/queue")
+    thread, result = _wait_in_background(waiter)
+    time.sleep(0.1)
+    sqs.send({"inferenceId": "inference-1", "invocationStatus": "Failed", "failureReason": "Out of memory"})
+    thread.join()
+
+    assert isinstance(result["error"], AsyncInferenceError)
+    assert "Out of memory" in str(result["error"])
+
+
+def test_unknown_notifications_are_deleted_when_stale():
+    """
+    Tests that notifications of other processes stay in the queue until nobody waits for them
+    """
+    s3 = FakeS3()
+    sqs = FakeSQS()
+    waiter = AsyncInferenceWaiter(
+        lambda region: s3, sqs, "https://sqs.eu-west-1.amazonaws.com/1/queue", stale_notification_age=60
+    )
+    sqs.send({"inferenceId": "other-process", "invocationStatus": "Completed"})
+    sqs.send({"inferenceId": "timed-out", "invocationStatus": "Completed"}, age_seconds=120)
+    thread, result = _wait_in_background(waiter)
+    time.sleep(0.1)
+    # Only now, so that the notification and not the S3 backstop completes the wait
+    s3.put(OUTPUT, b"answer")
+    sqs.send({"inferenceId": "inference-1", "invocationStatus": "Completed"})
+    thread.join()
+    _wait_for_deletes(sqs, 2)
+
+    assert result["output"] == b"answer"
+    assert sorted(sqs.deleted) == ["handle-1", "handle-2"]
+    assert waiter.stale_notifications == 1
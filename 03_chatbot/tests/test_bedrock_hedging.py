@@ -0,0 +1,40 @@
+import io
+import threading
+import time
+
+from chatbot.helpers.bedrock_hedging import HedgedBedrockClient, RegionLatencies
+
+
+class FakeBedrockRuntime:
+    def __init__(self, answer: bytes, release: threading.Event = None):
+        self.answer = answer
+        self.release = release
+        self.bodies = []
+
+    def invoke_model(self, **kwargs):
+        if self.release is not None:
+            self.release.wait(5)
+        body = io.BytesIO(self.answer)
+        self.bodies.append(body)
+        return {"body": body}
+
+
+def test_losing_invoke_model_body_is_closed():
+    """
+    Tests that the body of an invoke_model response that lost the race is closed.
+    """
+    release = threading.Event()
+    slow = FakeBedrockRuntime(b"slow", release)
+    fast = FakeBedrockRuntime(b"fast")
+    client = HedgedBedrockClient(
+        {"us-east-1": slow, "us-west-2": fast}, default_delay=0.05, latencies=RegionLatencies()
+    )
+
+    response = client.invoke_model(modelId="anthropic.claude-v2", body="{}")
+    release.set()
+    deadline = time.monotonic() + 5
+    while not (slow.bodies and slow.bodies[0].closed) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert response["body"].read() == b"fast"
+    assert slow.bodies[0].closed
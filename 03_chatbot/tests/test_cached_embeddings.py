@@ -0,0 +1,60 @@
+from langchain.schema.embeddings import Embeddings
+
+from chatbot.embeddings.cached_embeddings import CachedEmbeddings, SQLiteEmbeddingStore
+from chatbot.helpers.lru_cache import LRUCache
+from chatbot.helpers.metrics import EVENT_COUNTERS, LATENCY_HISTOGRAM, metric_dimensions
+
+
+class CountingEmbeddings(Embeddings):
+    """Stand-in embedding model that counts its calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def _counts():
+    return {(key[0], key[2]): count for key, count in EVENT_COUNTERS.counts("embedding_cache").items()}
+
+
+def test_hits_and_misses_are_counted_per_tier(tmp_path):
+    """
+    Tests that equivalent queries are embedded once and that every lookup is counted by tier
+    """
+    EVENT_COUNTERS.clear()
+    store = SQLiteEmbeddingStore(str(tmp_path / "embeddings.db"))
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, "titan", memory_cache=LRUCache(max_size=8), disk_store=store)
+
+    assert embeddings.embed_query("What is  Bedrock?") == [17.0, 1.0]
+    assert embeddings.embed_query("What is Bedrock?") == [17.0, 1.0]
+    # A restarted process only has the disk tier
+    restarted = CachedEmbeddings(model, "titan", memory_cache=LRUCache(max_size=8), disk_store=store)
+    assert restarted.embed_query("What is Bedrock?") == [17.0, 1.0]
+
+    assert model.calls == 1
+    assert _counts() == {("embedding_cache_miss", "titan"): 1, ("embedding_cache_hit", "titan"): 2}
+    assert (embeddings.stats()["memory"].hits, store.stats().hits) == (1, 1)
+
+
+def test_embedding_latency_has_the_dimensions_of_the_turn():
+    """
+    Tests that the shared embeddings record their latency with the flow and index of the chat turn
+    """
+    LATENCY_HISTOGRAM.clear()
+    embeddings = CachedEmbeddings(CountingEmbeddings(), "titan", memory_cache=LRUCache(max_size=8), disk_store=None)
+
+    with metric_dimensions(flow="RAG", model="anthropic.claude-v2", index="kendra:docs"):
+        embeddings.embed_query("What is Bedrock?")
+    embeddings.embed_query("What is Kendra?")
+
+    assert sorted(LATENCY_HISTOGRAM.percentiles("embedding")) == [
+        ("embedding", "-", "titan", "-"),
+        ("embedding", "RAG", "titan", "kendra:docs"),
+    ]
@@ -0,0 +1,103 @@
+import threading
+import time
+
+from chatbot.catalog import (
+    CatalogStore,
+    DynamoDBTableMemoryItem,
+    KendraRetrieverItem,
+    MemoryCatalog,
+    ModelCatalog,
+    SageMakerModelItem,
+)
+from chatbot.catalog.catalog_snapshot import CatalogSnapshot
+from chatbot.catalog.resource_discovery import TaggingApiResourceDiscovery, get_resource_discovery
+from chatbot.catalog.retriever_catalog import RetrieverCatalog
+from chatbot.config import AppConfigProvider
+
+REGIONS = ["eu-west-1"]
+
+
+def _catalogs():
+    app_config = AppConfigProvider(None, None, None)
+    memory = MemoryCatalog("123456789012", REGIONS)
+    memory.append(DynamoDBTableMemoryItem(table_name="memory", region="eu-west-1"))
+    retriever = RetrieverCatalog("123456789012", REGIONS, app_config)
+    retriever.append(KendraRetrieverItem("Docs", "index-1", [{"Id": "ds-1", "Status": "ACTIVE"}], "eu-west-1"))
+    model = ModelCatalog(REGIONS, [], app_config.config.llm_config.parameters)
+    model.append(SageMakerModelItem("Model", "endpoint-1", region="eu-west-1"))
+    return {("memory",): memory, ("retriever",): retriever, ("model",): model}
+
+
+def test_snapshot_keeps_real_catalogs(tmp_path):
+    """
+    Tests that the catalogs with the process-wide resource discovery survive a snapshot
+    """
+    catalogs = _catalogs()
+    assert all(isinstance(catalog.discovery, TaggingApiResourceDiscovery) for catalog in catalogs.values())
+    snapshot = CatalogSnapshot(str(tmp_path / "snapshot.pickle"))
+
+    snapshot.save(catalogs)
+    loaded = snapshot.load()
+
+    assert set(loaded) == set(catalogs)
+    for key, catalog in catalogs.items():
+        assert type(loaded[key]) is type(catalog)
+        assert loaded[key].get_friendly_names() == catalog.get_friendly_names()
+        assert loaded[key].discovery is get_resource_discovery()
+
+
+def test_store_loads_snapshot_outside_of_its_lock(tmp_path):
+    """
+    Tests that other lookups of the store do not wait while the snapshot loads
+    """
+    snapshot = CatalogSnapshot(str(tmp_path / "snapshot.pickle"))
+    snapshot.save({("account",): "123456789012"})
+    store = CatalogStore(snapshot=snapshot)
+    locked_while_loading = []
+    load = snapshot.load
+
+    def locked_load():
+        locked_while_loading.append(store._lock.locked())
+        return load()
+
+    snapshot.load = locked_load
+    threads = [
+        threading.Thread(target=store.get_value, args=(("account",), lambda: "live")) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert locked_while_loading == [False]
+    assert store.stats().snapshot_hits == 1
+
+
+def _refresh_and_wait(store, key, loader):
+    store.invalidate(lambda cached_key: cached_key == key)
+    refreshes = store.stats().refreshes
+    store.get_value(key, loader)
+    while store.stats().refreshes == refreshes:
+        time.sleep(0.01)
+    return store.get_value(key, loader)
+
+
+def test_refresh_keeps_an_unchanged_catalog():
+    """
+    Tests that a refresh that finds the same catalog keeps the current one, so that sessions keep their views
+    """
+    store = CatalogStore()
+    catalog = store.get_value(("retriever",), lambda: _catalogs()[("retriever",)])
+
+    refreshed = _refresh_and_wait(store, ("retriever",), lambda: _catalogs()[("retriever",)])
+    assert refreshed is catalog
+    assert store.stats().unchanged_refreshes == 1
+
+    def changed():
+        retriever = _catalogs()[("retriever",)]
+        retriever.append(KendraRetrieverItem("New docs", "index-2", [], "eu-west-1"))
+        return retriever
+
+    refreshed = _refresh_and_wait(store, ("retriever",), changed)
+    assert refreshed is not catalog
+    assert refreshed.get_friendly_names() == ["Docs", "New docs"]
@@ -0,0 +1,35 @@
+import uuid
+
+from chatbot.catalog import SageMakerModelItem
+from chatbot.helpers.logger.latency_handler import LatencyCallbackHandler
+from chatbot.helpers.metrics import LATENCY_HISTOGRAM, metric_dimensions
+from chatbot.ui.chatbot_app import _metric_dimensions
+from chatbot.ui.sidebar import SidebarObj
+
+
+class FakeFlow:
+    friendly_name = "Chat"
+
+    def enable_retriever(self) -> bool:
+        return False
+
+
+def test_turn_with_sagemaker_model():
+    """
+    Tests that a turn with a SageMaker model records its latency with the endpoint name as model.
+    """
+    LATENCY_HISTOGRAM.clear()
+    sidebar = SidebarObj()
+    sidebar.init()
+    sidebar.flow = FakeFlow()
+    sidebar.model = SageMakerModelItem("Model", "endpoint-1", region="eu-west-1")
+
+    dimensions = _metric_dimensions(sidebar)
+    latency_handler = LatencyCallbackHandler(**dimensions)
+    run_id = uuid.uuid4()
+    with metric_dimensions(**dimensions):
+        latency_handler.on_chain_start({}, {"question": "Hello"}, run_id=run_id)
+        latency_handler.on_chain_end({"answer": "Hi"}, run_id=run_id)
+
+    assert dimensions == {"flow": "Chat", "model": "endpoint-1", "index": ""}
+    assert list(LATENCY_HISTOGRAM.percentiles("turn")) == [("turn", "Chat", "endpoint-1", "-")]
@@ -0,0 +1,103 @@
+import time
+
+from langchain.llms.fake import FakeListLLM
+from langchain.memory import ChatMessageHistory
+from langchain.schema import BaseChatMessageHistory
+
+from chatbot.helpers import conversation_memory
+from chatbot.helpers.context_packer import TokenCounter
+from chatbot.helpers.conversation_memory import (
+    ConversationSummary,
+    TokenBudgetSummaryMemory,
+    can_keep_summary,
+    keyed_messages,
+    load_summary,
+)
+
+
+class WordCounter(TokenCounter):
+    """Stand-in token counter that counts words."""
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+class RecordingLLM(FakeListLLM):
+    """Fake LLM that records its prompts."""
+
+    prompts: list = []
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(prompt)
+        return super()._call(prompt, stop, run_manager, **kwargs)
+
+
+class ListHistory(BaseChatMessageHistory):
+    """Chat history without session id that keeps all messages in a list."""
+
+    def __init__(self):
+        self._messages = []
+
+    @property
+    def messages(self):
+        return list(self._messages)
+
+    def add_message(self, message):
+        self._messages.append(message)
+
+    def clear(self):
+        self._messages = []
+
+
+def _memory(history, llm):
+    return TokenBudgetSummaryMemory(
+        llm=llm,
+        token_counter=WordCounter(llm),
+        chat_memory=history,
+        max_tokens=1000,
+        max_messages=2,
+        return_messages=True,
+    )
+
+
+def _wait_for_folds():
+    while conversation_memory._folding:
+        time.sleep(0.01)
+
+
+def test_identical_messages_are_folded():
+    """
+    Tests that messages with the same content as already summarized ones are still folded into the summary
+    """
+    history = ListHistory()
+    llm = RecordingLLM(responses=["First summary", "Second summary"], prompts=[])
+    memory = _memory(history, llm)
+
+    for _ in range(3):
+        memory.save_context({"input": "Yes"}, {"output": "OK"})
+        _wait_for_folds()
+
+    assert keyed_messages(history)[1] == [0, 1, 2, 3, 4, 5]
+    assert load_summary(history) == ConversationSummary("Second summary", 3)
+    assert len(llm.prompts) == 2
+    assert "First summary" in llm.prompts[1] and "Human: Yes\nAI: OK" in llm.prompts[1]
+
+
+def test_history_that_cannot_keep_a_summary_is_not_summarized():
+    """
+    Tests that a chat history that cannot keep a summary passes the recent messages without summary calls
+    """
+    history = ChatMessageHistory()
+    llm = RecordingLLM(responses=["Summary"], prompts=[])
+    memory = _memory(history, llm)
+
+    for turn in range(3):
+        memory.save_context({"input": f"Question {turn}"}, {"output": f"Answer {turn}"})
+        _wait_for_folds()
+
+    assert not can_keep_summary(history)
+    assert llm.prompts == []
+    assert [message.content for message in memory.load_memory_variables({})["history"]] == [
+        "Question 2",
+        "Answer 2",
+    ]
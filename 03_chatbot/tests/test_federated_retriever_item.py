@@ -0,0 +1,74 @@
+from typing import List
+
+import pytest
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever, Document
+
+from chatbot.catalog.retriever_catalog_item_federated import FederatedRetrieverItem
+from chatbot.helpers.metrics import EVENT_COUNTERS
+
+
+class StaticRetriever(BaseRetriever):
+    """Stand-in retriever that returns one document."""
+
+    source: str
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [Document(page_content=f"Passage from {self.source}", metadata={"source": self.source})]
+
+
+class FakeSourceItem:
+    """Stand-in of a Kendra retriever catalog item whose retriever can fail to be created."""
+
+    def __init__(self, friendly_name: str, error: Exception = None):
+        self.friendly_name = friendly_name
+        self.region = "eu-west-1"
+        self.error = error
+        self.top_k = 3
+        self.current_filter = []
+
+    @property
+    def available_filter_options(self):
+        return [(self.friendly_name, self.friendly_name)]
+
+    def get_instance(self) -> BaseRetriever:
+        if self.error is not None:
+            raise self.error
+        return StaticRetriever(source=f"https://{self.friendly_name}.example.com")
+
+
+def test_sources_that_fail_are_left_out():
+    """
+    Tests that a source whose retriever cannot be created is logged, counted and left out
+    """
+    EVENT_COUNTERS.clear()
+    item = FederatedRetrieverItem(
+        "All knowledge bases",
+        [FakeSourceItem("kendra"), FakeSourceItem("unreachable", ConnectionError("Domain unreachable"))],
+    )
+
+    retriever = item.get_instance()
+
+    assert list(retriever.retrievers) == ["kendra"]
+    assert [document.page_content for document in retriever.get_relevant_documents("question")] == [
+        "Passage from https://kendra.example.com"
+    ]
+    counts = EVENT_COUNTERS.counts("federated_retrieval_source_error")
+    assert [(key[0], key[3], count) for key, count in counts.items()] == [
+        ("federated_retrieval_source_error", "unreachable", 1)
+    ]
+
+
+def test_raises_when_no_source_can_be_created():
+    """
+    Tests that the first error is raised when the retriever of no source can be created
+    """
+    item = FederatedRetrieverItem(
+        "All knowledge bases",
+        [FakeSourceItem("first", ConnectionError("First unreachable")), FakeSourceItem("second", ValueError())],
+    )
+
+    with pytest.raises(ConnectionError, match="First unreachable"):
+        item.get_instance()
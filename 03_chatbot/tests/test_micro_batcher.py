@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+
+import pytest
+
+from chatbot.helpers.micro_batcher import MicroBatcher
+from chatbot.helpers.sagemaker_async_endpoint import _invoke_batch
+
+
+def test_items_of_a_window_are_dispatched_together():
+    """
+    Tests that items that arrive for the same key within the window form one batch
+    """
+    batches = []
+    batcher = MicroBatcher(lambda key, items: batches.append((key, list(items))) or items, max_wait=0.1)
+
+    futures = [batcher.submit("endpoint", prompt) for prompt in ["a", "b", "c"]]
+
+    assert [future.result(timeout=1) for future in futures] == ["a", "b", "c"]
+    assert batches == [("endpoint", ["a", "b", "c"])]
+    assert (batcher.batches, batcher.items) == (1, 3)
+
+
+def test_keys_are_never_batched_together():
+    """
+    Tests that items with different keys, e.g. model parameters, go into their own batches
+    """
+    batches = []
+    batcher = MicroBatcher(lambda key, items: batches.append((key, list(items))) or items, max_wait=0.05)
+
+    first = batcher.submit(("endpoint", 0.1), "a")
+    second = batcher.submit(("endpoint", 0.9), "b")
+
+    assert (first.result(timeout=1), second.result(timeout=1)) == ("a", "b")
+    assert sorted(batches) == [(("endpoint", 0.1), ["a"]), (("endpoint", 0.9), ["b"])]
+
+
+def test_full_batch_is_dispatched_without_waiting():
+    """
+    Tests that a full batch is dispatched at once and later items open the next batch
+    """
+    batches = []
+    batcher = MicroBatcher(
+        lambda key, items: batches.append(list(items)) or items, max_batch_size=2, max_wait=1
+    )
+    start = time.monotonic()
+
+    futures = [batcher.submit("endpoint", prompt) for prompt in ["a", "b"]]
+    assert [future.result(timeout=1) for future in futures] == ["a", "b"]
+    assert time.monotonic() - start < 0.5
+
+    assert batcher.submit("endpoint", "c").result(timeout=2) == "c"
+    assert batches == [["a", "b"], ["c"]]
+
+
+def test_failed_dispatch_fails_every_item():
+    """
+    Tests that an error of the batch, or a wrong number of results, fails all items of the batch
+    """
+    def dispatch(key, items):
+        if key == "error":
+            raise RuntimeError("Endpoint failed")
+        return items[:1]
+
+    batcher = MicroBatcher(dispatch, max_wait=0.05)
+
+    failed = [batcher.submit("error", prompt) for prompt in ["a", "b"]]
+    short = [batcher.submit("short", prompt) for prompt in ["a", "b"]]
+
+    for future in failed:
+        with pytest.raises(RuntimeError, match="Endpoint failed"):
+            future.result(timeout=1)
+    for future in short:
+        with pytest.raises(ValueError):
+            future.result(timeout=1)
+
+
+class ContentHandler:
+    """Content handler of a Hugging Face text generation endpoint."""
+
+    content_type = "application/json"
+    accepts = "application/json"
+
+    def transform_input(self, prompt, model_kwargs):
+        return json.dumps({"inputs": prompt, "parameters": model_kwargs}).encode("utf-8")
+
+    def transform_output(self, output):
+        return json.loads(output.read().decode("utf-8"))[0]["generated_text"]
+
+
+class FakeAsyncEndpoint:
+    """Stand-in of SagemakerAsyncEndpoint that answers every input of a request."""
+
+    content_handler = ContentHandler()
+
+    def __init__(self, single_generation=False):
+        self.requests = []
+        self.single_generation = single_generation
+        self._lock = threading.Lock()
+
+    def _invoke(self, body):
+        request = json.loads(body)
+        with self._lock:
+            self.requests.append(request)
+        if isinstance(request["inputs"], str):
+            return json.dumps([{"generated_text": f"answer to {request['inputs']}"}]).encode("utf-8")
+        outputs = [[{"generated_text": f"answer to {prompt}"}] for prompt in request["inputs"]]
+        if self.single_generation:
+            outputs = [output[0] for output in outputs]
+        return json.dumps(outputs).encode("utf-8")
+
+
+@pytest.mark.parametrize("single_generation", [False, True])
+def test_invoke_batch_splits_the_outputs_of_one_request(single_generation):
+    """
+    Tests that the prompts of a batch are sent as one request and its outputs are returned in order
+    """
+    endpoint = FakeAsyncEndpoint(single_generation)
+    items = [(endpoint, prompt, {"temperature": 0.1}) for prompt in ["first", "second", "third"]]
+
+    answers = _invoke_batch("key", items)
+
+    assert answers == ["answer to first", "answer to second", "answer to third"]
+    assert endpoint.requests == [{"inputs": ["first", "second", "third"], "parameters": {"temperature": 0.1}}]
+
+
+def test_invoke_batch_sends_a_single_prompt_unchanged():
+    """
+    Tests that a batch of one prompt is sent like without batching
+    """
+    endpoint = FakeAsyncEndpoint()
+
+    assert _invoke_batch("key", [(endpoint, "only", {})]) == ["answer to only"]
+    assert endpoint.requests == [{"inputs": "only", "parameters": {}}]
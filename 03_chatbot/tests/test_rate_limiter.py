@@ -0,0 +1,224 @@
+import json
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from chatbot.helpers.rate_limiter import (
+    RateLimitedBedrockClient,
+    RateLimiter,
+    RateLimitExceeded,
+    estimate_tokens,
+    find_rate_limit_exceeded,
+)
+
+BODY = json.dumps({"inputText": "question", "textGenerationConfig": {"maxTokenCount": 256}})
+
+
+def _queue(limiter, owner, served, lock):
+    def acquire():
+        limiter.acquire(1, owner=owner)
+        with lock:
+            served.append(owner)
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    # Wait until the request is queued, so that the queue order is deterministic
+    while not any(waiter.owner == owner for queue in limiter._queues.values() for waiter in queue):
+        time.sleep(0.001)
+    return thread
+
+
+def test_owners_are_served_in_turn():
+    """
+    Tests that a session with many waiting requests does not hold back another session
+    """
+    # One request every 100 ms, so that all requests are queued before the first is served
+    limiter = RateLimiter("model/region", requests_per_minute=600, max_queue=10)
+    limiter.requests.level = 0
+    served, lock = [], threading.Lock()
+    threads = []
+    for owner in ["A", "A", "A", "B"]:
+        threads.append(_queue(limiter, owner, served, lock))
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+
+    assert served == ["A", "B", "A", "A"]
+
+
+def test_settle_corrects_the_reserved_tokens_once():
+    """
+    Tests that the tokens of a request are corrected by the used tokens, but only once
+    """
+    limiter = RateLimiter("model/region", tokens_per_minute=1000)
+    reservation = limiter.acquire(300)
+    assert limiter.tokens.level == pytest.approx(700, abs=1)
+
+    limiter.settle(reservation, 100)
+    assert limiter.tokens.level == pytest.approx(900, abs=1)
+
+    limiter.settle(reservation, 0)
+    assert limiter.tokens.level == pytest.approx(900, abs=1)
+
+
+def test_rejects_when_the_queue_is_full():
+    """
+    Tests that a request is rejected at once when max_queue requests wait
+    """
+    limiter = RateLimiter("model/region", requests_per_minute=600, max_queue=1)
+    limiter.requests.level = 0
+    waiting = _queue(limiter, "A", [], threading.Lock())
+
+    start = time.monotonic()
+    with pytest.raises(RateLimitExceeded) as error:
+        limiter.acquire(1, owner="B")
+    assert time.monotonic() - start < 0.05
+    assert error.value.retry_after > 0
+    assert limiter.rejections == 1
+    waiting.join()
+
+
+def test_rejects_when_the_wait_is_too_long():
+    """
+    Tests that a request is rejected with the expected wait when it exceeds max_wait
+    """
+    limiter = RateLimiter("model/region", requests_per_minute=60, max_wait=0.5)
+    limiter.requests.level = 0
+
+    with pytest.raises(RateLimitExceeded) as error:
+        limiter.acquire(1)
+    assert error.value.retry_after == pytest.approx(1, abs=0.1)
+
+
+def test_does_not_reject_requests_that_need_not_wait():
+    """
+    Tests that a full budget sends requests right away, even with max_queue 0
+    """
+    limiter = RateLimiter("model/region", requests_per_minute=60, max_queue=0)
+
+    assert limiter.acquire(1).waited < 0.05
+
+
+class FakeBedrockRuntime:
+    """Stand-in of the bedrock-runtime client."""
+
+    def __init__(self, error=None, events=()):
+        self.error = error
+        self.events = list(events)
+        self.closed = False
+
+    def invoke_model(self, **kwargs):
+        if self.error:
+            raise self.error
+        headers = {"x-amzn-bedrock-input-token-count": "10", "x-amzn-bedrock-output-token-count": "20"}
+        return {"body": None, "ResponseMetadata": {"HTTPHeaders": headers}}
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        if self.error:
+            raise self.error
+        fake = self
+
+        class Stream:
+            def __iter__(self):
+                return iter(fake.events)
+
+            def close(self):
+                fake.closed = True
+
+        return {"body": Stream()}
+
+
+def _chunk(data: dict) -> dict:
+    return {"chunk": {"bytes": json.dumps(data).encode("utf-8")}}
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        ClientError({"Error": {"Code": "ValidationException", "Message": "Bad request"}}, "InvokeModel"),
+        ConnectionError("Connection reset"),
+    ],
+)
+def test_failed_request_returns_its_tokens(error):
+    """
+    Tests that a request that failed without throttling returns its reserved tokens
+    """
+    limiter = RateLimiter("model/region", tokens_per_minute=10000)
+    client = RateLimitedBedrockClient(FakeBedrockRuntime(error=error), limiter)
+
+    with pytest.raises(type(error)):
+        client.invoke_model(body=BODY, modelId="amazon.titan-text-express-v1")
+    assert limiter.tokens.level == pytest.approx(10000, abs=1)
+
+
+def test_request_settles_with_the_reported_tokens():
+    """
+    Tests that the token counts of the response headers settle the reservation
+    """
+    limiter = RateLimiter("model/region", tokens_per_minute=10000)
+    client = RateLimitedBedrockClient(FakeBedrockRuntime(), limiter)
+
+    client.invoke_model(body=BODY, modelId="amazon.titan-text-express-v1")
+    assert estimate_tokens(BODY) > 30
+    assert limiter.tokens.level == pytest.approx(10000 - 30, abs=1)
+
+
+def test_stream_settles_with_the_invocation_metrics():
+    """
+    Tests that the invocation metrics of the last chunk settle the reservation
+    """
+    limiter = RateLimiter("model/region", tokens_per_minute=10000)
+    service = FakeBedrockRuntime(
+        events=[
+            _chunk({"outputText": "answer"}),
+            _chunk({"amazon-bedrock-invocationMetrics": {"inputTokenCount": 10, "outputTokenCount": 20}}),
+        ]
+    )
+    client = RateLimitedBedrockClient(service, limiter)
+
+    response = client.invoke_model_with_response_stream(body=BODY, modelId="amazon.titan-text-express-v1")
+    assert len(list(response["body"])) == 2
+    assert limiter.tokens.level == pytest.approx(10000 - 30, abs=1)
+    assert service.closed
+
+
+def test_stream_closed_early_returns_its_tokens():
+    """
+    Tests that a stream that is closed before its last chunk, e.g. of a hedged request that lost,
+    returns its reserved tokens
+    """
+    limiter = RateLimiter("model/region", tokens_per_minute=10000)
+    service = FakeBedrockRuntime(events=[_chunk({"outputText": "answer"}), _chunk({"outputText": "more"})])
+    client = RateLimitedBedrockClient(service, limiter)
+
+    response = client.invoke_model_with_response_stream(body=BODY, modelId="amazon.titan-text-express-v1")
+    events = response["body"]
+    next(events)
+    events.close()
+    assert limiter.tokens.level == pytest.approx(10000, abs=1)
+    assert service.closed
+
+
+@pytest.mark.parametrize("max_attempts", [1, 3])
+def test_throttling_is_raised_after_the_last_attempt(max_attempts):
+    """
+    Tests that a request that is throttled on every attempt raises the throttling error and returns its tokens
+    """
+    limiter = RateLimiter("model/region", tokens_per_minute=10000)
+    service = FakeBedrockRuntime(
+        error=ClientError({"Error": {"Code": "ThrottlingException", "Message": "Slow down"}}, "InvokeModel")
+    )
+    calls = []
+    invoke_model = service.invoke_model
+    service.invoke_model = lambda **kwargs: calls.append(kwargs) or invoke_model(**kwargs)
+    # Throttling empties the budget, the next attempt must not wait for the refill
+    limiter.throttled = lambda: None
+    client = RateLimitedBedrockClient(service, limiter, max_attempts=max_attempts)
+
+    with pytest.raises(ClientError) as error:
+        client.invoke_model(body=BODY, modelId="amazon.titan-text-express-v1")
+    assert len(calls) == max_attempts
+    assert limiter.tokens.level == pytest.approx(10000, abs=1)
+    assert find_rate_limit_exceeded(error.value).retry_after > 0
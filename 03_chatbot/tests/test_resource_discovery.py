@@ -0,0 +1,157 @@
+import json
+
+import pytest
+
+from chatbot.catalog import CatalogStore, resource_discovery
+from chatbot.catalog.resource_discovery import (
+    LocalResourceDiscovery,
+    TaggedResource,
+    TaggingApiResourceDiscovery,
+)
+
+FRIENDLY_NAME = "genie:friendly-name"
+MEMORY_TABLE = "genie:memory-table"
+
+
+@pytest.mark.parametrize(
+    "arn, resource_type, resource_id",
+    [
+        ("arn:aws:sagemaker:eu-west-1:123456789012:endpoint/falcon-40b", "sagemaker:endpoint", "falcon-40b"),
+        ("arn:aws:kendra:eu-west-1:123456789012:index/0123-abcd", "kendra:index", "0123-abcd"),
+        ("arn:aws:es:eu-west-1:123456789012:domain/genie", "es:domain", "genie"),
+        ("arn:aws:dynamodb:eu-west-1:123456789012:table/memory", "dynamodb:table", "memory"),
+    ],
+)
+def test_tagged_resource_parses_arn(arn, resource_type, resource_id):
+    """
+    Tests the resource type and id of the ARNs of the discovered services
+    """
+    resource = TaggedResource(arn)
+
+    assert (resource.region, resource.resource_type, resource.resource_id) == ("eu-west-1", resource_type, resource_id)
+
+
+class FakeTaggingApi:
+    """Stand-in of the Resource Groups Tagging API client with paginated resources."""
+
+    def __init__(self, resources, page_size=2):
+        self.resources = resources
+        self.page_size = page_size
+        self.queries = []
+
+    def client(self, service, region, config=None):
+        assert service == "resourcegroupstaggingapi"
+        self.region = region
+        return self
+
+    def get_paginator(self, operation):
+        assert operation == "get_resources"
+        return self
+
+    def paginate(self, TagFilters, ResourcesPerPage):
+        tag_key = TagFilters[0]["Key"]
+        self.queries.append((self.region, tag_key))
+        mappings = [
+            {"ResourceARN": arn, "Tags": [{"Key": key, "Value": value} for key, value in tags.items()]}
+            for arn, tags in self.resources
+            if arn.split(":")[3] == self.region and tag_key in tags
+        ]
+        for index in range(0, len(mappings), self.page_size):
+            yield {"ResourceTagMappingList": mappings[index : index + self.page_size]}
+
+
+@pytest.fixture
+def tagging_api(monkeypatch):
+    api = FakeTaggingApi(
+        [
+            ("arn:aws:sagemaker:eu-west-1:123456789012:endpoint/falcon-40b", {FRIENDLY_NAME: "Falcon"}),
+            ("arn:aws:sagemaker:eu-west-1:123456789012:endpoint/llama", {FRIENDLY_NAME: "Llama"}),
+            ("arn:aws:kendra:eu-west-1:123456789012:index/0123-abcd", {FRIENDLY_NAME: "Docs"}),
+            ("arn:aws:kendra:us-east-1:123456789012:index/4567-efgh", {FRIENDLY_NAME: "US docs"}),
+            ("arn:aws:dynamodb:eu-west-1:123456789012:table/memory", {MEMORY_TABLE: "True"}),
+        ]
+    )
+    monkeypatch.setattr(resource_discovery.boto3, "Session", lambda: api)
+    return api
+
+
+def test_one_query_answers_all_services(tagging_api):
+    """
+    Tests that the catalogs of all services share the paginated query of a region and tag key
+    """
+    discovery = TaggingApiResourceDiscovery()
+
+    endpoints = discovery.get_resources("eu-west-1", FRIENDLY_NAME, "sagemaker:endpoint")
+    indices = discovery.get_resources("eu-west-1", FRIENDLY_NAME, "kendra:index")
+
+    assert [(resource.resource_id, resource.tags) for resource in endpoints] == [
+        ("falcon-40b", {FRIENDLY_NAME: "Falcon"}),
+        ("llama", {FRIENDLY_NAME: "Llama"}),
+    ]
+    assert [resource.resource_id for resource in indices] == ["0123-abcd"]
+    assert tagging_api.queries == [("eu-west-1", FRIENDLY_NAME)]
+    assert discovery.pages == 2
+
+
+def test_queries_expire(tagging_api):
+    """
+    Tests that resources are queried again after the time to live
+    """
+    discovery = TaggingApiResourceDiscovery(ttl_seconds=0)
+
+    discovery.get_resources("eu-west-1", MEMORY_TABLE, "dynamodb:table")
+    discovery.get_resources("eu-west-1", MEMORY_TABLE, "dynamodb:table")
+
+    assert tagging_api.queries == [("eu-west-1", MEMORY_TABLE)] * 2
+
+
+def test_invalidate_finds_new_resources(tagging_api):
+    """
+    Tests that invalidating the discovery finds resources that were tagged after the last query
+    """
+    discovery = TaggingApiResourceDiscovery()
+    assert discovery.get_resources("us-east-1", MEMORY_TABLE, "dynamodb:table") == []
+    tagging_api.resources.append(("arn:aws:dynamodb:us-east-1:123456789012:table/memory", {MEMORY_TABLE: "True"}))
+    assert discovery.get_resources("us-east-1", MEMORY_TABLE, "dynamodb:table") == []
+
+    assert discovery.invalidate() == 1
+    tables = discovery.get_resources("us-east-1", MEMORY_TABLE, "dynamodb:table")
+
+    assert [table.resource_id for table in tables] == ["memory"]
+
+
+def test_invalidating_the_catalogs_invalidates_the_discovery(tagging_api, monkeypatch):
+    """
+    Tests that catalogs that refresh after an invalidation do not get the cached tag queries
+    """
+    discovery = TaggingApiResourceDiscovery()
+    monkeypatch.setattr(resource_discovery, "_resource_discovery", discovery)
+    discovery.get_resources("eu-west-1", FRIENDLY_NAME, "kendra:index")
+
+    CatalogStore().invalidate()
+    discovery.get_resources("eu-west-1", FRIENDLY_NAME, "kendra:index")
+
+    assert tagging_api.queries == [("eu-west-1", FRIENDLY_NAME)] * 2
+
+
+def test_local_discovery_reads_resources_from_file(tmp_path):
+    """
+    Tests that the local discovery finds the resources of a file by region, tag key and type
+    """
+    path = tmp_path / "resources.json"
+    path.write_text(
+        json.dumps(
+            [
+                {"arn": "arn:aws:dynamodb:eu-west-1:123456789012:table/memory", "tags": {MEMORY_TABLE: "True"}},
+                {"arn": "arn:aws:dynamodb:us-east-1:123456789012:table/other", "tags": {MEMORY_TABLE: "True"}},
+                {"arn": "arn:aws:dynamodb:eu-west-1:123456789012:table/untagged"},
+            ]
+        )
+    )
+    discovery = LocalResourceDiscovery.from_file(str(path))
+
+    tables = discovery.get_resources("eu-west-1", MEMORY_TABLE, "dynamodb:table")
+
+    assert [table.resource_id for table in tables] == ["memory"]
+    assert discovery.get_resources("eu-west-1", MEMORY_TABLE, "sagemaker:endpoint") == []
+    assert discovery.invalidate() == 0
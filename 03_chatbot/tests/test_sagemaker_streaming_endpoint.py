@@ -0,0 +1,131 @@
+import json
+
+import pytest
+from langchain.llms.sagemaker_endpoint import LLMContentHandler
+
+from chatbot.helpers.sagemaker_streaming_endpoint import (
+    SagemakerStreamingEndpoint,
+    StopWordFilter,
+    TGIStreamParser,
+)
+
+
+def _event(text: str, special: bool = False) -> bytes:
+    token = {"id": 1, "text": text, "special": special}
+    return b"data:" + json.dumps({"token": token, "generated_text": None}).encode("utf-8") + b"\n\n"
+
+
+def _split(data: bytes, size: int):
+    return [data[index : index + size] for index in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("part_size", [1, 3, 7, 64, 10_000])
+def test_parser_joins_events_across_payload_parts(part_size):
+    """
+    Tests that events split at any byte, also within UTF-8 characters, are parsed once complete
+    """
+    stream = b"".join(_event(text) for text in ["Grüezi", " from", " Zürich", " 🏔"])
+    parser = TGIStreamParser()
+
+    texts = [text for part in _split(stream, part_size) for text in parser.feed(part)] + parser.close()
+
+    assert texts == ["Grüezi", " from", " Zürich", " 🏔"]
+
+
+def test_parser_skips_special_tokens_and_other_fields():
+    """
+    Tests that special tokens, comments and empty lines yield no text
+    """
+    parser = TGIStreamParser()
+
+    texts = parser.feed(b": keep-alive\n\n" + _event("Bern") + _event("<|endoftext|>", special=True))
+
+    assert texts == ["Bern"]
+
+
+def test_parser_returns_last_event_without_new_line():
+    """
+    Tests that an event at the end of the stream without new line is returned on close
+    """
+    parser = TGIStreamParser()
+
+    assert parser.feed(_event("Bern").rstrip(b"\n")) == []
+    assert parser.close() == ["Bern"]
+
+
+def test_stop_word_filter_holds_back_possible_stop_words():
+    """
+    Tests that text that could start a stop word is held back until the next token decides
+    """
+    stop_word_filter = StopWordFilter(["\nUser:"])
+
+    assert stop_word_filter.push("The capital\n") == "The capital"
+    assert stop_word_filter.push("is Bern.\nUs") == "\nis Bern."
+    assert stop_word_filter.push("er: next") == ""
+    assert stop_word_filter.stopped
+    assert stop_word_filter.flush() == ""
+
+
+def test_stop_word_filter_flushes_held_back_text():
+    """
+    Tests that held back text is passed on when the stream ends without the stop word
+    """
+    stop_word_filter = StopWordFilter(["\nUser:"])
+
+    assert stop_word_filter.push("Bern\nU") == "Bern"
+    assert stop_word_filter.flush() == "\nU"
+
+
+class ContentHandler(LLMContentHandler):
+    content_type = "application/json"
+    accepts = "application/json"
+
+    def transform_input(self, prompt, model_kwargs):
+        return json.dumps({"inputs": prompt, "parameters": model_kwargs}).encode("utf-8")
+
+    def transform_output(self, output):
+        return json.loads(output.read().decode("utf-8"))[0]["generated_text"]
+
+
+class FakeSageMakerRuntime:
+    """Stand-in of the sagemaker-runtime client that streams payload parts."""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.body = None
+        self.closed = False
+
+    def invoke_endpoint_with_response_stream(self, EndpointName, Body, ContentType):
+        self.body = json.loads(Body)
+        fake = self
+
+        class Stream:
+            def __iter__(self):
+                return iter({"PayloadPart": {"Bytes": part}} for part in fake.parts)
+
+            def close(self):
+                fake.closed = True
+
+        return {"Body": Stream()}
+
+
+def test_endpoint_streams_tokens_until_the_stop_word():
+    """
+    Tests that the endpoint requests a stream, reports every token and stops at a stop word
+    """
+    stream = b"".join(_event(text) for text in ["Bern", " is", " the", " capital", "\nUs", "er:", " more"])
+    client = FakeSageMakerRuntime(_split(stream, 5))
+    llm = SagemakerStreamingEndpoint(
+        endpoint_name="falcon-40b",
+        region_name="eu-west-1",
+        content_handler=ContentHandler(),
+        client=client,
+        streaming=True,
+    )
+
+    chunks = [chunk.text for chunk in llm._stream("Capital of Switzerland?", stop=["\nUser:"])]
+
+    assert "".join(chunks) == "Bern is the capital"
+    assert chunks[0] == "Bern"
+    assert client.body["stream"] is True
+    assert client.closed
@@ -0,0 +1,142 @@
+import threading
+import time
+from typing import List
+
+import pytest
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.llms.fake import FakeListLLM
+from langchain.schema import BaseRetriever, Document
+from langchain.schema.embeddings import Embeddings
+
+from chatbot.helpers import speculative_retrieval as speculative_retrieval_module
+from chatbot.helpers.conversational_retrieval_chain import GenieConversationalRetrievalChain
+from chatbot.helpers.logger import latency_handler
+from chatbot.helpers.logger.latency_handler import LatencyCallbackHandler
+from chatbot.helpers.speculative_retrieval import (
+    SPECULATION_HIT,
+    SPECULATION_MISS,
+    SpeculativeRetrieval,
+)
+
+QUESTION = "What does the vignette cost?"
+SIMILAR = "What does the digital vignette cost?"
+REWRITTEN = "Which documents does the asylum procedure require?"
+
+
+class WordEmbeddings(Embeddings):
+    """Stand-in of an embedding model with one dimension per word of a small vocabulary."""
+
+    VOCABULARY = ["what", "does", "the", "vignette", "cost", "digital", "asylum", "procedure"]
+
+    def __init__(self, seconds: float = 0):
+        self.seconds = seconds
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.seconds)
+        words = text.lower().replace("?", "").split()
+        return [float(words.count(word)) for word in self.VOCABULARY]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+class SlowRetriever(BaseRetriever):
+    """Stand-in retriever that sleeps like a search and records its queries."""
+
+    seconds: float = 0
+    queries: List[str] = []
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        self.queries.append(query)
+        time.sleep(self.seconds)
+        return [Document(page_content=f"Passage about {query}")]
+
+
+def _retrieve(retriever):
+    return lambda question: retriever.get_relevant_documents(question)
+
+
+def test_hit_reuses_the_documents_of_the_raw_question():
+    """
+    Tests that a similar condensed question gets the documents of the raw question without a search
+    """
+    retriever = SlowRetriever(queries=[])
+    speculative_retrieval = SpeculativeRetrieval(WordEmbeddings(), similarity_threshold=0.8)
+
+    speculation = speculative_retrieval.start(QUESTION, _retrieve(retriever))
+    outcome = speculative_retrieval.resolve(speculation, SIMILAR, _retrieve(retriever))
+
+    assert outcome.outcome == SPECULATION_HIT
+    assert [document.page_content for document in outcome.documents] == [f"Passage about {QUESTION}"]
+    assert outcome.embedding == WordEmbeddings().embed_query(SIMILAR)
+
+
+def test_miss_retrieves_while_the_condensed_question_is_embedded():
+    """
+    Tests that the documents of a miss are retrieved together with the embedding of the condensed question
+    """
+    retriever = SlowRetriever(seconds=0.2, queries=[])
+    speculative_retrieval = SpeculativeRetrieval(WordEmbeddings(seconds=0.2), similarity_threshold=0.8)
+    speculation = speculative_retrieval.start(QUESTION, _retrieve(retriever))
+    speculation.embedding.result()
+    speculation.documents.result()
+
+    start = time.monotonic()
+    outcome = speculative_retrieval.resolve(speculation, REWRITTEN, _retrieve(retriever))
+
+    assert outcome.outcome == SPECULATION_MISS
+    assert [document.page_content for document in outcome.documents] == [f"Passage about {REWRITTEN}"]
+    assert time.monotonic() - start < 0.35
+    assert retriever.queries == [QUESTION, REWRITTEN]
+
+
+def test_miss_without_retrieve_leaves_the_retrieval_to_the_caller():
+    """
+    Tests that a miss without retrieve returns no documents
+    """
+    speculative_retrieval = SpeculativeRetrieval(WordEmbeddings(), similarity_threshold=0.8)
+    speculation = speculative_retrieval.start(QUESTION, _retrieve(SlowRetriever(queries=[])))
+
+    outcome = speculative_retrieval.resolve(speculation, REWRITTEN)
+
+    assert outcome.outcome == SPECULATION_MISS
+    assert outcome.documents is None
+
+
+@pytest.fixture
+def recorded_latencies(monkeypatch):
+    latencies = []
+    lock = threading.Lock()
+
+    def record_latency(stage, milliseconds, **properties):
+        with lock:
+            latencies.append((stage, properties))
+
+    monkeypatch.setattr(latency_handler, "record_latency", record_latency)
+    monkeypatch.setattr(speculative_retrieval_module, "record_latency", lambda *args, **kwargs: None)
+    return latencies
+
+
+def test_speculative_hit_reports_the_retrieval_to_the_callbacks(recorded_latencies):
+    """
+    Tests that the retrieval of a speculative hit is recorded by the callbacks of the chat turn
+    """
+    retriever = SlowRetriever(queries=[])
+    chain = GenieConversationalRetrievalChain.from_llm(
+        FakeListLLM(responses=[SIMILAR, "It costs 40 francs."]),
+        retriever=retriever,
+        return_source_documents=True,
+        speculative_retrieval=SpeculativeRetrieval(WordEmbeddings(), similarity_threshold=0.8),
+    )
+
+    result = chain(
+        {"question": QUESTION, "chat_history": [("Do I need a vignette?", "Yes.")]},
+        callbacks=[LatencyCallbackHandler(flow="rag")],
+    )
+
+    assert result["answer"] == "It costs 40 francs."
+    assert result["source_documents"][0].page_content == f"Passage about {QUESTION}"
+    retrievals = [properties for stage, properties in recorded_latencies if stage == "retrieval"]
+    assert {"flow": "rag", "model": "", "index": "", "Documents": 1, "Speculative": True} in retrievals
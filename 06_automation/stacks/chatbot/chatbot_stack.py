@@ -207,6 +207,14 @@ class ChatbotStack(GenAiStack):
                 resources=["*"],
             )
         )
+        # The chatbot discovers its genie:* tagged resources with the Resource Groups Tagging API
+        core.role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["tag:GetResources"],
+                resources=["*"],
+            )
+        )
         core.role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
@@ -251,7 +259,7 @@ class ChatbotStack(GenAiStack):
                 ],
                 resources=[
                     # this makes the core class depend on this one create a cyclic reference.
-                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/{core.memory_table.table_name}"
+                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/{core.message_table.table_name}"
                 ],
             )
         )
@@ -33,7 +33,10 @@ class CoreStack(GenAiStack):
 
         self.chatbot_security_group_id_cfn_output_name = f"{config['appPrefix']}ChatbotSecurityGroupIdOutput"
 
-        self.memory_table = dynamodb.Table(
+        # Chat history table of stacks deployed before, one item per session. Changing its key
+        # would replace it while the chatbot stack imports its name, so the message table
+        # below is a new table. Untagged, the chatbot no longer uses it, see 03_chatbot/README.md.
+        self.legacy_memory_table = dynamodb.Table(
             self,
             "MemoryTable",
             partition_key=dynamodb.Attribute(
@@ -43,6 +46,24 @@ class CoreStack(GenAiStack):
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             point_in_time_recovery=True
         )
+        # Keeps the export of the old table name until the chatbot stack no longer imports it
+        self.export_value(self.legacy_memory_table.table_name)
+
+        self.message_table = dynamodb.Table(
+            self,
+            "MemoryMessageTable",
+            partition_key=dynamodb.Attribute(
+                name="SessionId", type=dynamodb.AttributeType.STRING
+            ),
+            # One item per message, see 03_chatbot/src/chatbot/helpers/dynamodb_message_history.py
+            sort_key=dynamodb.Attribute(
+                name="Sequence", type=dynamodb.AttributeType.NUMBER
+            ),
+            time_to_live_attribute="ExpiresAt",
+            removal_policy=RemovalPolicy.DESTROY,
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            point_in_time_recovery=True
+        )
 
         self.textract_bucket = s3.Bucket(
             self,
@@ -66,7 +87,7 @@ class CoreStack(GenAiStack):
             auto_delete_objects=True,
         )
 
-        Tags.of(self.memory_table).add(
+        Tags.of(self.message_table).add(
             f"genie:memory-table",
             "Use this table to store the history",
         )